@@ -1,28 +1,325 @@
-"""音声対話アプリケーションのメインモジュール"""
+"""音声対話アプリケーションのメインモジュール
+
+起動を速くするため、google.genai・speech_recognition・httpx などの重い
+ライブラリはここでは読み込まず、使用する時点でスレッドで並行して読み込みます。
+"""
+
+import time
+
+# モジュールの読み込みも起動時間に含めるため、他の import より前に記録する
+_STARTED_AT = time.perf_counter()
 
 import asyncio
+import importlib
 import os
 import random
+from pathlib import Path
+from typing import TYPE_CHECKING
 
 from dotenv import load_dotenv
-from google.genai import Client  # type: ignore
 
-from stt.ai_chat import AIChat
+from stt.bundle import BundledVoiceClient, PhraseBundle, open_bundle
+from stt.cache import CachingVoiceClient
+from stt.capture import FileAudioSource, MicrophoneSource, StdinAudioSource
+from stt.codec import transfer_format_from_env
 from stt.config import (
     CHARACTER_MAP,
     GEMINI_MODEL,
     SYSTEM_INSTRUCTION_TEMPLATE,
     TALK_END_KEYWORD,
+    VOICE_BACKENDS,
     CharacterOptions,
+    VoiceBackend,
 )
-from stt.googlevoice import GoogleTTSClient
-from stt.nijivoice import NijiVoiceClient
-from stt.output import StandardOutputWriter
-from stt.talk import TalkController
+from stt.effect import EffectPlayer, ToneEffectPlayer
+from stt.governor import BackendName, Governor, create_governors
+from stt.hedge import HedgedVoiceClient
+from stt.metrics import HistogramSink, Metrics, MetricsDumper
+from stt.output import OutputWriter, StandardOutputWriter
+from stt.playback import PlaybackEngine, create_playback_engine
+from stt.recording import SessionRecorder
+from stt.startup import StartupProfiler
+from stt.voice import VoiceClient
+
+if TYPE_CHECKING:
+    from google.genai import Client  # type: ignore
+
+    from stt.speech_recognition import SpeechRecognizer
+
+_IMPORTED_AT = time.perf_counter()
 
 load_dotenv()  # 環境変数の読み込み
 
 
+async def _warm_up(
+    voice_client: VoiceClient,
+    output: OutputWriter,
+    profiler: StartupProfiler,
+) -> None:
+    """音声合成 API への接続を事前に確立する（失敗しても会話は継続する）"""
+    try:
+        with profiler.phase('warm_up'):
+            await voice_client.warm_up()
+    except Exception as e:
+        output.print(f'音声合成 API への事前接続に失敗しました: {e}')
+
+
+def _create_genai_client(api_key: str) -> 'Client':
+    """Gemini クライアントを作成する（google.genai の読み込みを含む）"""
+    from google.genai import Client  # type: ignore
+
+    # 会話で使うモジュールも、google.genai と一緒に読み込んでおく
+    for module in (
+        'stt.ai_chat',
+        'stt.googlevoice',
+        'stt.nijivoice',
+        'stt.talk',
+    ):
+        importlib.import_module(module)
+
+    return Client(api_key=api_key)
+
+
+def _create_voice_client(
+    backend: VoiceBackend,
+    character: CharacterOptions,
+    genai_client: 'Client',
+    nijivoice_api_key: str,
+    metrics: Metrics,
+    governors: dict[BackendName, Governor],
+    sample_rate: int | None = None,
+    bundle: PhraseBundle | None = None,
+) -> tuple[CachingVoiceClient, BundledVoiceClient | None]:
+    """バックエンドの音声合成クライアントを作成し、キャッシュでラップする
+    繰り返し使われる台詞は API を呼ばずに再生できるようキャッシュします。
+    TTS_CACHE_DIR が設定されている場合はディスクにも保存します。
+    合成した音声は前後の無音を削除し、音量を揃え、sample_rate に変換してから
+    キャッシュします（TTS_POSTPROCESS=0 の場合は何もしません）。
+    TTS_CHUNK_CHARS 文字を超える台詞は分割して並行に合成します
+    （0 の場合は分割しません）。
+    bundle がある場合は、定型の台詞をファイルから返します。
+    Returns:
+        tuple[CachingVoiceClient, BundledVoiceClient | None]: 会話で使う
+            クライアントと、ファイルから返すラッパー（bundle がない場合は None）
+    """
+    from stt.chunked import ChunkedVoiceClient
+    from stt.dsp import PostProcessingVoiceClient
+    from stt.googlevoice import GoogleTTSClient
+    from stt.nijivoice import NijiVoiceClient
+
+    voice_client: VoiceClient = (
+        NijiVoiceClient.create_from_character_id(
+            api_key=nijivoice_api_key,
+            character_id=character.id,
+            metrics=metrics,
+            governor=governors['nijivoice'],
+            # TTS_TRANSFER_FORMAT=mp3 で転送量を減らす（デコードに ffmpeg を使う）
+            audio_format=transfer_format_from_env(),
+        )
+        if backend == 'nijivoice'
+        else GoogleTTSClient.create_from_character_id(
+            client=genai_client,
+            character_id=character.id,
+            metrics=metrics,
+            governor=governors['gemini'],
+        )
+    )
+    backend_settings = voice_client.voice_settings()
+    # 後処理の前に分割し、チャンクの継ぎ目の間を無音として削除しないようにする
+    chunk_chars = int(
+        os.getenv('TTS_CHUNK_CHARS', str(ChunkedVoiceClient.MAX_CHARS))
+    )
+    if chunk_chars > 0:
+        voice_client = ChunkedVoiceClient(
+            voice_client,
+            max_chars=chunk_chars,
+            max_parallel=int(
+                os.getenv(
+                    'TTS_CHUNK_PARALLEL', str(ChunkedVoiceClient.MAX_PARALLEL)
+                )
+            ),
+            metrics=metrics,
+        )
+    # ファイルの台詞は `python -m stt.bundle` がバックエンドのクライアントで
+    # 合成しているため、分割の設定を含まないバックエンドの設定で探す。
+    # 後処理の内側に置き、合成した音声と同じ後処理を通す
+    bundled: BundledVoiceClient | None = None
+    if bundle is not None:
+        bundled = BundledVoiceClient(
+            voice_client, bundle, key_settings=backend_settings
+        )
+        voice_client = bundled
+    if os.getenv('TTS_POSTPROCESS', '1') != '0':
+        voice_client = PostProcessingVoiceClient(
+            voice_client, sample_rate=sample_rate, metrics=metrics
+        )
+
+    cache_dir = os.getenv('TTS_CACHE_DIR')
+    cache = CachingVoiceClient(
+        voice_client=voice_client,
+        cache_dir=Path(cache_dir) if cache_dir else None,
+    )
+    return cache, bundled
+
+
+def _create_metrics_dumper(sink: HistogramSink) -> MetricsDumper | None:
+    """METRICS_FILE が設定されている場合、計測結果を定期的に書き出す
+    METRICS_FORMAT は `jsonl`（デフォルト）または `prometheus` です。
+    """
+    metrics_file = os.getenv('METRICS_FILE')
+    if not metrics_file:
+        return None
+
+    return MetricsDumper(
+        sink,
+        path=Path(metrics_file),
+        format=os.getenv('METRICS_FORMAT', 'jsonl'),
+        interval=float(
+            os.getenv('METRICS_INTERVAL', str(MetricsDumper.INTERVAL))
+        ),
+    )
+
+
+def _create_session_recorder(
+    mode: str, character: CharacterOptions
+) -> SessionRecorder:
+    """SESSION_LOG_DIR が設定されている場合、会話セッションを記録する
+    記録したファイルは `python -m stt.replay` で再生できます。
+    """
+    log_dir = os.getenv('SESSION_LOG_DIR')
+    if not log_dir:
+        return SessionRecorder()
+
+    return SessionRecorder(
+        Path(log_dir) / f'session-{time.strftime("%Y%m%d-%H%M%S")}.log',
+        metadata={
+            'mode': mode,
+            'character_id': character.id,
+            'character_name': character.name,
+            'talk_end_keyword': TALK_END_KEYWORD,
+            'phrases': character.phrases,
+        },
+    )
+
+
+def _create_effect_player(
+    playback: PlaybackEngine,
+    output: OutputWriter,
+    loop: asyncio.AbstractEventLoop,
+) -> EffectPlayer:
+    """録音開始・終了の効果音を、応答と同じ出力ストリームで鳴らすプレイヤーを作成する
+    EFFECT_START_SOUND と EFFECT_END_SOUND で効果音のファイルを指定できます
+    （指定しない場合は合成した音を使います）。
+    """
+    start_sound = os.getenv('EFFECT_START_SOUND')
+    end_sound = os.getenv('EFFECT_END_SOUND')
+    try:
+        return ToneEffectPlayer(
+            playback,
+            start_sound=Path(start_sound) if start_sound else None,
+            end_sound=Path(end_sound) if end_sound else None,
+            loop=loop,
+        )
+    except ValueError as e:
+        output.print(
+            f'効果音のファイルを使用できないため合成した音を使います: {e}'
+        )
+        return ToneEffectPlayer(playback, loop=loop)
+
+
+def _create_speech_recognizer(
+    output: OutputWriter,
+    metrics: Metrics,
+    governor: Governor,
+    playback: PlaybackEngine,
+    loop: asyncio.AbstractEventLoop,
+) -> 'SpeechRecognizer':
+    """音声認識インスタンスを作成する
+    CAPTURE_MODE が `stream`（デフォルト）の場合はマイクを開いたまま使い続け、
+    `legacy` の場合は発話ごとにマイクを開き直します。サウンドカードのない
+    環境では、`file` で CAPTURE_FILE の録音ファイルを、`stdin` で標準入力の
+    16kHz・16bit・モノラルの PCM を入力にします。
+    speech_recognition と sounddevice の読み込みを含むため、起動時は
+    スレッドで実行します。
+    """
+    from stt.speech_recognition import SpeechRecognizer
+
+    effect_player = _create_effect_player(playback, output, loop)
+    capture_mode = os.getenv('CAPTURE_MODE', 'stream')
+    if capture_mode in ('file', 'stdin'):
+        capture_file = os.getenv('CAPTURE_FILE')
+        if capture_mode == 'file' and not capture_file:
+            raise OSError('CAPTURE_FILEが設定されていません。')
+        return SpeechRecognizer(
+            effect_player=effect_player,
+            output_writer=output,
+            audio_source=(
+                FileAudioSource(Path(capture_file), realtime=True)
+                if capture_file and capture_mode == 'file'
+                else StdinAudioSource()
+            ),
+            metrics=metrics,
+            governor=governor,
+        )
+
+    if capture_mode == 'stream':
+        try:
+            return SpeechRecognizer(
+                effect_player=effect_player,
+                output_writer=output,
+                audio_source=MicrophoneSource(),
+                metrics=metrics,
+                governor=governor,
+            )
+        except ValueError as e:
+            output.print(
+                f'常時入力を使用できないため従来の録音を使用します: {e}'
+            )
+
+    return SpeechRecognizer(
+        effect_player=effect_player,
+        output_writer=output,
+        metrics=metrics,
+        governor=governor,
+    )
+
+
+async def _prepare_speech_recognizer(
+    output: OutputWriter,
+    metrics: Metrics,
+    governor: Governor,
+    profiler: StartupProfiler,
+    playback: PlaybackEngine,
+) -> 'SpeechRecognizer':
+    """音声認識インスタンスを作成し、マイクを開いて周囲音を測定する"""
+    with profiler.phase('speech_recognizer'):
+        speech_recognizer = await asyncio.to_thread(
+            _create_speech_recognizer,
+            output,
+            metrics,
+            governor,
+            playback,
+            asyncio.get_running_loop(),
+        )
+    try:
+        with profiler.phase('calibrate'):
+            await speech_recognizer.calibrate()
+    except BaseException:
+        speech_recognizer.close()
+        raise
+    return speech_recognizer
+
+
+async def _discard_speech_recognizer(
+    task: 'asyncio.Task[SpeechRecognizer]',
+) -> None:
+    """起動の途中で終了する場合に、準備中の音声認識を中止して閉じる"""
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    if not task.cancelled() and task.exception() is None:
+        task.result().close()
+
+
 async def talk(
     mode: str = 'google',
     # 何も指定しない場合はランダムにキャラクターを選択
@@ -55,44 +352,203 @@ async def talk(
     output.print(f'選択された音声合成モード: {mode}')
     output.print(f'選択されたキャラクター: {character.name}')
 
-    # Gemini クライアントを作成
-    # AIChat と GoogleTTSClient の両方で使用
-    genai_client = Client(api_key=gemini_api_key)
-
-    # AI チャットインスタンスを作成
-    # キャラクターのシステムインストラクションを設定
-    # キャラクターの名前と指示をテンプレートに埋め込む
-    # モデルは GEMINI_MODEL で指定されたものを使用
-    ai_chat = AIChat(
-        system_instruction=SYSTEM_INSTRUCTION_TEMPLATE.format(
-            character_name=character.name,
-            character_instruction=character.instruction,
-        ),
-        model=GEMINI_MODEL,
-        client=genai_client,
+    # 各段階の所要時間をセッションを通して集計する
+    metrics_sink = HistogramSink()
+    # SESSION_LOG_DIR が設定されている場合は、各段階の所要時間も記録する
+    recorder = _create_session_recorder(mode, character)
+    metrics = Metrics(metrics_sink, recorder)
+    metrics_dumper = _create_metrics_dumper(metrics_sink)
+
+    # 起動の各段階の所要時間（STARTUP_TARGET で目標時間を設定）
+    profiler = StartupProfiler(started_at=_STARTED_AT, metrics=metrics)
+    profiler.record('import', _STARTED_AT, _IMPORTED_AT)
+
+    # バックエンドごとの流量制御（GOVERNOR_<BACKEND>_<FIELD> で設定）
+    # Gemini の流量制御は AIChat と GoogleTTSClient で共有する
+    governors = create_governors(metrics)
+
+    # 録音の効果音と応答の音声は同じ出力ストリームで再生する
+    with profiler.phase('playback'):
+        playback = await asyncio.to_thread(create_playback_engine)
+
+    # マイクを開いて周囲音を測定している間に、クライアントの作成と
+    # 音声合成 API への事前接続を並行して進める
+    recognizer_task = asyncio.create_task(
+        _prepare_speech_recognizer(
+            output, metrics, governors['speech_recognition'], profiler, playback
+        )
     )
 
-    # 会話コントローラーを作成して会話を開始
-    controller = TalkController(
-        character_name=character.name,
-        talk_end_keyword=TALK_END_KEYWORD,
-        ai_chat=ai_chat,
+    # 事前に合成した台詞のファイル（起動の途中や会話の終了時に閉じる）
+    bundle: PhraseBundle | None = None
+    try:
+        # Gemini クライアントを作成
+        # AIChat と GoogleTTSClient の両方で使用
+        with profiler.phase('genai_client'):
+            genai_client = await asyncio.to_thread(
+                _create_genai_client, gemini_api_key
+            )
+
+        # google.genai と一緒に読み込み済みのモジュール
+        from stt.ai_chat import AIChat
+        from stt.prompt_cache import PromptCache
+        from stt.talk import TalkController
+
+        # キャラクターのシステムインストラクションを Gemini 側にキャッシュし、
+        # 送信のたびに送らずに済ませる（PROMPT_CACHE=0 の場合は毎回送る）
+        prompt_cache = (
+            PromptCache(
+                genai_client,
+                ttl=float(
+                    os.getenv('PROMPT_CACHE_TTL', str(PromptCache.DEFAULT_TTL))
+                ),
+                governor=governors['gemini'],
+            )
+            if os.getenv('PROMPT_CACHE', '1') != '0'
+            else None
+        )
+
+        # AI チャットインスタンスを作成
+        # キャラクターのシステムインストラクションを設定
+        # キャラクターの名前と指示をテンプレートに埋め込む
+        # モデルは GEMINI_MODEL で指定されたものを使用
+        ai_chat = AIChat(
+            system_instruction=SYSTEM_INSTRUCTION_TEMPLATE.format(
+                character_name=character.name,
+                character_instruction=character.instruction,
+            ),
+            model=GEMINI_MODEL,
+            client=genai_client,
+            governor=governors['gemini'],
+            prompt_cache=prompt_cache,
+        )
+
         # 音声クライアントの選択
         # `nijivoice` モードでは NijiVoiceClient を使用
         # `google` モードでは GoogleTTSClient を使用
-        voice_client=NijiVoiceClient.create_from_character_id(
-            api_key=nijivoice_api_key,
-            character_id=character.id,
+        backend: VoiceBackend = 'nijivoice' if mode == 'nijivoice' else 'google'
+        # バックエンドごとにレートが違う音声を、出力デバイスのレートに揃える
+        # TTS_OUTPUT_SAMPLE_RATE で変換先のレートを指定できる
+        output_rate = os.getenv('TTS_OUTPUT_SAMPLE_RATE')
+        sample_rate = (
+            int(output_rate) if output_rate else playback.device_sample_rate
         )
-        if mode == 'nijivoice'
-        else GoogleTTSClient.create_from_character_id(
-            client=genai_client,
-            character_id=character.id,
-        ),
-        output_writer=output,
-    )
+        # PHRASE_BUNDLE が設定されている場合は、挨拶などの定型の台詞を
+        # 事前に合成したファイルから再生する（python -m stt.bundle で作成）
+        bundle_path = os.getenv('PHRASE_BUNDLE')
+        bundle = open_bundle(Path(bundle_path) if bundle_path else None, output)
+        cache, bundled = _create_voice_client(
+            backend,
+            character,
+            genai_client,
+            nijivoice_api_key,
+            metrics,
+            governors,
+            sample_rate,
+            bundle,
+        )
+        voice_client: VoiceClient = cache
+
+        # TTS_HEDGE_BACKEND が設定されている場合は、応答が遅いときに
+        # もう一方のバックエンドにも送り、先に返した方の音声を使う
+        # キャッシュやファイルから返した台詞はすぐに返るため送らない
+        hedged: HedgedVoiceClient | None = None
+        hedge_backend = os.getenv('TTS_HEDGE_BACKEND')
+        if hedge_backend in VOICE_BACKENDS and hedge_backend != backend:
+            hedged = HedgedVoiceClient(
+                primary=voice_client,
+                secondary=_create_voice_client(
+                    hedge_backend,
+                    character,
+                    genai_client,
+                    nijivoice_api_key,
+                    metrics,
+                    governors,
+                    sample_rate,
+                )[0],
+                quantile=float(
+                    os.getenv(
+                        'TTS_HEDGE_QUANTILE',
+                        str(HedgedVoiceClient.DEFAULT_QUANTILE),
+                    )
+                ),
+                metrics=metrics,
+            )
+            voice_client = hedged
+    except BaseException:
+        await _discard_speech_recognizer(recognizer_task)
+        if bundle is not None:
+            bundle.close()
+        raise
 
-    await controller.start_talk()
+    # 音声クライアントの接続は会話全体で使い回し、終了時に閉じる
+    async with voice_client:
+        # 最初の返答までに音声合成 API への接続を確立しておく
+        # システムインストラクションのキャッシュも作成しておく
+        warm_up = asyncio.create_task(_warm_up(voice_client, output, profiler))
+        prompt_warm_up = asyncio.create_task(ai_chat.warm_up())
+        dump = (
+            asyncio.create_task(metrics_dumper.run())
+            if metrics_dumper is not None
+            else None
+        )
+
+        try:
+            # 常時入力が使える場合は、応答中の割り込みを有効にする
+            # BARGE_IN=0 の場合は応答を最後まで再生する
+            speech_recognizer = await recognizer_task
+            barge_in = (
+                speech_recognizer.supports_barge_in
+                and os.getenv('BARGE_IN', '1') != '0'
+            )
+            recorder.write('session', barge_in=barge_in)
+
+            # 会話コントローラーを作成して会話を開始
+            controller = TalkController(
+                character_name=character.name,
+                talk_end_keyword=TALK_END_KEYWORD,
+                ai_chat=ai_chat,
+                voice_client=voice_client,
+                output_writer=output,
+                playback_engine=playback,
+                speech_recognizer=speech_recognizer,
+                barge_in=barge_in,
+                metrics=metrics,
+                phrases=character.phrases,
+                recorder=recorder,
+            )
+
+            profiler.mark_ready()
+            output.print(profiler.report())
+            await controller.start_talk()
+        finally:
+            await _discard_speech_recognizer(recognizer_task)
+            warm_up.cancel()
+            prompt_warm_up.cancel()
+            await ai_chat.aclose()
+            if prompt_cache is not None:
+                await prompt_cache.aclose()
+            recorder.close()
+            # 再生中の音声が参照している場合は、参照がなくなった時点で解放される
+            if bundle is not None:
+                bundle.close()
+            if dump is not None:
+                dump.cancel()
+                await asyncio.gather(dump, return_exceptions=True)
+
+    stats = cache.stats
+    output.print(
+        f'音声キャッシュ: ヒット {stats.hits} 回 / ミス {stats.misses} 回'
+    )
+    if bundled is not None:
+        output.print(f'定型の台詞: ファイルから再生 {bundled.hits} 回')
+    if hedged is not None:
+        output.print(hedged.stats.report())
+    if prompt_cache is not None:
+        output.print(prompt_cache.stats.report())
+    metrics_sink.print_summary(output)
+    if recorder.path is not None:
+        output.print(f'会話セッションを記録しました: {recorder.path}')
 
 
 def main():
@@ -1,29 +1,234 @@
-from .ai_chat import AIChat
-from .config import (
-    CHARACTER_MAP,
-    GEMINI_MODEL,
-    SYSTEM_INSTRUCTION_TEMPLATE,
-    TALK_END_KEYWORD,
-    CharacterID,
-    CharacterOptions,
-)
-from .exceptions import (
-    AIResponseError,
-    EnvironmentError,
-    SpeechRecognitionError,
-    STTAppError,
-    VoiceSynthesisError,
-)
-from .googlevoice import GoogleTTSClient
-from .nijivoice import NijiVoiceClient
-from .output import OutputWriter, StandardOutputWriter
-from .speech_recognition import SpeechRecognizer
-from .talk import TalkController
-from .voice import VoiceClient, is_installed, play
+"""音声対話アプリケーションのパッケージ
+起動を速くするため、各クラスは最初に参照された時点でモジュールを読み込みます。
+`import stt` だけでは google.genai・speech_recognition・httpx などの
+重いライブラリは読み込まれず、使用するバックエンドのものだけが読み込まれます。
+"""
+
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .ai_chat import AIChat
+    from .audio import AudioBuffer, AudioFormat, WavStreamParser
+    from .batch import BatchRenderer, BatchStats, ScriptLine, read_script
+    from .bundle import BundledVoiceClient, PhraseBundle
+    from .cache import CacheStats, CachingVoiceClient
+    from .capture import (
+        AudioSource,
+        FileAudioSource,
+        MicrophoneSource,
+        QueueAudioSource,
+        StdinAudioSource,
+        load_audio_file,
+    )
+    from .chunked import ChunkedVoiceClient, ChunkStats, split_text
+    from .codec import FFmpegDecoder, TransferFormat, decode_audio
+    from .config import (
+        CHARACTER_MAP,
+        GEMINI_MODEL,
+        SYSTEM_INSTRUCTION_TEMPLATE,
+        TALK_END_KEYWORD,
+        CharacterID,
+        CharacterOptions,
+        PhraseID,
+        VoiceBackend,
+    )
+    from .context import ConversationContext, Turn, estimate_tokens
+    from .dsp import (
+        PostProcessingVoiceClient,
+        PostProcessStats,
+        SpeechPostProcessor,
+        StreamResampler,
+    )
+    from .effect import (
+        EffectPlayer,
+        EffectPlayerForMac,
+        NullEffectPlayer,
+        ToneEffectPlayer,
+        synthesize_tone,
+    )
+    from .exceptions import (
+        AIResponseError,
+        BackendUnavailableError,
+        EnvironmentError,
+        SpeechRecognitionError,
+        STTAppError,
+        VoiceSynthesisError,
+    )
+    from .googlevoice import GoogleTTSClient
+    from .governor import (
+        BackendLimits,
+        CircuitBreaker,
+        Governor,
+        GovernorStats,
+        TokenBucket,
+        create_governors,
+    )
+    from .hedge import HedgedVoiceClient, HedgeStats
+    from .metrics import (
+        HistogramSink,
+        HistogramSummary,
+        Metrics,
+        MetricsDumper,
+        MetricsSink,
+        Span,
+    )
+    from .nijivoice import NijiVoiceClient
+    from .output import OutputWriter, StandardOutputWriter
+    from .playback import (
+        FFPlayPlaybackEngine,
+        PlaybackEngine,
+        SoundDevicePlaybackEngine,
+        create_playback_engine,
+    )
+    from .prompt_cache import CachedPrompt, PromptCache, PromptCacheStats
+    from .recording import (
+        RecordingVoiceClient,
+        SessionLog,
+        SessionRecord,
+        SessionRecorder,
+    )
+    from .segmenter import SentenceSegmenter
+    from .speech_recognition import SpeechRecognizer
+    from .startup import StartupPhase, StartupProfiler
+    from .talk import TalkController
+    from .transcribe import (
+        BatchTranscriber,
+        TranscriptionStats,
+        find_recordings,
+    )
+    from .vad import (
+        BargeInDetector,
+        EnergyVAD,
+        Utterance,
+        UtteranceEndpointer,
+    )
+    from .voice import VoiceClient, is_installed, play
+
+# 公開する名前と、その名前を定義しているモジュール
+_EXPORTS: dict[str, str] = {
+    'AIChat': 'ai_chat',
+    'AudioBuffer': 'audio',
+    'AudioFormat': 'audio',
+    'WavStreamParser': 'audio',
+    'BatchRenderer': 'batch',
+    'BatchStats': 'batch',
+    'ScriptLine': 'batch',
+    'read_script': 'batch',
+    'BundledVoiceClient': 'bundle',
+    'PhraseBundle': 'bundle',
+    'CacheStats': 'cache',
+    'CachingVoiceClient': 'cache',
+    'FFmpegDecoder': 'codec',
+    'TransferFormat': 'codec',
+    'decode_audio': 'codec',
+    'AudioSource': 'capture',
+    'FileAudioSource': 'capture',
+    'MicrophoneSource': 'capture',
+    'QueueAudioSource': 'capture',
+    'StdinAudioSource': 'capture',
+    'load_audio_file': 'capture',
+    'ChunkStats': 'chunked',
+    'ChunkedVoiceClient': 'chunked',
+    'split_text': 'chunked',
+    'CHARACTER_MAP': 'config',
+    'GEMINI_MODEL': 'config',
+    'SYSTEM_INSTRUCTION_TEMPLATE': 'config',
+    'TALK_END_KEYWORD': 'config',
+    'CharacterID': 'config',
+    'CharacterOptions': 'config',
+    'PhraseID': 'config',
+    'VoiceBackend': 'config',
+    'ConversationContext': 'context',
+    'Turn': 'context',
+    'estimate_tokens': 'context',
+    'PostProcessStats': 'dsp',
+    'PostProcessingVoiceClient': 'dsp',
+    'SpeechPostProcessor': 'dsp',
+    'StreamResampler': 'dsp',
+    'EffectPlayer': 'effect',
+    'EffectPlayerForMac': 'effect',
+    'NullEffectPlayer': 'effect',
+    'ToneEffectPlayer': 'effect',
+    'synthesize_tone': 'effect',
+    'AIResponseError': 'exceptions',
+    'BackendUnavailableError': 'exceptions',
+    'EnvironmentError': 'exceptions',
+    'SpeechRecognitionError': 'exceptions',
+    'STTAppError': 'exceptions',
+    'VoiceSynthesisError': 'exceptions',
+    'GoogleTTSClient': 'googlevoice',
+    'BackendLimits': 'governor',
+    'CircuitBreaker': 'governor',
+    'Governor': 'governor',
+    'GovernorStats': 'governor',
+    'TokenBucket': 'governor',
+    'create_governors': 'governor',
+    'HedgedVoiceClient': 'hedge',
+    'HedgeStats': 'hedge',
+    'HistogramSink': 'metrics',
+    'HistogramSummary': 'metrics',
+    'Metrics': 'metrics',
+    'MetricsDumper': 'metrics',
+    'MetricsSink': 'metrics',
+    'Span': 'metrics',
+    'NijiVoiceClient': 'nijivoice',
+    'OutputWriter': 'output',
+    'StandardOutputWriter': 'output',
+    'CachedPrompt': 'prompt_cache',
+    'PromptCache': 'prompt_cache',
+    'PromptCacheStats': 'prompt_cache',
+    'FFPlayPlaybackEngine': 'playback',
+    'PlaybackEngine': 'playback',
+    'SoundDevicePlaybackEngine': 'playback',
+    'create_playback_engine': 'playback',
+    'RecordingVoiceClient': 'recording',
+    'SessionLog': 'recording',
+    'SessionRecord': 'recording',
+    'SessionRecorder': 'recording',
+    'SentenceSegmenter': 'segmenter',
+    'SpeechRecognizer': 'speech_recognition',
+    'StartupPhase': 'startup',
+    'StartupProfiler': 'startup',
+    'TalkController': 'talk',
+    'BatchTranscriber': 'transcribe',
+    'TranscriptionStats': 'transcribe',
+    'find_recordings': 'transcribe',
+    'BargeInDetector': 'vad',
+    'EnergyVAD': 'vad',
+    'Utterance': 'vad',
+    'UtteranceEndpointer': 'vad',
+    'VoiceClient': 'voice',
+    'is_installed': 'voice',
+    'play': 'voice',
+}
+
+
+def __getattr__(name: str) -> Any:
+    """公開する名前が最初に参照された時点でモジュールを読み込む"""
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    value = getattr(importlib.import_module(f'.{module_name}', __name__), name)
+    # 2回目以降はモジュールの属性として直接参照させる
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_EXPORTS])
+
 
 __all__ = [
     # AI チャット
     'AIChat',
+    'ConversationContext',
+    'Turn',
+    'estimate_tokens',
+    'PromptCache',
+    'PromptCacheStats',
+    'CachedPrompt',
     # 設定とキャラクター
     'CHARACTER_MAP',
     'GEMINI_MODEL',
@@ -31,8 +236,11 @@ __all__ = [
     'TALK_END_KEYWORD',
     'CharacterID',
     'CharacterOptions',
+    'PhraseID',
+    'VoiceBackend',
     # 例外クラス
     'AIResponseError',
+    'BackendUnavailableError',
     'EnvironmentError',
     'SpeechRecognitionError',
     'STTAppError',
@@ -41,13 +249,85 @@ __all__ = [
     'GoogleTTSClient',
     'NijiVoiceClient',
     'VoiceClient',
+    'CachingVoiceClient',
+    'CacheStats',
+    'BundledVoiceClient',
+    'PhraseBundle',
+    'HedgedVoiceClient',
+    'HedgeStats',
+    'ChunkedVoiceClient',
+    'ChunkStats',
+    # 音声の後処理
+    'PostProcessingVoiceClient',
+    'PostProcessStats',
+    'SpeechPostProcessor',
+    'StreamResampler',
     # 出力制御
     'OutputWriter',
     'StandardOutputWriter',
+    # テキスト分割
+    'SentenceSegmenter',
+    'split_text',
+    # 音声再生
+    'AudioFormat',
+    'AudioBuffer',
+    'WavStreamParser',
+    'FFmpegDecoder',
+    'TransferFormat',
+    'decode_audio',
+    'PlaybackEngine',
+    'SoundDevicePlaybackEngine',
+    'FFPlayPlaybackEngine',
+    'create_playback_engine',
+    'EffectPlayer',
+    'ToneEffectPlayer',
+    'EffectPlayerForMac',
+    'NullEffectPlayer',
+    'synthesize_tone',
     # 音声認識
     'SpeechRecognizer',
+    'AudioSource',
+    'FileAudioSource',
+    'MicrophoneSource',
+    'QueueAudioSource',
+    'StdinAudioSource',
+    'load_audio_file',
+    'BargeInDetector',
+    'EnergyVAD',
+    'Utterance',
+    'UtteranceEndpointer',
+    # 計測
+    'Metrics',
+    'MetricsSink',
+    'HistogramSink',
+    'HistogramSummary',
+    'MetricsDumper',
+    'Span',
+    'StartupPhase',
+    'StartupProfiler',
+    # 流量制御
+    'BackendLimits',
+    'CircuitBreaker',
+    'Governor',
+    'GovernorStats',
+    'TokenBucket',
+    'create_governors',
+    # 一括変換
+    'BatchRenderer',
+    'BatchStats',
+    'ScriptLine',
+    'read_script',
+    # 一括文字起こし
+    'BatchTranscriber',
+    'TranscriptionStats',
+    'find_recordings',
     # 会話制御
     'TalkController',
+    # 会話の記録
+    'RecordingVoiceClient',
+    'SessionLog',
+    'SessionRecord',
+    'SessionRecorder',
     # ユーティリティ関数
     'is_installed',
     'play',
@@ -1,33 +1,153 @@
+import asyncio
+import contextlib
+from collections.abc import AsyncGenerator
+
 from google.genai import Client, chats, types  # type: ignore
 
+from .context import ConversationContext, Turn
 from .exceptions import AIResponseError
+from .governor import Governor
+from .prompt_cache import PromptCache, is_cache_error
+from .runner import run_sync
 
 
 class AIChat:
     """AI チャット機能を提供するクラス
+    Gemini SDK の非同期 API (`client.aio`) を使用するため、通信中も
+    イベントループをブロックしません。
+    送信する履歴は `ConversationContext` で予算内に保ちます。予算を超えた
+    古い会話はバックグラウンドで要約し、システムインストラクションの末尾に
+    加えてチャットセッションを作り直します。
+    `PromptCache` を渡すと、システムインストラクションを Gemini 側の
+    キャッシュから参照し、送信のたびに送らずに済ませます。キャッシュが
+    使えない間や、キャッシュの原因で送信に失敗した場合は、キャッシュを
+    使わずにそのまま送ります。
     Attributes:
         _system_instruction (str): システムインストラクション
         _model (str): 使用するモデル名
         _client (Client): Google GenAI クライアント
+        _context (ConversationContext): 送信する会話の履歴
+        _summary_model (str): 要約に使用するモデル名
+        _summary_task (asyncio.Task[None] | None): 実行中の要約タスク
+        _governor (Governor): Gemini API へのリクエストの流量制御
+        _prompt_cache (PromptCache | None): システムインストラクションのキャッシュ
+        _chat_cache (str | None): 現在のチャットセッションが使うキャッシュの名前
     """
 
-    _chat: chats.Chat | None = None
+    _chat: chats.AsyncChat | None = None
+    _chat_cache: str | None = None
+
+    # 割り込みで打ち切られた応答の末尾に付ける目印
+    TRUNCATED_MARKER = '…（ユーザーが話し始めたため中断）'
 
-    def __init__(self, system_instruction: str, model: str, client: Client):
+    # 古い会話を要約する際の指示
+    SUMMARY_INSTRUCTION = (
+        'あなたは会話の記録係です。'
+        'これまでの要約と新しい会話を、登場した事実・ユーザーの好みや状況・'
+        '約束したことを落とさずに、300文字以内の日本語の箇条書きにまとめてください。'
+        '要約のみを出力してください。'
+    )
+
+    def __init__(
+        self,
+        system_instruction: str,
+        model: str,
+        client: Client,
+        context: ConversationContext | None = None,
+        summary_model: str | None = None,
+        governor: Governor | None = None,
+        prompt_cache: PromptCache | None = None,
+    ):
+        """
+        Args:
+            system_instruction (str): システムインストラクション
+            model (str): 使用するモデル名
+            client (Client): Google GenAI クライアント
+            context (ConversationContext | None): 履歴の予算を設定した
+                ConversationContext（None の場合は既定の予算）
+            summary_model (str | None): 要約に使用するモデル名
+                （None の場合は model と同じ）
+            governor (Governor | None): GoogleTTSClient と共有する Gemini API の
+                流量制御（None の場合は再試行のみ行う）
+            prompt_cache (PromptCache | None): 他の会話と共有する
+                システムインストラクションのキャッシュ（None の場合は使わない）
+        """
         self._system_instruction = system_instruction
         self._model = model
         self._client = client
+        self._context = context or ConversationContext()
+        self._summary_model = summary_model or model
+        self._summary_task: asyncio.Task[None] | None = None
+        self._governor = governor or Governor('gemini')
+        self._prompt_cache = prompt_cache
+
+    @property
+    def context(self) -> ConversationContext:
+        """送信する会話の履歴"""
+        return self._context
+
+    async def warm_up(self) -> None:
+        """最初の送信までにシステムインストラクションのキャッシュを用意する"""
+        if self._prompt_cache is not None:
+            await self._prompt_cache.prepare(
+                self._model, self._system_instruction
+            )
 
-    def _create_chat(self) -> chats.Chat:
-        """チャットセッションを作成する"""
-        return self._client.chats.create(
+    def _create_chat(self, cache_name: str | None) -> chats.AsyncChat:
+        """保持している履歴と要約からチャットセッションを作成する
+        Args:
+            cache_name (str | None): システムインストラクションのキャッシュの
+                名前（None の場合はシステムインストラクションをそのまま送る）
+        """
+        if cache_name is None:
+            return self._client.aio.chats.create(
+                model=self._model,
+                config=types.GenerateContentConfig(
+                    system_instruction=self._context.system_instruction(
+                        self._system_instruction
+                    ),
+                ),
+                history=self._context.history(),
+            )
+
+        # キャッシュしたシステムインストラクションには要約を加えられないため、
+        # 要約は履歴の先頭で伝える
+        return self._client.aio.chats.create(
             model=self._model,
-            config=types.GenerateContentConfig(
-                system_instruction=self._system_instruction,
-            ),
+            config=types.GenerateContentConfig(cached_content=cache_name),
+            history=self._context.summary_history() + self._context.history(),
+        )
+
+    def _get_chat(self) -> chats.AsyncChat:
+        """チャットセッションを取得する
+        未作成の場合と、使えるキャッシュが変わった場合（作成できた・期限が
+        切れたなど）は、保持している履歴からチャットセッションを作り直します。
+        """
+        cache_name = (
+            self._prompt_cache.lookup(self._model, self._system_instruction)
+            if self._prompt_cache is not None
+            else None
         )
+        if self._chat is None or cache_name != self._chat_cache:
+            self._chat = self._create_chat(cache_name)
+            self._chat_cache = cache_name
+        return self._chat
 
-    def send_message(self, message: str) -> str:
+    def _fall_back(self, error: Exception) -> bool:
+        """キャッシュの原因で送信に失敗した場合に、キャッシュを使わないようにする
+        Returns:
+            bool: キャッシュを使わずに送り直せる場合は True
+        """
+        if (
+            self._prompt_cache is None
+            or self._chat_cache is None
+            or not is_cache_error(error)
+        ):
+            return False
+        self._prompt_cache.invalidate(self._chat_cache)
+        return True
+
+    async def send_message(self, message: str) -> str:
         """メッセージを送信し、応答を取得する
         Args:
             message: 送信するメッセージ
@@ -37,16 +157,159 @@ class AIChat:
             AIResponseError: AI の応答が空の場合
         """
 
-        # チャットセッションが未作成の場合は新規作成
-        if self._chat is None:
-            self._chat = self._create_chat()
-
-        response: types.GenerateContentResponse = self._chat.send_message(
-            message=message
-        )
+        try:
+            response = await self._send(message)
+        except Exception as e:
+            if not self._fall_back(e):
+                raise
+            response = await self._send(message)
 
         response_text = response.text
         if not response_text:
             raise AIResponseError('AIの返答がありません。')
 
+        self._record_turn(message, response_text)
         return response_text
+
+    async def send_message_stream(self, message: str) -> AsyncGenerator[str]:
+        """メッセージを送信し、応答をテキスト断片として逐次取得する
+        Args:
+            message: 送信するメッセージ
+        Yields:
+            str: AI の応答テキストの断片
+        Raises:
+            AIResponseError: AI の応答が空の場合
+        """
+
+        response_text = ''
+        while True:
+            try:
+                async with contextlib.aclosing(
+                    self._send_stream(message)
+                ) as stream:
+                    async for text in stream:
+                        response_text += text
+                        yield text
+                break
+            except Exception as e:
+                # 受信を始めた後は、重複した出力を避けるため送り直さない
+                # キャッシュを使わない送信が失敗した場合はそのまま送出する
+                if response_text or not self._fall_back(e):
+                    raise
+
+        if not response_text:
+            raise AIResponseError('AIの返答がありません。')
+
+        self._record_turn(message, response_text)
+
+    async def _send(self, message: str) -> types.GenerateContentResponse:
+        """現在のチャットセッションでメッセージを送信する"""
+        chat = self._get_chat()
+        return await self._governor.call(
+            lambda: chat.send_message(message=message)
+        )
+
+    async def _send_stream(self, message: str) -> AsyncGenerator[str]:
+        """現在のチャットセッションでメッセージを送信し、応答の断片を返す"""
+        chat = self._get_chat()
+
+        async def open_stream() -> AsyncGenerator[
+            types.GenerateContentResponse
+        ]:
+            async for chunk in await chat.send_message_stream(message=message):
+                yield chunk
+
+        # 最初の断片を受信するまでのエラーは Governor が再試行する
+        async with contextlib.aclosing(
+            self._governor.stream(open_stream)
+        ) as stream:
+            async for chunk in stream:
+                if chunk.text:
+                    yield chunk.text
+
+    def record_truncated(self, message: str, partial_response: str) -> None:
+        """途中で打ち切られた応答を履歴に記録する
+        ストリーミング中にキャンセルされた応答は SDK の履歴に残らないため、
+        ユーザーが割り込んだことが分かる形で記録します。
+        Args:
+            message: 送信したメッセージ
+            partial_response: 打ち切られるまでに受信した応答テキスト
+        """
+        model_output = f'{partial_response}{self.TRUNCATED_MARKER}'
+        self._get_chat().record_history(
+            user_input=types.Content(
+                role='user', parts=[types.Part(text=message)]
+            ),
+            model_output=[
+                types.Content(
+                    role='model',
+                    parts=[types.Part(text=model_output)],
+                )
+            ],
+            is_valid=True,
+        )
+        self._record_turn(message, model_output)
+
+    def _record_turn(self, message: str, response_text: str) -> None:
+        """完了した会話を記録し、予算を超えた場合は要約を始める"""
+        self._context.append(message, response_text)
+
+        if not self._context.over_budget:
+            return
+        if self._summary_task is not None and not self._summary_task.done():
+            return
+
+        turns = self._context.select_oldest()
+        if turns:
+            self._summary_task = asyncio.create_task(self._summarize(turns))
+
+    async def _summarize(self, turns: list[Turn]) -> None:
+        """古い会話を要約にまとめ、次の送信から短い履歴を使う
+        要約の生成中も会話は続けられます。生成中の会話は履歴の末尾に
+        追加されるだけなので、要約の対象の会話とは重なりません。
+        """
+        lines = [
+            f'ユーザー: {turn.user}\nあなた: {turn.model}' for turn in turns
+        ]
+        prompt = (
+            f'# これまでの要約\n{self._context.summary or "なし"}\n\n'
+            '# 新しい会話\n' + '\n'.join(lines)
+        )
+
+        summary: str | None = None
+        try:
+            response = await self._governor.call(
+                lambda: self._client.aio.models.generate_content(
+                    model=self._summary_model,
+                    contents=prompt,
+                    config=types.GenerateContentConfig(
+                        system_instruction=self.SUMMARY_INSTRUCTION,
+                    ),
+                )
+            )
+            summary = response.text or None
+        except Exception:
+            # 要約に失敗しても履歴が増え続けないよう、古い会話は取り除く
+            summary = None
+
+        self._context.fold(turns, summary)
+        # 次の送信時に新しい履歴と要約でチャットセッションを作り直す
+        self._chat = None
+
+    async def aclose(self) -> None:
+        """実行中の要約を取り消す"""
+        if self._summary_task is not None:
+            self._summary_task.cancel()
+            await asyncio.gather(self._summary_task, return_exceptions=True)
+            self._summary_task = None
+
+    def send_message_sync(self, message: str) -> str:
+        """メッセージを同期的に送信し、応答を取得する（互換用ラッパー）
+        Args:
+            message: 送信するメッセージ
+        Returns:
+            str: AI の応答テキスト
+        Raises:
+            AIResponseError: AI の応答が空の場合
+        """
+        return run_sync(self.send_message(message))
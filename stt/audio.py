@@ -0,0 +1,262 @@
+import struct
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    """PCM 音声の形式
+    Attributes:
+        sample_rate (int): サンプリングレート (Hz)
+        channels (int): チャンネル数
+        sample_width (int): 1サンプルあたりのバイト数
+    """
+
+    sample_rate: int
+    channels: int = 1
+    sample_width: int = 2
+
+    @property
+    def frame_size(self) -> int:
+        """1フレーム（全チャンネル分のサンプル）のバイト数"""
+        return self.channels * self.sample_width
+
+    @property
+    def bytes_per_second(self) -> int:
+        """1秒あたりのバイト数"""
+        return self.sample_rate * self.frame_size
+
+    def duration(self, size: int) -> float:
+        """指定したバイト数の PCM の再生時間（秒）を返す"""
+        return size / self.bytes_per_second
+
+
+def is_wav(audio: bytes | bytearray | memoryview) -> bool:
+    """データが WAV (RIFF/WAVE) 形式かどうかを判定する"""
+    return bytes(audio[:4]) == b'RIFF' and bytes(audio[8:12]) == b'WAVE'
+
+
+def _parse_fmt_chunk(
+    data: bytes | bytearray | memoryview, offset: int
+) -> AudioFormat:
+    """WAV の fmt チャンクの本体を解析する
+    Raises:
+        ValueError: PCM 以外の形式の場合
+    """
+    tag, channels, sample_rate = struct.unpack_from('<HHI', data, offset)
+    (bits,) = struct.unpack_from('<H', data, offset + 14)
+    # 1: PCM, 0xFFFE: WAVE_FORMAT_EXTENSIBLE
+    if tag not in (1, 0xFFFE):
+        raise ValueError(f'未対応の WAV 形式です: {tag}')
+    return AudioFormat(
+        sample_rate=sample_rate,
+        channels=channels,
+        sample_width=bits // 8,
+    )
+
+
+def parse_wav(
+    audio: bytes | bytearray | memoryview,
+) -> tuple[AudioFormat, memoryview]:
+    """WAV データをヘッダーと PCM に分ける
+    PCM はコピーせず、元のデータを参照する memoryview として返します。
+    Args:
+        audio (bytes | bytearray | memoryview): WAV 形式の音声データ
+    Returns:
+        tuple[AudioFormat, memoryview]: 音声の形式と PCM データ
+    Raises:
+        ValueError: WAV 形式でない場合、または PCM 以外の形式の場合
+    """
+    view = memoryview(audio).cast('B')
+
+    if not is_wav(view):
+        raise ValueError('WAV 形式の音声データではありません。')
+
+    audio_format: AudioFormat | None = None
+    offset = 12
+
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset : offset + 4])
+        (chunk_size,) = struct.unpack_from('<I', view, offset + 4)
+        body = offset + 8
+
+        if chunk_id == b'fmt ':
+            audio_format = _parse_fmt_chunk(view, body)
+        elif chunk_id == b'data':
+            if audio_format is None:
+                raise ValueError('WAV の fmt チャンクがありません。')
+            # ストリーミング出力ではサイズが未確定（最大値）の場合がある
+            end = min(body + chunk_size, len(view))
+            return audio_format, view[body:end]
+
+        # チャンクは2バイト境界に揃えられる
+        offset = body + chunk_size + (chunk_size & 1)
+
+    raise ValueError('WAV の data チャンクがありません。')
+
+
+def wav_header(audio_format: AudioFormat, data_size: int) -> bytes:
+    """PCM データの前に付ける WAV ヘッダーを作成する
+    Args:
+        audio_format (AudioFormat): 音声の形式
+        data_size (int): PCM データのバイト数
+    Returns:
+        bytes: 44 バイトの WAV ヘッダー
+    """
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF',
+        36 + data_size,
+        b'WAVE',
+        b'fmt ',
+        16,
+        1,
+        audio_format.channels,
+        audio_format.sample_rate,
+        audio_format.bytes_per_second,
+        audio_format.frame_size,
+        audio_format.sample_width * 8,
+        b'data',
+        data_size,
+    )
+
+
+class AudioBuffer:
+    """PCM とその形式を保持する音声データ
+    PCM は memoryview として保持し、スライスや受け渡しでコピーしません。
+    WAV ヘッダーは WAV 形式が必要になった時点（ffplay での再生や
+    ディスクへの保存）で初めて作成します。
+    Attributes:
+        pcm (memoryview): PCM データ（バイト単位の1次元ビュー）
+        audio_format (AudioFormat): PCM の形式
+    """
+
+    __slots__ = ('pcm', 'audio_format')
+
+    def __init__(
+        self,
+        pcm: bytes | bytearray | memoryview,
+        audio_format: AudioFormat,
+    ):
+        self.pcm = memoryview(pcm).cast('B')
+        self.audio_format = audio_format
+
+    @classmethod
+    def from_wav(cls, audio: bytes | bytearray | memoryview) -> 'AudioBuffer':
+        """WAV データから PCM をコピーせずに作成する
+        Raises:
+            ValueError: WAV 形式でない場合、または PCM 以外の形式の場合
+        """
+        audio_format, pcm = parse_wav(audio)
+        return cls(pcm, audio_format)
+
+    @property
+    def sample_rate(self) -> int:
+        """サンプリングレート (Hz)"""
+        return self.audio_format.sample_rate
+
+    @property
+    def channels(self) -> int:
+        """チャンネル数"""
+        return self.audio_format.channels
+
+    @property
+    def sample_width(self) -> int:
+        """1サンプルあたりのバイト数"""
+        return self.audio_format.sample_width
+
+    @property
+    def nbytes(self) -> int:
+        """PCM のバイト数"""
+        return self.pcm.nbytes
+
+    @property
+    def duration(self) -> float:
+        """再生時間（秒）"""
+        return self.audio_format.duration(self.pcm.nbytes)
+
+    def __len__(self) -> int:
+        return self.pcm.nbytes
+
+    def __repr__(self) -> str:
+        return (
+            f'AudioBuffer({self.nbytes} bytes, {self.sample_rate}Hz, '
+            f'{self.channels}ch, {self.sample_width * 8}bit)'
+        )
+
+    def wav_header(self) -> bytes:
+        """この PCM 用の WAV ヘッダーを作成する"""
+        return wav_header(self.audio_format, self.pcm.nbytes)
+
+    def to_wav(self) -> bytes:
+        """WAV ヘッダーを付けたデータを作成する（PCM を1回コピーする）"""
+        return self.wav_header() + self.pcm
+
+
+class WavStreamParser:
+    """分割して届く WAV データから逐次 PCM を取り出すクラス
+    ヘッダーが揃うまではデータを保持し、以降は届いた分の PCM を
+    フレーム境界に揃えて返します。
+    Attributes:
+        audio_format (AudioFormat | None): ヘッダーから取得した形式（取得前は None）
+    """
+
+    def __init__(self):
+        self.audio_format: AudioFormat | None = None
+        self._pending = bytearray()
+
+    def feed(self, data: bytes) -> bytes:
+        """データを追加し、取り出せる PCM を返す
+        Args:
+            data (bytes): 受信したデータ
+        Returns:
+            bytes: フレーム境界に揃えた PCM（まだない場合は空）
+        Raises:
+            ValueError: WAV 形式でない場合
+        """
+        self._pending += data
+
+        if self.audio_format is None and not self._parse_header():
+            return b''
+
+        assert self.audio_format is not None
+        size = len(self._pending)
+        size -= size % self.audio_format.frame_size
+        pcm = bytes(self._pending[:size])
+        del self._pending[:size]
+        return pcm
+
+    def _parse_header(self) -> bool:
+        """data チャンクの開始位置までのヘッダーを解析する
+        Returns:
+            bool: ヘッダーの解析が完了した場合は True
+        """
+        if len(self._pending) < 12:
+            return False
+        if not is_wav(self._pending):
+            raise ValueError('WAV 形式の音声データではありません。')
+
+        offset = 12
+        audio_format: AudioFormat | None = None
+
+        while offset + 8 <= len(self._pending):
+            chunk_id = bytes(self._pending[offset : offset + 4])
+            (chunk_size,) = struct.unpack_from('<I', self._pending, offset + 4)
+            body = offset + 8
+
+            if chunk_id == b'data':
+                if audio_format is None:
+                    raise ValueError('WAV の fmt チャンクがありません。')
+                self.audio_format = audio_format
+                del self._pending[:body]
+                return True
+
+            # data 以外のチャンクは全体が届くまで待つ
+            if body + chunk_size > len(self._pending):
+                return False
+
+            if chunk_id == b'fmt ':
+                audio_format = _parse_fmt_chunk(self._pending, body)
+
+            offset = body + chunk_size + (chunk_size & 1)
+
+        return False
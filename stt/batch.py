@@ -0,0 +1,544 @@
+"""台本を一括で音声ファイルに変換するコマンド
+
+(キャラクター, テキスト) の行を並べた CSV または JSONL を読み込み、
+GoogleTTSClient または NijiVoiceClient で1行ずつ WAV ファイルに変換します。
+
+- 同時に実行する音声合成の数は `--max-parallel` で制限します。
+- 台本は1行ずつ読み込み、音声は受信した断片から順にファイルへ書き込むため、
+  数万行の台本でもメモリ使用量は同時に処理する行数分で一定です。
+- 完成したファイルは一時ファイルから置き換えるため、中断した後に同じ
+  コマンドを実行すると、出力済みの行を飛ばして続きから再開します。
+
+使い方:
+    python -m stt.batch script.csv --output-dir out/ --max-parallel 8
+    python -m stt.batch script.jsonl --output-dir out/ --backend nijivoice
+
+台本の形式:
+    CSV: ヘッダー行に `character` と `text` の列（`id` の列は任意）
+    JSONL: 1行に1つの {"character": ..., "text": ..., "id": ...}
+    `id` は出力ファイル名になります（省略時は台本の行番号）。
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import re
+import secrets
+import sys
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, TextIO
+
+from .audio import AudioFormat, wav_header
+from .config import CHARACTER_MAP, VOICE_BACKENDS, CharacterID, VoiceBackend
+from .governor import create_governors
+from .metrics import Metrics
+from .output import OutputWriter, StandardOutputWriter
+from .voice import VoiceClient
+
+if TYPE_CHECKING:
+    import httpx
+    from google.genai import Client  # type: ignore
+
+# 出力ファイル名に使える文字
+_SAFE_ID = re.compile(r'^[0-9A-Za-z_.-]+$')
+
+
+@dataclass(frozen=True)
+class ScriptLine:
+    """台本の1行
+    Attributes:
+        id (str): 出力ファイル名に使う識別子
+        character (str): キャラクターID
+        text (str): 音声に変換するテキスト
+    """
+
+    id: str
+    character: str
+    text: str
+
+
+def read_script(path: Path) -> Iterator[ScriptLine]:
+    """台本を1行ずつ読み込む（ファイル全体は読み込まない）
+    Args:
+        path (Path): `.csv` または `.jsonl` の台本
+    Yields:
+        ScriptLine: 台本の1行（空行は飛ばす）
+    Raises:
+        ValueError: 対応していない形式、必要な列がないか空の場合、または
+            出力ファイル名に使えない `id` か、重複した `id` の場合
+    """
+    suffix = path.suffix.lower()
+    if suffix == '.csv':
+        rows = _read_csv(path)
+    elif suffix in ('.jsonl', '.ndjson'):
+        rows = _read_jsonl(path)
+    else:
+        raise ValueError(f'CSV または JSONL の台本のみ対応しています: {path}')
+
+    # 同じ id の行は同じファイルに書き込むため、重複は台本の誤りとする
+    # （保持するのは id だけのため、数万行の台本でも小さい）
+    seen: set[str] = set()
+    for line_number, row in rows:
+        try:
+            character = row['character']
+            text = row['text']
+        except KeyError as e:
+            raise ValueError(f'{path}:{line_number}: {e} の列がありません')
+        # CSV で列が足りない行は、足りない列の値が None になる
+        character = '' if character is None else str(character).strip()
+        text = '' if text is None else str(text).strip()
+        if not character or not text:
+            raise ValueError(
+                f'{path}:{line_number}: character と text は空にできません'
+            )
+
+        # 行番号は桁数をそろえ、ファイル名の順に並ぶようにする
+        line_id = str(row.get('id') or f'{line_number:06d}').strip()
+        if not _SAFE_ID.match(line_id):
+            raise ValueError(
+                f'{path}:{line_number}: ファイル名に使えない id です: {line_id}'
+            )
+        if line_id in seen:
+            raise ValueError(
+                f'{path}:{line_number}: id が重複しています: {line_id}'
+            )
+        seen.add(line_id)
+        yield ScriptLine(id=line_id, character=character, text=text)
+
+
+def _read_csv(path: Path) -> Iterator[tuple[int, dict[str, Any]]]:
+    """CSV の各行を行番号とともに返す"""
+    with path.open(encoding='utf-8', newline='') as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def _read_jsonl(path: Path) -> Iterator[tuple[int, dict[str, Any]]]:
+    """JSONL の各行を行番号とともに返す"""
+    with path.open(encoding='utf-8') as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f'{path}:{line_number}: {e}')
+            if not isinstance(row, dict):
+                raise ValueError(
+                    f'{path}:{line_number}: オブジェクトではありません'
+                )
+            yield line_number, row
+
+
+@dataclass
+class BatchStats:
+    """一括変換の進捗と処理速度
+    Attributes:
+        rendered (int): 音声ファイルを出力した行数
+        skipped (int): 前回までに出力済みのため飛ばした行数
+        failed (int): 音声合成に失敗した行数
+        audio_seconds (float): 出力した音声の合計秒数
+        bytes_written (int): 出力したファイルの合計バイト数
+        started_at (float): 開始時刻（`time.perf_counter` の値）
+    """
+
+    rendered: int = 0
+    skipped: int = 0
+    failed: int = 0
+    audio_seconds: float = 0.0
+    bytes_written: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        """開始からの経過時間（秒）"""
+        return time.perf_counter() - self.started_at
+
+    @property
+    def lines_per_second(self) -> float:
+        """1秒あたりに出力した行数"""
+        elapsed = self.elapsed
+        return self.rendered / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def realtime_factor(self) -> float:
+        """経過時間に対する出力した音声の長さの比率"""
+        elapsed = self.elapsed
+        return self.audio_seconds / elapsed if elapsed > 0 else 0.0
+
+    def report(self) -> str:
+        """進捗と処理速度のレポートを返す"""
+        return (
+            f'完了 {self.rendered} 件 / スキップ {self.skipped} 件 / '
+            f'失敗 {self.failed} 件、経過 {self.elapsed:.1f} 秒、'
+            f'{self.lines_per_second:.2f} 件/秒、'
+            f'音声 {self.audio_seconds:.1f} 秒（実時間の '
+            f'{self.realtime_factor:.1f} 倍）、'
+            f'書き込み {self.bytes_written / 1024 / 1024:.1f} MiB'
+        )
+
+
+class BatchRenderer:
+    """台本の各行を音声合成し、WAV ファイルとして出力するクラス
+    台本の読み込みと音声合成はキューでつなぎ、キューの長さも同時実行数に
+    合わせて制限するため、台本の長さにかかわらずメモリ使用量は一定です。
+    出力した行は `manifest.jsonl` にも1行ずつ追記します。
+    Attributes:
+        _output_dir (Path): 音声ファイルの出力先
+        _backend (VoiceBackend): 使用する音声合成バックエンド
+        _voice_clients (dict[CharacterID, VoiceClient]): キャラクターごとのクライアント
+        _max_parallel (int): 同時に実行する音声合成の最大数
+        stats (BatchStats): 進捗と処理速度
+    """
+
+    # 同時に実行する音声合成の既定の最大数
+    MAX_PARALLEL = 4
+
+    # 進捗を出力する間隔（秒）
+    PROGRESS_INTERVAL = 10.0
+
+    # 出力済みの行を記録するファイル名
+    MANIFEST_NAME = 'manifest.jsonl'
+
+    # 出力する WAV ヘッダーのバイト数
+    WAV_HEADER_SIZE = 44
+
+    def __init__(
+        self,
+        output_dir: Path,
+        backend: VoiceBackend = 'google',
+        genai_client: 'Client | None' = None,
+        nijivoice_api_key: str | None = None,
+        nijivoice_base_url: str | None = None,
+        max_parallel: int = MAX_PARALLEL,
+        metrics: Metrics | None = None,
+        output_writer: OutputWriter = StandardOutputWriter(),
+    ):
+        """
+        Args:
+            output_dir (Path): 音声ファイルの出力先
+            backend (VoiceBackend): 使用する音声合成バックエンド
+            genai_client (Client | None): google バックエンドのクライアント
+            nijivoice_api_key (str | None): nijivoice バックエンドの API キー
+            nijivoice_base_url (str | None): にじボイス API のベース URL
+            max_parallel (int): 同時に実行する音声合成の最大数
+            metrics (Metrics | None): 1行ごとの所要時間の計測先
+            output_writer (OutputWriter): 進捗とエラーの出力先
+        Raises:
+            ValueError: バックエンドに必要なクライアントや API キーがない場合
+        """
+        if backend == 'google' and genai_client is None:
+            raise ValueError(
+                'google バックエンドには GEMINI_API_KEY が必要です'
+            )
+        if backend == 'nijivoice' and not nijivoice_api_key:
+            raise ValueError(
+                'nijivoice バックエンドには NIJIVOICE_API_KEY が必要です'
+            )
+        if max_parallel < 1:
+            raise ValueError('max_parallel は 1 以上を指定してください')
+
+        self._output_dir = output_dir
+        self._backend = backend
+        self._genai_client = genai_client
+        self._nijivoice_api_key = nijivoice_api_key
+        self._nijivoice_base_url = nijivoice_base_url
+        self._max_parallel = max_parallel
+        self._metrics = metrics or Metrics()
+        self._output = output_writer
+        self._voice_clients: dict[CharacterID, VoiceClient] = {}
+        self._http: httpx.AsyncClient | None = None
+        self._governors = create_governors(self._metrics)
+        self.stats = BatchStats()
+
+    def output_path(self, line: ScriptLine) -> Path:
+        """行の音声ファイルのパスを返す"""
+        return self._output_dir / f'{line.id}.wav'
+
+    async def render(self, lines: Iterable[ScriptLine]) -> BatchStats:
+        """台本のすべての行を音声ファイルに変換する
+        失敗した行は出力して続行し、次回の実行で再び変換します。
+        同じ id の行が複数ある場合は、最初の行だけを変換し、残りは失敗とします。
+        Args:
+            lines (Iterable[ScriptLine]): 台本の行（順に読み込まれる）
+        Returns:
+            BatchStats: 進捗と処理速度
+        """
+        self._output_dir.mkdir(parents=True, exist_ok=True)
+        self.stats = BatchStats()
+        queue: asyncio.Queue[ScriptLine | None] = asyncio.Queue(
+            maxsize=self._max_parallel * 2
+        )
+
+        with (self._output_dir / self.MANIFEST_NAME).open(
+            'a', encoding='utf-8'
+        ) as manifest:
+            workers = [
+                asyncio.create_task(self._work(queue, manifest))
+                for _ in range(self._max_parallel)
+            ]
+            progress = asyncio.create_task(self._report_progress())
+            seen: set[str] = set()
+            try:
+                for line in lines:
+                    if line.id in seen:
+                        self.stats.failed += 1
+                        self._output.print(
+                            f'{line.id}: 同じ id の行があるため変換しません'
+                        )
+                        continue
+                    seen.add(line.id)
+                    # 出力済みの行は音声合成せずに飛ばす
+                    if self.output_path(line).exists():
+                        self.stats.skipped += 1
+                        continue
+                    await queue.put(line)
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                progress.cancel()
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(progress, *workers, return_exceptions=True)
+
+        return self.stats
+
+    async def _work(
+        self,
+        queue: 'asyncio.Queue[ScriptLine | None]',
+        manifest: TextIO,
+    ) -> None:
+        """キューから行を取り出して音声ファイルに変換する"""
+        while (line := await queue.get()) is not None:
+            try:
+                with self._metrics.span('batch.render'):
+                    audio_format, size = await self._render_line(line)
+            except Exception as e:
+                self.stats.failed += 1
+                self._output.print(f'{line.id}: 音声合成に失敗しました: {e}')
+                continue
+
+            duration = audio_format.duration(size)
+            self.stats.rendered += 1
+            self.stats.audio_seconds += duration
+            self.stats.bytes_written += self.WAV_HEADER_SIZE + size
+            manifest.write(
+                json.dumps(
+                    {
+                        'id': line.id,
+                        'character': line.character,
+                        'text': line.text,
+                        'file': self.output_path(line).name,
+                        'duration': round(duration, 3),
+                    },
+                    ensure_ascii=False,
+                )
+                + '\n'
+            )
+            manifest.flush()
+
+    async def _render_line(self, line: ScriptLine) -> tuple[AudioFormat, int]:
+        """1行を音声合成し、受信した PCM から順にファイルへ書き込む
+        WAV ヘッダーの長さは受信し終わるまで分からないため、仮のヘッダーを
+        書いておき、最後に書き直してから出力ファイルに置き換えます。
+        Returns:
+            tuple[AudioFormat, int]: 音声の形式と PCM のバイト数
+        Raises:
+            ValueError: 不明なキャラクター、または音声を受信できなかった場合
+        """
+        voice_client = self._get_voice_client(line.character)
+        path = self.output_path(line)
+        # 書き込み中のファイルは書き込みごとに別の名前にし、混ざらないようにする
+        part_name = f'{path.name}.{secrets.token_hex(4)}.part'
+        part_path = path.with_name(part_name)
+
+        audio_format: AudioFormat | None = None
+        size = 0
+        try:
+            # PCM の断片は小さいため、書き込みはイベントループ上で行う
+            with part_path.open('wb') as file:
+                file.write(bytes(self.WAV_HEADER_SIZE))
+                async for chunk in voice_client.stream_speech(line.text):
+                    if audio_format is None:
+                        audio_format = chunk.audio_format
+                    elif chunk.audio_format != audio_format:
+                        raise ValueError('音声の形式が途中で変わりました')
+                    file.write(chunk.pcm)
+                    size += chunk.nbytes
+
+                if audio_format is None:
+                    raise ValueError('音声を受信できませんでした')
+                file.seek(0)
+                file.write(wav_header(audio_format, size))
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+
+        os.replace(part_path, path)
+        return audio_format, size
+
+    def _get_voice_client(self, character_id: str) -> VoiceClient:
+        """キャラクターの音声合成クライアントを取得する（未作成の場合は新規作成）
+        Raises:
+            ValueError: 不明なキャラクターの場合
+        """
+        for character in CHARACTER_MAP:
+            if character.id == character_id:
+                break
+        else:
+            raise ValueError(f'不明なキャラクターです: {character_id}')
+
+        voice_client = self._voice_clients.get(character.id)
+        if voice_client is not None:
+            return voice_client
+
+        # 使用するバックエンドのクライアントだけを読み込む
+        if self._backend == 'nijivoice':
+            from .nijivoice import NijiVoiceClient
+
+            assert self._nijivoice_api_key is not None
+            if self._http is None:
+                import httpx
+
+                # 同時実行数だけ接続を使い回す
+                self._http = NijiVoiceClient.create_http_client(
+                    limits=httpx.Limits(
+                        max_connections=self._max_parallel,
+                        max_keepalive_connections=self._max_parallel,
+                    )
+                )
+            voice_client = NijiVoiceClient.create_from_character_id(
+                api_key=self._nijivoice_api_key,
+                character_id=character.id,
+                http_client=self._http,
+                metrics=self._metrics,
+                base_url=self._nijivoice_base_url or NijiVoiceClient.BASE_URL,
+                governor=self._governors['nijivoice'],
+            )
+        else:
+            from .googlevoice import GoogleTTSClient
+
+            assert self._genai_client is not None
+            voice_client = GoogleTTSClient.create_from_character_id(
+                client=self._genai_client,
+                character_id=character.id,
+                metrics=self._metrics,
+                governor=self._governors['gemini'],
+            )
+
+        self._voice_clients[character.id] = voice_client
+        return voice_client
+
+    async def _report_progress(self) -> None:
+        """一定間隔で進捗を出力する"""
+        while True:
+            await asyncio.sleep(self.PROGRESS_INTERVAL)
+            self._output.print(self.stats.report())
+
+    async def aclose(self) -> None:
+        """音声合成クライアントと共有している接続を閉じる"""
+        for voice_client in self._voice_clients.values():
+            await voice_client.aclose()
+        self._voice_clients.clear()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def __aenter__(self) -> 'BatchRenderer':
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.aclose()
+
+
+async def render_script(
+    script: Path,
+    output_dir: Path,
+    backend: VoiceBackend = 'google',
+    max_parallel: int = BatchRenderer.MAX_PARALLEL,
+    output_writer: OutputWriter = StandardOutputWriter(),
+) -> BatchStats:
+    """環境変数の API キーで台本を音声ファイルに変換する
+    Raises:
+        OSError: 必要な環境変数が設定されていない場合
+    """
+    genai_client = None
+    if backend == 'google':
+        gemini_api_key = os.getenv('GEMINI_API_KEY')
+        if not gemini_api_key:
+            raise OSError('GEMINI_API_KEYが設定されていません。')
+
+        from google.genai import Client  # type: ignore
+
+        genai_client = Client(api_key=gemini_api_key)
+
+    nijivoice_api_key = os.getenv('NIJIVOICE_API_KEY')
+    if backend == 'nijivoice' and not nijivoice_api_key:
+        raise OSError('NIJIVOICE_API_KEYが設定されていません。')
+
+    async with BatchRenderer(
+        output_dir,
+        backend=backend,
+        genai_client=genai_client,
+        nijivoice_api_key=nijivoice_api_key,
+        max_parallel=max_parallel,
+        output_writer=output_writer,
+    ) as renderer:
+        return await renderer.render(read_script(script))
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(prog='python -m stt.batch')
+    parser.add_argument('script', type=Path, help='CSV または JSONL の台本')
+    parser.add_argument(
+        '--output-dir', type=Path, required=True, help='音声ファイルの出力先'
+    )
+    parser.add_argument(
+        '--backend',
+        choices=VOICE_BACKENDS,
+        default=os.getenv('VOICE_CLIENT_MODE', 'google'),
+        help='使用する音声合成バックエンド（デフォルトは VOICE_CLIENT_MODE）',
+    )
+    parser.add_argument(
+        '--max-parallel',
+        type=int,
+        default=BatchRenderer.MAX_PARALLEL,
+        help='同時に実行する音声合成の最大数',
+    )
+    args = parser.parse_args()
+
+    output = StandardOutputWriter()
+    try:
+        stats = asyncio.run(
+            render_script(
+                args.script,
+                args.output_dir,
+                backend=args.backend,
+                max_parallel=args.max_parallel,
+                output_writer=output,
+            )
+        )
+    except KeyboardInterrupt:
+        output.print(
+            '中断しました。同じコマンドを実行すると続きから再開します。'
+        )
+        sys.exit(130)
+
+    output.print(stats.report())
+    if stats.failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""外部サービスとマイクを使わずに会話の遅延を計測するベンチマーク
+
+Gemini・にじボイス・Google Speech Recognition・マイクを、待ち時間の分布を
+設定できる疑似実装に置き換えて TalkController を動かします。
+"""
+
+from .dsp import StageResult, run_dsp_benchmark
+from .fake_audio import (
+    FakeSpeechRecognizer,
+    NullEffectPlayer,
+    SimulatedPlaybackEngine,
+    WavFileSource,
+    make_script_wav,
+)
+from .fake_genai import FakeGenAIClient
+from .fake_nijivoice import FakeNijiVoiceServer
+from .harness import (
+    BenchmarkConfig,
+    BenchmarkResult,
+    TurnRecorder,
+    compare,
+    run_benchmark,
+)
+from .latency import LatencyModel
+
+__all__ = [
+    # 待ち時間の分布
+    'LatencyModel',
+    # 疑似バックエンド
+    'FakeGenAIClient',
+    'FakeNijiVoiceServer',
+    'FakeSpeechRecognizer',
+    'NullEffectPlayer',
+    'SimulatedPlaybackEngine',
+    'WavFileSource',
+    'make_script_wav',
+    # ベンチマークの実行
+    'BenchmarkConfig',
+    'BenchmarkResult',
+    'TurnRecorder',
+    'compare',
+    'run_benchmark',
+    # 音声の後処理の速度
+    'StageResult',
+    'run_dsp_benchmark',
+]
@@ -0,0 +1,86 @@
+"""疑似バックエンドで会話の遅延を計測するベンチマーク
+
+使い方:
+    python -m stt.bench --backend google --turns 5 --output bench/google.json
+    python -m stt.bench --baseline bench/google.json
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+from ..codec import TRANSFER_FORMATS
+from .harness import BenchmarkConfig, compare, run_benchmark
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m stt.bench')
+    parser.add_argument(
+        '--backend', choices=('google', 'nijivoice'), default='google'
+    )
+    parser.add_argument(
+        '--transfer-format',
+        choices=TRANSFER_FORMATS,
+        default='wav',
+        help='にじボイスから受信する音声の形式（既定: wav）',
+    )
+    parser.add_argument(
+        '--bandwidth',
+        type=float,
+        default=BenchmarkConfig.nijivoice_bytes_per_second,
+        help='にじボイスの音声ファイルの送信帯域（バイト/秒）',
+    )
+    parser.add_argument('--turns', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--output', type=Path, help='結果を保存する JSON ファイル'
+    )
+    parser.add_argument(
+        '--baseline', type=Path, help='比較する基準の JSON ファイル'
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.1,
+        help='悪化とみなす増加率（既定: 0.1）',
+    )
+    parser.add_argument(
+        '--no-trace-memory',
+        action='store_true',
+        help='tracemalloc によるメモリ計測を行わない',
+    )
+    args = parser.parse_args()
+
+    config = BenchmarkConfig(
+        backend=args.backend,
+        nijivoice_bytes_per_second=args.bandwidth,
+        nijivoice_transfer_format=args.transfer_format,
+        turns=args.turns,
+        seed=args.seed,
+        trace_memory=not args.no_trace_memory,
+    )
+    result = asyncio.run(run_benchmark(config))
+
+    for line in result.report():
+        print(line)
+
+    if args.output is not None:
+        result.save(args.output)
+        print(f'結果を保存しました: {args.output}')
+
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text(encoding='utf-8'))
+        lines, regressed = compare(
+            baseline, result.to_dict(), threshold=args.threshold
+        )
+        print(f'--- {args.baseline} との比較 ---')
+        for line in lines:
+            print(line)
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""音声の後処理（stt.dsp）の処理速度を計測するベンチマーク
+
+合成音声を模した信号を断片に分けて後処理し、処理の段階ごとに
+音声1秒あたりの処理時間と、断片1つあたりの処理時間を計測します。
+
+使い方:
+    python -m stt.bench.dsp --seconds 60 --chunk-ms 40 --target-rate 48000
+    python -m stt.bench.dsp --min-speed 50  # 実時間の 50 倍未満なら失敗
+"""
+
+import argparse
+import sys
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from ..audio import AudioBuffer, AudioFormat
+from ..dsp import SpeechPostProcessor
+from ..metrics import Histogram
+
+# 計測する段階と、それぞれの SpeechPostProcessor の設定
+# （無効にした処理は行わずに計測する）
+STAGES: dict[str, dict[str, bool]] = {
+    'trim': {'trim': True, 'normalize': False, 'resample': False},
+    'normalize': {'trim': False, 'normalize': True, 'resample': False},
+    'resample': {'trim': False, 'normalize': False, 'resample': True},
+    'all': {'trim': True, 'normalize': True, 'resample': True},
+}
+
+
+def make_speech_like(
+    seconds: float, audio_format: AudioFormat, seed: int = 0
+) -> AudioBuffer:
+    """合成音声を模した信号を作成する
+    先頭と末尾の無音と、音量の揺れる倍音と雑音の区間を交互に並べます。
+    Args:
+        seconds (float): 信号の長さ（秒）
+        audio_format (AudioFormat): 作成する PCM の形式
+        seed (int): 乱数のシード
+    Returns:
+        AudioBuffer: 作成した信号
+    """
+    rng = np.random.default_rng(seed)
+    rate = audio_format.sample_rate
+    t = np.arange(int(rate * seconds)) / rate
+    voice = sum(
+        np.sin(2 * np.pi * 180 * k * t) / k for k in range(1, 6)
+    ) + rng.normal(0, 0.05, t.size)
+    # 0.4 秒ごとに発話と間を切り替え、音節ごとに音量を揺らす
+    envelope = (np.sin(2 * np.pi * 1.25 * t) > -0.3) * (
+        0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+    )
+    signal = voice * envelope * 0.2
+    signal[: int(rate * 0.3)] = 0.0
+    signal[-int(rate * 0.5) :] = 0.0
+    signal += rng.normal(0, 1e-4, t.size)
+
+    peak = 2 ** (audio_format.sample_width * 8 - 1) - 1
+    samples = np.clip(signal, -1.0, 1.0) * peak
+    samples = np.repeat(samples, audio_format.channels)
+    return AudioBuffer(
+        samples.astype(f'<i{audio_format.sample_width}').tobytes(),
+        audio_format,
+    )
+
+
+@dataclass
+class StageResult:
+    """1つの段階の計測結果
+    Attributes:
+        name (str): 段階の名前
+        audio_seconds (float): 処理した音声の長さ（秒）
+        processing_seconds (float): 処理にかかった時間（秒）
+        chunk (Histogram): 断片1つあたりの処理時間（秒）
+    """
+
+    name: str
+    audio_seconds: float
+    processing_seconds: float
+    chunk: Histogram
+
+    @property
+    def speed(self) -> float:
+        """実時間の何倍の速さで処理できたか"""
+        return self.audio_seconds / max(self.processing_seconds, 1e-9)
+
+    def report(self) -> str:
+        """結果を1行の文字列にする"""
+        chunk = self.chunk.summary()
+        return (
+            f'{self.name:<10} {self.speed:8.0f}x realtime  '
+            f'chunk p50 {chunk.p50 * 1000:6.3f}ms / '
+            f'p95 {chunk.p95 * 1000:6.3f}ms / max {chunk.max * 1000:6.3f}ms'
+        )
+
+
+def run_dsp_benchmark(
+    seconds: float = 30.0,
+    chunk_seconds: float = 0.04,
+    source_format: AudioFormat = AudioFormat(sample_rate=24000),
+    target_rate: int = 48000,
+    repeat: int = 3,
+) -> list[StageResult]:
+    """段階ごとに後処理の速度を計測する
+    Args:
+        seconds (float): 1回に処理する音声の長さ（秒）
+        chunk_seconds (float): 断片1つの長さ（秒）
+        source_format (AudioFormat): 入力の形式（Gemini TTS は 24kHz モノラル）
+        target_rate (int): 変換後のサンプリングレート
+        repeat (int): 繰り返す回数
+    Returns:
+        list[StageResult]: 段階ごとの結果
+    """
+    audio = make_speech_like(seconds, source_format)
+    chunk_size = (
+        max(1, int(source_format.sample_rate * chunk_seconds))
+        * source_format.frame_size
+    )
+    chunks = [
+        AudioBuffer(audio.pcm[i : i + chunk_size], source_format)
+        for i in range(0, audio.nbytes, chunk_size)
+    ]
+
+    results: list[StageResult] = []
+    for name, stage in STAGES.items():
+        histogram = Histogram()
+        processing_seconds = 0.0
+        for _ in range(repeat):
+            processor = SpeechPostProcessor(
+                sample_rate=target_rate if stage['resample'] else None,
+                target_dbfs=(
+                    SpeechPostProcessor.TARGET_DBFS
+                    if stage['normalize']
+                    else None
+                ),
+                trim_silence=stage['trim'],
+            )
+            for chunk in [*chunks, None]:
+                started_at = time.perf_counter()
+                if chunk is None:
+                    processor.flush()
+                else:
+                    processor.process(chunk)
+                elapsed = time.perf_counter() - started_at
+                histogram.observe(elapsed)
+                processing_seconds += elapsed
+        results.append(
+            StageResult(
+                name=name,
+                audio_seconds=audio.duration * repeat,
+                processing_seconds=processing_seconds,
+                chunk=histogram,
+            )
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m stt.bench.dsp')
+    parser.add_argument(
+        '--seconds', type=float, default=30.0, help='処理する音声の長さ'
+    )
+    parser.add_argument(
+        '--chunk-ms', type=float, default=40.0, help='断片1つの長さ（ミリ秒）'
+    )
+    parser.add_argument('--source-rate', type=int, default=24000)
+    parser.add_argument('--target-rate', type=int, default=48000)
+    parser.add_argument('--channels', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument(
+        '--min-speed',
+        type=float,
+        default=0.0,
+        help='いずれかの処理がこの倍率（実時間比）未満の場合に終了コード 1 で終了する',
+    )
+    args = parser.parse_args()
+
+    results = run_dsp_benchmark(
+        seconds=args.seconds,
+        chunk_seconds=args.chunk_ms / 1000,
+        source_format=AudioFormat(
+            sample_rate=args.source_rate, channels=args.channels
+        ),
+        target_rate=args.target_rate,
+        repeat=args.repeat,
+    )
+    print(
+        f'{args.seconds:.0f}s x {args.repeat} / chunk {args.chunk_ms:.0f}ms / '
+        f'{args.source_rate}Hz -> {args.target_rate}Hz, {args.channels}ch'
+    )
+    for result in results:
+        print(result.report())
+
+    slow = [r.name for r in results if r.speed < args.min_speed]
+    if slow:
+        print(
+            f'実時間の {args.min_speed:.0f} 倍に届きません: {", ".join(slow)}'
+        )
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
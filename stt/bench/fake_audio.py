@@ -0,0 +1,191 @@
+import asyncio
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+import numpy as np
+import speech_recognition as sr  # type: ignore
+
+from ..audio import AudioBuffer, AudioFormat, parse_wav, wav_header
+from ..capture import AudioSource
+from ..effect import NullEffectPlayer
+from ..exceptions import SpeechRecognitionError
+from ..metrics import Metrics
+from ..output import OutputWriter, SilentOutputWriter
+from ..playback import PlaybackEngine
+from ..speech_recognition import SpeechRecognizer
+from .latency import LatencyModel
+
+
+class WavFileSource(AudioSource):
+    """WAV ファイルの音声をマイク入力の代わりに供給するクラス
+    `realtime` が True の場合は読み込みのたびに1フレーム分の時間を待つため、
+    マイクと同じ速さで発話区間検出が進みます。読み込まれていない間は
+    フレームが溜まらない（応答中に話した音声を失わない）点がマイクとの違いです。
+    """
+
+    FRAME_MS = 30
+
+    def __init__(
+        self,
+        audio: Path | bytes,
+        realtime: bool = True,
+        frame_ms: int = FRAME_MS,
+    ):
+        """
+        Raises:
+            ValueError: WAV でない場合、または 16bit でない場合
+        """
+        data = audio.read_bytes() if isinstance(audio, Path) else audio
+        audio_format, pcm = parse_wav(data)
+        if audio_format.sample_width != 2:
+            raise ValueError('16bit の WAV のみ使用できます')
+
+        super().__init__(audio_format=audio_format, frame_ms=frame_ms)
+        self._pcm = pcm
+        self._offset = 0
+        self._realtime = realtime
+        self._next_frame_at = 0.0
+        self._started = False
+
+    async def start(self) -> None:
+        self._started = True
+
+    async def read(self) -> bytes:
+        if not self._started or self._offset >= len(self._pcm):
+            raise EOFError
+
+        if self._realtime:
+            # 前回の読み込みから時間が空いた場合は現在時刻から数え直す
+            now = time.monotonic()
+            self._next_frame_at = (
+                max(self._next_frame_at, now) + self.frame_ms / 1000
+            )
+            await asyncio.sleep(self._next_frame_at - now)
+
+        frame = bytes(self._pcm[self._offset : self._offset + self.frame_bytes])
+        self._offset += self.frame_bytes
+        # 最後のフレームは無音で埋めて長さを揃える
+        return frame.ljust(self.frame_bytes, b'\0')
+
+    def close(self) -> None:
+        self._started = False
+
+
+def make_script_wav(
+    utterances: int,
+    speech_seconds: float = 1.2,
+    gap_seconds: float = 0.8,
+    lead_seconds: float = 0.6,
+    sample_rate: int = 16000,
+    seed: int = 0,
+) -> bytes:
+    """発話を模した音声と無音を交互に並べた WAV を作成する
+    発話区間は振幅を揺らした雑音、無音区間は小さな雑音です。
+    Args:
+        utterances (int): 発話の数
+        speech_seconds (float): 1発話の長さ
+        gap_seconds (float): 発話の間の無音の長さ
+        lead_seconds (float): 最初の発話の前の無音（周囲音の測定に使われる）
+        sample_rate (int): サンプリングレート
+        seed (int): 乱数のシード
+    Returns:
+        bytes: 16bit モノラルの WAV データ
+    """
+    rng = np.random.default_rng(seed)
+
+    def noise(seconds: float, amplitude: float) -> np.ndarray:
+        return rng.normal(0, amplitude, int(seconds * sample_rate))
+
+    def speech(seconds: float) -> np.ndarray:
+        samples = noise(seconds, 3000)
+        # 音節のような 4Hz の強弱を付ける
+        t = np.arange(samples.size) / sample_rate
+        return samples * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+
+    parts = [noise(lead_seconds, 30)]
+    for _ in range(utterances):
+        parts += [speech(speech_seconds), noise(gap_seconds, 30)]
+
+    pcm = np.clip(np.concatenate(parts), -32768, 32767).astype('<i2').tobytes()
+    return wav_header(AudioFormat(sample_rate=sample_rate), len(pcm)) + pcm
+
+
+class FakeSpeechRecognizer(SpeechRecognizer):
+    """Google Speech Recognition の代わりに用意した文字列を返す音声認識
+    発話の検出は SpeechRecognizer と同じ処理を使い、認識処理だけを
+    設定した待ち時間の後に台本の文字列を返す処理に置き換えます。
+    """
+
+    def __init__(
+        self,
+        transcripts: Iterable[str],
+        audio_source: AudioSource,
+        latency: LatencyModel | None = None,
+        output_writer: OutputWriter = SilentOutputWriter(),
+        metrics: Metrics | None = None,
+    ):
+        super().__init__(
+            effect_player=NullEffectPlayer(),
+            output_writer=output_writer,
+            audio_source=audio_source,
+            metrics=metrics,
+        )
+        self._transcripts = iter(transcripts)
+        self._latency = latency or LatencyModel(0.35, 0.1)
+
+    def _recognize(self, audio: sr.AudioData) -> str:
+        # 認識はワーカースレッドで実行されるため、同期的に待つ
+        time.sleep(self._latency.sample())
+        try:
+            return next(self._transcripts)
+        except StopIteration:
+            raise SpeechRecognitionError('台本の発話がありません')
+
+
+class SimulatedPlaybackEngine(PlaybackEngine):
+    """出力デバイスを使わず、再生時間だけを模擬する再生エンジン
+    追加された音声の長さから再生終了時刻を計算するため、`drain` は実際の
+    再生と同じだけ待ちます。応答の途中で再生する音声が途切れた回数と
+    長さも記録します。
+    Attributes:
+        played_seconds (float): 再生した音声の合計秒数
+        gaps (int): 応答の途中で音声が途切れた回数
+        gap_seconds (float): 途切れていた合計秒数
+    """
+
+    def __init__(self):
+        self._ends_at = 0.0
+        self._active = False
+        self.played_seconds = 0.0
+        self.gaps = 0
+        self.gap_seconds = 0.0
+
+    @property
+    def is_playing(self) -> bool:
+        return time.monotonic() < self._ends_at
+
+    async def enqueue(self, audio: AudioBuffer) -> None:
+        if not audio:
+            return
+
+        now = time.monotonic()
+        if self._active and now > self._ends_at:
+            self.gaps += 1
+            self.gap_seconds += now - self._ends_at
+
+        duration = audio.duration
+        self._ends_at = max(self._ends_at, now) + duration
+        self.played_seconds += duration
+        self._active = True
+
+    async def drain(self) -> None:
+        await asyncio.sleep(max(0.0, self._ends_at - time.monotonic()))
+        self._active = False
+
+    def flush(self) -> None:
+        self._ends_at = time.monotonic()
+        self._active = False
+
+    def stop(self) -> None:
+        self.flush()
@@ -0,0 +1,418 @@
+import asyncio
+import itertools
+from collections.abc import AsyncIterator, Iterable
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from google.genai import errors, types  # type: ignore
+
+from .latency import LatencyModel
+
+# 応答を指定しない場合に繰り返し使う台詞
+DEFAULT_REPLIES = (
+    'こんにちは！今日はどんな一日だった？私はずっとあなたと話したかったんだ。',
+    'なるほどね、それは大変だったね。でも、ちゃんと頑張ってえらいと思うよ。',
+    'え、本当に？もっと詳しく聞かせてほしいな。続きが気になっちゃう！',
+)
+
+
+def text_response(text: str) -> types.GenerateContentResponse:
+    """テキストの応答を作成する"""
+    return types.GenerateContentResponse(
+        candidates=[
+            types.Candidate(
+                content=types.Content(
+                    role='model', parts=[types.Part(text=text)]
+                ),
+                finish_reason=types.FinishReason.STOP,
+            )
+        ]
+    )
+
+
+def _audio_response(
+    pcm: bytes, sample_rate: int
+) -> types.GenerateContentResponse:
+    """PCM 音声の応答を作成する"""
+    return types.GenerateContentResponse(
+        candidates=[
+            types.Candidate(
+                content=types.Content(
+                    role='model',
+                    parts=[
+                        types.Part(
+                            inline_data=types.Blob(
+                                data=pcm,
+                                mime_type=f'audio/L16;codec=pcm;rate={sample_rate}',
+                            )
+                        )
+                    ],
+                )
+            )
+        ]
+    )
+
+
+def _client_error(code: int, status: str, message: str) -> errors.ClientError:
+    """Gemini API と同じ形式のクライアントエラーを作成する"""
+    return errors.ClientError(
+        code, {'error': {'code': code, 'message': message, 'status': status}}
+    )
+
+
+class FakeAsyncCaches:
+    """`client.aio.caches` の疑似実装
+    作成したキャッシュを有効期限とともに保持し、期限切れや削除済みの
+    キャッシュを使ったリクエストは Gemini API と同じく 404 で失敗させます。
+    Attributes:
+        contents (dict[str, types.CachedContent]): 保持しているキャッシュ
+        available (bool): False の場合、作成を 400 で失敗させる
+            （キャッシュに対応していないモデルなどを模す）
+        created (int): 作成したキャッシュの数
+    """
+
+    def __init__(self, available: bool = True):
+        self.contents: dict[str, types.CachedContent] = {}
+        self.available = available
+        self.created = 0
+
+    async def create(
+        self, *, model: str, config: Any = None
+    ) -> types.CachedContent:
+        if not self.available:
+            raise _client_error(
+                400, 'INVALID_ARGUMENT', 'Caching is not supported.'
+            )
+        self.created += 1
+        now = datetime.now(UTC)
+        content = types.CachedContent(
+            name=f'cachedContents/fake-{self.created}',
+            display_name=getattr(config, 'display_name', None),
+            model=model,
+            create_time=now,
+            update_time=now,
+            expire_time=now + _ttl(config),
+        )
+        assert content.name is not None
+        self.contents[content.name] = content
+        return content
+
+    async def get(
+        self, *, name: str, config: Any = None
+    ) -> types.CachedContent:
+        return self.require(name)
+
+    async def update(
+        self, *, name: str, config: Any = None
+    ) -> types.CachedContent:
+        content = self.require(name)
+        now = datetime.now(UTC)
+        content.update_time = now
+        content.expire_time = now + _ttl(config)
+        return content
+
+    async def delete(self, *, name: str, config: Any = None) -> None:
+        self.require(name)
+        del self.contents[name]
+
+    def expire(self, name: str) -> None:
+        """キャッシュを期限切れにする（期限切れのリクエストを試すため）"""
+        self.require(name).expire_time = datetime.now(UTC)
+
+    def require(self, name: str) -> types.CachedContent:
+        """有効期限内のキャッシュを返す（ない場合は 404 で失敗させる）"""
+        content = self.contents.get(name)
+        if content is None or (
+            content.expire_time is not None
+            and content.expire_time <= datetime.now(UTC)
+        ):
+            self.contents.pop(name, None)
+            raise _client_error(
+                404, 'NOT_FOUND', f'CachedContent not found: {name}'
+            )
+        return content
+
+
+class FakeAsyncModels:
+    """`client.aio.models` の疑似実装
+    `response_modalities` に AUDIO を含む設定で呼ばれた場合は無音の PCM を、
+    それ以外の場合は用意した台詞を返します。`cached_content` を指定した
+    リクエストは、キャッシュが有効な場合のみ受け付けます。
+    Attributes:
+        requests (int): 受け付けたリクエスト数
+        cached_requests (int): キャッシュを使ったリクエスト数
+    """
+
+    # 音声の形式（Gemini TTS と同じ 24kHz / 16bit / モノラル）
+    SAMPLE_RATE = 24000
+    SAMPLE_WIDTH = 2
+
+    def __init__(
+        self,
+        replies: Iterable[str],
+        chat_ttft: LatencyModel,
+        chat_token_interval: LatencyModel,
+        tts_ttfb: LatencyModel,
+        tts_realtime_factor: float,
+        chars_per_second: float,
+        token_chars: int,
+        audio_chunk_seconds: float,
+        caches: FakeAsyncCaches | None = None,
+    ):
+        self._replies = itertools.cycle(tuple(replies))
+        self._chat_ttft = chat_ttft
+        self._chat_token_interval = chat_token_interval
+        self._tts_ttfb = tts_ttfb
+        self._tts_realtime_factor = tts_realtime_factor
+        self._chars_per_second = chars_per_second
+        self._token_chars = token_chars
+        self._audio_chunk_seconds = audio_chunk_seconds
+        self._caches = caches or FakeAsyncCaches()
+        self.requests = 0
+        self.cached_requests = 0
+
+    def _check_cached_content(self, config: Any) -> None:
+        """キャッシュを使うリクエストの場合は、キャッシュが有効か確認する"""
+        name = getattr(config, 'cached_content', None)
+        if name is None:
+            return
+        if getattr(config, 'system_instruction', None) is not None:
+            raise _client_error(
+                400,
+                'INVALID_ARGUMENT',
+                'CachedContent can not be used with system_instruction.',
+            )
+        self._caches.require(name)
+        self.cached_requests += 1
+
+    async def generate_content(
+        self, *, model: str, contents: Any, config: Any = None
+    ) -> types.GenerateContentResponse:
+        self._check_cached_content(config)
+        self.requests += 1
+        if _is_audio(config):
+            pcm = b''.join(
+                [chunk async for chunk in self._speech(last_text(contents))]
+            )
+            return _audio_response(pcm, self.SAMPLE_RATE)
+
+        text = next(self._replies)
+        await self._chat_ttft.sleep()
+        for _ in _split(text, self._token_chars)[1:]:
+            await self._chat_token_interval.sleep()
+        return text_response(text)
+
+    async def generate_content_stream(
+        self, *, model: str, contents: Any, config: Any = None
+    ) -> AsyncIterator[types.GenerateContentResponse]:
+        self._check_cached_content(config)
+        self.requests += 1
+        if _is_audio(config):
+            return self._stream_audio(last_text(contents))
+        return self._stream_text(next(self._replies))
+
+    async def _stream_text(
+        self, text: str
+    ) -> AsyncIterator[types.GenerateContentResponse]:
+        """応答の台詞を一定の文字数ずつ返す"""
+        await self._chat_ttft.sleep()
+        for index, token in enumerate(_split(text, self._token_chars)):
+            if index:
+                await self._chat_token_interval.sleep()
+            yield text_response(token)
+
+    async def _stream_audio(
+        self, text: str
+    ) -> AsyncIterator[types.GenerateContentResponse]:
+        """音声を一定の長さずつ返す"""
+        async for pcm in self._speech(text):
+            yield _audio_response(pcm, self.SAMPLE_RATE)
+
+    async def _speech(self, text: str) -> AsyncIterator[bytes]:
+        """テキストの長さに応じた無音の PCM を生成速度に合わせて返す"""
+        await self._tts_ttfb.sleep()
+        remaining = max(len(text), 1) / self._chars_per_second
+        while remaining > 0:
+            seconds = min(self._audio_chunk_seconds, remaining)
+            remaining -= seconds
+            await asyncio.sleep(seconds * self._tts_realtime_factor)
+            frames = int(seconds * self.SAMPLE_RATE)
+            yield bytes(frames * self.SAMPLE_WIDTH)
+
+
+class FakeAsyncChat:
+    """`chats.AsyncChat` の疑似実装
+    SDK と同様に、最後まで受信できた応答だけを履歴に追加します。
+    """
+
+    def __init__(self, models: FakeAsyncModels, model: str, config: Any):
+        self._models = models
+        self._model = model
+        self._config = config
+        self._history: list[types.Content] = []
+
+    async def send_message(
+        self, message: str, config: Any = None
+    ) -> types.GenerateContentResponse:
+        user_input = types.Content(
+            role='user', parts=[types.Part(text=message)]
+        )
+        response = await self._models.generate_content(
+            model=self._model,
+            contents=[*self._history, user_input],
+            config=config or self._config,
+        )
+        self._history += [
+            user_input,
+            types.Content(
+                role='model', parts=[types.Part(text=response.text or '')]
+            ),
+        ]
+        return response
+
+    async def send_message_stream(
+        self, message: str, config: Any = None
+    ) -> AsyncIterator[types.GenerateContentResponse]:
+        user_input = types.Content(
+            role='user', parts=[types.Part(text=message)]
+        )
+        stream = await self._models.generate_content_stream(
+            model=self._model,
+            contents=[*self._history, user_input],
+            config=config or self._config,
+        )
+
+        async def generator() -> AsyncIterator[types.GenerateContentResponse]:
+            text = ''
+            async for response in stream:
+                text += response.text or ''
+                yield response
+            self._history += [
+                user_input,
+                types.Content(role='model', parts=[types.Part(text=text)]),
+            ]
+
+        return generator()
+
+    def record_history(
+        self,
+        user_input: types.Content,
+        model_output: list[types.Content],
+        is_valid: bool,
+    ) -> None:
+        self._history += [user_input, *model_output]
+
+    def get_history(self, curated: bool = False) -> list[types.Content]:
+        return list(self._history)
+
+
+class FakeAsyncChats:
+    """`client.aio.chats` の疑似実装"""
+
+    def __init__(self, models: FakeAsyncModels):
+        self._models = models
+
+    def create(
+        self,
+        *,
+        model: str,
+        config: Any = None,
+        history: list[types.Content] | None = None,
+    ) -> FakeAsyncChat:
+        chat = FakeAsyncChat(self._models, model, config)
+        for content in history or []:
+            chat.record_history(content, [], is_valid=True)
+        return chat
+
+
+class FakeAsyncClient:
+    """`client.aio` の疑似実装"""
+
+    def __init__(self, models: FakeAsyncModels, caches: FakeAsyncCaches):
+        self.models = models
+        self.chats = FakeAsyncChats(models)
+        self.caches = caches
+
+
+class FakeGenAIClient:
+    """`google.genai.Client` の疑似実装
+    AIChat と GoogleTTSClient が使用する非同期 API のみを実装しています。
+    Attributes:
+        aio (FakeAsyncClient): 非同期 API
+    """
+
+    def __init__(
+        self,
+        replies: Iterable[str] = DEFAULT_REPLIES,
+        chat_ttft: LatencyModel | None = None,
+        chat_token_interval: LatencyModel | None = None,
+        tts_ttfb: LatencyModel | None = None,
+        tts_realtime_factor: float = 0.2,
+        chars_per_second: float = 8.0,
+        token_chars: int = 6,
+        audio_chunk_seconds: float = 0.5,
+        caching: bool = True,
+    ):
+        """
+        Args:
+            replies (Iterable[str]): 順番に繰り返し返す台詞
+            chat_ttft (LatencyModel | None): 応答の最初の断片までの待ち時間
+            chat_token_interval (LatencyModel | None): 応答の断片の間隔
+            tts_ttfb (LatencyModel | None): 音声の最初の断片までの待ち時間
+            tts_realtime_factor (float): 音声1秒分の生成にかかる秒数
+            chars_per_second (float): 音声の長さを決める1秒あたりの文字数
+            token_chars (int): 応答の1断片あたりの文字数
+            audio_chunk_seconds (float): 音声の1断片あたりの秒数
+            caching (bool): コンテキストキャッシュを作成できるかどうか
+        """
+        caches = FakeAsyncCaches(available=caching)
+        self.aio = FakeAsyncClient(
+            FakeAsyncModels(
+                replies=replies,
+                chat_ttft=chat_ttft or LatencyModel(0.4, 0.1),
+                chat_token_interval=chat_token_interval
+                or LatencyModel(0.03, 0.01),
+                tts_ttfb=tts_ttfb or LatencyModel(0.5, 0.15),
+                tts_realtime_factor=tts_realtime_factor,
+                chars_per_second=chars_per_second,
+                token_chars=token_chars,
+                audio_chunk_seconds=audio_chunk_seconds,
+                caches=caches,
+            ),
+            caches,
+        )
+
+    @property
+    def requests(self) -> int:
+        """受け付けたリクエスト数"""
+        return self.aio.models.requests
+
+
+def _ttl(config: Any) -> timedelta:
+    """キャッシュの設定から有効期間を取り出す（指定がない場合は1時間）"""
+    ttl = getattr(config, 'ttl', None) or '3600s'
+    return timedelta(seconds=float(ttl.removesuffix('s')))
+
+
+def _is_audio(config: Any) -> bool:
+    """音声を要求する設定かどうかを判定する"""
+    modalities: list[Any] = getattr(config, 'response_modalities', None) or []
+    return any(
+        str(modality).upper().endswith('AUDIO') for modality in modalities
+    )
+
+
+def last_text(contents: Any) -> str:
+    """リクエストの内容から最後のテキストを取り出す"""
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, list) and contents:
+        return last_text(contents[-1])
+    if isinstance(contents, types.Content):
+        return ''.join(part.text or '' for part in contents.parts or [])
+    return ''
+
+
+def _split(text: str, size: int) -> list[str]:
+    """テキストを一定の文字数ごとに分割する"""
+    return [text[i : i + size] for i in range(0, len(text), size)] or ['']
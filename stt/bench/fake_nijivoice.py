@@ -0,0 +1,253 @@
+import asyncio
+import base64
+import itertools
+import json
+import re
+
+from ..audio import AudioFormat, wav_header
+from .latency import LatencyModel
+
+
+class FakeNijiVoiceServer:
+    """にじボイス API を模したローカルの HTTP サーバー
+    `generate-encoded-voice`（base64 の JSON）と `generate-voice`
+    （音声ファイルの URL）を実装しています。音声はテキストの長さに応じた
+    無音の WAV（`format` が `mp3` の場合は ffmpeg で変換した MP3）で、
+    設定した待ち時間と帯域で返します。
+    `NijiVoiceClient(base_url=server.base_url)` で接続できます。
+    Attributes:
+        requests (int): 受け付けたリクエスト数
+        connections (int): 受け付けた TCP 接続数
+    """
+
+    # 生成する音声の形式
+    AUDIO_FORMAT = AudioFormat(sample_rate=24000)
+
+    # 音声ファイルを送信する際の1回あたりのサイズ
+    SEND_CHUNK_SIZE = 8192
+
+    # MP3 のビットレート
+    MP3_BITRATE = '64k'
+
+    # 形式ごとの Content-Type
+    CONTENT_TYPES = {'wav': 'audio/wav', 'mp3': 'audio/mpeg'}
+
+    API_PREFIX = '/api/platform/v1'
+
+    def __init__(
+        self,
+        generate_latency: LatencyModel | None = None,
+        bytes_per_second: float | None = 2_000_000,
+        chars_per_second: float = 8.0,
+        host: str = '127.0.0.1',
+        port: int = 0,
+    ):
+        """
+        Args:
+            generate_latency (LatencyModel | None): 音声生成の待ち時間
+            bytes_per_second (float | None): 音声ファイルの送信帯域（None は無制限）
+            chars_per_second (float): 音声の長さを決める1秒あたりの文字数
+            host (str): 待ち受けるアドレス
+            port (int): 待ち受けるポート（0 の場合は空いているポート）
+        """
+        self._generate_latency = generate_latency or LatencyModel(0.8, 0.2)
+        self._bytes_per_second = bytes_per_second
+        self._chars_per_second = chars_per_second
+        self._host = host
+        self._port = port
+        self._server: asyncio.Server | None = None
+        self._files: dict[str, tuple[str, bytes]] = {}
+        self._file_ids = itertools.count()
+        self.requests = 0
+        self.connections = 0
+
+    @property
+    def origin(self) -> str:
+        """サーバーのオリジン（`http://host:port`）"""
+        return f'http://{self._host}:{self._port}'
+
+    @property
+    def base_url(self) -> str:
+        """API のベース URL"""
+        return f'{self.origin}{self.API_PREFIX}'
+
+    async def start(self) -> None:
+        """待ち受けを開始する"""
+        self._server = await asyncio.start_server(
+            self._handle, self._host, self._port
+        )
+        self._port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        """待ち受けを終了する"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> 'FakeNijiVoiceServer':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close()
+
+    def _synthesize(self, text: str) -> bytes:
+        """テキストの長さに応じた無音の WAV を作成する"""
+        seconds = max(len(text), 1) / self._chars_per_second
+        size = (
+            int(seconds * self.AUDIO_FORMAT.sample_rate)
+            * self.AUDIO_FORMAT.frame_size
+        )
+        return wav_header(self.AUDIO_FORMAT, size) + bytes(size)
+
+    async def _encode(self, audio: bytes, audio_format: str) -> bytes:
+        """WAV を指定した形式に変換する"""
+        if audio_format == 'wav':
+            return audio
+        process = await asyncio.create_subprocess_exec(
+            'ffmpeg',
+            '-hide_banner',
+            '-loglevel',
+            'error',
+            '-f',
+            'wav',
+            '-i',
+            'pipe:0',
+            '-b:a',
+            self.MP3_BITRATE,
+            '-f',
+            audio_format,
+            'pipe:1',
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        encoded, _ = await process.communicate(audio)
+        return encoded
+
+    async def _handle(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """1つの接続で keep-alive のリクエストを順に処理する"""
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _version = request_line.decode().split(' ', 2)
+
+                headers: dict[str, str] = {}
+                while (line := await reader.readline()) not in (b'\r\n', b''):
+                    name, _, value = line.decode().partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(
+                    int(headers.get('content-length', '0'))
+                )
+                self.requests += 1
+                await self._route(method, target, body, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(
+        self,
+        method: str,
+        target: str,
+        body: bytes,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """リクエストのパスに応じて応答する"""
+        prefix = re.escape(self.API_PREFIX)
+        if match := re.fullmatch(
+            rf'{prefix}/voice-actors/[^/]+/(generate-encoded-voice|generate-voice)',
+            target,
+        ):
+            if method != 'POST':
+                await self._respond(writer, 405, b'')
+                return
+            payload = json.loads(body)
+            audio_format = payload.get('format', 'wav')
+            await self._generate_latency.sleep()
+            audio = self._synthesize(payload['script'])
+            duration = self.AUDIO_FORMAT.duration(len(audio) - 44)
+            audio = await self._encode(audio, audio_format)
+
+            if match.group(1) == 'generate-encoded-voice':
+                voice = {'base64Audio': base64.b64encode(audio).decode()}
+            else:
+                file_id = str(next(self._file_ids))
+                self._files[file_id] = (audio_format, audio)
+                voice = {
+                    'audioFileUrl': f'{self.origin}/audio/{file_id}.{audio_format}'
+                }
+
+            await self._respond_json(
+                writer,
+                {
+                    'generatedVoice': {
+                        **voice,
+                        'duration': int(duration * 1000),
+                        'remainingCredits': 10_000,
+                    }
+                },
+            )
+        elif target == f'{self.API_PREFIX}/voice-actors':
+            await self._respond_json(writer, {'voiceActors': []})
+        elif match := re.fullmatch(r'/audio/(\d+)\.\w+', target):
+            file = self._files.pop(match.group(1), None)
+            if file is None:
+                await self._respond(writer, 404, b'')
+                return
+            audio_format, audio = file
+            await self._send_file(
+                writer, audio, self.CONTENT_TYPES[audio_format]
+            )
+        else:
+            await self._respond(writer, 404, b'')
+
+    async def _respond(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        body: bytes,
+        content_type: str = 'application/json',
+    ) -> None:
+        """応答全体を送信する"""
+        writer.write(self._headers(status, len(body), content_type) + body)
+        await writer.drain()
+
+    async def _respond_json(
+        self, writer: asyncio.StreamWriter, data: object
+    ) -> None:
+        await self._respond(writer, 200, json.dumps(data).encode())
+
+    async def _send_file(
+        self,
+        writer: asyncio.StreamWriter,
+        audio: bytes,
+        content_type: str = 'audio/wav',
+    ) -> None:
+        """音声ファイルを設定した帯域で分割して送信する"""
+        writer.write(self._headers(200, len(audio), content_type))
+        for offset in range(0, len(audio), self.SEND_CHUNK_SIZE):
+            chunk = audio[offset : offset + self.SEND_CHUNK_SIZE]
+            writer.write(chunk)
+            await writer.drain()
+            if self._bytes_per_second:
+                await asyncio.sleep(len(chunk) / self._bytes_per_second)
+
+    @staticmethod
+    def _headers(status: int, length: int, content_type: str) -> bytes:
+        reason = {200: 'OK', 404: 'Not Found', 405: 'Method Not Allowed'}
+        return (
+            f'HTTP/1.1 {status} {reason[status]}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Length: {length}\r\n'
+            'Connection: keep-alive\r\n'
+            '\r\n'
+        ).encode()
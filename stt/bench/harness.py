@@ -0,0 +1,405 @@
+import contextlib
+import json
+import platform
+import resource
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, Literal
+
+from ..ai_chat import AIChat
+from ..codec import TransferFormat
+from ..config import GEMINI_MODEL, TALK_END_KEYWORD
+from ..googlevoice import GoogleTTSClient
+from ..metrics import (
+    Histogram,
+    HistogramSink,
+    HistogramSummary,
+    Metrics,
+    MetricsSink,
+)
+from ..nijivoice import NijiVoiceClient
+from ..output import SilentOutputWriter
+from ..talk import TalkController
+from ..voice import VoiceClient
+from .fake_audio import (
+    FakeSpeechRecognizer,
+    SimulatedPlaybackEngine,
+    WavFileSource,
+    make_script_wav,
+)
+from .fake_genai import FakeGenAIClient
+from .fake_nijivoice import FakeNijiVoiceServer
+from .latency import LatencyModel
+
+# ベースラインの形式のバージョン（互換性のない変更をしたら上げる）
+SCHEMA_VERSION = 1
+
+
+@dataclass
+class BenchmarkConfig:
+    """ベンチマークの設定
+    待ち時間の分布はすべて `seed` から決まるシードで初期化されるため、
+    同じ設定なら同じ系列の待ち時間で実行されます。
+    Attributes:
+        backend (Literal['google', 'nijivoice']): 使用する音声合成
+        turns (int): 会話のターン数（終了の発話を除く）
+        seed (int): 乱数のシード
+        recognize (LatencyModel): 音声認識の待ち時間
+        chat_ttft (LatencyModel): 応答の最初の断片までの待ち時間
+        chat_token_interval (LatencyModel): 応答の断片の間隔
+        tts_ttfb (LatencyModel): 音声合成の最初の音声までの待ち時間
+        tts_realtime_factor (float): Gemini TTS で音声1秒分の生成にかかる秒数
+        nijivoice_bytes_per_second (float): にじボイスの音声ファイルの送信帯域
+        nijivoice_transfer_format (TransferFormat): にじボイスから受信する音声の形式
+        trace_memory (bool): tracemalloc でメモリ使用量を計測するかどうか
+    """
+
+    backend: Literal['google', 'nijivoice'] = 'google'
+    turns: int = 5
+    seed: int = 0
+    recognize: LatencyModel = field(
+        default_factory=lambda: LatencyModel(0.35, 0.1, 'lognormal')
+    )
+    chat_ttft: LatencyModel = field(
+        default_factory=lambda: LatencyModel(0.45, 0.15, 'lognormal')
+    )
+    chat_token_interval: LatencyModel = field(
+        default_factory=lambda: LatencyModel(0.03, 0.01)
+    )
+    tts_ttfb: LatencyModel = field(
+        default_factory=lambda: LatencyModel(0.6, 0.2, 'lognormal')
+    )
+    tts_realtime_factor: float = 0.2
+    nijivoice_bytes_per_second: float = 2_000_000
+    nijivoice_transfer_format: TransferFormat = 'wav'
+    trace_memory: bool = True
+
+    def latency_models(self) -> dict[str, LatencyModel]:
+        """待ち時間の分布を名前付きで返す"""
+        return {
+            'recognize': self.recognize,
+            'chat_ttft': self.chat_ttft,
+            'chat_token_interval': self.chat_token_interval,
+            'tts_ttfb': self.tts_ttfb,
+        }
+
+    def to_dict(self) -> dict[str, Any]:
+        """ベースラインに保存する形式に変換する"""
+        return {
+            'backend': self.backend,
+            'turns': self.turns,
+            'seed': self.seed,
+            'latency': {
+                name: {
+                    'mean': model.mean,
+                    'jitter': model.jitter,
+                    'distribution': model.distribution,
+                }
+                for name, model in self.latency_models().items()
+            },
+            'tts_realtime_factor': self.tts_realtime_factor,
+            'nijivoice_bytes_per_second': self.nijivoice_bytes_per_second,
+            'nijivoice_transfer_format': self.nijivoice_transfer_format,
+            'trace_memory': self.trace_memory,
+        }
+
+
+class TurnRecorder(MetricsSink):
+    """計測結果をターンごとにまとめる出力先
+    `stt.endpoint`（発話の終了）で新しいターンを始め、`playback.end`
+    （応答の再生終了）でそのターンを完了とします。
+    Attributes:
+        turns (list[dict[str, float]]): 完了したターンの計測結果
+    """
+
+    def __init__(self):
+        self.turns: list[dict[str, float]] = []
+        self._current: dict[str, float] | None = None
+
+    def observe(self, name: str, seconds: float) -> None:
+        if name == 'stt.endpoint':
+            self._current = {}
+        if self._current is None:
+            return
+        self._current[name] = seconds
+        if name == 'playback.end':
+            self.turns.append(self._current)
+            self._current = None
+
+
+@dataclass
+class BenchmarkResult:
+    """ベンチマークの結果
+    Attributes:
+        config (dict[str, Any]): 実行時の設定
+        environment (dict[str, str]): 実行環境
+        time_to_first_audio (HistogramSummary): 発話の終了から応答の音声の
+            再生開始までの時間
+        turn_latency (HistogramSummary): 発話の終了から応答の再生終了までの時間
+        stages (dict[str, HistogramSummary]): 各段階の所要時間
+        throughput (dict[str, float]): 処理量
+        memory (dict[str, int]): メモリ使用量（バイト）
+        playback (dict[str, float]): 応答の途中で音声が途切れた回数と長さ
+    """
+
+    config: dict[str, Any]
+    environment: dict[str, str]
+    time_to_first_audio: HistogramSummary
+    turn_latency: HistogramSummary
+    stages: dict[str, HistogramSummary]
+    throughput: dict[str, float]
+    memory: dict[str, int]
+    playback: dict[str, float]
+    created_at: str = field(
+        default_factory=lambda: datetime.now(UTC).isoformat(timespec='seconds')
+    )
+
+    def to_dict(self) -> dict[str, Any]:
+        """ベースラインの形式に変換する"""
+        return {
+            'schema': SCHEMA_VERSION,
+            'created_at': self.created_at,
+            'environment': self.environment,
+            'config': self.config,
+            'time_to_first_audio': _summary_dict(self.time_to_first_audio),
+            'turn_latency': _summary_dict(self.turn_latency),
+            'stages': {
+                name: _summary_dict(summary)
+                for name, summary in self.stages.items()
+            },
+            'throughput': self.throughput,
+            'memory': self.memory,
+            'playback': self.playback,
+        }
+
+    def save(self, path: Path) -> None:
+        """ベースラインとして JSON で保存する"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            json.dumps(self.to_dict(), ensure_ascii=False, indent=2) + '\n',
+            encoding='utf-8',
+        )
+
+    def report(self) -> list[str]:
+        """結果の概要を表示用の行で返す"""
+        lines = [
+            f'バックエンド: {self.config["backend"]} / '
+            f'ターン数: {self.time_to_first_audio.count}',
+        ]
+        for name, summary in (
+            ('time_to_first_audio', self.time_to_first_audio),
+            ('turn_latency', self.turn_latency),
+            *self.stages.items(),
+        ):
+            lines.append(
+                f'{name:<20} p50 {summary.p50 * 1000:7.0f}ms  '
+                f'p95 {summary.p95 * 1000:7.0f}ms  '
+                f'p99 {summary.p99 * 1000:7.0f}ms'
+            )
+        lines.append(
+            f'ターン/分: {self.throughput["turns_per_minute"]:.1f}  '
+            f'再生した音声: {self.throughput["audio_seconds"]:.1f}秒'
+        )
+        lines.append(
+            f'メモリ: ピーク {self.memory["traced_peak"] / 1024:.0f}KiB '
+            f'(tracemalloc) / 最大 RSS {self.memory["max_rss"] / 1024:.0f}KiB'
+        )
+        lines.append(
+            f'再生の途切れ: {self.playback["gaps"]:.0f}回 '
+            f'({self.playback["gap_seconds"] * 1000:.0f}ms)'
+        )
+        return lines
+
+
+def _summary_dict(summary: HistogramSummary) -> dict[str, float]:
+    return {**asdict(summary), 'mean': summary.mean}
+
+
+def _summarize(values: list[float]) -> HistogramSummary:
+    histogram = Histogram()
+    for value in values:
+        histogram.observe(value)
+    return histogram.summary()
+
+
+async def run_benchmark(config: BenchmarkConfig) -> BenchmarkResult:
+    """疑似バックエンドで TalkController を最後まで動かして計測する
+    Args:
+        config (BenchmarkConfig): ベンチマークの設定
+    Returns:
+        BenchmarkResult: 計測結果
+    """
+    for index, model in enumerate(config.latency_models().values()):
+        model.reseed(config.seed * 100 + index)
+
+    sink = HistogramSink()
+    recorder = TurnRecorder()
+    metrics = Metrics(sink, recorder)
+
+    # 最後の発話で会話を終了する
+    source = WavFileSource(make_script_wav(config.turns + 1, seed=config.seed))
+    transcripts = [f'テスト発話{i + 1}' for i in range(config.turns)]
+    recognizer = FakeSpeechRecognizer(
+        transcripts=[*transcripts, TALK_END_KEYWORD],
+        audio_source=source,
+        latency=config.recognize,
+        metrics=metrics,
+    )
+
+    genai_client = FakeGenAIClient(
+        chat_ttft=config.chat_ttft,
+        chat_token_interval=config.chat_token_interval,
+        tts_ttfb=config.tts_ttfb,
+        tts_realtime_factor=config.tts_realtime_factor,
+    )
+    ai_chat = AIChat(
+        system_instruction='ベンチマーク用の会話です。',
+        model=GEMINI_MODEL,
+        client=genai_client,  # type: ignore
+    )
+    playback = SimulatedPlaybackEngine()
+
+    if config.trace_memory:
+        tracemalloc.start()
+    started_at = time.perf_counter()
+
+    async with contextlib.AsyncExitStack() as stack:
+        voice_client: VoiceClient
+        if config.backend == 'nijivoice':
+            server = await stack.enter_async_context(
+                FakeNijiVoiceServer(
+                    generate_latency=config.tts_ttfb,
+                    bytes_per_second=config.nijivoice_bytes_per_second,
+                )
+            )
+            voice_client = NijiVoiceClient(
+                api_key='bench',
+                voice_id='bench',
+                metrics=metrics,
+                base_url=server.base_url,
+                audio_format=config.nijivoice_transfer_format,
+            )
+        else:
+            voice_client = GoogleTTSClient(
+                client=genai_client,  # type: ignore
+                voice_name='Kore',
+                metrics=metrics,
+            )
+        await stack.enter_async_context(voice_client)
+
+        controller = TalkController(
+            character_name='ベンチマーク',
+            talk_end_keyword=TALK_END_KEYWORD,
+            ai_chat=ai_chat,
+            voice_client=voice_client,
+            output_writer=SilentOutputWriter(),
+            playback_engine=playback,
+            speech_recognizer=recognizer,
+            metrics=metrics,
+        )
+        await controller.start_talk()
+
+    elapsed = time.perf_counter() - started_at
+    traced_peak = 0
+    if config.trace_memory:
+        _current, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    turns = recorder.turns
+    stages = sink.snapshot()
+
+    return BenchmarkResult(
+        config=config.to_dict(),
+        environment={
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+        },
+        time_to_first_audio=_summarize(
+            [
+                turn['stt.endpoint']
+                + turn['stt.recognize']
+                + turn['playback.start']
+                for turn in turns
+            ]
+        ),
+        turn_latency=_summarize(
+            [
+                turn['stt.endpoint']
+                + turn['stt.recognize']
+                + turn['playback.end']
+                for turn in turns
+            ]
+        ),
+        stages=stages,
+        throughput={
+            'elapsed_seconds': elapsed,
+            'turns_per_minute': len(turns) / elapsed * 60 if elapsed else 0,
+            'audio_seconds': playback.played_seconds,
+            'genai_requests': float(genai_client.requests),
+        },
+        memory={
+            'traced_peak': traced_peak,
+            # ru_maxrss は Linux では KiB、macOS ではバイト単位
+            'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            * (1 if platform.system() == 'Darwin' else 1024),
+        },
+        playback={
+            'gaps': float(playback.gaps),
+            'gap_seconds': playback.gap_seconds,
+        },
+    )
+
+
+def compare(
+    baseline: dict[str, Any],
+    current: dict[str, Any],
+    threshold: float = 0.1,
+    min_delta: float = 0.005,
+) -> tuple[list[str], bool]:
+    """2つのベンチマーク結果の p50 / p95 を比較する
+    Args:
+        baseline (dict[str, Any]): 基準のベンチマーク結果
+        current (dict[str, Any]): 今回のベンチマーク結果
+        threshold (float): 悪化とみなす増加率
+        min_delta (float): 悪化とみなす最小の増加量（秒）。ごく短い段階の
+            誤差を悪化と判定しないために使用する
+    Returns:
+        tuple[list[str], bool]: 比較結果の行と、悪化した項目があるかどうか
+    Raises:
+        ValueError: 形式のバージョンが異なる場合
+    """
+    if baseline.get('schema') != current.get('schema'):
+        raise ValueError('ベンチマーク結果の形式のバージョンが異なります')
+
+    def entries(result: dict[str, Any]) -> dict[str, dict[str, float]]:
+        return {
+            'time_to_first_audio': result['time_to_first_audio'],
+            'turn_latency': result['turn_latency'],
+            **result['stages'],
+        }
+
+    before = entries(baseline)
+    after = entries(current)
+    lines: list[str] = []
+    regressed = False
+
+    for name in sorted(before.keys() & after.keys()):
+        for quantile in ('p50', 'p95'):
+            old = before[name][quantile]
+            new = after[name][quantile]
+            change = (new - old) / old if old else 0.0
+            mark = ''
+            if change > threshold and new - old > min_delta:
+                mark = '  <- 悪化'
+                regressed = True
+            lines.append(
+                f'{name:<20} {quantile} {old * 1000:7.0f}ms -> '
+                f'{new * 1000:7.0f}ms ({change:+.0%}){mark}'
+            )
+
+    return lines, regressed
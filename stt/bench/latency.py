@@ -0,0 +1,67 @@
+import asyncio
+import math
+import random
+from dataclasses import dataclass, field
+from typing import Literal
+
+type Distribution = Literal['fixed', 'uniform', 'normal', 'lognormal']
+
+
+@dataclass
+class LatencyModel:
+    """疑似バックエンドの待ち時間の分布
+    Attributes:
+        mean (float): 平均の待ち時間（秒）
+        jitter (float): ばらつきの大きさ（秒）。分布ごとの意味は以下のとおり
+            - fixed: 使用しない
+            - uniform: mean ± jitter の一様分布
+            - normal: 標準偏差
+            - lognormal: 標準偏差（平均が mean になるよう調整する）
+        distribution (Distribution): 分布の種類
+        seed (int | None): 乱数のシード（同じシードなら同じ系列になる）
+    """
+
+    mean: float
+    jitter: float = 0.0
+    distribution: Distribution = 'normal'
+    seed: int | None = None
+    _random: random.Random = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._random = random.Random(self.seed)
+
+    def sample(self) -> float:
+        """待ち時間を1つ生成する（負の値にはならない）"""
+        if self.jitter <= 0 or self.distribution == 'fixed':
+            return max(0.0, self.mean)
+
+        match self.distribution:
+            case 'uniform':
+                value = self._random.uniform(
+                    self.mean - self.jitter, self.mean + self.jitter
+                )
+            case 'normal':
+                value = self._random.gauss(self.mean, self.jitter)
+            case 'lognormal':
+                # 平均と標準偏差から対数正規分布のパラメータを求める
+                if self.mean <= 0:
+                    return 0.0
+                sigma = math.sqrt(math.log1p((self.jitter / self.mean) ** 2))
+                mu = math.log(self.mean) - sigma**2 / 2
+                value = self._random.lognormvariate(mu, sigma)
+
+        return max(0.0, value)
+
+    async def sleep(self) -> float:
+        """生成した待ち時間だけ待つ
+        Returns:
+            float: 待った秒数
+        """
+        delay = self.sample()
+        await asyncio.sleep(delay)
+        return delay
+
+    def reseed(self, seed: int | None) -> None:
+        """乱数の系列を初期化する"""
+        self.seed = seed
+        self._random.seed(seed)
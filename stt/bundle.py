@@ -0,0 +1,482 @@
+"""定型の台詞を事前に音声合成してまとめたファイル
+
+`CHARACTER_MAP` の各キャラクターの `phrases` を音声合成バックエンドごとに
+事前に合成し、索引付きの1つのファイルにまとめます。実行時はファイルを
+mmap で開き、PCM をコピーせずに再生へ渡すため、会話の開始時の挨拶などを
+API を呼ばずにすぐ再生できます。
+
+使い方:
+    python -m stt.bundle --output .cache/phrases.bundle
+    python -m stt.bundle --output .cache/phrases.bundle --backend nijivoice
+    python -m stt.bundle --list .cache/phrases.bundle
+
+ファイルの形式:
+    マジック (8バイト) | 索引の長さ (uint32 LE) | 索引 (JSON) | PCM ...
+    各 PCM の位置はファイルの先頭からのオフセットで索引に記録します。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import mmap
+import os
+import struct
+from collections.abc import AsyncIterator, Sequence
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from .audio import AudioBuffer, AudioFormat
+from .cache import speech_key
+from .codec import TRANSFER_FORMATS, TransferFormat
+from .config import (
+    CHARACTER_MAP,
+    VOICE_BACKENDS,
+    CharacterOptions,
+    VoiceBackend,
+)
+from .output import OutputWriter, StandardOutputWriter
+from .voice import VoiceClient
+
+if TYPE_CHECKING:
+    from google.genai import Client  # type: ignore
+
+
+@dataclass(frozen=True)
+class BundleEntry:
+    """ファイルに含まれる台詞の情報
+    Attributes:
+        key (str): `speech_key` で作成したキャッシュキー
+        character (str): キャラクターID
+        backend (str): 音声合成バックエンド
+        phrase (str): 台詞の種類（`PhraseID`）
+        text (str): 台詞のテキスト
+    """
+
+    key: str
+    character: str
+    backend: str
+    phrase: str
+    text: str
+
+
+class PhraseBundle:
+    """事前に音声合成した台詞のファイルを mmap で参照するクラス
+    台詞の PCM はファイルの内容を直接参照する AudioBuffer として返すため、
+    読み込みやコピーは発生しません。
+    Attributes:
+        path (Path): ファイルのパス
+        entries (list[BundleEntry]): ファイルに含まれる台詞
+    """
+
+    MAGIC = b'STTPHRS1'
+    HEADER = struct.Struct('<8sI')
+
+    # 各 PCM の先頭位置をそろえる単位（サンプル単位で参照できるようにする）
+    ALIGNMENT = 8
+
+    def __init__(self, path: Path):
+        """
+        Raises:
+            ValueError: 台詞のファイルとして読み込めない場合
+        """
+        self.path = path
+        with path.open('rb') as file:
+            try:
+                self._mmap = mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            except ValueError:
+                raise ValueError(f'空のファイルです: {path}')
+
+        try:
+            index = self._read_index()
+        except ValueError:
+            self._mmap.close()
+            raise
+
+        self._view = memoryview(self._mmap)
+        self.entries: list[BundleEntry] = []
+        self._locations: dict[str, tuple[int, int, AudioFormat]] = {}
+        for item in index:
+            self.entries.append(
+                BundleEntry(
+                    key=item['key'],
+                    character=item['character'],
+                    backend=item['backend'],
+                    phrase=item['phrase'],
+                    text=item['text'],
+                )
+            )
+            self._locations[item['key']] = (
+                item['offset'],
+                item['length'],
+                AudioFormat(**item['audio_format']),
+            )
+
+    def _read_index(self) -> list[dict[str, Any]]:
+        """ヘッダーと索引を読み込み、PCM の位置がファイル内にあるか確認する"""
+        size = len(self._mmap)
+        if size < self.HEADER.size:
+            raise ValueError(f'台詞のファイルではありません: {self.path}')
+        magic, index_size = self.HEADER.unpack_from(self._mmap)
+        if magic != self.MAGIC or self.HEADER.size + index_size > size:
+            raise ValueError(f'台詞のファイルではありません: {self.path}')
+
+        start = self.HEADER.size
+        try:
+            index: list[dict[str, Any]] = json.loads(
+                self._mmap[start : start + index_size]
+            )['entries']
+        except (ValueError, KeyError) as e:
+            raise ValueError(f'索引を読み込めません: {self.path}: {e}')
+
+        for item in index:
+            if item['offset'] + item['length'] > size:
+                raise ValueError(f'ファイルが途中で切れています: {self.path}')
+        return index
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._locations
+
+    def get(self, key: str) -> AudioBuffer | None:
+        """キャッシュキーに対応する台詞の音声を返す（ない場合は None）"""
+        location = self._locations.get(key)
+        if location is None:
+            return None
+        offset, length, audio_format = location
+        return AudioBuffer(self._view[offset : offset + length], audio_format)
+
+    def close(self) -> None:
+        """ファイルの参照を閉じる
+        再生中の音声がまだ参照している場合は、参照がなくなった時点で
+        解放されます。
+        """
+        self._view.release()
+        with contextlib.suppress(BufferError):
+            self._mmap.close()
+
+
+def write_bundle(
+    path: Path, phrases: Sequence[tuple[BundleEntry, AudioBuffer]]
+) -> None:
+    """台詞と音声を1つのファイルに書き込む
+    書き込み途中のファイルを読まないよう、一時ファイルから置き換えます。
+    Args:
+        path (Path): 書き込むファイルのパス
+        phrases (Sequence[tuple[BundleEntry, AudioBuffer]]): 台詞と音声
+    """
+
+    def align(offset: int) -> int:
+        return -offset % PhraseBundle.ALIGNMENT
+
+    # 索引の長さで PCM の位置が変わるため、位置を仮に決めてから確定する
+    index_size = 0
+    while True:
+        offset = PhraseBundle.HEADER.size + index_size
+        index: list[dict[str, Any]] = []
+        for entry, audio in phrases:
+            offset += align(offset)
+            index.append(
+                {
+                    **asdict(entry),
+                    'offset': offset,
+                    'length': audio.nbytes,
+                    'audio_format': asdict(audio.audio_format),
+                }
+            )
+            offset += audio.nbytes
+        encoded = json.dumps({'entries': index}, ensure_ascii=False).encode()
+        if len(encoded) == index_size:
+            break
+        index_size = len(encoded)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    with tmp_path.open('wb') as file:
+        file.write(PhraseBundle.HEADER.pack(PhraseBundle.MAGIC, index_size))
+        file.write(encoded)
+        for item, (_entry, audio) in zip(index, phrases, strict=True):
+            file.write(bytes(item['offset'] - file.tell()))
+            file.write(audio.pcm)
+    os.replace(tmp_path, path)
+
+
+class BundledVoiceClient(VoiceClient):
+    """事前に合成した台詞はファイルから返す VoiceClient のラッパー
+    ファイルにない台詞はラップしているクライアントで音声合成します。
+    キャッシュキーはバックエンドのクライアントの設定から作成するため、
+    ファイルの作成後に音声の設定を変えた台詞は使われません。
+    Attributes:
+        _voice_client (VoiceClient): ファイルにない台詞を合成するクライアント
+        _bundle (PhraseBundle): 事前に合成した台詞のファイル
+        _key_settings (dict[str, str] | None): キャッシュキーに使う設定
+        hits (int): ファイルから返した回数
+    """
+
+    def __init__(
+        self,
+        voice_client: VoiceClient,
+        bundle: PhraseBundle,
+        key_settings: dict[str, str] | None = None,
+    ):
+        """
+        Args:
+            voice_client (VoiceClient): ファイルにない台詞を合成するクライアント
+            bundle (PhraseBundle): 事前に合成した台詞のファイル
+            key_settings (dict[str, str] | None): キャッシュキーに使う設定。
+                分割などのラッパーを挟む場合は、`build_bundle` と同じ
+                バックエンドのクライアントの設定を渡す（None の場合は
+                ラップしているクライアントの設定）
+        """
+        self._voice_client = voice_client
+        self._bundle = bundle
+        self._key_settings = key_settings
+        self.hits = 0
+
+    def _lookup(self, text: str) -> AudioBuffer | None:
+        """ファイルから台詞の音声を取得する"""
+        settings = self._key_settings or self._voice_client.voice_settings()
+        audio = self._bundle.get(speech_key(settings, text))
+        if audio is not None:
+            self.hits += 1
+        return audio
+
+    async def text_to_speech(self, text: str) -> AudioBuffer:
+        audio = self._lookup(text)
+        if audio is not None:
+            return audio
+        return await self._voice_client.text_to_speech(text)
+
+    async def stream_speech(self, text: str) -> AsyncIterator[AudioBuffer]:
+        audio = self._lookup(text)
+        if audio is not None:
+            yield audio
+            return
+        async for chunk in self._voice_client.stream_speech(text):
+            yield chunk
+
+    def voice_settings(self) -> dict[str, str]:
+        """ラップしているクライアントの設定を返す"""
+        return self._voice_client.voice_settings()
+
+    async def warm_up(self) -> None:
+        """ラップしているクライアントの接続を事前に確立する"""
+        await self._voice_client.warm_up()
+
+    async def aclose(self) -> None:
+        """ラップしているクライアントのリソースを解放する
+        ファイルは複数のクライアントで共有するため、呼び出し側が閉じます。
+        """
+        await self._voice_client.aclose()
+
+
+def open_bundle(
+    path: Path | None, output_writer: OutputWriter = StandardOutputWriter()
+) -> PhraseBundle | None:
+    """台詞のファイルを開く（指定がない・開けない場合は None）
+    ファイルがなくても会話はできるため、開けない場合は出力して続けます。
+    """
+    if path is None:
+        return None
+    try:
+        return PhraseBundle(path)
+    except (OSError, ValueError) as e:
+        output_writer.print(f'定型の台詞のファイルを使用できません: {e}')
+        return None
+
+
+async def build_bundle(
+    output: Path,
+    backends: Sequence[VoiceBackend] = VOICE_BACKENDS,
+    characters: Sequence[CharacterOptions] = CHARACTER_MAP,
+    genai_client: 'Client | None' = None,
+    nijivoice_api_key: str | None = None,
+    nijivoice_base_url: str | None = None,
+    max_parallel: int = 4,
+    output_writer: OutputWriter = StandardOutputWriter(),
+    nijivoice_audio_format: TransferFormat = 'wav',
+) -> list[BundleEntry]:
+    """各キャラクターの台詞を各バックエンドで音声合成してファイルにまとめる
+    Args:
+        output (Path): 作成するファイルのパス
+        backends (Sequence[VoiceBackend]): 合成に使用するバックエンド
+        characters (Sequence[CharacterOptions]): 台詞を合成するキャラクター
+        genai_client (Client | None): google バックエンドで使用するクライアント
+        nijivoice_api_key (str | None): nijivoice バックエンドの API キー
+        nijivoice_base_url (str | None): にじボイス API のベース URL
+        max_parallel (int): 同時に実行する音声合成リクエストの最大数
+        output_writer (OutputWriter): 進捗の出力先
+        nijivoice_audio_format (TransferFormat): にじボイスから受信する音声の
+            形式。キャッシュキーに含まれるため、会話で使う形式と合わせる
+    Returns:
+        list[BundleEntry]: ファイルに書き込んだ台詞
+    Raises:
+        ValueError: バックエンドに必要なクライアントや API キーがない場合
+    """
+    if 'google' in backends and genai_client is None:
+        raise ValueError('google の台詞には GEMINI_API_KEY が必要です')
+    if 'nijivoice' in backends and not nijivoice_api_key:
+        raise ValueError('nijivoice の台詞には NIJIVOICE_API_KEY が必要です')
+
+    # 実行時に読み込まないよう、合成に使うクライアントはここで読み込む
+    from .governor import create_governors
+
+    governors = create_governors()
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    def create_client(
+        backend: VoiceBackend, character: CharacterOptions
+    ) -> VoiceClient:
+        if backend == 'google':
+            from .googlevoice import GoogleTTSClient
+
+            assert genai_client is not None
+            return GoogleTTSClient.create_from_character_id(
+                client=genai_client,
+                character_id=character.id,
+                governor=governors['gemini'],
+            )
+
+        from .nijivoice import NijiVoiceClient
+
+        assert nijivoice_api_key is not None
+        return NijiVoiceClient.create_from_character_id(
+            api_key=nijivoice_api_key,
+            character_id=character.id,
+            base_url=nijivoice_base_url or NijiVoiceClient.BASE_URL,
+            governor=governors['nijivoice'],
+            audio_format=nijivoice_audio_format,
+        )
+
+    async def synthesize(
+        client: VoiceClient, entry: BundleEntry
+    ) -> tuple[BundleEntry, AudioBuffer]:
+        async with semaphore:
+            audio = await client.text_to_speech(entry.text)
+        output_writer.print(
+            f'{entry.character}/{entry.backend}/{entry.phrase}: '
+            f'{audio.duration:.1f} 秒'
+        )
+        return entry, audio
+
+    clients = [
+        (backend, character, create_client(backend, character))
+        for backend in backends
+        for character in characters
+        if character.phrases
+    ]
+    try:
+        phrases = await asyncio.gather(
+            *(
+                synthesize(
+                    client,
+                    BundleEntry(
+                        key=speech_key(client.voice_settings(), text),
+                        character=character.id,
+                        backend=backend,
+                        phrase=phrase,
+                        text=text,
+                    ),
+                )
+                for backend, character, client in clients
+                for phrase, text in character.phrases.items()
+            )
+        )
+    finally:
+        for _backend, _character, client in clients:
+            await client.aclose()
+
+    await asyncio.to_thread(write_bundle, output, phrases)
+    return [entry for entry, _audio in phrases]
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(prog='python -m stt.bundle')
+    parser.add_argument(
+        '--output',
+        type=Path,
+        default=Path(os.getenv('PHRASE_BUNDLE') or '.cache/phrases.bundle'),
+        help='作成するファイル（デフォルトは PHRASE_BUNDLE）',
+    )
+    parser.add_argument(
+        '--backend',
+        nargs='+',
+        choices=VOICE_BACKENDS,
+        default=list(VOICE_BACKENDS),
+        help='台詞を合成するバックエンド',
+    )
+    parser.add_argument(
+        '--character',
+        nargs='+',
+        choices=[character.id for character in CHARACTER_MAP],
+        help='台詞を合成するキャラクター（デフォルトはすべて）',
+    )
+    parser.add_argument(
+        '--transfer-format',
+        choices=TRANSFER_FORMATS,
+        default=os.getenv('TTS_TRANSFER_FORMAT') or 'wav',
+        help='にじボイスから受信する音声の形式（デフォルトは TTS_TRANSFER_FORMAT）',
+    )
+    parser.add_argument(
+        '--max-parallel',
+        type=int,
+        default=4,
+        help='同時に実行する音声合成リクエストの最大数',
+    )
+    parser.add_argument(
+        '--list',
+        type=Path,
+        metavar='BUNDLE',
+        help='作成せず、ファイルに含まれる台詞を一覧表示する',
+    )
+    args = parser.parse_args()
+
+    if args.list is not None:
+        bundle = PhraseBundle(args.list)
+        for entry in bundle.entries:
+            audio = bundle.get(entry.key)
+            assert audio is not None
+            print(
+                f'{entry.character}/{entry.backend}/{entry.phrase}'
+                f' ({audio.duration:.1f} 秒): {entry.text}'
+            )
+        bundle.close()
+        return
+
+    genai_client = None
+    gemini_api_key = os.getenv('GEMINI_API_KEY')
+    if 'google' in args.backend and gemini_api_key:
+        from google.genai import Client  # type: ignore
+
+        genai_client = Client(api_key=gemini_api_key)
+
+    characters = [
+        character
+        for character in CHARACTER_MAP
+        if args.character is None or character.id in args.character
+    ]
+    entries = asyncio.run(
+        build_bundle(
+            args.output,
+            backends=args.backend,
+            characters=characters,
+            genai_client=genai_client,
+            nijivoice_api_key=os.getenv('NIJIVOICE_API_KEY'),
+            max_parallel=args.max_parallel,
+            nijivoice_audio_format=args.transfer_format,
+        )
+    )
+    print(f'{len(entries)} 件の台詞を {args.output} に書き込みました')
+
+
+if __name__ == '__main__':
+    main()
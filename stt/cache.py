@@ -0,0 +1,339 @@
+import asyncio
+import hashlib
+import json
+import os
+import unicodedata
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Mapping
+from dataclasses import dataclass
+from pathlib import Path
+
+from .audio import AudioBuffer, AudioFormat
+from .voice import VoiceClient
+
+
+@dataclass
+class CacheStats:
+    """音声キャッシュの統計情報"""
+
+    # メモリまたはディスクから返した回数
+    memory_hits: int = 0
+    disk_hits: int = 0
+    # API で音声合成した回数
+    misses: int = 0
+    # キャッシュから返したバイト数と API から受信したバイト数
+    bytes_served: int = 0
+    bytes_synthesized: int = 0
+    # 各階層の現在のサイズ
+    memory_bytes: int = 0
+    disk_bytes: int = 0
+    # 容量超過で削除したエントリ数
+    memory_evictions: int = 0
+    disk_evictions: int = 0
+
+    @property
+    def hits(self) -> int:
+        """キャッシュから返した回数の合計"""
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def hit_rate(self) -> float:
+        """キャッシュのヒット率"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def normalize_text(text: str) -> str:
+    """キャッシュキー用にテキストを正規化する
+    全角・半角の揺れと前後・連続する空白を吸収します。
+    Args:
+        text (str): 正規化するテキスト
+    Returns:
+        str: 正規化されたテキスト
+    """
+    return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+
+def speech_key(voice_settings: Mapping[str, str], text: str) -> str:
+    """音声合成の設定とテキストからキャッシュキーを作成する
+    Args:
+        voice_settings (Mapping[str, str]): `VoiceClient.voice_settings()` の値
+        text (str): 音声に変換するテキスト
+    Returns:
+        str: SHA-256 の16進文字列
+    """
+    payload = json.dumps(
+        {**voice_settings, 'text': normalize_text(text)},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class CachingVoiceClient(VoiceClient):
+    """音声合成結果をキャッシュする VoiceClient のラッパー
+    キャッシュキーはバックエンド・音声ID・話速・出力形式と正規化した
+    テキストから作成されるため、同じ台詞は API を呼ばずに再生できます。
+    メモリ上の LRU とディスクの2階層で保持します。
+    Attributes:
+        _voice_client (VoiceClient): 実際に音声合成を行うクライアント
+        _cache_dir (Path | None): ディスクキャッシュのディレクトリ（None の場合は無効）
+        _memory (OrderedDict[str, AudioBuffer]): メモリ上の LRU キャッシュ
+        _inflight (dict[str, asyncio.Future[AudioBuffer]]): 合成中のリクエスト
+        stats (CacheStats): キャッシュの統計情報
+    """
+
+    # メモリキャッシュの既定の上限
+    DEFAULT_MAX_MEMORY_ENTRIES = 256
+    DEFAULT_MAX_MEMORY_BYTES = 32 * 1024 * 1024
+
+    # ディスクキャッシュの既定の上限
+    DEFAULT_MAX_DISK_BYTES = 512 * 1024 * 1024
+
+    # ディスクの容量超過時に、上限のこの割合まで削除する
+    DISK_EVICTION_RATIO = 0.9
+
+    def __init__(
+        self,
+        voice_client: VoiceClient,
+        cache_dir: Path | None = None,
+        max_memory_entries: int = DEFAULT_MAX_MEMORY_ENTRIES,
+        max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES,
+        max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES,
+    ):
+        self._voice_client = voice_client
+        self._cache_dir = cache_dir
+        self._max_memory_entries = max_memory_entries
+        self._max_memory_bytes = max_memory_bytes
+        self._max_disk_bytes = max_disk_bytes
+        self._memory: OrderedDict[str, AudioBuffer] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future[AudioBuffer]] = {}
+        self._disk_scanned = False
+        self.stats = CacheStats()
+
+    def cache_key(self, text: str) -> str:
+        """テキストのキャッシュキーを作成する
+        Args:
+            text (str): 音声に変換するテキスト
+        Returns:
+            str: SHA-256 の16進文字列
+        """
+        return speech_key(self._voice_client.voice_settings(), text)
+
+    async def text_to_speech(self, text: str) -> AudioBuffer:
+        """キャッシュを確認し、なければ音声合成してキャッシュする
+        Args:
+            text (str): 音声に変換するテキスト
+        Returns:
+            AudioBuffer: 音声データ
+        """
+        key = self.cache_key(text)
+
+        audio = self._memory_get(key)
+        if audio is not None:
+            self.stats.memory_hits += 1
+            self.stats.bytes_served += len(audio)
+            return audio
+
+        # 同じ台詞を合成中の場合は、その結果を待つ
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            audio = await asyncio.shield(inflight)
+            self.stats.memory_hits += 1
+            self.stats.bytes_served += len(audio)
+            return audio
+
+        future: asyncio.Future[AudioBuffer] = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._inflight[key] = future
+        try:
+            audio = await self._load_or_synthesize(key, text)
+        except BaseException as e:
+            future.set_exception(e)
+            # 待機者がいない場合に警告が出ないよう、例外を取得済みにする
+            future.exception()
+            raise
+        else:
+            future.set_result(audio)
+        finally:
+            del self._inflight[key]
+
+        self._memory_put(key, audio)
+        return audio
+
+    async def stream_speech(self, text: str) -> AsyncIterator[AudioBuffer]:
+        """キャッシュがあれば全体を返し、なければ受信しながら返してキャッシュする
+        Args:
+            text (str): 音声に変換するテキスト
+        Yields:
+            AudioBuffer: PCM の断片
+        """
+        key = self.cache_key(text)
+
+        audio = self._memory_get(key)
+        if audio is not None:
+            self.stats.memory_hits += 1
+            self.stats.bytes_served += len(audio)
+        else:
+            audio = await self._load_disk(key)
+
+        if audio is not None:
+            yield audio
+            return
+
+        pcm = bytearray()
+        audio_format: AudioFormat | None = None
+        async for chunk in self._voice_client.stream_speech(text):
+            pcm += chunk.pcm
+            audio_format = chunk.audio_format
+            yield chunk
+
+        # 最後まで受信できた場合のみキャッシュする
+        if audio_format is None:
+            return
+        audio = AudioBuffer(pcm, audio_format)
+        self.stats.misses += 1
+        self.stats.bytes_synthesized += len(audio)
+        self._memory_put(key, audio)
+        if self._cache_dir is not None:
+            await asyncio.to_thread(self._disk_put, key, audio)
+
+    async def _load_disk(self, key: str) -> AudioBuffer | None:
+        """ディスクキャッシュから読み込む（無効な場合は None）"""
+        if self._cache_dir is None:
+            return None
+
+        audio = await asyncio.to_thread(self._disk_get, key)
+        if audio is not None:
+            self.stats.disk_hits += 1
+            self.stats.bytes_served += len(audio)
+        return audio
+
+    async def _load_or_synthesize(self, key: str, text: str) -> AudioBuffer:
+        """ディスクキャッシュから読み込むか、API で音声合成する"""
+        audio = await self._load_disk(key)
+        if audio is not None:
+            return audio
+
+        audio = await self._voice_client.text_to_speech(text)
+        self.stats.misses += 1
+        self.stats.bytes_synthesized += len(audio)
+
+        if self._cache_dir is not None:
+            await asyncio.to_thread(self._disk_put, key, audio)
+
+        return audio
+
+    def _memory_get(self, key: str) -> AudioBuffer | None:
+        """メモリキャッシュから取得する"""
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+        return audio
+
+    def _memory_put(self, key: str, audio: AudioBuffer) -> None:
+        """メモリキャッシュに追加し、上限を超えた古いエントリを削除する"""
+        if len(audio) > self._max_memory_bytes:
+            return
+
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self.stats.memory_bytes -= len(previous)
+
+        self._memory[key] = audio
+        self.stats.memory_bytes += len(audio)
+
+        while (
+            len(self._memory) > self._max_memory_entries
+            or self.stats.memory_bytes > self._max_memory_bytes
+        ):
+            _key, evicted = self._memory.popitem(last=False)
+            self.stats.memory_bytes -= len(evicted)
+            self.stats.memory_evictions += 1
+
+    def _disk_path(self, key: str) -> Path:
+        """ディスクキャッシュのファイルパスを取得する"""
+        assert self._cache_dir is not None
+        return self._cache_dir / key[:2] / f'{key}.audio'
+
+    def _disk_get(self, key: str) -> AudioBuffer | None:
+        """ディスクキャッシュから取得する（LRU 判定のため更新日時を更新する）"""
+        self._scan_disk()
+        path = self._disk_path(key)
+        try:
+            audio = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        try:
+            return AudioBuffer.from_wav(audio)
+        except ValueError:
+            # 壊れたファイルは削除して合成し直す
+            path.unlink(missing_ok=True)
+            self.stats.disk_bytes -= len(audio)
+            return None
+
+    def _disk_put(self, key: str, audio: AudioBuffer) -> None:
+        """ディスクキャッシュに書き込み、容量を超えた場合は古いものから削除する"""
+        self._scan_disk()
+        path = self._disk_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # 書き込み途中のファイルを読まないよう、一時ファイルから置き換える
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        header = audio.wav_header()
+        with tmp_path.open('wb') as file:
+            file.write(header)
+            file.write(audio.pcm)
+        # 既存のファイルを置き換える場合は、その分を使用量から差し引く
+        try:
+            replaced_bytes = path.stat().st_size
+        except FileNotFoundError:
+            replaced_bytes = 0
+        os.replace(tmp_path, path)
+        self.stats.disk_bytes += len(header) + len(audio) - replaced_bytes
+
+        if self.stats.disk_bytes > self._max_disk_bytes:
+            self._evict_disk()
+
+    def _scan_disk(self) -> None:
+        """初回アクセス時にディスクキャッシュの使用量を集計する"""
+        if self._disk_scanned or self._cache_dir is None:
+            return
+        self._disk_scanned = True
+        self.stats.disk_bytes = sum(
+            path.stat().st_size for path in self._cache_dir.glob('*/*.audio')
+        )
+
+    def _evict_disk(self) -> None:
+        """更新日時の古いファイルから削除し、使用量を上限の一定割合まで減らす"""
+        assert self._cache_dir is not None
+        entries: list[tuple[float, int, Path]] = []
+        for path in self._cache_dir.glob('*/*.audio'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        target = self._max_disk_bytes * self.DISK_EVICTION_RATIO
+        for _mtime, size, path in entries:
+            if self.stats.disk_bytes <= target:
+                break
+            path.unlink(missing_ok=True)
+            self.stats.disk_bytes -= size
+            self.stats.disk_evictions += 1
+
+    def voice_settings(self) -> dict[str, str]:
+        """ラップしているクライアントの設定を返す"""
+        return self._voice_client.voice_settings()
+
+    async def warm_up(self) -> None:
+        """ラップしているクライアントの接続を事前に確立する"""
+        await self._voice_client.warm_up()
+
+    async def aclose(self) -> None:
+        """ラップしているクライアントのリソースを解放する"""
+        await self._voice_client.aclose()
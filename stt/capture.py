@@ -0,0 +1,427 @@
+import asyncio
+import sys
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import IO, Any
+
+from .audio import AudioBuffer, AudioFormat
+
+
+class AudioSource(ABC):
+    """一定長のフレーム単位で PCM を供給する音声入力の抽象クラス
+    Attributes:
+        audio_format (AudioFormat): 供給する PCM の形式
+        frame_ms (int): 1フレームの長さ（ミリ秒）
+    """
+
+    def __init__(self, audio_format: AudioFormat, frame_ms: int):
+        self.audio_format = audio_format
+        self.frame_ms = frame_ms
+
+    @property
+    def frame_bytes(self) -> int:
+        """1フレームのバイト数"""
+        return (
+            self.audio_format.sample_rate
+            * self.frame_ms
+            // 1000
+            * self.audio_format.frame_size
+        )
+
+    @abstractmethod
+    async def start(self) -> None:
+        """音声の入力を開始する（開始済みの場合は何もしない）"""
+        pass
+
+    @abstractmethod
+    async def read(self) -> bytes:
+        """次のフレームを取得する
+        Returns:
+            bytes: 1フレーム分の PCM
+        Raises:
+            EOFError: 入力が終了した場合
+        """
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        """音声の入力を終了する"""
+        pass
+
+    def discard_pending(self) -> None:
+        """受信済みで未処理のフレームを破棄する"""
+        return None
+
+    async def frames(self) -> AsyncIterator[bytes]:
+        """入力が終了するまでフレームを順番に取得する"""
+        await self.start()
+        while True:
+            try:
+                yield await self.read()
+            except EOFError:
+                return
+
+
+class MicrophoneSource(AudioSource):
+    """マイクの入力ストリームを開いたままフレームを供給するクラス
+    ストリームはセッションを通して開いたままにするため、発話ごとに
+    マイクを開き直す待ち時間が発生しません。消費が追いつかない場合は
+    古いフレームから破棄するリングバッファとして動作します。
+    Attributes:
+        _stream (Any): sounddevice の RawInputStream
+        _queue (asyncio.Queue[bytes]): 受信済みのフレーム
+    """
+
+    # 音声認識に適したサンプリングレート
+    SAMPLE_RATE = 16000
+
+    # 1フレームの長さ（ミリ秒）
+    FRAME_MS = 30
+
+    # 保持するフレーム数の上限（約10秒分）
+    MAX_QUEUED_FRAMES = 10_000 // FRAME_MS
+
+    def __init__(self, device: int | str | None = None):
+        super().__init__(
+            audio_format=AudioFormat(sample_rate=self.SAMPLE_RATE),
+            frame_ms=self.FRAME_MS,
+        )
+        try:
+            import sounddevice as sd  # type: ignore
+        except (ModuleNotFoundError, OSError):
+            message = (
+                'マイク入力には `uv add sounddevice` と PortAudio が必要です'
+            )
+            raise ValueError(message)
+
+        self._sd = sd
+        self._device = device
+        self._stream: Any = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue[bytes] = asyncio.Queue(
+            maxsize=self.MAX_QUEUED_FRAMES
+        )
+        # 入力デバイスのオーバーフローなどの発生回数
+        self.overflows = 0
+
+    async def start(self) -> None:
+        if self._stream is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._stream = self._sd.RawInputStream(
+            samplerate=self.audio_format.sample_rate,
+            channels=self.audio_format.channels,
+            dtype='int16',
+            blocksize=self.frame_bytes // self.audio_format.frame_size,
+            device=self._device,
+            callback=self._callback,
+        )
+        self._stream.start()
+
+    async def read(self) -> bytes:
+        if self._stream is None:
+            raise EOFError
+        return await self._queue.get()
+
+    def discard_pending(self) -> None:
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def close(self) -> None:
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def _callback(
+        self,
+        indata: Any,
+        frames: int,
+        time: Any,
+        status: Any,
+    ) -> None:
+        """オーディオスレッドから呼ばれ、フレームをイベントループに渡す"""
+        if status:
+            self.overflows += 1
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._push, bytes(indata))
+
+    def _push(self, frame: bytes) -> None:
+        """フレームをキューに追加する（満杯の場合は最も古いものを捨てる）"""
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(frame)
+
+
+class QueueAudioSource(AudioSource):
+    """外部から渡された PCM をフレーム単位で供給するクラス
+    ネットワークなど、マイク以外から届く音声を音声認識に渡すために使います。
+    `push` で渡した PCM は長さを問わず、1フレームずつに分けて供給します。
+    消費が追いつかない場合は古いフレームから破棄します。
+    Attributes:
+        _queue (asyncio.Queue[bytes | None]): 受信済みのフレーム（None は入力の終了）
+        _pending (bytearray): 1フレームに満たない受信済みの PCM
+    """
+
+    FRAME_MS = 30
+
+    # 保持するフレーム数の上限（約10秒分）
+    MAX_QUEUED_FRAMES = 10_000 // FRAME_MS
+
+    def __init__(
+        self,
+        audio_format: AudioFormat = AudioFormat(sample_rate=16000),
+        frame_ms: int = FRAME_MS,
+        max_queued_frames: int = MAX_QUEUED_FRAMES,
+    ):
+        super().__init__(audio_format=audio_format, frame_ms=frame_ms)
+        self._queue: asyncio.Queue[bytes | None] = asyncio.Queue(
+            maxsize=max_queued_frames
+        )
+        self._pending = bytearray()
+        self._ended = False
+        # 消費が追いつかずに破棄したフレーム数
+        self.dropped_frames = 0
+
+    async def start(self) -> None:
+        return None
+
+    async def read(self) -> bytes:
+        if self._ended and self._queue.empty():
+            raise EOFError
+        frame = await self._queue.get()
+        if frame is None:
+            raise EOFError
+        return frame
+
+    def push(self, pcm: bytes | memoryview) -> None:
+        """受信した PCM を追加する（入力の終了後は無視する）"""
+        if self._ended:
+            return
+
+        self._pending += pcm
+        size = self.frame_bytes
+        count = len(self._pending) // size
+        for index in range(count):
+            self._put(bytes(self._pending[index * size : (index + 1) * size]))
+        del self._pending[: count * size]
+
+    def end(self) -> None:
+        """入力の終了を通知する（待機中の `read` は EOFError になる）"""
+        if self._ended:
+            return
+        self._ended = True
+        self._pending.clear()
+        self._put(None)
+
+    def discard_pending(self) -> None:
+        while not self._queue.empty():
+            if self._queue.get_nowait() is None:
+                # 終了の通知は破棄しない
+                self._queue.put_nowait(None)
+                return
+
+    def close(self) -> None:
+        self.end()
+
+    def _put(self, frame: bytes | None) -> None:
+        """フレームをキューに追加する（満杯の場合は最も古いものを捨てる）"""
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped_frames += 1
+        self._queue.put_nowait(frame)
+
+
+class FileAudioSource(AudioSource):
+    """録音ファイル（WAV / FLAC など）の音声をフレーム単位で供給するクラス
+    通話の録音などを音声認識に渡すために使います。ファイル全体を読み込み、
+    モノラル・16bit・指定のサンプリングレートに変換してから供給します。
+    """
+
+    FRAME_MS = 30
+
+    # 音声認識に適したサンプリングレート
+    SAMPLE_RATE = 16000
+
+    def __init__(
+        self,
+        path: Path,
+        sample_rate: int = SAMPLE_RATE,
+        realtime: bool = False,
+        frame_ms: int = FRAME_MS,
+    ):
+        """
+        Args:
+            path (Path): 録音ファイル
+            sample_rate (int): 供給する PCM のサンプリングレート
+            realtime (bool): True の場合は1フレームごとにフレームの長さだけ
+                待ち、マイクと同じ速さで供給する
+            frame_ms (int): 1フレームの長さ（ミリ秒）
+        Raises:
+            ValueError: soundfile がインストールされていない場合、
+                またはファイルを読み込めない場合
+        """
+        audio = load_audio_file(path, sample_rate)
+        super().__init__(audio_format=audio.audio_format, frame_ms=frame_ms)
+        self._pcm = audio.pcm
+        self._offset = 0
+        self._realtime = realtime
+        self._started = False
+
+    @property
+    def duration(self) -> float:
+        """ファイル全体の長さ（秒）"""
+        return self.audio_format.duration(self._pcm.nbytes)
+
+    async def start(self) -> None:
+        self._started = True
+
+    async def read(self) -> bytes:
+        if not self._started or self._offset >= self._pcm.nbytes:
+            raise EOFError
+
+        if self._realtime:
+            await asyncio.sleep(self.frame_ms / 1000)
+
+        frame = bytes(self._pcm[self._offset : self._offset + self.frame_bytes])
+        self._offset += self.frame_bytes
+        # 最後のフレームは無音で埋めて長さを揃える
+        return frame.ljust(self.frame_bytes, b'\0')
+
+    def close(self) -> None:
+        self._started = False
+
+
+class StdinAudioSource(AudioSource):
+    """標準入力から生の PCM を読み込んでフレーム単位で供給するクラス
+    サウンドカードのないサーバーで、`arecord` や `ffmpeg` の出力を
+    パイプで受け取るために使います。読み込みは別スレッドで行い、
+    消費が追いつかない場合は読み込みを止めるため、ファイルを流し込んでも
+    音声を失いません。同じ理由で、受信済みのフレームは破棄しません。
+    Attributes:
+        _queue (asyncio.Queue[bytes | None]): 読み込んだフレーム（None は入力の終了）
+    """
+
+    FRAME_MS = 30
+
+    # 保持するフレーム数の上限（約10秒分）
+    MAX_QUEUED_FRAMES = 10_000 // FRAME_MS
+
+    # キューの空きを待つ間に、入力の終了を確認する間隔（秒）
+    PUT_TIMEOUT = 0.5
+
+    def __init__(
+        self,
+        audio_format: AudioFormat = AudioFormat(sample_rate=16000),
+        frame_ms: int = FRAME_MS,
+        stream: IO[bytes] | None = None,
+    ):
+        """
+        Args:
+            audio_format (AudioFormat): 入力される PCM（リトルエンディアン）の形式
+            frame_ms (int): 1フレームの長さ（ミリ秒）
+            stream (IO[bytes] | None): 読み込むストリーム
+                （None の場合は標準入力）
+        """
+        super().__init__(audio_format=audio_format, frame_ms=frame_ms)
+        self._stream = stream or sys.stdin.buffer
+        self._queue: asyncio.Queue[bytes | None] = asyncio.Queue(
+            maxsize=self.MAX_QUEUED_FRAMES
+        )
+        self._thread: threading.Thread | None = None
+        self._closed = threading.Event()
+        self._ended = False
+
+    async def start(self) -> None:
+        if self._thread is not None:
+            return
+        # 読み込み中のスレッドは終了を待たずにプロセスを終了できるようにする
+        self._thread = threading.Thread(
+            target=self._read_stream,
+            args=(asyncio.get_running_loop(),),
+            name='stdin-audio-source',
+            daemon=True,
+        )
+        self._thread.start()
+
+    async def read(self) -> bytes:
+        if self._ended or self._thread is None:
+            raise EOFError
+        frame = await self._queue.get()
+        if frame is None:
+            self._ended = True
+            raise EOFError
+        return frame
+
+    def close(self) -> None:
+        self._closed.set()
+        self._ended = True
+
+    def _read_stream(self, loop: asyncio.AbstractEventLoop) -> None:
+        """別スレッドで1フレームずつ読み込み、イベントループのキューに渡す"""
+        try:
+            while not self._closed.is_set():
+                frame = self._stream.read(self.frame_bytes)
+                if not frame:
+                    break
+                # 最後のフレームは無音で埋めて長さを揃える
+                self._put(loop, frame.ljust(self.frame_bytes, b'\0'))
+            self._put(loop, None)
+        except (OSError, ValueError, RuntimeError):
+            # ストリームやイベントループが閉じられた場合
+            pass
+
+    def _put(
+        self, loop: asyncio.AbstractEventLoop, frame: bytes | None
+    ) -> None:
+        """キューに空きができるまで待ってフレームを追加する
+        Raises:
+            RuntimeError: イベントループが終了した場合
+        """
+        future = asyncio.run_coroutine_threadsafe(self._queue.put(frame), loop)
+        while not self._closed.is_set():
+            try:
+                future.result(timeout=self.PUT_TIMEOUT)
+                return
+            except TimeoutError:
+                continue
+        future.cancel()
+
+
+def load_audio_file(path: Path, sample_rate: int) -> AudioBuffer:
+    """録音ファイルを読み込み、モノラル・16bit・指定のサンプリングレートに変換する
+    WAV・FLAC など soundfile（libsndfile）が対応する形式を読み込めます。
+    プロセスプールのワーカーからも呼べるよう、モジュールの関数にしています。
+    Args:
+        path (Path): 録音ファイル
+        sample_rate (int): 変換後のサンプリングレート
+    Returns:
+        AudioBuffer: 変換した PCM
+    Raises:
+        ValueError: soundfile がインストールされていない場合、
+            またはファイルを読み込めない場合
+    """
+    try:
+        import numpy as np
+        import soundfile as sf  # type: ignore
+    except (ModuleNotFoundError, OSError):
+        raise ValueError(
+            '録音ファイルの読み込みには `uv add soundfile numpy` が必要です'
+        )
+
+    try:
+        samples, source_rate = sf.read(path, dtype='float32', always_2d=True)
+    except RuntimeError as e:
+        raise ValueError(f'録音ファイルを読み込めません: {path}: {e}')
+
+    # チャンネルを平均してモノラルにする
+    mono = samples.mean(axis=1)
+    if source_rate != sample_rate and mono.size:
+        # 音声認識に使う用途のため、線形補間で十分な品質とする
+        count = int(round(mono.size * sample_rate / source_rate))
+        positions = np.arange(count) * (source_rate / sample_rate)
+        mono = np.interp(positions, np.arange(mono.size), mono)
+
+    pcm = (np.clip(mono, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+    return AudioBuffer(pcm, AudioFormat(sample_rate=sample_rate))
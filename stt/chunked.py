@@ -0,0 +1,209 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+
+from .audio import AudioBuffer
+from .metrics import Metrics
+from .segmenter import SentenceSegmenter
+from .voice import VoiceClient
+
+
+@dataclass
+class ChunkStats:
+    """分割合成の統計情報"""
+
+    # 音声合成の呼び出し回数と、そのうち分割して合成した回数
+    requests: int = 0
+    split: int = 0
+    # 分割したチャンクの数
+    chunks: int = 0
+    # いずれかのチャンクの合成に失敗した呼び出しの回数
+    failures: int = 0
+
+    def report(self) -> str:
+        """統計情報を1行の文字列にする"""
+        return (
+            f'分割合成: {self.split} / {self.requests} 回'
+            f' / チャンク {self.chunks} 個 / 失敗 {self.failures} 回'
+        )
+
+
+def split_text(text: str, max_chars: int) -> list[str]:
+    """テキストを max_chars 文字以下のチャンクに分割する
+    文末で区切り、長すぎる文は読点で、それでも長すぎる部分は空白か
+    文字数で区切ります。区切った後、短いチャンクは上限を超えない範囲で
+    前のチャンクとつなげ、API の呼び出し回数と不自然な継ぎ目を減らします。
+    Args:
+        text (str): 分割するテキスト
+        max_chars (int): 1チャンクの最大文字数
+    Returns:
+        list[str]: チャンクのリスト
+    """
+    pieces: list[str] = []
+    # 最小文字数をテキストより長くし、文末記号だけで区切る
+    for sentence in SentenceSegmenter.split(text, min_chars=len(text) + 1):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for clause in SentenceSegmenter.split(sentence, min_chars=1):
+            pieces.extend(_split_by_length(clause, max_chars))
+
+    chunks: list[str] = []
+    for piece in pieces:
+        if chunks and len(joined := _join(chunks[-1], piece)) <= max_chars:
+            chunks[-1] = joined
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+def _split_by_length(text: str, max_chars: int) -> list[str]:
+    """区切り記号のないテキストを、なるべく空白の位置で max_chars 文字以下に切る"""
+    chunks: list[str] = []
+    while len(text) > max_chars:
+        cut = text.rfind(' ', 1, max_chars + 1)
+        if cut <= 0:
+            cut = max_chars
+        chunks.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+def _join(head: str, tail: str) -> str:
+    """2つのチャンクをつなげる（英語の単語の間にだけ空白を入れる）"""
+    separator = ' ' if head[-1].isascii() and tail[0].isascii() else ''
+    return head + separator + tail
+
+
+class ChunkedVoiceClient(VoiceClient):
+    """長いテキストを分割して並行に合成し、順番どおりに返す VoiceClient のラッパー
+    1回の合成にかかる時間はテキストの長さに比例するため、長い台詞は
+    文や読点の位置でチャンクに分割し、同時に最大 max_parallel 個まで
+    合成します。音声は先頭のチャンクの合成が終わるたびに順番どおりに返すため、
+    最初の音声までの時間は先頭のチャンクの合成時間になります。
+    チャンクごとに別のリクエストとして送るため、一時的なエラーはバックエンドの
+    Governor がそのチャンクだけを再試行し、台詞全体を合成し直すことはありません。
+    上限より短いテキストは分割せず、ラップしているクライアントの
+    ストリーミングをそのまま使います。
+    Attributes:
+        _voice_client (VoiceClient): 実際に音声合成を行うクライアント
+        _semaphore (asyncio.Semaphore): 同時に合成するチャンクの数の制限
+            （すべての呼び出しで共有する）
+        stats (ChunkStats): 分割合成の統計情報
+    """
+
+    # 1チャンクの最大文字数
+    MAX_CHARS = 80
+
+    # 同時に合成するチャンクの最大数
+    MAX_PARALLEL = 3
+
+    def __init__(
+        self,
+        voice_client: VoiceClient,
+        max_chars: int = MAX_CHARS,
+        max_parallel: int = MAX_PARALLEL,
+        metrics: Metrics | None = None,
+    ):
+        """
+        Args:
+            voice_client (VoiceClient): 実際に音声合成を行うクライアント
+            max_chars (int): 1チャンクの最大文字数
+            max_parallel (int): 同時に合成するチャンクの最大数
+            metrics (Metrics | None): チャンクごとの合成時間の計測先
+        Raises:
+            ValueError: 文字数か並行数が 1 未満の場合
+        """
+        if min(max_chars, max_parallel) < 1:
+            raise ValueError(
+                'max_chars と max_parallel は 1 以上を指定してください'
+            )
+
+        self._voice_client = voice_client
+        self._max_chars = max_chars
+        self._metrics = metrics or Metrics()
+        self._semaphore = asyncio.Semaphore(max_parallel)
+        self.stats = ChunkStats()
+
+    async def text_to_speech(self, text: str) -> AudioBuffer:
+        """チャンクごとに合成した音声をつなげて返す
+        Args:
+            text (str): 音声に変換するテキスト
+        Returns:
+            AudioBuffer: 音声データ
+        Raises:
+            ValueError: チャンクの音声の形式が揃っていない場合
+        """
+        if len(split_text(text, self._max_chars)) <= 1:
+            self.stats.requests += 1
+            return await self._voice_client.text_to_speech(text)
+
+        pieces = [piece async for piece in self.stream_speech(text)]
+        audio_format = pieces[0].audio_format
+        if any(piece.audio_format != audio_format for piece in pieces):
+            raise ValueError('チャンクの音声の形式が揃っていません')
+        return AudioBuffer(
+            b''.join(piece.pcm for piece in pieces), audio_format
+        )
+
+    async def stream_speech(self, text: str) -> AsyncIterator[AudioBuffer]:
+        """チャンクを並行に合成し、先頭から順番に音声を返す
+        Args:
+            text (str): 音声に変換するテキスト
+        Yields:
+            AudioBuffer: チャンクごとの音声
+        """
+        self.stats.requests += 1
+        chunks = split_text(text, self._max_chars)
+        if len(chunks) <= 1:
+            async for piece in self._voice_client.stream_speech(text):
+                yield piece
+            return
+
+        self.stats.split += 1
+        self.stats.chunks += len(chunks)
+        tasks = [
+            asyncio.create_task(self._synthesize(chunk)) for chunk in chunks
+        ]
+        try:
+            for task in tasks:
+                try:
+                    audio = await task
+                except Exception:
+                    self.stats.failures += 1
+                    raise
+                yield audio
+        finally:
+            # 途中で中止された場合は、まだ合成中のチャンクも取り消す
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _synthesize(self, text: str) -> AudioBuffer:
+        """1つのチャンクを合成する
+        一時的なエラーの再試行はバックエンドの Governor が行うため、
+        ここでは合成し直しません。
+        """
+        # セマフォは待った順に枠を渡すため、先頭のチャンクから合成される
+        async with self._semaphore:
+            started_at = time.perf_counter()
+            audio = await self._voice_client.text_to_speech(text)
+        self._metrics.observe('tts.chunk', time.perf_counter() - started_at)
+        return audio
+
+    def voice_settings(self) -> dict[str, str]:
+        """ラップしているクライアントの設定に分割の設定を加えて返す
+        チャンクの継ぎ目で音声が変わるため、キャッシュのキーに含めます。
+        """
+        return self._voice_client.voice_settings() | {
+            'chunk_chars': str(self._max_chars)
+        }
+
+    async def warm_up(self) -> None:
+        await self._voice_client.warm_up()
+
+    async def aclose(self) -> None:
+        await self._voice_client.aclose()
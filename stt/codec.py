@@ -0,0 +1,157 @@
+import asyncio
+import contextlib
+import os
+from collections.abc import AsyncGenerator, AsyncIterator
+from typing import Literal
+
+from .audio import AudioBuffer, WavStreamParser
+from .voice import is_installed
+
+# 音声合成 API から受信する音声の形式
+# wav: デコード不要だが転送量が多い、mp3: 転送量は数分の1だがデコードに CPU を使う
+type TransferFormat = Literal['wav', 'mp3']
+
+TRANSFER_FORMATS: tuple[TransferFormat, ...] = ('wav', 'mp3')
+
+
+def transfer_format_from_env() -> TransferFormat:
+    """環境変数 `TTS_TRANSFER_FORMAT` で指定された受信する音声の形式を返す
+    帯域の狭い環境では `mp3`、CPU に余裕のない環境では `wav`（デフォルト）を
+    指定します。
+    Raises:
+        ValueError: 未対応の形式が指定された場合
+    """
+    value = os.getenv('TTS_TRANSFER_FORMAT') or 'wav'
+    for transfer_format in TRANSFER_FORMATS:
+        if transfer_format == value:
+            return transfer_format
+    raise ValueError(f'未対応の TTS_TRANSFER_FORMAT です: {value}')
+
+
+class FFmpegDecoder:
+    """圧縮された音声を ffmpeg で逐次 PCM にデコードするクラス
+    受信したデータを ffmpeg の標準入力に書き込みながら、標準出力から
+    デコードできた分の PCM を読み出すため、ファイル全体の受信を待たずに
+    再生を始められます。
+    Attributes:
+        _input_format (TransferFormat): 入力する音声の形式
+    """
+
+    # 標準出力から1回に読み込むサイズ
+    READ_SIZE = 8192
+
+    def __init__(self, input_format: TransferFormat):
+        """
+        Args:
+            input_format (TransferFormat): 入力する音声の形式
+        Raises:
+            ValueError: ffmpeg がインストールされていない場合
+        """
+        if not is_installed('ffmpeg'):
+            raise ValueError(
+                f'`ffmpeg` がインストールされていません。{input_format} の音声をデコードするにはインストールしてください。'
+            )
+        self._input_format = input_format
+
+    async def decode(
+        self, chunks: AsyncIterator[bytes]
+    ) -> AsyncGenerator[AudioBuffer]:
+        """受信した音声データを PCM にデコードし、デコードできた順に返す
+        Args:
+            chunks (AsyncIterator[bytes]): 受信した音声データ
+        Yields:
+            AudioBuffer: PCM の断片
+        Raises:
+            ValueError: ffmpeg がデコードに失敗した場合
+        """
+        process = await asyncio.create_subprocess_exec(
+            'ffmpeg',
+            '-hide_banner',
+            '-loglevel',
+            'error',
+            # 形式を推測するための読み込みを最小にし、最初の PCM を早く出力する
+            '-probesize',
+            '4096',
+            '-analyzeduration',
+            '0',
+            '-f',
+            self._input_format,
+            '-i',
+            'pipe:0',
+            '-map_metadata',
+            '-1',
+            '-f',
+            'wav',
+            'pipe:1',
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        feed = asyncio.create_task(self._feed(process, chunks))
+        try:
+            assert process.stdout is not None
+            parser = WavStreamParser()
+            while data := await process.stdout.read(self.READ_SIZE):
+                pcm = parser.feed(data)
+                if pcm and parser.audio_format is not None:
+                    yield AudioBuffer(pcm, parser.audio_format)
+
+            # 受信中のエラーはデコードのエラーより優先して伝える
+            await feed
+            assert process.stderr is not None
+            stderr = await process.stderr.read()
+            if await process.wait() != 0:
+                raise ValueError(
+                    f'音声をデコードできませんでした: {stderr.decode().strip()}'
+                )
+        finally:
+            feed.cancel()
+            await asyncio.gather(feed, return_exceptions=True)
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+    @staticmethod
+    async def _feed(
+        process: asyncio.subprocess.Process, chunks: AsyncIterator[bytes]
+    ) -> None:
+        """受信した音声データを ffmpeg の標準入力に書き込む"""
+        assert process.stdin is not None
+        try:
+            async for data in chunks:
+                process.stdin.write(data)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg がエラーで終了した場合（エラーは終了コードで伝える）
+            return
+        finally:
+            with contextlib.suppress(BrokenPipeError, ConnectionResetError):
+                process.stdin.close()
+
+
+async def decode_audio(
+    data: bytes | bytearray | memoryview, input_format: TransferFormat
+) -> AudioBuffer:
+    """音声データ全体を PCM にデコードする
+    Args:
+        data (bytes | bytearray | memoryview): 音声データ
+        input_format (TransferFormat): 音声データの形式
+    Returns:
+        AudioBuffer: 音声データ
+    Raises:
+        ValueError: デコードに失敗した場合
+    """
+    if input_format == 'wav':
+        return AudioBuffer.from_wav(data)
+
+    async def chunks() -> AsyncIterator[bytes]:
+        yield bytes(data)
+
+    pcm = bytearray()
+    audio_format = None
+    async for chunk in FFmpegDecoder(input_format).decode(chunks()):
+        pcm += chunk.pcm
+        audio_format = chunk.audio_format
+    if audio_format is None:
+        raise ValueError('音声データに PCM が含まれていません。')
+    return AudioBuffer(pcm, audio_format)
@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Literal
 
 # キャラクターの識別子
@@ -8,14 +8,31 @@ type CharacterID = Literal[
     'ikemen',
 ]
 
+# 音声合成バックエンド（VOICE_CLIENT_MODE で選択する名前）
+type VoiceBackend = Literal['google', 'nijivoice']
+
+VOICE_BACKENDS: tuple[VoiceBackend, ...] = ('google', 'nijivoice')
+
+# 定型の台詞の種類
+# greeting: 会話の開始時の挨拶、error: エラー時のお詫び、farewell: 会話終了時の挨拶
+type PhraseID = Literal[
+    'greeting',
+    'error',
+    'farewell',
+]
+
 
 @dataclass
 class CharacterOptions:
-    """キャラクターの設定オプション"""
+    """キャラクターの設定オプション
+    `phrases` の台詞は毎回同じため、`python -m stt.bundle` で事前に
+    音声合成しておくと API を呼ばずに再生できます。
+    """
 
     id: CharacterID
     name: str
     instruction: str
+    phrases: dict[PhraseID, str] = field(default_factory=dict)
 
 
 # キャラクター設定
@@ -31,6 +48,11 @@ CHARACTER_MAP: list[CharacterOptions] = [
         使って、会話を盛り上げてください。
         たまに「ギャル語」を使うこともあります。
         """,
+        phrases={
+            'greeting': 'やっほー！来てくれてマジうれしい！',
+            'error': 'ごめん、ちょっと聞き取れなかったかも。もう一回言って？',
+            'farewell': 'えー、もう終わり？また話そうね、バイバイ！',
+        },
     ),
     CharacterOptions(
         id='shy',
@@ -42,6 +64,11 @@ CHARACTER_MAP: list[CharacterOptions] = [
         例えば、「あの、もしよかったら…」や「ごめんなさい、ちょっと恥ずかしいんですけど…」のようなフレーズを
         使って、会話を進めてください。
         """,
+        phrases={
+            'greeting': 'あ、あの…こんにちは。来てくれて、うれしいです…',
+            'error': 'ご、ごめんなさい…よく聞こえなかったので、もう一度お願いできますか…？',
+            'farewell': 'お話しできて、楽しかったです…また、来てくださいね…',
+        },
     ),
     CharacterOptions(
         id='ikemen',
@@ -53,6 +80,11 @@ CHARACTER_MAP: list[CharacterOptions] = [
         例えば、「君のこと、ずっと気になってたんだ」とか「最近どう？元気にしてる？」のようなフレーズを
         使って、会話を進めてください。
         """,
+        phrases={
+            'greeting': 'やあ、来てくれたんだね。待ってたよ。',
+            'error': 'ごめん、よく聞こえなかったんだ。もう一度聞かせてくれる？',
+            'farewell': '今日は楽しかったよ。またね。',
+        },
     ),
 ]
 
@@ -0,0 +1,163 @@
+import math
+from dataclasses import dataclass
+
+from google.genai import types  # type: ignore
+
+
+def estimate_tokens(text: str) -> int:
+    """テキストのトークン数を概算する
+    API を呼ばずに予算を判定するための目安で、日本語などの非 ASCII 文字は
+    1文字1トークン、ASCII 文字は4文字1トークンとして数えます。
+    Args:
+        text (str): 対象のテキスト
+    Returns:
+        int: 概算のトークン数
+    """
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return (len(text) - ascii_chars) + math.ceil(ascii_chars / 4)
+
+
+@dataclass(frozen=True)
+class Turn:
+    """会話の1往復
+    Attributes:
+        user (str): ユーザーの発話
+        model (str): AI の応答
+        tokens (int): 発話と応答の概算トークン数
+    """
+
+    user: str
+    model: str
+    tokens: int
+
+    @classmethod
+    def create(cls, user: str, model: str) -> 'Turn':
+        """トークン数を概算して作成する"""
+        return cls(
+            user=user,
+            model=model,
+            tokens=estimate_tokens(user) + estimate_tokens(model),
+        )
+
+    def contents(self) -> list[types.ContentOrDict]:
+        """チャット履歴の形式に変換する"""
+        return [
+            types.Content(role='user', parts=[types.Part(text=self.user)]),
+            types.Content(role='model', parts=[types.Part(text=self.model)]),
+        ]
+
+
+class ConversationContext:
+    """予算内に収まるよう会話の履歴を管理するクラス
+    直近の会話はそのまま保持し、予算を超えた古い会話は要約にまとめます。
+    トークン数は会話の追加・削除のたびに差分で更新するため、予算の判定は
+    履歴の長さによらず一定の時間で行えます。
+    Attributes:
+        turns (list[Turn]): そのまま保持している会話（古い順）
+        summary (str): 要約にまとめた会話の内容（まだない場合は空）
+        tokens (int): 保持している会話の概算トークン数
+    """
+
+    # 保持する会話の既定の上限
+    MAX_TOKENS = 2000
+    MAX_TURNS = 12
+
+    # 要約せずに必ず残す直近の会話数
+    KEEP_RECENT_TURNS = 4
+
+    # 予算を超えた場合に、上限のこの割合まで古い会話を要約にまとめる
+    COMPACT_RATIO = 0.5
+
+    # 要約の見出しと、履歴の先頭に置いた要約への応答
+    SUMMARY_HEADING = '# これまでの会話の要約'
+    SUMMARY_ACK = 'わかりました。この内容を踏まえて会話を続けます。'
+
+    def __init__(
+        self,
+        max_tokens: int = MAX_TOKENS,
+        max_turns: int = MAX_TURNS,
+        keep_recent_turns: int = KEEP_RECENT_TURNS,
+    ):
+        self._max_tokens = max_tokens
+        self._max_turns = max_turns
+        self._keep_recent_turns = keep_recent_turns
+        self.turns: list[Turn] = []
+        self.summary = ''
+        self.tokens = 0
+
+    @property
+    def over_budget(self) -> bool:
+        """保持している会話が予算を超えているかどうか"""
+        return (
+            self.tokens > self._max_tokens or len(self.turns) > self._max_turns
+        )
+
+    def append(self, user: str, model: str) -> None:
+        """会話を追加する"""
+        turn = Turn.create(user, model)
+        self.turns.append(turn)
+        self.tokens += turn.tokens
+
+    def select_oldest(self) -> list[Turn]:
+        """要約にまとめる古い会話を選ぶ
+        残りの会話が上限の `COMPACT_RATIO` 以下になるまで古い順に選びますが、
+        直近の `keep_recent_turns` 件は選びません。
+        Returns:
+            list[Turn]: 要約にまとめる会話（古い順）
+        """
+        target_tokens = self._max_tokens * self.COMPACT_RATIO
+        target_turns = self._max_turns * self.COMPACT_RATIO
+        remaining_tokens = self.tokens
+        count = 0
+
+        for turn in self.turns[: -self._keep_recent_turns or None]:
+            if (
+                remaining_tokens <= target_tokens
+                and len(self.turns) - count <= target_turns
+            ):
+                break
+            remaining_tokens -= turn.tokens
+            count += 1
+
+        return self.turns[:count]
+
+    def fold(self, turns: list[Turn], summary: str | None) -> None:
+        """古い会話を履歴から取り除き、要約を更新する
+        Args:
+            turns (list[Turn]): `select_oldest` で選んだ会話
+            summary (str | None): 新しい要約（None の場合は要約を変更しない）
+        """
+        count = len(turns)
+        assert self.turns[:count] == turns
+        del self.turns[:count]
+        self.tokens -= sum(turn.tokens for turn in turns)
+        if summary is not None:
+            self.summary = summary
+
+    def history(self) -> list[types.ContentOrDict]:
+        """保持している会話をチャット履歴の形式で返す"""
+        return [content for turn in self.turns for content in turn.contents()]
+
+    def system_instruction(self, base: str) -> str:
+        """要約を加えたシステムインストラクションを返す
+        Args:
+            base (str): 元のシステムインストラクション
+        Returns:
+            str: 要約がある場合はそれを末尾に加えたシステムインストラクション
+        """
+        if not self.summary:
+            return base
+        return f'{base}\n\n{self.SUMMARY_HEADING}\n{self.summary}'
+
+    def summary_history(self) -> list[types.ContentOrDict]:
+        """要約をチャット履歴の先頭に置く形式で返す
+        システムインストラクションをキャッシュしていて要約を加えられない
+        場合に、履歴の先頭で要約を伝えるために使います。
+        Returns:
+            list[types.ContentOrDict]: 要約の往復（要約がない場合は空）
+        """
+        if not self.summary:
+            return []
+        return Turn.create(
+            f'{self.SUMMARY_HEADING}\n{self.summary}', self.SUMMARY_ACK
+        ).contents()
@@ -0,0 +1,478 @@
+import math
+import time
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+
+import numpy as np
+import numpy.typing as npt
+
+from .audio import AudioBuffer, AudioFormat
+from .metrics import Metrics
+from .voice import VoiceClient
+
+# (フレーム数, チャンネル数) の float32 のサンプル（-1.0 〜 1.0）
+type Samples = npt.NDArray[np.float32]
+
+# 後処理できる PCM のサンプル幅（バイト）。8bit の WAV は符号なしのため対象外
+SUPPORTED_SAMPLE_WIDTHS = (2, 4)
+
+
+def to_samples(audio: AudioBuffer) -> Samples:
+    """PCM を (フレーム数, チャンネル数) の float32 の配列に変換する"""
+    peak = float(2 ** (audio.sample_width * 8 - 1))
+    samples = np.frombuffer(audio.pcm, dtype=f'<i{audio.sample_width}')
+    return (samples.astype(np.float32) / peak).reshape(-1, audio.channels)
+
+
+def to_pcm(samples: Samples, audio_format: AudioFormat) -> AudioBuffer:
+    """float32 の配列を指定した形式の PCM に変換する（範囲外の値は切り詰める）"""
+    peak = 2 ** (audio_format.sample_width * 8 - 1) - 1
+    pcm = np.clip(samples, -1.0, 1.0) * peak
+    return AudioBuffer(
+        pcm.astype(f'<i{audio_format.sample_width}').tobytes(), audio_format
+    )
+
+
+class StreamResampler:
+    """断片ごとに届く PCM を線形補間でサンプリングレート変換するクラス
+    直前の断片の最後のフレームと次に出力する位置を持ち越すため、断片の
+    境界で音が途切れたり、位相がずれたりしません。出力デバイスのレートは
+    通常 TTS のレート以上のため、間引き前の低域通過フィルタは省いています。
+    Attributes:
+        source_rate (int): 入力のサンプリングレート
+        target_rate (int): 出力のサンプリングレート
+    """
+
+    def __init__(self, source_rate: int, target_rate: int):
+        self.source_rate = source_rate
+        self.target_rate = target_rate
+        self._step = source_rate / target_rate
+        self._last: Samples | None = None
+        # 次に出力する位置（次の断片の先頭を 0、直前のフレームを -1 とする）
+        self._position = 0.0
+
+    def process(self, samples: Samples) -> Samples:
+        """断片を変換する
+        Args:
+            samples (Samples): 入力の断片
+        Returns:
+            Samples: 変換した断片（入力が短い場合は空のこともある）
+        """
+        if self.source_rate == self.target_rate or not len(samples):
+            return samples
+
+        if self._last is None:
+            self._last = samples[:1]
+        # 先頭に直前のフレームを付け、位置 p を添字 p + 1 で参照する
+        padded = np.concatenate([self._last, samples])
+        size = len(samples)
+        count = math.floor((size - 1 - self._position) / self._step) + 1
+        self._last = samples[-1:]
+        if count <= 0:
+            self._position -= size
+            return samples[:0]
+
+        positions = self._position + 1.0 + np.arange(count) * self._step
+        index = positions.astype(np.int64)
+        fraction = (positions - index).astype(np.float32)[:, np.newaxis]
+        upper = np.minimum(index + 1, size)
+        resampled = padded[index] + (padded[upper] - padded[index]) * fraction
+        self._position += count * self._step - size
+        return resampled.astype(np.float32, copy=False)
+
+
+class SpeechPostProcessor:
+    """1回の発話の音声を断片ごとに後処理するクラス
+    以下を順に行います。
+    - 先頭と末尾の無音の削除（BLOCK_SECONDS ごとのエネルギーで判定）
+    - 音量の正規化（発話区間の RMS を目標の大きさに揃える）
+    - 出力デバイスのサンプリングレートへの変換
+    末尾の無音は、発話が続くか音声が終わるまで保留します（発話の途中の
+    無音はそのまま残します）。対応していない形式の音声はそのまま返します。
+    Attributes:
+        trimmed_frames (int): 削除した無音のフレーム数（入力のレート）
+        processed_frames (int): 処理した音声のフレーム数（入力のレート）
+    """
+
+    # 無音を判定する区間の長さ（秒）
+    BLOCK_SECONDS = 0.01
+
+    # この大きさ（RMS、dBFS）以下の区間を無音とみなす
+    GATE_DBFS = -45.0
+
+    # 子音の立ち上がりや余韻を削らないよう、発話の前後に残す無音（秒）
+    PAD_SECONDS = 0.03
+
+    # 末尾の無音として保留する上限（秒）。長い間は保留せずに送り出す
+    MAX_HOLD_SECONDS = 1.0
+
+    # 正規化の目標の大きさ（発話区間の RMS、dBFS）
+    TARGET_DBFS = -20.0
+
+    # 正規化で変える音量の上限（dB）。ほぼ無音の音声を増幅しすぎない
+    MAX_GAIN_DB = 12.0
+
+    def __init__(
+        self,
+        sample_rate: int | None = None,
+        target_dbfs: float | None = TARGET_DBFS,
+        trim_silence: bool = True,
+        loudness_db: float | None = None,
+    ):
+        """
+        Args:
+            sample_rate (int | None): 出力のサンプリングレート
+                （None の場合は変換しない）
+            target_dbfs (float | None): 正規化の目標の大きさ
+                （None の場合は正規化しない）
+            trim_silence (bool): 先頭と末尾の無音を削除するかどうか
+            loudness_db (float | None): これまでの発話から推定した、この声の
+                大きさ（None の場合は最初の発話区間から推定する）
+        """
+        self._sample_rate = sample_rate
+        self._target_dbfs = target_dbfs
+        self._trim_silence = trim_silence
+        self._loudness_db = loudness_db
+        self._gate_power = 10 ** (self.GATE_DBFS / 10)
+
+        self._format: AudioFormat | None = None
+        self._output_format: AudioFormat | None = None
+        self._resampler: StreamResampler | None = None
+        self._block = 0
+        self._pad = 0
+        self._max_hold = 0
+        self._pending: Samples | None = None
+        self._lead: Samples | None = None
+        self._held: Samples | None = None
+        self._started = not trim_silence
+        self._gain: float | None = None
+        self._voiced_power = 0.0
+        self._voiced_blocks = 0
+        self.trimmed_frames = 0
+        self.processed_frames = 0
+
+    @property
+    def input_format(self) -> AudioFormat | None:
+        """後処理している音声の形式（最初の断片を受け取る前は None）"""
+        return self._format
+
+    @property
+    def measured_db(self) -> float | None:
+        """ここまでの発話区間の大きさ（RMS、dBFS。発話がない場合は None）"""
+        if not self._voiced_blocks:
+            return None
+        return 10 * math.log10(self._voiced_power / self._voiced_blocks)
+
+    def process(self, audio: AudioBuffer) -> AudioBuffer | None:
+        """断片を後処理する
+        Args:
+            audio (AudioBuffer): 受信した断片
+        Returns:
+            AudioBuffer | None: 後処理した断片（送り出す音声がない場合は None）
+        """
+        if not self._accepts(audio):
+            return audio if audio else None
+
+        samples = to_samples(audio)
+        self.processed_frames += len(samples)
+        if self._pending is not None:
+            samples = np.concatenate([self._pending, samples])
+        # 区間の長さに満たない端数は次の断片と合わせて判定する
+        usable = len(samples) - len(samples) % self._block
+        self._pending = samples[usable:]
+        return self._emit(self._gate(samples[:usable]))
+
+    def flush(self) -> AudioBuffer | None:
+        """音声の終わりに、保留している音声を後処理する
+        Returns:
+            AudioBuffer | None: 残りの音声（ない場合は None）
+        """
+        if self._format is None:
+            return None
+
+        pending = self._pending if self._pending is not None else self._empty()
+        self._pending = None
+        if not self._trim_silence:
+            return self._emit(pending)
+
+        if not self._started:
+            # 発話がなかった場合はすべて削除する
+            lead = len(self._lead) if self._lead is not None else 0
+            self.trimmed_frames += lead + len(pending)
+            self._lead = None
+            return None
+
+        held = self._held if self._held is not None else self._empty()
+        self._held = None
+        tail = np.concatenate([held, pending])
+        keep = (
+            len(tail) if self._is_voiced(pending) else min(len(tail), self._pad)
+        )
+        self.trimmed_frames += len(tail) - keep
+        return self._emit(tail[:keep])
+
+    def _accepts(self, audio: AudioBuffer) -> bool:
+        """断片を後処理できるか確認し、最初の断片で形式に合わせて初期化する"""
+        if not audio or audio.sample_width not in SUPPORTED_SAMPLE_WIDTHS:
+            return False
+        if self._format is None:
+            self._format = audio.audio_format
+            rate = audio.sample_rate
+            self._block = max(1, round(rate * self.BLOCK_SECONDS))
+            self._pad = round(rate * self.PAD_SECONDS)
+            self._max_hold = round(rate * self.MAX_HOLD_SECONDS)
+            self._output_format = AudioFormat(
+                sample_rate=self._sample_rate or rate,
+                channels=audio.channels,
+                sample_width=audio.sample_width,
+            )
+            if self._sample_rate is not None:
+                self._resampler = StreamResampler(rate, self._sample_rate)
+        # 途中で形式が変わった断片はそのまま返す
+        return self._format == audio.audio_format
+
+    def _gate(self, samples: Samples) -> Samples:
+        """区間ごとのエネルギーで、先頭と末尾の無音を取り除く"""
+        if not len(samples):
+            return samples
+
+        channels = samples.shape[1]
+        blocks = samples.reshape(-1, self._block * channels)
+        power = np.mean(np.square(blocks), axis=1)
+        voiced = np.flatnonzero(power > self._gate_power)
+        if voiced.size:
+            self._voiced_power += float(power[voiced].sum())
+            self._voiced_blocks += int(voiced.size)
+        if not self._trim_silence:
+            return samples
+
+        if not self._started:
+            lead = self._lead if self._lead is not None else self._empty()
+            if not voiced.size:
+                self._lead = self._keep_pad(lead, samples)
+                self.trimmed_frames += (
+                    len(lead) + len(samples) - len(self._lead)
+                )
+                return self._empty()
+
+            # 発話の始まりの前は PAD_SECONDS だけ残す
+            onset = int(voiced[0]) * self._block
+            head = self._keep_pad(lead, samples[:onset])
+            self.trimmed_frames += len(lead) + onset - len(head)
+            self._lead = None
+            self._started = True
+            samples = np.concatenate([head, samples[onset:]])
+            voiced_end = (int(voiced[-1]) + 1) * self._block - onset + len(head)
+            self._held = None
+        else:
+            held = self._held if self._held is not None else self._empty()
+            voiced_end = (
+                len(held) + (int(voiced[-1]) + 1) * self._block
+                if voiced.size
+                else 0
+            )
+            samples = np.concatenate([held, samples])
+
+        # 最後の発話の区間より後ろは、音声の終わりまで保留する
+        # ただし長い間は保留し続けず、MAX_HOLD_SECONDS を超えた分を送り出す
+        voiced_end = max(voiced_end, len(samples) - self._max_hold)
+        self._held = samples[voiced_end:]
+        return samples[:voiced_end]
+
+    def _emit(self, samples: Samples) -> AudioBuffer | None:
+        """音量を揃えてサンプリングレートを変換し、PCM に戻す"""
+        assert self._output_format is not None
+        if not len(samples):
+            return None
+
+        gain = self._decide_gain()
+        if gain != 1.0:
+            samples = samples * np.float32(gain)
+        if self._resampler is not None:
+            samples = self._resampler.process(samples)
+        if not len(samples):
+            return None
+        return to_pcm(samples, self._output_format)
+
+    def _decide_gain(self) -> float:
+        """音量の倍率を決める（発話の途中で変わらないよう最初に一度だけ）"""
+        if self._gain is not None:
+            return self._gain
+        if self._target_dbfs is None:
+            self._gain = 1.0
+            return self._gain
+
+        # この声の過去の大きさ、なければ最初の発話区間の大きさに合わせる
+        loudness_db = self._loudness_db
+        if loudness_db is None:
+            loudness_db = self.measured_db
+        if loudness_db is None:
+            # 発話の始まる前の音声（無音を削除しない場合）は変えない
+            return 1.0
+
+        gain_db = min(
+            max(self._target_dbfs - loudness_db, -self.MAX_GAIN_DB),
+            self.MAX_GAIN_DB,
+        )
+        self._gain = 10 ** (gain_db / 20)
+        return self._gain
+
+    def _is_voiced(self, samples: Samples) -> bool:
+        """サンプル全体の大きさが無音のしきい値を超えるかどうか"""
+        return bool(
+            len(samples) and np.mean(np.square(samples)) > self._gate_power
+        )
+
+    def _keep_pad(self, lead: Samples, samples: Samples) -> Samples:
+        """発話の前に残す無音として、末尾の PAD_SECONDS だけを返す"""
+        joined = np.concatenate([lead, samples])
+        return joined[len(joined) - min(len(joined), self._pad) :]
+
+    def _empty(self) -> Samples:
+        """0 フレームのサンプル"""
+        assert self._format is not None
+        return np.zeros((0, self._format.channels), dtype=np.float32)
+
+
+@dataclass
+class PostProcessStats:
+    """音声の後処理の統計情報"""
+
+    # 後処理した発話の数
+    utterances: int = 0
+    # 後処理した音声と、削除した無音の長さ（秒）
+    audio_seconds: float = 0.0
+    trimmed_seconds: float = 0.0
+    # 後処理にかかった時間（秒）
+    processing_seconds: float = 0.0
+
+    @property
+    def realtime_factor(self) -> float:
+        """音声1秒あたりの処理時間（秒）"""
+        if not self.audio_seconds:
+            return 0.0
+        return self.processing_seconds / self.audio_seconds
+
+
+class PostProcessingVoiceClient(VoiceClient):
+    """合成した音声を再生前に後処理する VoiceClient のラッパー
+    先頭と末尾の無音を削除し、音量を揃え、出力デバイスのサンプリング
+    レートに一度だけ変換します。ストリーミングでは断片ごとに処理します。
+    声の大きさはこのクライアントで合成した発話から推定し続けるため、
+    バックエンドやキャラクターごとにラップしてください。
+    Attributes:
+        _voice_client (VoiceClient): 実際に音声合成を行うクライアント
+        _loudness_db (float | None): これまでの発話から推定した声の大きさ
+        stats (PostProcessStats): 後処理の統計情報
+    """
+
+    # 声の大きさの推定値を、新しい発話の大きさで更新する割合
+    LOUDNESS_SMOOTHING = 0.3
+
+    def __init__(
+        self,
+        voice_client: VoiceClient,
+        sample_rate: int | None = None,
+        target_dbfs: float | None = SpeechPostProcessor.TARGET_DBFS,
+        trim_silence: bool = True,
+        metrics: Metrics | None = None,
+    ):
+        """
+        Args:
+            voice_client (VoiceClient): 実際に音声合成を行うクライアント
+            sample_rate (int | None): 出力のサンプリングレート
+                （None の場合は変換しない）
+            target_dbfs (float | None): 正規化の目標の大きさ（RMS、dBFS。
+                None の場合は正規化しない）
+            trim_silence (bool): 先頭と末尾の無音を削除するかどうか
+            metrics (Metrics | None): 後処理の時間の計測先
+        """
+        self._voice_client = voice_client
+        self._sample_rate = sample_rate
+        self._target_dbfs = target_dbfs
+        self._trim_silence = trim_silence
+        self._metrics = metrics or Metrics()
+        self._loudness_db: float | None = None
+        self.stats = PostProcessStats()
+
+    def processor(self) -> SpeechPostProcessor:
+        """1回の発話を後処理するインスタンスを作成する"""
+        return SpeechPostProcessor(
+            sample_rate=self._sample_rate,
+            target_dbfs=self._target_dbfs,
+            trim_silence=self._trim_silence,
+            loudness_db=self._loudness_db,
+        )
+
+    async def text_to_speech(self, text: str) -> AudioBuffer:
+        audio = await self._voice_client.text_to_speech(text)
+        processor = self.processor()
+        started_at = time.perf_counter()
+        parts = [processor.process(audio), processor.flush()]
+        self._finish(processor, time.perf_counter() - started_at)
+
+        processed = [part for part in parts if part is not None]
+        if not processed:
+            # すべて無音だった場合
+            return AudioBuffer(b'', audio.audio_format)
+        return AudioBuffer(
+            b''.join(part.pcm for part in processed),
+            processed[0].audio_format,
+        )
+
+    async def stream_speech(self, text: str) -> AsyncIterator[AudioBuffer]:
+        processor = self.processor()
+        elapsed = 0.0
+        try:
+            async for chunk in self._voice_client.stream_speech(text):
+                started_at = time.perf_counter()
+                processed = processor.process(chunk)
+                elapsed += time.perf_counter() - started_at
+                # 無音だけの断片は送らず、最初の音声までの時間を正しく測る
+                if processed is not None:
+                    yield processed
+
+            started_at = time.perf_counter()
+            processed = processor.flush()
+            elapsed += time.perf_counter() - started_at
+            if processed is not None:
+                yield processed
+        finally:
+            self._finish(processor, elapsed)
+
+    def _finish(self, processor: SpeechPostProcessor, elapsed: float) -> None:
+        """1回の発話の統計と、声の大きさの推定値を更新する"""
+        self._metrics.observe('tts.dsp', elapsed)
+        self.stats.utterances += 1
+        self.stats.processing_seconds += elapsed
+        if processor.input_format is not None:
+            rate = processor.input_format.sample_rate
+            self.stats.audio_seconds += processor.processed_frames / rate
+            self.stats.trimmed_seconds += processor.trimmed_frames / rate
+
+        measured_db = processor.measured_db
+        if measured_db is not None:
+            self._loudness_db = (
+                measured_db
+                if self._loudness_db is None
+                else self._loudness_db
+                + (measured_db - self._loudness_db) * self.LOUDNESS_SMOOTHING
+            )
+
+    def voice_settings(self) -> dict[str, str]:
+        """ラップしているクライアントの設定に後処理の設定を加えて返す
+        後処理した音声をキャッシュできるよう、キャッシュのキーに含めます。
+        """
+        return self._voice_client.voice_settings() | {
+            'output_sample_rate': str(self._sample_rate or ''),
+            'loudness_dbfs': str(
+                '' if self._target_dbfs is None else self._target_dbfs
+            ),
+            'trim_silence': str(self._trim_silence),
+        }
+
+    async def warm_up(self) -> None:
+        await self._voice_client.warm_up()
+
+    async def aclose(self) -> None:
+        await self._voice_client.aclose()
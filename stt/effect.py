@@ -1,5 +1,15 @@
-import os
+import asyncio
+import subprocess
 from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Literal
+
+from .audio import AudioBuffer, AudioFormat
+from .capture import load_audio_file
+from .playback import PlaybackEngine, create_playback_engine
+
+# 効果音の種類（start: 録音開始、end: 録音終了）
+type Cue = Literal['start', 'end']
 
 
 class EffectPlayer(ABC):
@@ -15,12 +25,219 @@ class EffectPlayer(ABC):
         """録音終了時の効果音を再生する"""
         pass
 
+    async def wait(self) -> None:
+        """再生中の効果音が鳴り終わるまで待つ
+        効果音を録音しないよう、録音を始める前に呼びます。
+        """
+        return None
+
+
+class NullEffectPlayer(EffectPlayer):
+    """何も再生しない効果音プレイヤー"""
+
+    def start(self) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
 
 class EffectPlayerForMac(EffectPlayer):
-    """macOS用の録音効果音クラス"""
+    """macOS用の録音効果音クラス
+    afplay の終了は待たずに戻り、終了は `wait` で待ちます。
+    Attributes:
+        _process (subprocess.Popen[bytes] | None): 最後に起動した afplay
+    """
+
+    def __init__(self):
+        self._process: subprocess.Popen[bytes] | None = None
+
+    def start(self) -> None:
+        self._play('/System/Library/Sounds/Tink.aiff')
+
+    def end(self) -> None:
+        self._play('/System/Library/Sounds/Purr.aiff')
+
+    async def wait(self) -> None:
+        process = self._process
+        if process is not None and process.poll() is None:
+            await asyncio.to_thread(process.wait)
+
+    def _play(self, path: str) -> None:
+        self._process = subprocess.Popen(
+            ['afplay', path],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+
+class ToneEffectPlayer(EffectPlayer):
+    """メモリ上の効果音を応答と同じ再生エンジンで鳴らす効果音プレイヤー
+    効果音は作成時に一度だけ NumPy で合成（またはファイルから読み込み）して
+    保持し、再生は再生エンジンのキューに追加するだけで終了を待たないため、
+    効果音と同時に録音を始められます。OS を問わず動作します。
+    Attributes:
+        _playback (PlaybackEngine | None): 効果音を再生するエンジン
+        _tones (dict[tuple[Cue, AudioFormat], AudioBuffer]): 形式ごとの効果音
+    """
+
+    # 合成する効果音の形式（Gemini TTS と同じ形式にし、出力ストリームを
+    # 開き直さずに済むようにする）
+    AUDIO_FORMAT = AudioFormat(sample_rate=24000)
+
+    # 効果音の音程（Hz）。開始は上がる2音、終了は下がる2音
+    START_FREQUENCIES = (660.0, 880.0)
+    END_FREQUENCIES = (880.0, 660.0)
+
+    # 1音の長さ（秒）と音量（最大振幅に対する比率）
+    TONE_SECONDS = 0.06
+    VOLUME = 0.2
+
+    # 音の始まりと終わりのフェードの長さ（秒）。クリック音を防ぐ
+    FADE_SECONDS = 0.005
+
+    def __init__(
+        self,
+        playback: PlaybackEngine | None = None,
+        start_sound: Path | None = None,
+        end_sound: Path | None = None,
+        loop: asyncio.AbstractEventLoop | None = None,
+    ):
+        """
+        Args:
+            playback (PlaybackEngine | None): 効果音を再生するエンジン。
+                応答の再生と同じエンジンを渡すと出力ストリームを共有する
+                （None の場合は最初の再生時に作成する）
+            start_sound (Path | None): 録音開始の効果音のファイル
+                （None の場合は合成した音を使う）
+            end_sound (Path | None): 録音終了の効果音のファイル。
+                ファイルの効果音は再生中の形式に変換せずに使う
+            loop (asyncio.AbstractEventLoop | None): 別スレッドから呼ばれた
+                場合に再生を渡すイベントループ（None の場合は作成時か、
+                最初に呼ばれた時点で実行中のもの）
+        Raises:
+            ValueError: 効果音のファイルを読み込めない場合
+        """
+        self._playback = playback
+        self._tones: dict[tuple[Cue, AudioFormat], AudioBuffer] = {}
+        self._files: dict[Cue, AudioBuffer] = {}
+        sounds: tuple[tuple[Cue, Path | None], ...] = (
+            ('start', start_sound),
+            ('end', end_sound),
+        )
+        for cue, path in sounds:
+            if path is not None:
+                self._files[cue] = load_audio_file(
+                    path, self.AUDIO_FORMAT.sample_rate
+                )
+        for cue in ('start', 'end'):
+            self.tone(cue, self.AUDIO_FORMAT)
+
+        # 再生中の効果音のタスク（完了前に破棄されないよう保持する）
+        self._tasks: set[asyncio.Task[None]] = set()
+        self._loop = loop
+        if loop is None:
+            try:
+                self._loop = asyncio.get_running_loop()
+            except RuntimeError:
+                pass
 
     def start(self) -> None:
-        os.system('afplay /System/Library/Sounds/Tink.aiff')
+        self._play('start')
 
     def end(self) -> None:
-        os.system('afplay /System/Library/Sounds/Purr.aiff')
+        self._play('end')
+
+    async def wait(self) -> None:
+        """再生キューへの追加と、効果音の再生が終わるまで待つ"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._playback is not None:
+            await self._playback.drain()
+
+    def tone(self, cue: Cue, audio_format: AudioFormat) -> AudioBuffer:
+        """指定した形式の効果音を返す（形式ごとに一度だけ作成する）"""
+        tone = self._tones.get((cue, audio_format))
+        if tone is None:
+            tone = self._files.get(cue) or synthesize_tone(
+                self.START_FREQUENCIES
+                if cue == 'start'
+                else self.END_FREQUENCIES,
+                tone_seconds=self.TONE_SECONDS,
+                volume=self.VOLUME,
+                fade_seconds=self.FADE_SECONDS,
+                audio_format=audio_format,
+            )
+            self._tones[cue, audio_format] = tone
+        return tone
+
+    def _play(self, cue: Cue) -> None:
+        """効果音を再生キューに追加する（再生の完了は待たない）
+        録音をワーカースレッドで行う場合に備えて、別スレッドから呼ばれた
+        場合はイベントループに処理を渡します。
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._schedule, cue)
+            return
+
+        self._loop = loop
+        self._schedule(cue)
+
+    def _schedule(self, cue: Cue) -> None:
+        """イベントループ上で効果音を再生するタスクを開始する"""
+        task = asyncio.create_task(self._enqueue(cue))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _enqueue(self, cue: Cue) -> None:
+        """効果音を再生エンジンに渡す（再生できない場合は何もしない）"""
+        try:
+            if self._playback is None:
+                self._playback = create_playback_engine()
+            # 出力ストリームを開き直さないよう、再生中の形式に合わせる
+            audio_format = self._playback.audio_format or self.AUDIO_FORMAT
+            await self._playback.enqueue(self.tone(cue, audio_format))
+        except (ValueError, OSError):
+            # 出力デバイスがない環境では効果音を鳴らさずに続ける
+            self._playback = None
+
+
+def synthesize_tone(
+    frequencies: tuple[float, ...],
+    tone_seconds: float,
+    volume: float,
+    fade_seconds: float,
+    audio_format: AudioFormat,
+) -> AudioBuffer:
+    """正弦波の音を順に並べた効果音を合成する
+    Args:
+        frequencies (tuple[float, ...]): 順に鳴らす音の周波数（Hz）
+        tone_seconds (float): 1音の長さ（秒）
+        volume (float): 最大振幅に対する音量の比率
+        fade_seconds (float): 各音の始まりと終わりのフェードの長さ（秒）
+        audio_format (AudioFormat): 合成する PCM の形式（整数の PCM）
+    Returns:
+        AudioBuffer: 合成した効果音
+    """
+    import numpy as np
+
+    rate = audio_format.sample_rate
+    t = np.arange(int(rate * tone_seconds)) / rate
+    fade = min(int(rate * fade_seconds), t.size // 2)
+    envelope = np.ones(t.size)
+    if fade:
+        ramp = np.linspace(0.0, 1.0, fade)
+        envelope[:fade] = ramp
+        envelope[-fade:] = ramp[::-1]
+
+    wave = np.concatenate(
+        [np.sin(2 * np.pi * f * t) * envelope for f in frequencies]
+    )
+    peak = 2 ** (audio_format.sample_width * 8 - 1) - 1
+    samples = (wave * volume * peak).astype(f'<i{audio_format.sample_width}')
+    # 全チャンネルに同じ音を出力する
+    samples = np.repeat(samples, audio_format.channels)
+    return AudioBuffer(samples.tobytes(), audio_format)
@@ -26,3 +26,9 @@ class VoiceSynthesisError(STTAppError):
     """音声合成関連のエラー"""
 
     pass
+
+
+class BackendUnavailableError(STTAppError):
+    """バックエンドが一時的に利用できない（サーキットブレーカーが開いている）場合のエラー"""
+
+    pass
@@ -1,9 +1,13 @@
-import io
-import wave
+import contextlib
+from collections.abc import AsyncGenerator, AsyncIterator
 
 from google.genai import Client, types  # type: ignore
 
+from .audio import AudioBuffer, AudioFormat
 from .config import CharacterID
+from .governor import Governor
+from .metrics import Metrics
+from .runner import run_sync
 from .voice import VoiceClient
 
 
@@ -13,6 +17,8 @@ class GoogleTTSClient(VoiceClient):
     Attributes:
         _client (Client): Google GenAI クライアント
         _voice_name (str): 音声の名前
+        _metrics (Metrics): 音声データの変換時間の計測先
+        _governor (Governor): Gemini API へのリクエストの流量制御
     """
 
     # キャラクターIDと音声IDのマッピング
@@ -22,33 +28,51 @@ class GoogleTTSClient(VoiceClient):
         'ikemen': 'Fenrir',
     }
 
-    def __init__(self, client: Client, voice_name: str):
+    # 音声合成に使用するモデル
+    MODEL = 'gemini-2.5-flash-preview-tts'
+
+    # API が返す PCM の形式
+    SAMPLE_RATE = 24000
+    CHANNELS = 1
+    SAMPLE_WIDTH = 2
+
+    def __init__(
+        self,
+        client: Client,
+        voice_name: str,
+        metrics: Metrics | None = None,
+        governor: Governor | None = None,
+    ):
+        """
+        Args:
+            client (Client): Google GenAI クライアント
+            voice_name (str): 音声の名前
+            metrics (Metrics | None): 音声データの変換時間の計測先
+            governor (Governor | None): AIChat と共有する Gemini API の流量制御
+                （None の場合は再試行のみ行う）
+        """
         self._client = client
         self._voice_name = voice_name
+        self._metrics = metrics or Metrics()
+        self._governor = governor or Governor('gemini')
 
-    async def text_to_speech(self, text: str) -> bytes:
+    async def text_to_speech(self, text: str) -> AudioBuffer:
         """Google TTS API を使用してテキストを音声に変換する
+        API が返す PCM をそのまま参照し、WAV への変換は行いません。
         Args:
             text (str): 音声に変換するテキスト
         Returns:
-            bytes: バイト形式の音声データ
+            AudioBuffer: 音声データ
         Raises:
             ValueError: API レスポンスに base64 音声データが含まれていない場合
         """
 
-        response = self._client.models.generate_content(
-            model='gemini-2.5-flash-preview-tts',
-            contents=text,
-            config=types.GenerateContentConfig(
-                response_modalities=['AUDIO'],
-                speech_config=types.SpeechConfig(
-                    voice_config=types.VoiceConfig(
-                        prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                            voice_name=self._voice_name,
-                        ),
-                    )
-                ),
-            ),
+        response = await self._governor.call(
+            lambda: self._client.aio.models.generate_content(
+                model=self.MODEL,
+                contents=text,
+                config=self._generate_config(),
+            )
         )
 
         candidates = response.candidates
@@ -60,44 +84,126 @@ class GoogleTTSClient(VoiceClient):
             and candidates[0].content.parts
             and candidates[0].content.parts[0].inline_data
         ):
-            data = candidates[0].content.parts[0].inline_data.data
+            inline_data = candidates[0].content.parts[0].inline_data
         else:
             raise ValueError('APIから音声データが受信されませんでした。')
 
-        if not data:
+        if not inline_data.data:
             raise ValueError('APIから音声データが受信されませんでした。')
 
-        return self._convert_to_wav(data)
+        with self._metrics.span('tts.decode', total=None):
+            return AudioBuffer(
+                inline_data.data, self._parse_mime_type(inline_data.mime_type)
+            )
 
-    def _convert_to_wav(self, audio: bytes) -> bytes:
-        """音声データを WAV 形式に変換する
+    async def stream_speech(self, text: str) -> AsyncIterator[AudioBuffer]:
+        """Google TTS API のストリーミング生成で音声を逐次受信する
         Args:
-            audio_data (bytes): 音声データ
-        Returns:
-            bytes: WAV 形式の音声データ
+            text (str): 音声に変換するテキスト
+        Yields:
+            AudioBuffer: PCM の断片
+        Raises:
+            ValueError: API レスポンスに音声データが含まれていない場合
         """
 
-        # 音声データをバイト形式に変換
-        buffer = io.BytesIO(audio)
+        async def open_stream() -> AsyncGenerator[AudioBuffer]:
+            stream = await self._client.aio.models.generate_content_stream(
+                model=self.MODEL,
+                contents=text,
+                config=self._generate_config(),
+            )
+            async for response in stream:
+                candidates = response.candidates
+                if not (
+                    candidates
+                    and candidates[0].content
+                    and candidates[0].content.parts
+                ):
+                    continue
+
+                for part in candidates[0].content.parts:
+                    inline_data = part.inline_data
+                    if inline_data is None or not inline_data.data:
+                        continue
+                    yield AudioBuffer(
+                        inline_data.data,
+                        self._parse_mime_type(inline_data.mime_type),
+                    )
+
+        received = False
+        # 最初の断片を受信するまでのエラーは Governor が再試行する
+        async with contextlib.aclosing(
+            self._governor.stream(open_stream)
+        ) as stream:
+            async for audio in stream:
+                received = True
+                yield audio
+
+        if not received:
+            raise ValueError('APIから音声データが受信されませんでした。')
+
+    def _generate_config(self) -> types.GenerateContentConfig:
+        """音声合成リクエストの設定を作成する"""
+        return types.GenerateContentConfig(
+            response_modalities=['AUDIO'],
+            speech_config=types.SpeechConfig(
+                voice_config=types.VoiceConfig(
+                    prebuilt_voice_config=types.PrebuiltVoiceConfig(
+                        voice_name=self._voice_name,
+                    ),
+                )
+            ),
+        )
+
+    def _parse_mime_type(self, mime_type: str | None) -> AudioFormat:
+        """`audio/L16;codec=pcm;rate=24000` 形式の MIME タイプから PCM の形式を取得する"""
+        sample_rate = self.SAMPLE_RATE
+        for param in (mime_type or '').split(';')[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'rate' and value.isdigit():
+                sample_rate = int(value)
+
+        return AudioFormat(
+            sample_rate=sample_rate,
+            channels=self.CHANNELS,
+            sample_width=self.SAMPLE_WIDTH,
+        )
 
-        # wave モジュールを使用してバイトデータを WAV 形式に変換
-        with wave.open(buffer, 'wb') as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)
-            wf.setframerate(24000)
-            wf.writeframes(audio)
+    def text_to_speech_sync(self, text: str) -> AudioBuffer:
+        """テキストを同期的に音声に変換する（互換用ラッパー）
+        Args:
+            text (str): 音声に変換するテキスト
+        Returns:
+            AudioBuffer: 音声データ
+        Raises:
+            ValueError: API レスポンスに音声データが含まれていない場合
+        """
+        return run_sync(self.text_to_speech(text))
 
-        return buffer.getvalue()
+    def voice_settings(self) -> dict[str, str]:
+        """合成結果に影響する設定を返す"""
+        return {
+            'backend': 'google',
+            'model': self.MODEL,
+            'voice_name': self._voice_name,
+            'format': f'wav/{self.SAMPLE_RATE}',
+        }
 
     @classmethod
     def create_from_character_id(
-        cls, client: Client, character_id: CharacterID
+        cls,
+        client: Client,
+        character_id: CharacterID,
+        metrics: Metrics | None = None,
+        governor: Governor | None = None,
     ) -> 'GoogleTTSClient':
         """キャラクターIDから GoogleTTSClient を作成する
 
         Args:
             client (Client): Google GenAI クライアント
             id (CharacterID): キャラクターの識別子
+            metrics (Metrics | None): 音声データの変換時間の計測先
+            governor (Governor | None): Gemini API の流量制御
 
         Returns:
             GoogleTTSClient: Google TTS クライアントインスタンス
@@ -108,4 +214,9 @@ class GoogleTTSClient(VoiceClient):
         if voice_name is None:
             raise ValueError(f'Unknown character ID: {character_id}')
 
-        return cls(client=client, voice_name=voice_name)
+        return cls(
+            client=client,
+            voice_name=voice_name,
+            metrics=metrics,
+            governor=governor,
+        )
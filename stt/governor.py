@@ -0,0 +1,540 @@
+import asyncio
+import contextlib
+import email.utils
+import os
+import random
+import re
+import sys
+import time
+from collections.abc import AsyncGenerator, Awaitable, Callable, Mapping
+from dataclasses import dataclass, replace
+from typing import Any, ClassVar, Literal
+
+from .exceptions import BackendUnavailableError
+from .metrics import Metrics
+
+# 流量を制御するバックエンドの名前
+type BackendName = Literal['gemini', 'nijivoice', 'speech_recognition']
+
+# 再試行するステータスコード
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+@dataclass(frozen=True)
+class BackendLimits:
+    """バックエンドごとの流量制御の設定
+    Attributes:
+        rate (float | None): 1秒あたりのリクエスト数の上限（None は無制限）
+        burst (int): 連続して送れるリクエスト数（トークンバケットの容量）
+        max_in_flight (int | None): 同時に実行するリクエスト数の上限（None は無制限）
+        max_attempts (int): 1回の呼び出しで試行する最大回数（1 は再試行しない）
+        base_delay (float): 再試行の待ち時間の基準（秒）
+        max_delay (float): 再試行の待ち時間の上限（秒）
+        max_retry_after (float): 従う Retry-After の上限。これより長い場合は再試行しない
+        failure_threshold (int): サーキットブレーカーを開く連続失敗回数
+        reset_timeout (float): サーキットブレーカーを開いてから試行を再開するまでの秒数
+    """
+
+    rate: float | None = None
+    burst: int = 1
+    max_in_flight: int | None = None
+    max_attempts: int = 3
+    base_delay: float = 0.2
+    max_delay: float = 2.0
+    max_retry_after: float = 10.0
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+
+    # 整数として読み込む設定
+    _INT_FIELDS: ClassVar[frozenset[str]] = frozenset(
+        {'burst', 'max_in_flight', 'max_attempts', 'failure_threshold'}
+    )
+
+    @classmethod
+    def from_env(
+        cls,
+        backend: BackendName,
+        default: 'BackendLimits | None' = None,
+        environ: Mapping[str, str] = os.environ,
+    ) -> 'BackendLimits':
+        """環境変数 `GOVERNOR_<BACKEND>_<FIELD>` で既定値を上書きした設定を作成する
+        例: `GOVERNOR_GEMINI_RATE=5`, `GOVERNOR_NIJIVOICE_MAX_IN_FLIGHT=4`。
+        `RATE` と `MAX_IN_FLIGHT` は `none` で無制限にできます。
+        Args:
+            backend (BackendName): バックエンドの名前
+            default (BackendLimits | None): 既定の設定（None の場合は `DEFAULT_LIMITS`）
+            environ (Mapping[str, str]): 環境変数
+        Raises:
+            ValueError: 値を数値として読み込めない場合
+        """
+        limits = default or DEFAULT_LIMITS[backend]
+        prefix = f'GOVERNOR_{backend.upper()}_'
+        overrides: dict[str, Any] = {}
+        for name in vars(limits):
+            raw = environ.get(prefix + name.upper())
+            if raw is None or raw == '':
+                continue
+            if raw.lower() == 'none' and name in ('rate', 'max_in_flight'):
+                overrides[name] = None
+            elif name in cls._INT_FIELDS:
+                overrides[name] = int(raw)
+            else:
+                overrides[name] = float(raw)
+        return replace(limits, **overrides)
+
+
+# バックエンドごとの既定の設定
+DEFAULT_LIMITS: dict[BackendName, BackendLimits] = {
+    'gemini': BackendLimits(rate=10.0, burst=20, max_in_flight=16),
+    'nijivoice': BackendLimits(rate=5.0, burst=10, max_in_flight=8),
+    'speech_recognition': BackendLimits(max_in_flight=4),
+}
+
+
+@dataclass
+class GovernorStats:
+    """流量制御の統計情報"""
+
+    # 呼び出し回数と、再試行を含む試行回数
+    calls: int = 0
+    attempts: int = 0
+    retries: int = 0
+    # 再試行しても失敗した呼び出しの回数
+    failures: int = 0
+    # サーキットブレーカーにより即座に失敗させた回数
+    rejected: int = 0
+    # 実行中と、上限により待っているリクエスト数
+    in_flight: int = 0
+    waiting: int = 0
+
+
+class TokenBucket:
+    """一定の速さでトークンが補充されるバケットでリクエスト数を制限するクラス
+    トークンが足りない場合は前借りして補充されるまで待つため、待っている
+    リクエストは到着順に送られます。
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """
+        Args:
+            rate (float): 1秒あたりに補充するトークン数
+            burst (int): バケットの容量
+        """
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+
+    async def acquire(self) -> float:
+        """トークンを1つ取得する
+        Returns:
+            float: 取得までに待った秒数
+        """
+        now = time.monotonic()
+        self._tokens = min(
+            self._burst, self._tokens + (now - self._updated_at) * self._rate
+        )
+        self._updated_at = now
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0.0
+
+        delay = -self._tokens / self._rate
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            # 待っている間に取り消された場合は前借りした分を返す
+            self._tokens += 1
+            raise
+        return delay
+
+
+class CircuitBreaker:
+    """連続して失敗したバックエンドへのリクエストを一定時間止めるクラス
+    連続失敗が `failure_threshold` 回に達すると開き、`reset_timeout` 秒の間は
+    リクエストを送らずに失敗させます。その後は1つのリクエストだけを試し、
+    成功すれば閉じ、失敗すれば再び開きます。
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> Literal['closed', 'open', 'half_open']:
+        """現在の状態"""
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at < self._reset_timeout:
+            return 'open'
+        return 'half_open'
+
+    def allow(self) -> bool:
+        """リクエストを送ってよいかどうかを判定する（試行の枠を確保する）"""
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._probing or self._failures >= self._failure_threshold:
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self) -> None:
+        """結果を判定しなかった試行の枠を返す（キャンセルされた場合など）"""
+        self._probing = False
+
+
+class Governor:
+    """1つのバックエンドへのリクエストの流量を制御するクラス
+    AIChat・GoogleTTSClient・NijiVoiceClient・SpeechRecognizer で共有し、
+    次の順にリクエストを制御します。
+    1. サーキットブレーカーが開いている場合は即座に失敗させる
+    2. トークンバケットで1秒あたりのリクエスト数を制限する
+    3. セマフォで同時に実行するリクエスト数を制限する
+    4. 429 や 5xx などの一時的なエラーは、Retry-After に従うか、
+       揺らぎを加えた指数関数的な待ち時間の後に再試行する
+    待ち時間は `governor.<name>.rate_wait`（トークンバケット）、
+    `governor.<name>.queue_wait`（同時実行数）、`governor.<name>.backoff`
+    （再試行）として計測します。
+    Attributes:
+        name (str): バックエンドの名前
+        limits (BackendLimits): 流量制御の設定
+        stats (GovernorStats): 統計情報
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limits: BackendLimits = BackendLimits(),
+        metrics: Metrics | None = None,
+        retry_on: tuple[type[BaseException], ...] = (),
+        retry_on_names: tuple[tuple[str, str], ...] = (),
+        rng: random.Random | None = None,
+    ):
+        """
+        Args:
+            name (str): バックエンドの名前（計測区間の名前に使う）
+            limits (BackendLimits): 流量制御の設定
+            metrics (Metrics | None): 待ち時間の計測先
+            retry_on (tuple[type[BaseException], ...]): HTTP のエラー以外で
+                再試行する例外（例外の原因 `__cause__` も確認する）
+            retry_on_names (tuple[tuple[str, str], ...]): モジュール名と
+                クラス名で指定する再試行する例外（判定のためにモジュールを
+                読み込まないため、起動時に読み込みたくない例外に使う）
+            rng (random.Random | None): 待ち時間の揺らぎに使う乱数
+        """
+        self.name = name
+        self.limits = limits
+        self._metrics = metrics or Metrics()
+        self._retry_on = retry_on
+        self._retry_on_names = retry_on_names
+        self._random = rng or random.Random()
+        self._bucket = (
+            TokenBucket(limits.rate, limits.burst)
+            if limits.rate is not None
+            else None
+        )
+        self._semaphore = (
+            asyncio.Semaphore(limits.max_in_flight)
+            if limits.max_in_flight is not None
+            else None
+        )
+        self._breaker = CircuitBreaker(
+            limits.failure_threshold, limits.reset_timeout
+        )
+        self.stats = GovernorStats()
+
+    @property
+    def circuit_state(self) -> Literal['closed', 'open', 'half_open']:
+        """サーキットブレーカーの状態"""
+        return self._breaker.state
+
+    async def call[T](self, operation: Callable[[], Awaitable[T]]) -> T:
+        """流量を制御してリクエストを実行し、一時的なエラーは再試行する
+        Args:
+            operation (Callable[[], Awaitable[T]]): リクエストを実行する関数
+                （再試行のたびに呼び出される）
+        Returns:
+            T: リクエストの結果
+        Raises:
+            BackendUnavailableError: サーキットブレーカーが開いている場合
+        """
+        self.stats.calls += 1
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with self._permit():
+                    try:
+                        result = await operation()
+                    except Exception as e:
+                        self._record_failure(e)
+                        raise
+                    self._breaker.record_success()
+            except BackendUnavailableError:
+                raise
+            except Exception as e:
+                await self._backoff_or_raise(e, attempt)
+                continue
+
+            return result
+
+    async def stream[T](
+        self, open_stream: Callable[[], AsyncGenerator[T]]
+    ) -> AsyncGenerator[T]:
+        """流量を制御してストリーミングのリクエストを実行する
+        最初の要素を受信するまでに発生した一時的なエラーは再試行します。
+        受信を始めた後のエラーは、重複した出力を避けるため再試行しません。
+        ストリームを受信している間は同時実行数の枠を使用します。
+        Args:
+            open_stream (Callable[[], AsyncGenerator[T]]): ストリームを開始する
+                関数（再試行のたびに呼び出される）
+        Yields:
+            T: ストリームの要素
+        Raises:
+            BackendUnavailableError: サーキットブレーカーが開いている場合
+        """
+        self.stats.calls += 1
+        attempt = 0
+        while True:
+            attempt += 1
+            retry = False
+            async with self._permit():
+                async with contextlib.aclosing(open_stream()) as stream:
+                    try:
+                        first = await anext(stream)
+                    except StopAsyncIteration:
+                        self._breaker.record_success()
+                        return
+                    except Exception as e:
+                        self._record_failure(e)
+                        error = e
+                        retry = True
+                    else:
+                        yield first
+                        try:
+                            async for item in stream:
+                                yield item
+                        except Exception as e:
+                            self._record_failure(e)
+                            self.stats.failures += 1
+                            raise
+                        self._breaker.record_success()
+                        return
+
+            if retry:
+                await self._backoff_or_raise(error, attempt)
+
+    @contextlib.asynccontextmanager
+    async def _permit(self) -> AsyncGenerator[None]:
+        """サーキットブレーカー・レート・同時実行数の制限を通過する
+        Raises:
+            BackendUnavailableError: サーキットブレーカーが開いている場合
+        """
+        if not self._breaker.allow():
+            self.stats.rejected += 1
+            raise BackendUnavailableError(
+                f'{self.name} は一時的に利用できません。しばらくしてから'
+                'もう一度お試しください。'
+            )
+
+        try:
+            self.stats.waiting += 1
+            try:
+                if self._bucket is not None:
+                    waited = await self._bucket.acquire()
+                    self._metrics.observe(
+                        f'governor.{self.name}.rate_wait', waited
+                    )
+                if self._semaphore is not None:
+                    started_at = time.perf_counter()
+                    await self._semaphore.acquire()
+                    self._metrics.observe(
+                        f'governor.{self.name}.queue_wait',
+                        time.perf_counter() - started_at,
+                    )
+            finally:
+                self.stats.waiting -= 1
+
+            self.stats.attempts += 1
+            self.stats.in_flight += 1
+            try:
+                yield
+            finally:
+                self.stats.in_flight -= 1
+                if self._semaphore is not None:
+                    self._semaphore.release()
+        finally:
+            # 成功・失敗を記録しなかった試行（キャンセルなど）の枠を返す
+            self._breaker.release()
+
+    def _record_failure(self, error: Exception) -> None:
+        """失敗した試行の結果をサーキットブレーカーに記録する
+        試行の枠を返す前に呼び出し、半開状態で試したリクエストが失敗した
+        場合に確実に開き直します。
+        """
+        if self._is_retryable(error):
+            self._breaker.record_failure()
+        else:
+            # バックエンドは応答しているため、障害としては数えない
+            self._breaker.record_success()
+
+    async def _backoff_or_raise(self, error: Exception, attempt: int) -> None:
+        """再試行できるエラーであれば待ち、できなければ例外を送出する"""
+        if not self._is_retryable(error):
+            self.stats.failures += 1
+            raise error
+
+        retry_after = retry_after_seconds(error)
+        if (
+            attempt >= self.limits.max_attempts
+            or (
+                retry_after is not None
+                and retry_after > self.limits.max_retry_after
+            )
+            or self._breaker.state == 'open'
+        ):
+            self.stats.failures += 1
+            raise error
+
+        delay = self._random.uniform(
+            0,
+            min(
+                self.limits.max_delay,
+                self.limits.base_delay * 2 ** (attempt - 1),
+            ),
+        )
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        self.stats.retries += 1
+        self._metrics.observe(f'governor.{self.name}.backoff', delay)
+        await asyncio.sleep(delay)
+
+    def _is_retryable(self, error: BaseException) -> bool:
+        """一時的なエラーかどうかを判定する（例外の原因もたどる）"""
+        current: BaseException | None = error
+        while current is not None:
+            if isinstance(current, self._retry_on) or any(
+                _is_instance(current, module, name)
+                for module, name in self._retry_on_names
+            ):
+                return True
+            status = status_code(current)
+            if status is not None:
+                return status in RETRYABLE_STATUS_CODES
+            if _is_instance(current, 'httpx', 'TransportError'):
+                return True
+            current = current.__cause__
+        return False
+
+
+def status_code(error: BaseException) -> int | None:
+    """HTTP のエラーからステータスコードを取り出す（HTTP のエラーでない場合は None）"""
+    if _is_instance(error, 'httpx', 'HTTPStatusError'):
+        return error.response.status_code  # type: ignore
+    if _is_instance(error, 'google.genai.errors', 'APIError'):
+        return error.code  # type: ignore
+    return None
+
+
+def retry_after_seconds(error: BaseException) -> float | None:
+    """エラーの応答から再試行までの待ち時間を取り出す
+    `Retry-After` ヘッダー（秒数または日時）と、Gemini API のエラー詳細に
+    含まれる `RetryInfo.retryDelay` に対応しています。
+    Returns:
+        float | None: 待ち時間（秒）。指定がない場合は None
+    """
+    current: BaseException | None = error
+    while current is not None:
+        response = getattr(current, 'response', None)
+        headers = getattr(response, 'headers', None)
+        if headers is not None and (value := headers.get('retry-after')):
+            return _parse_retry_after(value)
+        if _is_instance(current, 'google.genai.errors', 'APIError'):
+            delay = _retry_delay_from_details(current.details)  # type: ignore
+            if delay is not None:
+                return delay
+        current = current.__cause__
+    return None
+
+
+def _is_instance(error: BaseException, module: str, name: str) -> bool:
+    """読み込み済みのモジュールの例外クラスのインスタンスかどうかを判定する
+    モジュールが読み込まれていなければその例外が送出されることもないため、
+    判定のためだけに httpx や google.genai を読み込まないようにします。
+    """
+    error_type = getattr(sys.modules.get(module), name, None)
+    return isinstance(error_type, type) and isinstance(error, error_type)
+
+
+def _parse_retry_after(value: str) -> float | None:
+    """Retry-After ヘッダーの値（秒数または HTTP の日時）を秒数に変換する"""
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def _retry_delay_from_details(details: Any) -> float | None:
+    """Gemini API のエラー詳細から `retryDelay`（例: `17s`）を取り出す"""
+    if not isinstance(details, dict):
+        return None
+    error = details.get('error', details)
+    for detail in error.get('details', None) or []:
+        if not isinstance(detail, dict):
+            continue
+        delay = detail.get('retryDelay')
+        if isinstance(delay, str) and (
+            match := re.fullmatch(r'([\d.]+)s', delay)
+        ):
+            return float(match.group(1))
+    return None
+
+
+def create_governors(
+    metrics: Metrics | None = None,
+    environ: Mapping[str, str] = os.environ,
+) -> dict[BackendName, Governor]:
+    """環境変数の設定でバックエンドごとの Governor を作成する
+    返した Governor は、同じバックエンドを使うすべてのクライアントで
+    共有してください（Gemini は AIChat と GoogleTTSClient で共有します）。
+    Args:
+        metrics (Metrics | None): 待ち時間の計測先
+        environ (Mapping[str, str]): 環境変数
+    Returns:
+        dict[BackendName, Governor]: バックエンドごとの Governor
+    """
+    governors: dict[BackendName, Governor] = {}
+    for backend in DEFAULT_LIMITS:
+        governors[backend] = Governor(
+            backend,
+            BackendLimits.from_env(backend, environ=environ),
+            metrics=metrics,
+            # 音声認識のエラーは SpeechRecognitionError の原因として伝わる
+            # speech_recognition は認識のスレッドで読み込むため、ここでは
+            # 読み込まずに名前で指定する
+            retry_on_names=(('speech_recognition', 'RequestError'),)
+            if backend == 'speech_recognition'
+            else (),
+        )
+    return governors
@@ -0,0 +1,295 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator, Callable
+from dataclasses import dataclass
+
+from .audio import AudioBuffer
+from .metrics import Histogram, Metrics
+from .voice import VoiceClient
+
+
+@dataclass
+class HedgeStats:
+    """ヘッジの統計情報"""
+
+    # 音声合成の呼び出し回数
+    requests: int = 0
+    # 待ち時間を超えたためセカンダリにも送った回数
+    hedged: int = 0
+    # 待ち時間の前にプライマリが失敗したため、セカンダリに送った回数
+    failovers: int = 0
+    # セカンダリにも送った呼び出しで、セカンダリの音声を使った回数
+    secondary_wins: int = 0
+    # 両方のバックエンドが失敗した回数
+    failures: int = 0
+
+    @property
+    def hedge_rate(self) -> float:
+        """セカンダリにも送った割合（追加の API 呼び出しのコスト）"""
+        return self.hedged / self.requests if self.requests else 0.0
+
+    @property
+    def secondary_win_rate(self) -> float:
+        """セカンダリにも送った呼び出しのうち、セカンダリが先に返した割合"""
+        return self.secondary_wins / self.hedged if self.hedged else 0.0
+
+    def report(self) -> str:
+        """統計情報のレポートを返す"""
+        return (
+            f'ヘッジ: {self.hedged} / {self.requests} 回'
+            f'（{self.hedge_rate:.1%}）、'
+            f'セカンダリの勝ち {self.secondary_wins} 回'
+            f'（{self.secondary_win_rate:.1%}）、'
+            f'切り替え {self.failovers} 回、'
+            f'失敗 {self.failures} 回'
+        )
+
+
+@dataclass
+class _Attempt:
+    """1つのバックエンドへの音声合成の呼び出し
+    Attributes:
+        secondary (bool): セカンダリへの呼び出しかどうか
+        stream (AsyncIterator[AudioBuffer]): 受信した PCM の断片
+        first (asyncio.Task[AudioBuffer]): 最初の断片を待つタスク
+        started_at (float): 送信した時刻（`time.perf_counter` の値）
+    """
+
+    secondary: bool
+    stream: AsyncIterator[AudioBuffer]
+    first: 'asyncio.Task[AudioBuffer]'
+    started_at: float
+
+    async def close(self) -> None:
+        """最初の断片を待つのをやめ、受信を中止する"""
+        self.first.cancel()
+        await asyncio.gather(self.first, return_exceptions=True)
+        await self.stream.aclose()  # type: ignore
+
+
+class HedgedVoiceClient(VoiceClient):
+    """プライマリの応答が遅い場合にセカンダリにも送る VoiceClient のラッパー
+    プライマリに送り、最初の音声が直近の応答時間の分位数（既定は p95）を
+    過ぎても届かない場合、またはプライマリが失敗した場合にセカンダリにも
+    送ります。先に最初の音声を返した方を使い、もう一方は中止します。
+    分位数を上げるとヘッジの回数（コスト）が減り、下げると遅い応答を
+    待つ時間が短くなります。
+    Attributes:
+        _primary (VoiceClient): 最初に送るクライアント
+        _secondary (VoiceClient): 応答が遅い場合に送るクライアント
+        _latencies (Histogram): プライマリの最初の音声までの時間
+        stats (HedgeStats): ヘッジの統計情報
+    """
+
+    # 待ち時間に使うプライマリの応答時間の分位数
+    DEFAULT_QUANTILE = 0.95
+
+    # 応答時間が集まるまでの待ち時間（秒）
+    INITIAL_DELAY = 1.0
+
+    # 待ち時間の下限と上限（秒）
+    MIN_DELAY = 0.05
+    MAX_DELAY = 3.0
+
+    # 分位数の計算に必要な応答時間の数と、計算に使う直近の応答時間の数
+    MIN_SAMPLES = 20
+    MAX_SAMPLES = 200
+
+    def __init__(
+        self,
+        primary: VoiceClient,
+        secondary: VoiceClient,
+        quantile: float = DEFAULT_QUANTILE,
+        initial_delay: float = INITIAL_DELAY,
+        min_delay: float = MIN_DELAY,
+        max_delay: float = MAX_DELAY,
+        metrics: Metrics | None = None,
+    ):
+        """
+        Args:
+            primary (VoiceClient): 最初に送るクライアント
+            secondary (VoiceClient): 応答が遅い場合に送るクライアント
+            quantile (float): 待ち時間に使うプライマリの応答時間の分位数
+            initial_delay (float): 応答時間が集まるまでの待ち時間（秒）
+            min_delay (float): 待ち時間の下限（秒）
+            max_delay (float): 待ち時間の上限（秒）
+            metrics (Metrics | None): 最初の音声までの時間と待ち時間の計測先
+        Raises:
+            ValueError: 分位数が 0 より大きく 1 以下でない場合
+        """
+        if not 0 < quantile <= 1:
+            raise ValueError(
+                'quantile は 0 より大きく 1 以下を指定してください'
+            )
+
+        self._primary = primary
+        self._secondary = secondary
+        self._quantile = quantile
+        self._initial_delay = initial_delay
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._metrics = metrics or Metrics()
+        self._latencies = Histogram(self.MAX_SAMPLES)
+        self.stats = HedgeStats()
+
+    def hedge_delay(self) -> float:
+        """セカンダリにも送るまでの待ち時間（秒）を返す"""
+        if self._latencies.count < self.MIN_SAMPLES:
+            return self._initial_delay
+        return min(
+            self._max_delay,
+            max(self._min_delay, self._latencies.quantile(self._quantile)),
+        )
+
+    async def text_to_speech(self, text: str) -> AudioBuffer:
+        """先に音声を返したバックエンドの音声を返す
+        Args:
+            text (str): 音声に変換するテキスト
+        Returns:
+            AudioBuffer: 音声データ
+        """
+        attempt, audio = await self._race(lambda client: _once(client, text))
+        await attempt.close()
+        return audio
+
+    async def stream_speech(self, text: str) -> AsyncIterator[AudioBuffer]:
+        """先に最初の断片を返したバックエンドの PCM を受信した順に返す
+        Args:
+            text (str): 音声に変換するテキスト
+        Yields:
+            AudioBuffer: PCM の断片
+        """
+        attempt, chunk = await self._race(
+            lambda client: client.stream_speech(text)
+        )
+        try:
+            yield chunk
+            async for chunk in attempt.stream:
+                yield chunk
+        finally:
+            await attempt.close()
+
+    async def _race(
+        self,
+        start: Callable[[VoiceClient], AsyncIterator[AudioBuffer]],
+    ) -> tuple[_Attempt, AudioBuffer]:
+        """プライマリに送り、必要に応じてセカンダリにも送って先に返した方を選ぶ
+        Args:
+            start (Callable[[VoiceClient], AsyncIterator[AudioBuffer]]):
+                クライアントに音声合成を送る関数
+        Returns:
+            tuple[_Attempt, AudioBuffer]: 選んだ呼び出しと最初の断片
+        Raises:
+            Exception: 両方のバックエンドが失敗した場合はプライマリの例外
+        """
+        self.stats.requests += 1
+        delay = self.hedge_delay()
+        primary = _start(start(self._primary), secondary=False)
+        attempts = [primary]
+        primary_error: Exception | None = None
+        winner: _Attempt | None = None
+        hedged = False
+        try:
+            pending = {primary.first}
+            timeout: float | None = delay
+            while winner is None:
+                if not pending:
+                    # すべての呼び出しが失敗した（プライマリも失敗している）
+                    assert primary_error is not None
+                    self.stats.failures += 1
+                    raise primary_error
+
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for attempt in attempts:
+                    if attempt.first not in done:
+                        continue
+                    error = attempt.first.exception()
+                    if error is None:
+                        winner = attempt
+                        break
+                    if not isinstance(error, Exception):
+                        raise error
+                    if attempt is primary:
+                        primary_error = error
+
+                # 待ち時間を過ぎたか、プライマリが失敗した場合はセカンダリにも送る
+                if winner is None and len(attempts) == 1:
+                    if primary_error is None:
+                        hedged = True
+                        self.stats.hedged += 1
+                        self._metrics.observe('tts.hedge.delay', delay)
+                    else:
+                        self.stats.failovers += 1
+                    secondary = _start(start(self._secondary), secondary=True)
+                    attempts.append(secondary)
+                    pending.add(secondary.first)
+                    timeout = None
+            elapsed = time.perf_counter() - primary.started_at
+        finally:
+            for attempt in attempts:
+                if attempt is not winner:
+                    await attempt.close()
+
+        assert winner is not None
+        # プライマリが負けた場合は、中止するまでの時間を応答時間の下限として記録する
+        if primary_error is None:
+            self._latencies.observe(elapsed)
+        if hedged and winner.secondary:
+            self.stats.secondary_wins += 1
+        self._metrics.observe('tts.hedge.first_audio', elapsed)
+        return winner, winner.first.result()
+
+    def voice_settings(self) -> dict[str, str]:
+        """両方のクライアントの設定を返す"""
+        return {
+            'backend': type(self).__name__,
+            **{
+                f'primary.{name}': value
+                for name, value in self._primary.voice_settings().items()
+            },
+            **{
+                f'secondary.{name}': value
+                for name, value in self._secondary.voice_settings().items()
+            },
+        }
+
+    async def warm_up(self) -> None:
+        """両方のクライアントの接続を事前に確立する"""
+        await asyncio.gather(self._primary.warm_up(), self._secondary.warm_up())
+
+    async def aclose(self) -> None:
+        """両方のクライアントのリソースを解放する"""
+        try:
+            await self._primary.aclose()
+        finally:
+            await self._secondary.aclose()
+
+
+def _start(stream: AsyncIterator[AudioBuffer], secondary: bool) -> _Attempt:
+    """音声合成を送り、最初の断片を待つタスクを開始する"""
+    return _Attempt(
+        secondary=secondary,
+        stream=stream,
+        first=asyncio.create_task(_first(stream)),
+        started_at=time.perf_counter(),
+    )
+
+
+async def _first(stream: AsyncIterator[AudioBuffer]) -> AudioBuffer:
+    """最初の断片を返す
+    Raises:
+        ValueError: 音声を受信できなかった場合
+    """
+    chunk = await anext(stream, None)
+    if chunk is None:
+        raise ValueError('音声を受信できませんでした')
+    return chunk
+
+
+async def _once(client: VoiceClient, text: str) -> AsyncIterator[AudioBuffer]:
+    """`text_to_speech` の結果を1つの断片として返す"""
+    yield await client.text_to_speech(text)
@@ -0,0 +1,282 @@
+import asyncio
+import json
+import math
+import os
+import re
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Generator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from .output import OutputWriter
+
+
+@dataclass(frozen=True)
+class HistogramSummary:
+    """ヒストグラムの集計結果（単位は秒）
+    Attributes:
+        count (int): 記録した回数
+        total (float): 記録した値の合計
+        p50 (float): 50 パーセンタイル
+        p95 (float): 95 パーセンタイル
+        p99 (float): 99 パーセンタイル
+        max (float): 最大値
+    """
+
+    count: int
+    total: float
+    p50: float
+    p95: float
+    p99: float
+    max: float
+
+    @property
+    def mean(self) -> float:
+        """平均値"""
+        return self.total / self.count if self.count else 0.0
+
+
+class Histogram:
+    """直近の値からパーセンタイルを計算するヒストグラム
+    回数と合計はすべての値で集計し、パーセンタイルは直近の
+    `max_samples` 件から計算します。
+    """
+
+    # パーセンタイルの計算に使用する値の最大数
+    MAX_SAMPLES = 4096
+
+    def __init__(self, max_samples: int = MAX_SAMPLES):
+        self._samples: deque[float] = deque(maxlen=max_samples)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        """値を記録する"""
+        self._samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> float:
+        """指定した分位数の値を返す（記録がない場合は 0）"""
+        return _pick(sorted(self._samples), q)
+
+    def summary(self) -> HistogramSummary:
+        """集計結果を返す"""
+        ordered = sorted(self._samples)
+        return HistogramSummary(
+            count=self.count,
+            total=self.total,
+            p50=_pick(ordered, 0.50),
+            p95=_pick(ordered, 0.95),
+            p99=_pick(ordered, 0.99),
+            max=ordered[-1] if ordered else 0.0,
+        )
+
+
+def _pick(ordered: list[float], q: float) -> float:
+    """昇順に並んだ値から分位数の値を返す（最近傍法）"""
+    if not ordered:
+        return 0.0
+    return ordered[
+        min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    ]
+
+
+class MetricsSink(ABC):
+    """計測結果を受け取る出力先のインターフェース"""
+
+    @abstractmethod
+    def observe(self, name: str, seconds: float) -> None:
+        """計測結果を記録する
+        Args:
+            name (str): 計測区間の名前（例: `chat.ttft`）
+            seconds (float): 所要時間（秒）
+        """
+        pass
+
+
+class HistogramSink(MetricsSink):
+    """計測結果をプロセス内のヒストグラムに集計する出力先
+    Attributes:
+        _histograms (dict[str, Histogram]): 計測区間ごとのヒストグラム
+    """
+
+    def __init__(self, max_samples: int = Histogram.MAX_SAMPLES):
+        self._max_samples = max_samples
+        self._histograms: dict[str, Histogram] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = Histogram(self._max_samples)
+            self._histograms[name] = histogram
+        histogram.observe(seconds)
+
+    def snapshot(self) -> dict[str, HistogramSummary]:
+        """計測区間ごとの集計結果を名前順に返す"""
+        return {
+            name: self._histograms[name].summary()
+            for name in sorted(self._histograms)
+        }
+
+    def to_json_line(self) -> str:
+        """集計結果を JSON Lines の1行に変換する"""
+        return json.dumps(
+            {
+                'timestamp': time.time(),
+                'metrics': {
+                    name: asdict(summary)
+                    for name, summary in self.snapshot().items()
+                },
+            },
+            ensure_ascii=False,
+        )
+
+    def to_prometheus(self, prefix: str = 'stt') -> str:
+        """集計結果を Prometheus のテキスト形式に変換する"""
+        lines: list[str] = []
+        for name, summary in self.snapshot().items():
+            metric = f'{prefix}_{re.sub(r"[^a-zA-Z0-9_]", "_", name)}_seconds'
+            lines.append(f'# TYPE {metric} summary')
+            for quantile, value in (
+                ('0.5', summary.p50),
+                ('0.95', summary.p95),
+                ('0.99', summary.p99),
+            ):
+                lines.append(f'{metric}{{quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'{metric}_sum {summary.total:.6f}')
+            lines.append(f'{metric}_count {summary.count}')
+        return '\n'.join(lines) + '\n'
+
+    def print_summary(self, output: OutputWriter) -> None:
+        """セッションの計測結果の概要を出力する"""
+        snapshot = self.snapshot()
+        if not snapshot:
+            return
+        output.print('--- レイテンシの概要 (p50 / p95 / p99) ---')
+        width = max(len(name) for name in snapshot)
+        for name, summary in snapshot.items():
+            output.print(
+                f'{name:<{width}}  '
+                f'{summary.p50 * 1000:7.0f}ms / '
+                f'{summary.p95 * 1000:7.0f}ms / '
+                f'{summary.p99 * 1000:7.0f}ms  '
+                f'(n={summary.count})'
+            )
+
+
+class Span:
+    """計測中の区間
+    区間の開始からの経過時間を、区間名に接尾辞を付けた名前で記録できます
+    （例: `chat` 区間の `ttft`）。
+    Attributes:
+        name (str): 区間の名前
+        started_at (float): 区間の開始時刻（`time.perf_counter` の値）
+    """
+
+    def __init__(self, metrics: 'Metrics', name: str):
+        self._metrics = metrics
+        self.name = name
+        self.started_at = time.perf_counter()
+        self._marked: set[str] = set()
+
+    @property
+    def elapsed(self) -> float:
+        """区間の開始からの経過時間（秒）"""
+        return time.perf_counter() - self.started_at
+
+    def mark(self, suffix: str) -> None:
+        """区間の開始からの経過時間を記録する（接尾辞ごとに最初の1回のみ）"""
+        if suffix in self._marked:
+            return
+        self._marked.add(suffix)
+        self._metrics.observe(f'{self.name}.{suffix}', self.elapsed)
+
+
+class Metrics:
+    """処理の各段階の所要時間を計測し、出力先に送るクラス
+    出力先を指定しない場合は何も記録しません。
+    Attributes:
+        _sinks (list[MetricsSink]): 計測結果の出力先
+    """
+
+    def __init__(self, *sinks: MetricsSink):
+        self._sinks = list(sinks)
+
+    def observe(self, name: str, seconds: float) -> None:
+        """計測結果をすべての出力先に記録する"""
+        for sink in self._sinks:
+            sink.observe(name, seconds)
+
+    @contextmanager
+    def span(self, name: str, total: str | None = 'total') -> Generator[Span]:
+        """ブロックの所要時間を計測する
+        ブロックが例外で終了した場合（キャンセルを含む）は全体の所要時間を
+        記録しません。
+        Args:
+            name (str): 区間の名前
+            total (str | None): 全体の所要時間を記録する接尾辞
+                （None の場合は区間名そのもので記録する）
+        Yields:
+            Span: 計測中の区間
+        """
+        span = Span(self, name)
+        yield span
+        if total is None:
+            self.observe(name, span.elapsed)
+        else:
+            span.mark(total)
+
+
+class MetricsDumper:
+    """ヒストグラムの集計結果を定期的にファイルへ書き出すクラス
+    JSON Lines 形式では1回ごとに1行を追記し、Prometheus 形式では
+    node_exporter の textfile collector で読めるようファイルを置き換えます。
+    """
+
+    # 書き出しの間隔（秒）
+    INTERVAL = 60.0
+
+    FORMATS = ('jsonl', 'prometheus')
+
+    def __init__(
+        self,
+        sink: HistogramSink,
+        path: Path,
+        format: str = 'jsonl',
+        interval: float = INTERVAL,
+    ):
+        """
+        Raises:
+            ValueError: 未対応の形式が指定された場合
+        """
+        if format not in self.FORMATS:
+            raise ValueError(f'未対応のメトリクス形式です: {format}')
+        self._sink = sink
+        self._path = path
+        self._format = format
+        self._interval = interval
+
+    def dump(self) -> None:
+        """現在の集計結果を書き出す"""
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        if self._format == 'jsonl':
+            with self._path.open('a', encoding='utf-8') as f:
+                f.write(self._sink.to_json_line() + '\n')
+            return
+
+        tmp_path = self._path.with_suffix(f'.{os.getpid()}.tmp')
+        tmp_path.write_text(self._sink.to_prometheus(), encoding='utf-8')
+        os.replace(tmp_path, self._path)
+
+    async def run(self) -> None:
+        """キャンセルされるまで一定間隔で書き出す（終了時にも書き出す）"""
+        try:
+            while True:
+                await asyncio.sleep(self._interval)
+                await asyncio.to_thread(self.dump)
+        finally:
+            self.dump()
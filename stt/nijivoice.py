@@ -1,17 +1,33 @@
-import base64
+import binascii
+import contextlib
+import importlib.util
+import time
+from collections.abc import AsyncGenerator, AsyncIterator
 
 import httpx
 
+from .audio import AudioBuffer, WavStreamParser
+from .codec import FFmpegDecoder, TransferFormat, decode_audio
 from .config import CharacterID
+from .governor import Governor
+from .metrics import Metrics
 from .voice import VoiceClient
 
 
 class NijiVoiceClient(VoiceClient):
     """にじボイス API のクライアント
     このクライアントを使用してにじボイス APIでテキストを音声に変換できます。
+    HTTP 接続はクライアントの生存期間を通して使い回されます。
+    `async with` で使用すると、終了時に接続プールを閉じます。
     Attributes:
         _api_key (str): にじボイス の API キー
         _voice_id (str): テキスト読み上げに使用する音声ID
+        _http (httpx.AsyncClient | None): 接続プールを保持する HTTP クライアント
+        _owns_http (bool): HTTP クライアントをこのインスタンスが管理しているかどうか
+        _metrics (Metrics): 音声データのデコード時間の計測先
+        _base_url (str): API のベース URL
+        _governor (Governor): にじボイス API へのリクエストの流量制御
+        _audio_format (TransferFormat): API から受信する音声の形式
     """
 
     # APIのベースURL
@@ -24,34 +40,142 @@ class NijiVoiceClient(VoiceClient):
         'ikemen': '04c7f4e0-41d8-4d02-9cbe-bf79e635f5ab',
     }
 
-    def __init__(self, api_key: str, voice_id: str):
+    # 話速と既定の出力形式
+    SPEED = '1.0'
+    AUDIO_FORMAT: TransferFormat = 'wav'
+
+    # 音声ファイルをダウンロードする際の1回あたりの受信サイズ
+    DOWNLOAD_CHUNK_SIZE = 8192
+
+    # 接続プールの既定の上限
+    DEFAULT_LIMITS = httpx.Limits(
+        max_connections=10,
+        max_keepalive_connections=5,
+        keepalive_expiry=60.0,
+    )
+
+    # 既定のタイムアウト（音声合成は読み込みに時間がかかるため長めに設定）
+    DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+
+    def __init__(
+        self,
+        api_key: str,
+        voice_id: str,
+        limits: httpx.Limits = DEFAULT_LIMITS,
+        timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+        http2: bool = False,
+        http_client: httpx.AsyncClient | None = None,
+        metrics: Metrics | None = None,
+        base_url: str = BASE_URL,
+        governor: Governor | None = None,
+        audio_format: TransferFormat = AUDIO_FORMAT,
+    ):
+        """
+        Args:
+            api_key (str): にじボイス の API キー
+            voice_id (str): テキスト読み上げに使用する音声ID
+            limits (httpx.Limits): 接続プールの上限
+            timeout (httpx.Timeout): リクエストのタイムアウト
+            http2 (bool): HTTP/2 を使用するかどうか（`h2` パッケージが必要）
+            http_client (httpx.AsyncClient | None): 共有する HTTP クライアント。
+                指定した場合、接続プールの設定とクローズは呼び出し側が管理する
+            metrics (Metrics | None): 音声データのデコード時間の計測先
+            base_url (str): API のベース URL（検証用のサーバーを使う場合に指定）
+            governor (Governor | None): 他のクライアントと共有する流量制御
+                （None の場合は再試行のみ行う）
+            audio_format (TransferFormat): API から受信する音声の形式。
+                `mp3` は転送量が減る代わりに ffmpeg でデコードする
+        Raises:
+            ValueError: http2 が True で `h2` がインストールされていない場合、
+                または `mp3` で ffmpeg がインストールされていない場合
+        """
+        if http2 and importlib.util.find_spec('h2') is None:
+            raise ValueError(
+                '`http2=True` の場合は `uv add "httpx[http2]"` が必要です'
+            )
+        if audio_format != 'wav':
+            # ffmpeg がない場合は最初の音声合成ではなく作成時に失敗させる
+            FFmpegDecoder(audio_format)
+
         self._api_key = api_key
         self._voice_id = voice_id
+        self._limits = limits
+        self._timeout = timeout
+        self._http2 = http2
+        self._http = http_client
+        self._owns_http = http_client is None
+        self._metrics = metrics or Metrics()
+        self._base_url = base_url
+        self._governor = governor or Governor('nijivoice')
+        self._audio_format: TransferFormat = audio_format
 
-    async def text_to_speech(self, text: str) -> bytes:
-        """にじボイス API を使用してテキストを音声に変換する
+    @classmethod
+    def create_http_client(
+        cls,
+        limits: httpx.Limits = DEFAULT_LIMITS,
+        timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+        http2: bool = False,
+    ) -> httpx.AsyncClient:
+        """にじボイス API 用の接続プール付き HTTP クライアントを作成する
         Args:
-            text (str): 音声に変換するテキスト
+            limits (httpx.Limits): 接続プールの上限
+            timeout (httpx.Timeout): リクエストのタイムアウト
+            http2 (bool): HTTP/2 を使用するかどうか
         Returns:
-            bytes: バイト形式の音声データ
-        Raises:
-            ValueError: API レスポンスに base64 音声データが含まれていない場合
+            httpx.AsyncClient: HTTP クライアント
         """
+        return httpx.AsyncClient(
+            limits=limits,
+            timeout=timeout,
+            http2=http2,
+        )
+
+    def _get_http(self) -> httpx.AsyncClient:
+        """HTTP クライアントを取得する（未作成の場合は新規作成）"""
+        if self._http is None:
+            self._http = self.create_http_client(
+                limits=self._limits,
+                timeout=self._timeout,
+                http2=self._http2,
+            )
+        return self._http
 
-        headers = {
+    def _headers(self) -> dict[str, str]:
+        """API リクエストのヘッダーを作成する"""
+        return {
             'x-api-key': self._api_key,
             'Content-Type': 'application/json',
         }
-        data = {'script': text, 'speed': '1.0', 'format': 'wav'}
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                url=f'{self.BASE_URL}/voice-actors/{self._voice_id}/generate-encoded-voice',
-                headers=headers,
-                json=data,
+    def _payload(self, text: str) -> dict[str, str]:
+        """音声生成リクエストの本文を作成する"""
+        return {
+            'script': text,
+            'speed': self.SPEED,
+            'format': self._audio_format,
+        }
+
+    async def text_to_speech(self, text: str) -> AudioBuffer:
+        """にじボイス API を使用してテキストを音声に変換する
+        Args:
+            text (str): 音声に変換するテキスト
+        Returns:
+            AudioBuffer: 音声データ
+        Raises:
+            ValueError: API レスポンスに base64 音声データが含まれていない場合、
+                または音声データをデコードできない場合
+        """
+
+        async def generate() -> httpx.Response:
+            response = await self._get_http().post(
+                url=f'{self._base_url}/voice-actors/{self._voice_id}/generate-encoded-voice',
+                headers=self._headers(),
+                json=self._payload(text),
             )
             response.raise_for_status()
+            return response
 
+        response = await self._governor.call(generate)
         data = response.json()
 
         base64_audio: str | None = data['generatedVoice']['base64Audio']
@@ -59,17 +183,124 @@ class NijiVoiceClient(VoiceClient):
         if base64_audio is None:
             raise ValueError('レスポンスに Base64 音声データがありません。')
 
-        return base64.b64decode(base64_audio)
+        with self._metrics.span('tts.decode', total=None):
+            # ASCII の文字列を bytes に変換せずに直接デコードし、
+            # WAV の PCM 部分はコピーせずに参照する
+            audio = binascii.a2b_base64(base64_audio)
+            if self._audio_format == 'wav':
+                return AudioBuffer.from_wav(audio)
+            return await decode_audio(audio, self._audio_format)
+
+    def voice_settings(self) -> dict[str, str]:
+        """合成結果に影響する設定を返す"""
+        return {
+            'backend': 'nijivoice',
+            'voice_id': self._voice_id,
+            'speed': self.SPEED,
+            'format': self._audio_format,
+        }
+
+    async def stream_speech(self, text: str) -> AsyncIterator[AudioBuffer]:
+        """にじボイス API で音声を生成し、音声ファイルを分割して受信する
+        base64 を含む JSON の代わりに音声ファイルの URL を受け取り、
+        ダウンロードしながら届いた分の PCM を返します。
+        Args:
+            text (str): 音声に変換するテキスト
+        Yields:
+            AudioBuffer: PCM の断片
+        Raises:
+            ValueError: API レスポンスに音声ファイルの URL が含まれていない場合
+        """
+
+        # 最初の断片を受信するまでのエラーは Governor が再試行する
+        async with contextlib.aclosing(
+            self._governor.stream(lambda: self._download_speech(text))
+        ) as stream:
+            async for audio in stream:
+                yield audio
+
+    async def _download_speech(self, text: str) -> AsyncGenerator[AudioBuffer]:
+        """音声を生成し、音声ファイルをダウンロードしながら PCM を返す"""
+        http = self._get_http()
+        response = await http.post(
+            url=f'{self._base_url}/voice-actors/{self._voice_id}/generate-voice',
+            headers=self._headers(),
+            json=self._payload(text),
+        )
+        response.raise_for_status()
+
+        audio_url: str | None = response.json()['generatedVoice'].get(
+            'audioFileUrl'
+        )
+        if audio_url is None:
+            raise ValueError('レスポンスに音声ファイルの URL がありません。')
+
+        async with http.stream('GET', audio_url) as download:
+            download.raise_for_status()
+            chunks = download.aiter_bytes(self.DOWNLOAD_CHUNK_SIZE)
+            if self._audio_format == 'wav':
+                async for audio in self._parse_wav(chunks):
+                    yield audio
+            else:
+                # 圧縮された音声は受信しながら ffmpeg でデコードする
+                decoder = FFmpegDecoder(self._audio_format)
+                async with contextlib.aclosing(decoder.decode(chunks)) as pcm:
+                    async for audio in pcm:
+                        yield audio
+
+    async def _parse_wav(
+        self, chunks: AsyncIterator[bytes]
+    ) -> AsyncIterator[AudioBuffer]:
+        """受信した WAV から届いた分の PCM を返す"""
+        parser = WavStreamParser()
+        # デコード時間は断片ごとではなく1文分の合計で記録する
+        decode_time = 0.0
+        async for data in chunks:
+            started_at = time.perf_counter()
+            pcm = parser.feed(data)
+            decode_time += time.perf_counter() - started_at
+            if pcm and parser.audio_format is not None:
+                yield AudioBuffer(pcm, parser.audio_format)
+        self._metrics.observe('tts.decode', decode_time)
+
+    async def warm_up(self) -> None:
+        """にじボイス API への接続（DNS・TCP・TLS）を事前に確立する
+        音声合成を伴わない軽量なリクエストを送り、接続をプールに残します。
+        """
+        response = await self._get_http().get(
+            url=f'{self._base_url}/voice-actors',
+            headers=self._headers(),
+        )
+        # 接続の確立が目的のため、ステータスコードは確認しない
+        await response.aclose()
+
+    async def aclose(self) -> None:
+        """接続プールを閉じる（共有された HTTP クライアントは閉じない）"""
+        if self._http is not None and self._owns_http:
+            await self._http.aclose()
+            self._http = None
 
     @classmethod
     def create_from_character_id(
-        cls, api_key: str, character_id: CharacterID
+        cls,
+        api_key: str,
+        character_id: CharacterID,
+        http_client: httpx.AsyncClient | None = None,
+        metrics: Metrics | None = None,
+        base_url: str = BASE_URL,
+        governor: Governor | None = None,
+        audio_format: TransferFormat = AUDIO_FORMAT,
     ) -> 'NijiVoiceClient':
         """キャラクターIDから NijiVoiceClient を作成する
 
         Args:
             api_key (str): にじボイス API キー
             id (CharacterID): キャラクターの識別子
+            http_client (httpx.AsyncClient | None): 共有する HTTP クライアント
+            metrics (Metrics | None): 音声データのデコード時間の計測先
+            base_url (str): API のベース URL
+            governor (Governor | None): にじボイス API の流量制御
+            audio_format (TransferFormat): API から受信する音声の形式
 
         Returns:
             NijiVoiceClient: にじボイスクライアントインスタンス
@@ -80,4 +311,12 @@ class NijiVoiceClient(VoiceClient):
         if voice_id is None:
             raise ValueError(f'Unknown character ID: {character_id}')
 
-        return cls(api_key=api_key, voice_id=voice_id)
+        return cls(
+            api_key=api_key,
+            voice_id=voice_id,
+            http_client=http_client,
+            metrics=metrics,
+            base_url=base_url,
+            governor=governor,
+            audio_format=audio_format,
+        )
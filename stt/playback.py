@@ -0,0 +1,297 @@
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any
+
+from .audio import AudioBuffer, AudioFormat
+from .voice import is_installed
+
+
+class PlaybackEngine(ABC):
+    """音声を順番に再生するエンジンの抽象クラス
+    `enqueue` で追加した音声は追加順に途切れなく再生されます。
+    """
+
+    @abstractmethod
+    async def enqueue(self, audio: AudioBuffer) -> None:
+        """音声を再生キューに追加する（再生の完了は待たない）
+        Args:
+            audio (AudioBuffer): 音声データ
+        """
+        pass
+
+    @abstractmethod
+    async def drain(self) -> None:
+        """キューに追加した音声がすべて再生されるまで待つ"""
+        pass
+
+    @abstractmethod
+    def flush(self) -> None:
+        """再生中・再生待ちの音声を破棄して、すぐに無音にする"""
+        pass
+
+    @abstractmethod
+    def stop(self) -> None:
+        """音声を破棄して出力デバイスを閉じる（次の enqueue で再び開く）"""
+        pass
+
+    @property
+    @abstractmethod
+    def is_playing(self) -> bool:
+        """再生中または再生待ちの音声があるかどうか"""
+        pass
+
+    @property
+    def audio_format(self) -> AudioFormat | None:
+        """開いている出力ストリームの形式（形式を問わない場合は None）
+        同じ形式の音声は、出力ストリームを開き直さずに再生できます。
+        """
+        return None
+
+    @property
+    def device_sample_rate(self) -> int | None:
+        """出力デバイスの既定のサンプリングレート（分からない場合は None）
+        音声をこのレートに変換しておくと、デバイス側での変換が不要になります。
+        """
+        return None
+
+
+class SoundDevicePlaybackEngine(PlaybackEngine):
+    """sounddevice の出力ストリームを開いたまま再生するエンジン
+    出力ストリームは一度開いたら閉じずに使い続け、キューが空の間は無音を
+    出力します。そのため発話ごとのデバイス初期化が発生しません。
+    Attributes:
+        _stream (Any): sounddevice の RawOutputStream
+        _format (AudioFormat | None): 現在開いているストリームの形式
+        _queue (deque[memoryview]): 再生待ちの PCM
+        _lock (threading.Lock): オーディオスレッドとキューを共有するためのロック
+        _idle (asyncio.Event): キューが空になったことを通知するイベント
+    """
+
+    # オーディオコールバック1回あたりのフレーム数（0 はデバイスに任せる）
+    BLOCK_SIZE = 0
+
+    def __init__(self, latency: str | float = 'low'):
+        try:
+            import sounddevice as sd  # type: ignore
+        except (ModuleNotFoundError, OSError):
+            message = (
+                '再生エンジンには `uv add sounddevice` と PortAudio が必要です'
+            )
+            raise ValueError(message)
+
+        self._sd = sd
+        self._latency = latency
+        self._stream: Any = None
+        self._format: AudioFormat | None = None
+        self._queue: deque[memoryview] = deque()
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def is_playing(self) -> bool:
+        return not self._idle.is_set()
+
+    @property
+    def audio_format(self) -> AudioFormat | None:
+        return self._format
+
+    @property
+    def device_sample_rate(self) -> int | None:
+        try:
+            device = self._sd.query_devices(kind='output')
+        except (self._sd.PortAudioError, ValueError):
+            return None
+        return int(device['default_samplerate'])
+
+    async def enqueue(self, audio: AudioBuffer) -> None:
+        if not audio:
+            return
+
+        # 形式が変わる場合は再生しきってからストリームを開き直す
+        if self._format != audio.audio_format:
+            await self.drain()
+            self._close_stream()
+            self._open_stream(audio.audio_format)
+
+        with self._lock:
+            self._queue.append(audio.pcm)
+            self._idle.clear()
+
+    async def drain(self) -> None:
+        await self._idle.wait()
+        # デバイス側のバッファに残っている分の再生を待つ
+        if self._stream is not None:
+            await asyncio.sleep(self._stream.latency)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._queue.clear()
+        self._idle.set()
+
+    def stop(self) -> None:
+        self.flush()
+        self._close_stream()
+
+    def _open_stream(self, audio_format: AudioFormat) -> None:
+        """指定した形式で出力ストリームを開く"""
+        self._loop = asyncio.get_running_loop()
+        self._stream = self._sd.RawOutputStream(
+            samplerate=audio_format.sample_rate,
+            channels=audio_format.channels,
+            dtype=f'int{audio_format.sample_width * 8}',
+            blocksize=self.BLOCK_SIZE,
+            latency=self._latency,
+            callback=self._callback,
+        )
+        self._format = audio_format
+        self._stream.start()
+
+    def _close_stream(self) -> None:
+        """出力ストリームを閉じる"""
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+            self._format = None
+
+    def _callback(
+        self,
+        outdata: Any,
+        frames: int,
+        time: Any,
+        status: Any,
+    ) -> None:
+        """オーディオスレッドから呼ばれ、キューの PCM を出力バッファに書き込む"""
+        size = len(outdata)
+        written = 0
+
+        with self._lock:
+            while written < size and self._queue:
+                head = self._queue[0]
+                count = min(size - written, len(head))
+                outdata[written : written + count] = head[:count]
+                written += count
+                if count == len(head):
+                    self._queue.popleft()
+                else:
+                    self._queue[0] = head[count:]
+            drained = not self._queue
+
+        if written < size:
+            outdata[written:size] = bytes(size - written)
+
+        if drained and self._loop is not None and not self._idle.is_set():
+            self._loop.call_soon_threadsafe(self._mark_idle)
+
+    def _mark_idle(self) -> None:
+        """イベントループ上で、キューが空のままであれば再生の終了を通知する
+        オーディオスレッドがキューを空にしてからこの処理が動くまでの間に
+        `enqueue` が追加した音声がある場合は、再生中のままにします。
+        """
+        with self._lock:
+            if not self._queue:
+                self._idle.set()
+
+
+class FFPlayPlaybackEngine(PlaybackEngine):
+    """ffplay を使用して再生するエンジン（sounddevice が使えない場合の代替）
+    音声ごとに ffplay を起動しますが、イベントループはブロックしません。
+    Attributes:
+        _queue (asyncio.Queue[AudioBuffer]): 再生待ちの音声データ
+        _worker (asyncio.Task[None] | None): キューを順番に再生するタスク
+        _process (asyncio.subprocess.Process | None): 再生中の ffplay プロセス
+    """
+
+    def __init__(self):
+        if not is_installed('ffplay'):
+            raise ValueError(
+                '`ffplay` がインストールされていません。音声再生を使用するにはインストールしてください。'
+            )
+
+        self._queue: asyncio.Queue[AudioBuffer] = asyncio.Queue()
+        self._worker: asyncio.Task[None] | None = None
+        self._process: asyncio.subprocess.Process | None = None
+
+    @property
+    def is_playing(self) -> bool:
+        return self._process is not None or not self._queue.empty()
+
+    async def enqueue(self, audio: AudioBuffer) -> None:
+        if not audio:
+            return
+
+        self._queue.put_nowait(audio)
+
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def drain(self) -> None:
+        await self._queue.join()
+
+    def flush(self) -> None:
+        while not self._queue.empty():
+            self._queue.get_nowait()
+            self._queue.task_done()
+        if self._process is not None and self._process.returncode is None:
+            self._process.kill()
+
+    def stop(self) -> None:
+        self.flush()
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    async def _run(self) -> None:
+        """キューの音声を1つずつ ffplay で再生する"""
+        while True:
+            audio = await self._queue.get()
+            try:
+                self._process = await asyncio.create_subprocess_exec(
+                    'ffplay',
+                    '-autoexit',
+                    '-nodisp',
+                    '-loglevel',
+                    'quiet',
+                    '-',
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+                await self._write(self._process, audio)
+                await self._process.wait()
+            finally:
+                self._process = None
+                self._queue.task_done()
+
+    @staticmethod
+    async def _write(
+        process: asyncio.subprocess.Process, audio: AudioBuffer
+    ) -> None:
+        """WAV ヘッダーと PCM を連結せずに ffplay の標準入力へ書き込む"""
+        assert process.stdin is not None
+        try:
+            process.stdin.write(audio.wav_header())
+            process.stdin.write(audio.pcm)
+            await process.stdin.drain()
+            process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # flush で ffplay が終了させられた場合
+            pass
+
+
+def create_playback_engine() -> PlaybackEngine:
+    """利用できる再生エンジンを作成する
+    sounddevice が使える場合は常時開いた出力ストリームを使い、
+    使えない場合は ffplay にフォールバックします。
+    Returns:
+        PlaybackEngine: 再生エンジン
+    Raises:
+        ValueError: sounddevice も ffplay も使用できない場合
+    """
+    try:
+        return SoundDevicePlaybackEngine()
+    except ValueError:
+        return FFPlayPlaybackEngine()
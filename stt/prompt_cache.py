@@ -0,0 +1,283 @@
+import asyncio
+import contextlib
+import hashlib
+import time
+from collections.abc import Callable, Coroutine
+from dataclasses import dataclass
+from typing import Any
+
+from google.genai import Client, types  # type: ignore
+
+from .context import estimate_tokens
+from .governor import Governor, status_code
+
+# キャッシュが使えなくなったことを示すステータスコード
+# （期限切れ・削除済み・権限がない・モデルが対応していないなど）
+CACHE_ERROR_STATUS_CODES = frozenset({400, 403, 404})
+
+
+def is_cache_error(error: BaseException) -> bool:
+    """キャッシュを使ったリクエストのエラーが、キャッシュを原因とするものかどうか
+    原因を区別できないため、キャッシュを使わずに送り直す価値のあるクライアント
+    エラーをすべて対象とします。
+    """
+    return status_code(error) in CACHE_ERROR_STATUS_CODES
+
+
+@dataclass
+class CachedPrompt:
+    """Gemini 側に作成したシステムインストラクションのキャッシュ
+    Attributes:
+        name (str): キャッシュの名前（`cachedContents/...`）
+        expires_at (float): 有効期限（`PromptCache` の時計の時刻）
+    """
+
+    name: str
+    expires_at: float
+
+
+@dataclass
+class PromptCacheStats:
+    """システムインストラクションのキャッシュの統計情報"""
+
+    # 参照したときにキャッシュを使用できた回数と、使用できなかった回数
+    hits: int = 0
+    misses: int = 0
+    # キャッシュを作成・延長した回数と、失敗した回数
+    created: int = 0
+    refreshed: int = 0
+    failures: int = 0
+    # 送信に失敗して、キャッシュを使わずに送り直した回数
+    fallbacks: int = 0
+
+    def report(self) -> str:
+        """統計情報を1行の文字列にする"""
+        return (
+            f'プロンプトキャッシュ: 使用 {self.hits} 回 / 不使用 {self.misses} 回'
+            f' / 作成 {self.created} 回 / 延長 {self.refreshed} 回'
+            f' / 失敗 {self.failures} 回 / 送り直し {self.fallbacks} 回'
+        )
+
+
+class PromptCache:
+    """キャラクターごとのシステムインストラクションを Gemini 側にキャッシュする
+    同じモデルとシステムインストラクションのキャッシュは1つだけ作成し、
+    同じプロセスのすべての会話で共有します。`lookup` は待たずに結果を返し、
+    キャッシュがまだない場合は作成を始めて None を返すため、呼び出し側は
+    その間システムインストラクションをそのまま送ります。
+    使われているキャッシュは期限が近づくと延長し、使われなくなったものは
+    TTL で自然に削除されます。作成に失敗した場合（短すぎるプロンプトや
+    対応していないモデルなど）は、しばらく作成を試みません。
+    Attributes:
+        _client (Client): Google GenAI クライアント
+        _entries (dict[str, CachedPrompt]): 作成済みのキャッシュ
+        _tasks (dict[str, asyncio.Task[str | None]]): 作成中・延長中の処理
+        _retry_at (dict[str, float]): 作成に失敗した後、再び試みる時刻
+        stats (PromptCacheStats): 統計情報
+    """
+
+    # キャッシュの有効期間（秒）
+    DEFAULT_TTL = 3600.0
+
+    # 有効期限のこの秒数前から、使われたときに期限を延長する
+    REFRESH_MARGIN = 300.0
+
+    # 作成に失敗した後、再び作成を試みるまでの秒数
+    RETRY_INTERVAL = 600.0
+
+    # キャッシュを作成するプロンプトの最小の概算トークン数
+    # （Gemini はこれより短いコンテンツのキャッシュを作成できない）
+    MIN_TOKENS = 1024
+
+    def __init__(
+        self,
+        client: Client,
+        ttl: float = DEFAULT_TTL,
+        refresh_margin: float = REFRESH_MARGIN,
+        retry_interval: float = RETRY_INTERVAL,
+        min_tokens: int = MIN_TOKENS,
+        governor: Governor | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            client (Client): Google GenAI クライアント
+            ttl (float): キャッシュの有効期間（秒）
+            refresh_margin (float): 有効期限のこの秒数前から期限を延長する
+            retry_interval (float): 作成に失敗した後、再び試みるまでの秒数
+            min_tokens (int): キャッシュを作成するプロンプトの最小の概算
+                トークン数（これより短いプロンプトは API を呼ばずに見送る）
+            governor (Governor | None): AIChat と共有する Gemini API の流量制御
+            clock (Callable[[], float]): 有効期限の判定に使う時計
+        """
+        self._client = client
+        self._ttl = ttl
+        self._refresh_margin = min(refresh_margin, ttl / 2)
+        self._retry_interval = retry_interval
+        self._min_tokens = min_tokens
+        self._governor = governor or Governor('gemini')
+        self._clock = clock
+        self._entries: dict[str, CachedPrompt] = {}
+        self._tasks: dict[str, asyncio.Task[str | None]] = {}
+        self._retry_at: dict[str, float] = {}
+        self.stats = PromptCacheStats()
+
+    @staticmethod
+    def key(model: str, system_instruction: str) -> str:
+        """モデルとシステムインストラクションからキャッシュのキーを作成する"""
+        payload = f'{model}\n{system_instruction}'
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def lookup(self, model: str, system_instruction: str) -> str | None:
+        """使用できるキャッシュの名前を返す（待たずに返す）
+        キャッシュがない場合は作成を、期限が近い場合は延長を始めます。
+        Args:
+            model (str): 使用するモデル名
+            system_instruction (str): システムインストラクション
+        Returns:
+            str | None: キャッシュの名前（使用できない場合は None）
+        """
+        key = self.key(model, system_instruction)
+        entry = self._valid_entry(key)
+        if entry is None:
+            self._start_create(key, model, system_instruction)
+            self.stats.misses += 1
+            return None
+
+        if self._clock() >= entry.expires_at - self._refresh_margin:
+            self._start(key, lambda: self._refresh(key, entry))
+        self.stats.hits += 1
+        return entry.name
+
+    async def prepare(self, model: str, system_instruction: str) -> str | None:
+        """キャッシュを作成し、作成が終わるまで待つ（起動時の事前準備用）
+        Returns:
+            str | None: キャッシュの名前（使用できない場合は None）
+        """
+        key = self.key(model, system_instruction)
+        entry = self._valid_entry(key)
+        if entry is not None:
+            return entry.name
+
+        task = self._start_create(key, model, system_instruction)
+        if task is None:
+            return None
+        return await asyncio.shield(task)
+
+    def invalidate(self, name: str) -> None:
+        """使用できなくなったキャッシュを破棄し、しばらく作成を試みない
+        キャッシュを使った送信がキャッシュの原因で失敗した場合に呼びます。
+        Args:
+            name (str): キャッシュの名前
+        """
+        for key, entry in list(self._entries.items()):
+            if entry.name == name:
+                del self._entries[key]
+                self._retry_at[key] = self._clock() + self._retry_interval
+        self.stats.fallbacks += 1
+
+    async def aclose(self) -> None:
+        """作成中の処理を取り消し、作成したキャッシュを削除する
+        削除に失敗したキャッシュも TTL で自然に削除されます。
+        """
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+        entries = list(self._entries.values())
+        self._entries.clear()
+        for entry in entries:
+            with contextlib.suppress(Exception):
+                await self._client.aio.caches.delete(name=entry.name)
+
+    def _valid_entry(self, key: str) -> CachedPrompt | None:
+        """有効期限内のキャッシュを返す（期限切れのものは破棄する）"""
+        entry = self._entries.get(key)
+        if entry is not None and self._clock() >= entry.expires_at:
+            del self._entries[key]
+            entry = None
+        return entry
+
+    def _start_create(
+        self, key: str, model: str, system_instruction: str
+    ) -> asyncio.Task[str | None] | None:
+        """キャッシュの作成を始める（作成を見送る場合は None を返す）"""
+        if key in self._tasks:
+            return self._tasks[key]
+        if self._clock() < self._retry_at.get(key, 0.0):
+            return None
+        if estimate_tokens(system_instruction) < self._min_tokens:
+            # 短すぎるプロンプトは作成できないため、API を呼ばずに見送る
+            self._retry_at[key] = float('inf')
+            return None
+        return self._start(
+            key, lambda: self._create(key, model, system_instruction)
+        )
+
+    def _start(
+        self,
+        key: str,
+        operation: Callable[[], Coroutine[Any, Any, str | None]],
+    ) -> asyncio.Task[str | None]:
+        """キーごとに1つだけ処理を実行する（実行中の場合はそれを返す）"""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.create_task(operation())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return task
+
+    async def _create(
+        self, key: str, model: str, system_instruction: str
+    ) -> str | None:
+        """キャッシュを作成する（失敗した場合は None を返す）"""
+        started_at = self._clock()
+        try:
+            cached: types.CachedContent = await self._governor.call(
+                lambda: self._client.aio.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        system_instruction=system_instruction,
+                        ttl=f'{int(self._ttl)}s',
+                        display_name=f'stt-{key[:16]}',
+                    ),
+                )
+            )
+        except Exception:
+            cached = types.CachedContent()
+        if not cached.name:
+            self.stats.failures += 1
+            self._retry_at[key] = self._clock() + self._retry_interval
+            return None
+
+        self.stats.created += 1
+        self._retry_at.pop(key, None)
+        self._entries[key] = CachedPrompt(
+            name=cached.name, expires_at=started_at + self._ttl
+        )
+        return cached.name
+
+    async def _refresh(self, key: str, entry: CachedPrompt) -> str | None:
+        """キャッシュの有効期限を延長する（失敗した場合は期限まで使う）"""
+        started_at = self._clock()
+        try:
+            await self._governor.call(
+                lambda: self._client.aio.caches.update(
+                    name=entry.name,
+                    config=types.UpdateCachedContentConfig(
+                        ttl=f'{int(self._ttl)}s'
+                    ),
+                )
+            )
+        except Exception as e:
+            self.stats.failures += 1
+            if is_cache_error(e) and self._entries.get(key) is entry:
+                # 既に削除されている場合は、次の lookup で作り直す
+                del self._entries[key]
+            return None
+
+        self.stats.refreshed += 1
+        entry.expires_at = started_at + self._ttl
+        return entry.name
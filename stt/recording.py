@@ -0,0 +1,321 @@
+"""会話セッションの記録
+
+実際の会話で起きた遅延を手元で再現できるよう、1回の会話で起きたことを
+追記専用のファイルに記録します。記録したファイルは `python -m stt.replay`
+で、マイクと外部 API を使わずに同じ会話として再生できます。
+
+ファイルは先頭の識別子に続けて、以下のレコードを順に並べたものです。
+    <II>  メタデータの JSON のバイト数、ペイロードのバイト数
+    JSON  メタデータ（kind: 種類、t: 記録開始からの秒数、turn: ターン番号）
+    bytes ペイロード（発話の PCM など。ない場合は 0 バイト）
+レコードは1件ごとに書き出すため、異常終了した場合も途中までは読み込めます。
+"""
+
+import hashlib
+import json
+import struct
+import time
+from collections.abc import AsyncIterator, Iterator, Mapping
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Any, Literal, TypedDict
+
+from .audio import AudioBuffer, AudioFormat
+from .metrics import MetricsSink
+from .voice import VoiceClient
+
+# レコードの種類
+# session: 会話の設定、listen: 音声認識の結果、capture: 発話の音声、
+# chat: AI への送信と応答、tts: 音声合成の結果、barge_in: 割り込み、
+# stage: 各段階の所要時間（Metrics の計測結果）
+type RecordKind = Literal[
+    'session', 'listen', 'capture', 'chat', 'tts', 'barge_in', 'stage'
+]
+
+
+@dataclass(frozen=True)
+class SessionRecord:
+    """記録の1件
+    Attributes:
+        kind (RecordKind): レコードの種類
+        t (float): 記録開始からの秒数
+        turn (int): ターン番号（0 は最初の挨拶、以降は音声認識ごとに増える）
+        data (dict[str, Any]): 種類ごとの内容
+        payload (bytes): 発話の PCM など（ない場合は空）
+    """
+
+    kind: RecordKind
+    t: float
+    turn: int
+    data: dict[str, Any] = field(default_factory=dict)
+    payload: bytes = b''
+
+
+class SessionRecorder(MetricsSink):
+    """会話セッションを追記専用のファイルに記録するクラス
+    `Metrics` の出力先として登録すると、各段階の所要時間も記録します。
+    パスを指定しない場合は何も記録しません。
+    Attributes:
+        path (Path | None): 記録先のファイル（None の場合は記録しない）
+        turn (int): 現在のターン番号
+    """
+
+    # ファイルの先頭の識別子
+    MAGIC = b'STTSES01'
+
+    # レコードのヘッダー（メタデータとペイロードのバイト数）
+    HEADER = struct.Struct('<II')
+
+    def __init__(
+        self,
+        path: Path | None = None,
+        metadata: Mapping[str, Any] | None = None,
+    ):
+        """
+        Args:
+            path (Path | None): 記録先のファイル。既にある場合は追記する
+            metadata (Mapping[str, Any] | None): `session` レコードとして
+                最初に記録する会話の設定（キャラクター・定型の台詞など）
+        """
+        self.path = path
+        self.turn = 0
+        self._started_at = time.perf_counter()
+        self._file: IO[bytes] | None = None
+        if path is None:
+            return
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = path.open('ab')
+        if self._file.tell() == 0:
+            self._file.write(self.MAGIC)
+        self.write('session', started_at=time.time(), **(metadata or {}))
+
+    @property
+    def enabled(self) -> bool:
+        """記録中かどうか"""
+        return self._file is not None
+
+    def elapsed(self) -> float:
+        """記録開始からの経過時間（秒）"""
+        return time.perf_counter() - self._started_at
+
+    def begin_turn(self) -> int:
+        """次のターンを始める（音声認識の開始時に呼ぶ）
+        Returns:
+            int: 新しいターン番号
+        """
+        self.turn += 1
+        return self.turn
+
+    def write(
+        self,
+        kind: RecordKind,
+        payload: bytes | bytearray | memoryview = b'',
+        **data: Any,
+    ) -> None:
+        """レコードを1件追記する
+        Args:
+            kind (RecordKind): レコードの種類
+            payload (bytes | bytearray | memoryview): 発話の PCM など
+            **data: 種類ごとの内容（JSON に変換できる値）
+        """
+        if self._file is None:
+            return
+
+        meta = json.dumps(
+            {'kind': kind, 't': round(self.elapsed(), 4), 'turn': self.turn}
+            | data,
+            ensure_ascii=False,
+            separators=(',', ':'),
+        ).encode()
+        payload = memoryview(payload).cast('B')
+        self._file.write(self.HEADER.pack(len(meta), payload.nbytes))
+        self._file.write(meta)
+        self._file.write(payload)
+        self._file.flush()
+
+    def capture(self, pcm: bytes, audio_format: AudioFormat) -> None:
+        """音声認識に送った発話の音声を記録する"""
+        self.write('capture', pcm, **_format_fields(audio_format))
+
+    def observe(self, name: str, seconds: float) -> None:
+        self.write('stage', name=name, seconds=round(seconds, 4))
+
+    def close(self) -> None:
+        """ファイルを閉じる"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RecordingVoiceClient(VoiceClient):
+    """音声合成の結果を記録する VoiceClient のラッパー
+    音声そのものは記録せず、断片ごとの受信時刻とバイト数、PCM 全体の
+    SHA-256 を記録します。再生時は同じ長さの無音を同じ間隔で返します。
+    Attributes:
+        _voice_client (VoiceClient): 実際に音声合成を行うクライアント
+        _recorder (SessionRecorder): 記録先
+    """
+
+    def __init__(self, voice_client: VoiceClient, recorder: SessionRecorder):
+        self._voice_client = voice_client
+        self._recorder = recorder
+
+    async def text_to_speech(self, text: str) -> AudioBuffer:
+        started_at = time.perf_counter()
+        chunks: list[tuple[float, AudioBuffer]] = []
+        # キャンセル（割り込み）された場合は cancelled のまま記録する
+        outcome = 'cancelled'
+        try:
+            audio = await self._voice_client.text_to_speech(text)
+            chunks.append((time.perf_counter() - started_at, audio))
+            outcome = 'completed'
+            return audio
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            self._write(text, chunks, outcome)
+
+    async def stream_speech(self, text: str) -> AsyncIterator[AudioBuffer]:
+        started_at = time.perf_counter()
+        chunks: list[tuple[float, AudioBuffer]] = []
+        # キャンセルや、受信の途中で閉じられた場合は cancelled のまま記録する
+        outcome = 'cancelled'
+        try:
+            async for chunk in self._voice_client.stream_speech(text):
+                chunks.append((time.perf_counter() - started_at, chunk))
+                yield chunk
+            outcome = 'completed'
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            self._write(text, chunks, outcome)
+
+    def _write(
+        self,
+        text: str,
+        chunks: list[tuple[float, AudioBuffer]],
+        outcome: str,
+    ) -> None:
+        """1回の音声合成の結果を記録する
+        Args:
+            text (str): 音声に変換したテキスト
+            chunks (list[tuple[float, AudioBuffer]]): 開始からの受信時刻と断片
+            outcome (str): completed・error・cancelled のいずれか
+        """
+        digest = hashlib.sha256()
+        for _offset, chunk in chunks:
+            digest.update(chunk.pcm)
+        self._recorder.write(
+            'tts',
+            text=text,
+            outcome=outcome,
+            chunks=[
+                [round(offset, 4), chunk.nbytes] for offset, chunk in chunks
+            ],
+            sha256=digest.hexdigest(),
+            **_format_fields(chunks[0][1].audio_format if chunks else None),
+        )
+
+    def voice_settings(self) -> dict[str, str]:
+        """ラップしているクライアントの設定を返す"""
+        return self._voice_client.voice_settings()
+
+    async def warm_up(self) -> None:
+        await self._voice_client.warm_up()
+
+    async def aclose(self) -> None:
+        await self._voice_client.aclose()
+
+
+@dataclass
+class SessionLog:
+    """記録した会話セッション
+    Attributes:
+        records (list[SessionRecord]): 記録した順のレコード
+        truncated (bool): 末尾のレコードが途中で切れていたかどうか
+    """
+
+    records: list[SessionRecord]
+    truncated: bool = False
+
+    @classmethod
+    def read(cls, path: Path) -> 'SessionLog':
+        """記録したファイルを読み込む
+        異常終了などで末尾のレコードが途中で切れている場合は、そこまでを
+        読み込みます。
+        Raises:
+            ValueError: 会話セッションの記録でない場合
+        """
+        data = path.read_bytes()
+        if not data.startswith(SessionRecorder.MAGIC):
+            raise ValueError(f'会話セッションの記録ではありません: {path}')
+
+        records: list[SessionRecord] = []
+        offset = len(SessionRecorder.MAGIC)
+        header = SessionRecorder.HEADER
+        while offset + header.size <= len(data):
+            meta_size, payload_size = header.unpack_from(data, offset)
+            body = offset + header.size
+            end = body + meta_size + payload_size
+            if end > len(data):
+                break
+            meta = json.loads(data[body : body + meta_size])
+            records.append(
+                SessionRecord(
+                    kind=meta.pop('kind'),
+                    t=meta.pop('t'),
+                    turn=meta.pop('turn'),
+                    data=meta,
+                    payload=data[body + meta_size : end],
+                )
+            )
+            offset = end
+        return cls(records, truncated=offset != len(data))
+
+    def of_kind(self, kind: RecordKind) -> Iterator[SessionRecord]:
+        """指定した種類のレコードを記録した順に返す"""
+        return (record for record in self.records if record.kind == kind)
+
+    @property
+    def metadata(self) -> dict[str, Any]:
+        """`session` レコードの内容（会話の設定）を記録した順にまとめたもの"""
+        metadata: dict[str, Any] = {}
+        for record in self.of_kind('session'):
+            metadata |= record.data
+        return metadata
+
+    @property
+    def duration(self) -> float:
+        """最後のレコードまでの秒数"""
+        return self.records[-1].t if self.records else 0.0
+
+
+def audio_format_of(data: Mapping[str, Any]) -> AudioFormat:
+    """レコードの内容から音声の形式を取り出す"""
+    return AudioFormat(
+        sample_rate=data['sample_rate'],
+        channels=data['channels'],
+        sample_width=data['sample_width'],
+    )
+
+
+class _FormatFields(TypedDict, total=False):
+    """レコードに記録する音声の形式"""
+
+    sample_rate: int
+    channels: int
+    sample_width: int
+
+
+def _format_fields(audio_format: AudioFormat | None) -> _FormatFields:
+    """音声の形式をレコードの内容に変換する（形式がない場合は空）"""
+    if audio_format is None:
+        return {}
+    return {
+        'sample_rate': audio_format.sample_rate,
+        'channels': audio_format.channels,
+        'sample_width': audio_format.sample_width,
+    }
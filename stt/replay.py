@@ -0,0 +1,423 @@
+"""記録した会話セッションを再生するコマンド
+
+`SESSION_LOG_DIR` を設定して記録した会話を、マイクと外部 API を使わずに
+同じ順序・同じ待ち時間で TalkController に流し直します。音声認識・AI の応答・
+音声合成は記録した結果と所要時間を返す代替の実装に置き換え、それ以外の
+処理（文の分割・並行した音声合成・再生の順序・割り込み）は実際のコードを
+そのまま使うため、ビルド間の遅延を本番の会話で比較できます。
+
+- `--time-scale` は記録した待ち時間と音声の長さに掛ける倍率です
+  （0.5 で2倍速、0 で待ち時間なし）。
+- 再生は出力デバイスを使わずに所要時間だけを模擬します。
+- 記録と異なるテキストの音声合成や AI への送信は、記録全体の中央値から
+  推定した待ち時間で代替し、件数を結果に表示します。
+
+使い方:
+    python -m stt.replay .sessions/session-20250101-120000.log
+    python -m stt.replay session.log --time-scale 0
+"""
+
+import argparse
+import asyncio
+import statistics
+from collections import defaultdict, deque
+from collections.abc import AsyncIterator, Callable, Iterable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from google.genai import types  # type: ignore
+
+from .ai_chat import AIChat
+from .audio import AudioBuffer, AudioFormat
+from .bench.fake_audio import NullEffectPlayer, SimulatedPlaybackEngine
+from .bench.fake_genai import FakeAsyncClient, last_text, text_response
+from .config import GEMINI_MODEL, TALK_END_KEYWORD
+from .exceptions import (
+    AIResponseError,
+    SpeechRecognitionError,
+    VoiceSynthesisError,
+)
+from .metrics import (
+    Histogram,
+    HistogramSink,
+    HistogramSummary,
+    Metrics,
+)
+from .output import OutputWriter, SilentOutputWriter, StandardOutputWriter
+from .recording import SessionLog, SessionRecord, audio_format_of
+from .speech_recognition import SpeechRecognizer
+from .talk import TalkController
+from .voice import VoiceClient
+
+
+class ReplaySpeechRecognizer(SpeechRecognizer):
+    """記録した音声認識の結果を同じ所要時間で返す音声認識
+    Attributes:
+        turn (int): 現在のターン番号（記録と同じく音声認識ごとに増える）
+    """
+
+    def __init__(
+        self,
+        log: SessionLog,
+        time_scale: float = 1.0,
+        output_writer: OutputWriter = SilentOutputWriter(),
+        metrics: Metrics | None = None,
+    ):
+        super().__init__(
+            effect_player=NullEffectPlayer(),
+            output_writer=output_writer,
+            metrics=metrics,
+        )
+        self._listens = deque(log.of_kind('listen'))
+        self._barge_ins = {
+            record.turn: record.data['offset']
+            for record in log.of_kind('barge_in')
+        }
+        self._barge_in = bool(log.metadata.get('barge_in', self._barge_ins))
+        self._time_scale = time_scale
+        self.turn = 0
+
+    @property
+    def supports_barge_in(self) -> bool:
+        return self._barge_in
+
+    async def listen_async(self, speech_started: bool = False) -> str:
+        """記録した所要時間の後に、記録した認識結果を返す
+        Raises:
+            SpeechRecognitionError: 記録した音声認識が失敗していた場合
+            EOFError: 記録した音声認識をすべて返した場合
+        """
+        if not self._listens:
+            raise EOFError
+        record = self._listens.popleft()
+        self.turn = record.turn
+        await asyncio.sleep(record.data['elapsed'] * self._time_scale)
+
+        error = record.data.get('error')
+        if error == 'EOFError':
+            raise EOFError
+        if error is not None:
+            raise SpeechRecognitionError(record.data.get('message', error))
+
+        self._effect_player.end()
+        self._output.print(f'認識結果: {record.data["text"]}')
+        return record.data['text']
+
+    async def wait_for_barge_in(self, is_playing: Callable[[], bool]) -> None:
+        """記録した割り込みの時刻まで待つ（割り込みがないターンは待ち続ける）"""
+        offset = self._barge_ins.get(self.turn)
+        if offset is None:
+            await asyncio.get_running_loop().create_future()
+            return
+        await asyncio.sleep(offset * self._time_scale)
+
+
+class ReplayModels:
+    """記録した AI の応答を同じ間隔で返す `client.aio.models` の代替
+    Attributes:
+        misses (int): 記録にないメッセージを受け付けた回数
+    """
+
+    # 会話履歴の要約を求められた場合に返す台詞
+    SUMMARY = '（再生中の会話の要約）'
+
+    # 記録にないメッセージへの応答
+    FALLBACK_REPLY = '（記録にない応答です）'
+
+    def __init__(self, chats: Iterable[SessionRecord], time_scale: float = 1.0):
+        self._chats: dict[str, deque[SessionRecord]] = defaultdict(deque)
+        first_offsets: list[float] = []
+        for record in chats:
+            self._chats[record.data['message']].append(record)
+            if record.data['deltas']:
+                first_offsets.append(record.data['deltas'][0][0])
+        self._fallback_delay = (
+            statistics.median(first_offsets) if first_offsets else 0.0
+        )
+        self._time_scale = time_scale
+        self.misses = 0
+
+    async def generate_content(
+        self, *, model: str, contents: Any, config: Any = None
+    ) -> types.GenerateContentResponse:
+        return text_response(self.SUMMARY)
+
+    async def generate_content_stream(
+        self, *, model: str, contents: Any, config: Any = None
+    ) -> AsyncIterator[types.GenerateContentResponse]:
+        records = self._chats.get(last_text(contents))
+        if not records:
+            self.misses += 1
+            return self._replay(
+                [[self._fallback_delay, self.FALLBACK_REPLY]], 'completed'
+            )
+        record = records.popleft()
+        return self._replay(record.data['deltas'], record.data['outcome'])
+
+    async def _replay(
+        self, deltas: list[list[Any]], outcome: str
+    ) -> AsyncIterator[types.GenerateContentResponse]:
+        """応答の断片を記録した時刻に返す
+        Raises:
+            AIResponseError: 記録した応答がエラーで終了していた場合
+        """
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        for offset, text in deltas:
+            await asyncio.sleep(
+                started_at + offset * self._time_scale - loop.time()
+            )
+            yield text_response(text)
+        if outcome == 'error':
+            raise AIResponseError('記録した応答はエラーで終了しています')
+
+
+class ReplayGenAIClient:
+    """記録した AI の応答を返す `google.genai.Client` の代替
+    Attributes:
+        aio (FakeAsyncClient): 非同期 API
+    """
+
+    def __init__(self, models: ReplayModels):
+        self.aio = FakeAsyncClient(models)  # type: ignore
+
+
+class ReplayVoiceClient(VoiceClient):
+    """記録した音声合成と同じ間隔・同じ長さの無音を返す VoiceClient
+    Attributes:
+        misses (int): 記録にないテキストを受け付けた回数
+    """
+
+    # 記録に音声がない場合の形式
+    DEFAULT_FORMAT = AudioFormat(sample_rate=24000)
+
+    def __init__(
+        self, syntheses: Iterable[SessionRecord], time_scale: float = 1.0
+    ):
+        self._syntheses: dict[str, deque[SessionRecord]] = defaultdict(deque)
+        first_offsets: list[float] = []
+        bytes_per_char: list[float] = []
+        audio_format = None
+        for record in syntheses:
+            self._syntheses[record.data['text']].append(record)
+            chunks = record.data['chunks']
+            if not chunks or record.data['outcome'] != 'completed':
+                continue
+            audio_format = audio_format or audio_format_of(record.data)
+            first_offsets.append(chunks[0][0])
+            bytes_per_char.append(
+                sum(size for _offset, size in chunks)
+                / max(len(record.data['text']), 1)
+            )
+        self._time_scale = time_scale
+        self._fallback_format = audio_format or self.DEFAULT_FORMAT
+        self._fallback_delay = (
+            statistics.median(first_offsets) if first_offsets else 0.0
+        )
+        self._fallback_bytes_per_char = (
+            statistics.median(bytes_per_char)
+            if bytes_per_char
+            else self._fallback_format.bytes_per_second / 8
+        )
+        self.misses = 0
+
+    async def text_to_speech(self, text: str) -> AudioBuffer:
+        pcm = bytearray()
+        audio_format = self._fallback_format
+        async for chunk in self.stream_speech(text):
+            pcm += chunk.pcm
+            audio_format = chunk.audio_format
+        return AudioBuffer(pcm, audio_format)
+
+    async def stream_speech(self, text: str) -> AsyncIterator[AudioBuffer]:
+        """記録した時刻に、記録した長さの無音を返す
+        Raises:
+            VoiceSynthesisError: 記録した音声合成がエラーで終了していた場合
+        """
+        records = self._syntheses.get(text)
+        if records:
+            record = records.popleft()
+            chunks = record.data['chunks']
+            outcome = record.data['outcome']
+            audio_format = (
+                audio_format_of(record.data)
+                if chunks
+                else self._fallback_format
+            )
+        else:
+            self.misses += 1
+            size = int(len(text) * self._fallback_bytes_per_char)
+            chunks = [[self._fallback_delay, size]]
+            outcome = 'completed'
+            audio_format = self._fallback_format
+
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        for offset, size in chunks:
+            await asyncio.sleep(
+                started_at + offset * self._time_scale - loop.time()
+            )
+            # 再生時間も倍率に合わせるため、無音の長さを伸縮する
+            frames = int(size * self._time_scale) // audio_format.frame_size
+            yield AudioBuffer(
+                bytes(frames * audio_format.frame_size), audio_format
+            )
+        if outcome == 'error':
+            raise VoiceSynthesisError(
+                '記録した音声合成はエラーで終了しています'
+            )
+
+    def voice_settings(self) -> dict[str, str]:
+        return {'backend': type(self).__name__}
+
+
+@dataclass
+class ReplayResult:
+    """再生の結果
+    Attributes:
+        time_scale (float): 待ち時間に掛けた倍率
+        recorded (dict[str, HistogramSummary]): 記録した各段階の所要時間
+            （倍率を掛けた値）
+        replayed (dict[str, HistogramSummary]): 再生した各段階の所要時間
+        chat_misses (int): 記録にない AI への送信の回数
+        tts_misses (int): 記録にない音声合成の回数
+        truncated (bool): 記録の末尾が途中で切れていたかどうか
+    """
+
+    time_scale: float
+    recorded: dict[str, HistogramSummary]
+    replayed: dict[str, HistogramSummary]
+    chat_misses: int = 0
+    tts_misses: int = 0
+    truncated: bool = False
+
+    def report(self) -> list[str]:
+        """記録と再生の p50 / p95 の比較を表示用の行で返す"""
+        lines = [f'倍率: {self.time_scale:g}  (記録 -> 再生)']
+        for name in sorted(self.recorded.keys() & self.replayed.keys()):
+            before = self.recorded[name]
+            after = self.replayed[name]
+            lines.append(
+                f'{name:<20} '
+                f'p50 {before.p50 * 1000:7.0f}ms -> {after.p50 * 1000:7.0f}ms  '
+                f'p95 {before.p95 * 1000:7.0f}ms -> {after.p95 * 1000:7.0f}ms'
+            )
+        lines.append(
+            f'記録にない送信: AI {self.chat_misses} 回 / '
+            f'音声合成 {self.tts_misses} 回'
+        )
+        if self.truncated:
+            lines.append(
+                '記録の末尾が途中で切れているため、そこまでを再生しました'
+            )
+        return lines
+
+
+def recorded_stages(
+    log: SessionLog, time_scale: float = 1.0
+) -> dict[str, HistogramSummary]:
+    """記録した各段階の所要時間を集計する
+    Args:
+        log (SessionLog): 記録した会話セッション
+        time_scale (float): 所要時間に掛ける倍率
+    Returns:
+        dict[str, HistogramSummary]: 段階ごとの集計結果
+    """
+    histograms: dict[str, Histogram] = {}
+    for record in log.of_kind('stage'):
+        name = record.data['name']
+        histogram = histograms.setdefault(name, Histogram())
+        histogram.observe(record.data['seconds'] * time_scale)
+    return {name: histogram.summary() for name, histogram in histograms.items()}
+
+
+async def replay_session(
+    log: SessionLog,
+    time_scale: float = 1.0,
+    output_writer: OutputWriter = SilentOutputWriter(),
+) -> ReplayResult:
+    """記録した会話セッションを TalkController で再生して計測する
+    Args:
+        log (SessionLog): 記録した会話セッション
+        time_scale (float): 記録した待ち時間と音声の長さに掛ける倍率
+        output_writer (OutputWriter): 会話の表示先
+    Returns:
+        ReplayResult: 記録と再生の各段階の所要時間
+    Raises:
+        ValueError: 倍率が負の場合
+    """
+    if time_scale < 0:
+        raise ValueError('time_scale は 0 以上を指定してください')
+
+    metadata = log.metadata
+    sink = HistogramSink()
+    metrics = Metrics(sink)
+
+    models = ReplayModels(log.of_kind('chat'), time_scale)
+    ai_chat = AIChat(
+        system_instruction='記録した会話の再生です。',
+        model=GEMINI_MODEL,
+        client=ReplayGenAIClient(models),  # type: ignore
+    )
+    voice_client = ReplayVoiceClient(log.of_kind('tts'), time_scale)
+    recognizer = ReplaySpeechRecognizer(
+        log, time_scale, output_writer=output_writer, metrics=metrics
+    )
+
+    async with voice_client:
+        controller = TalkController(
+            character_name=metadata.get('character_name', '再生'),
+            talk_end_keyword=metadata.get('talk_end_keyword', TALK_END_KEYWORD),
+            ai_chat=ai_chat,
+            voice_client=voice_client,
+            output_writer=output_writer,
+            playback_engine=SimulatedPlaybackEngine(),
+            speech_recognizer=recognizer,
+            barge_in=recognizer.supports_barge_in,
+            metrics=metrics,
+            phrases=metadata.get('phrases'),
+        )
+        try:
+            await controller.start_talk()
+        finally:
+            await ai_chat.aclose()
+
+    return ReplayResult(
+        time_scale=time_scale,
+        recorded=recorded_stages(log, time_scale),
+        replayed=sink.snapshot(),
+        chat_misses=models.misses,
+        tts_misses=voice_client.misses,
+        truncated=log.truncated,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m stt.replay')
+    parser.add_argument('log', type=Path, help='記録した会話セッション')
+    parser.add_argument(
+        '--time-scale',
+        type=float,
+        default=1.0,
+        help='記録した待ち時間と音声の長さに掛ける倍率（既定: 1.0）',
+    )
+    parser.add_argument(
+        '--verbose', action='store_true', help='再生中の会話を表示する'
+    )
+    args = parser.parse_args()
+
+    output = StandardOutputWriter()
+    result = asyncio.run(
+        replay_session(
+            SessionLog.read(args.log),
+            time_scale=args.time_scale,
+            output_writer=output if args.verbose else SilentOutputWriter(),
+        )
+    )
+    for line in result.report():
+        output.print(line)
+
+
+if __name__ == '__main__':
+    main()
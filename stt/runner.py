@@ -0,0 +1,51 @@
+import asyncio
+import threading
+from collections.abc import Coroutine
+from typing import Any
+
+# 同期ラッパーから非同期処理を実行するためのバックグラウンドイベントループ
+_loop: asyncio.AbstractEventLoop | None = None
+_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """バックグラウンドで動作するイベントループを取得する（未起動の場合は起動）"""
+    global _loop
+
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=_loop.run_forever,
+                name='stt-sync-runner',
+                daemon=True,
+            )
+            thread.start()
+        return _loop
+
+
+def run_sync[T](coro: Coroutine[Any, Any, T]) -> T:
+    """コルーチンを同期的に実行して結果を返す
+    非同期クライアントの接続を使い回せるよう、常に同じバックグラウンドの
+    イベントループ上で実行します。
+    Args:
+        coro (Coroutine): 実行するコルーチン
+    Returns:
+        T: コルーチンの戻り値
+    Raises:
+        RuntimeError: バックグラウンドのイベントループ上から呼び出された場合
+    """
+    loop = _get_loop()
+
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+
+    if running is loop:
+        coro.close()
+        raise RuntimeError(
+            '同期ラッパーはイベントループの外から呼び出してください。'
+        )
+
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
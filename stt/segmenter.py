@@ -0,0 +1,93 @@
+class SentenceSegmenter:
+    """ストリーミングされるテキストを文単位のチャンクに分割するクラス
+    LLM から逐次届くテキスト断片を受け取り、句読点や改行で区切られた
+    チャンクが完成した時点で返します。
+    Attributes:
+        _min_chars (int): 読点で区切る場合の最小文字数
+        _buffer (str): まだチャンクとして確定していないテキスト
+    """
+
+    # 常にチャンクを区切る文末記号
+    SENTENCE_TERMINATORS = frozenset('。！？!?\n')
+
+    # チャンクが十分な長さの場合のみ区切る記号
+    CLAUSE_TERMINATORS = frozenset('、，,')
+
+    # 区切り記号の直後に続く場合は同じチャンクに含める閉じ括弧など
+    TRAILING_CLOSERS = frozenset('」』）)】〉》"\'…')
+
+    def __init__(self, min_chars: int = 8):
+        self._min_chars = min_chars
+        self._buffer = ''
+
+    def feed(self, text: str) -> list[str]:
+        """テキスト断片を追加し、確定したチャンクを返す
+        Args:
+            text (str): LLM から受信したテキスト断片
+        Returns:
+            list[str]: 確定したチャンクのリスト（未確定の場合は空）
+        """
+        self._buffer += text
+
+        chunks: list[str] = []
+        start = 0
+        index = 0
+        length = len(self._buffer)
+
+        while index < length:
+            char = self._buffer[index]
+            is_sentence_end = char in self.SENTENCE_TERMINATORS
+            is_clause_end = (
+                char in self.CLAUSE_TERMINATORS
+                and index + 1 - start >= self._min_chars
+            )
+
+            if not (is_sentence_end or is_clause_end):
+                index += 1
+                continue
+
+            # 連続する区切り記号や閉じ括弧は同じチャンクに含める
+            end = index + 1
+            while end < length and (
+                self._buffer[end] in self.SENTENCE_TERMINATORS
+                or self._buffer[end] in self.TRAILING_CLOSERS
+            ):
+                end += 1
+
+            # バッファ末尾の場合は後続の閉じ括弧が届く可能性があるため保留する
+            if end == length and char != '\n':
+                break
+
+            chunk = self._buffer[start:end].strip()
+            if chunk:
+                chunks.append(chunk)
+            start = end
+            index = end
+
+        self._buffer = self._buffer[start:]
+        return chunks
+
+    def flush(self) -> str | None:
+        """残っているテキストをチャンクとして確定する
+        Returns:
+            str | None: 残りのテキスト（空の場合は None）
+        """
+        chunk = self._buffer.strip()
+        self._buffer = ''
+        return chunk or None
+
+    @classmethod
+    def split(cls, text: str, min_chars: int = 8) -> list[str]:
+        """テキスト全体をチャンクに分割する
+        Args:
+            text (str): 分割するテキスト
+            min_chars (int): 読点で区切る場合の最小文字数
+        Returns:
+            list[str]: チャンクのリスト
+        """
+        segmenter = cls(min_chars=min_chars)
+        chunks = segmenter.feed(text)
+        rest = segmenter.flush()
+        if rest is not None:
+            chunks.append(rest)
+        return chunks
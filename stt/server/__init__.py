@@ -0,0 +1,28 @@
+"""複数のユーザーと同時に会話するサーバー
+
+接続ごとに独立した TalkController で会話し、音声は TCP 上のフレームで
+やり取りします。`python -m stt.server` で起動できます。
+"""
+
+from .client import run_client
+from .protocol import FrameType, ProtocolError, read_frame, write_frame
+from .session import (
+    NetworkPlaybackEngine,
+    SessionEffectPlayer,
+    SessionOutputWriter,
+)
+from .talk_server import ServerStats, TalkServer, current_rss
+
+__all__ = [
+    'FrameType',
+    'NetworkPlaybackEngine',
+    'ProtocolError',
+    'ServerStats',
+    'SessionEffectPlayer',
+    'SessionOutputWriter',
+    'TalkServer',
+    'current_rss',
+    'read_frame',
+    'run_client',
+    'write_frame',
+]
@@ -0,0 +1,143 @@
+"""複数のユーザーと同時に会話するサーバー
+
+使い方:
+    python -m stt.server --port 8765 --max-sessions 32
+    python -m stt.server --connect recording.wav --output reply.wav
+
+環境変数は main.py と同じものを使用します（VOICE_CLIENT_MODE, GEMINI_API_KEY,
+NIJIVOICE_API_KEY, TTS_CACHE_DIR, TTS_TRANSFER_FORMAT, PHRASE_BUNDLE, BARGE_IN,
+METRICS_FILE, METRICS_FORMAT）。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from google.genai import Client  # type: ignore
+
+from ..bundle import open_bundle
+from ..codec import transfer_format_from_env
+from ..metrics import HistogramSink, Metrics, MetricsDumper
+from ..output import StandardOutputWriter
+from ..prompt_cache import PromptCache
+from .client import run_client
+from .talk_server import TalkServer
+
+
+async def serve(args: argparse.Namespace) -> None:
+    """環境変数の設定でサーバーを起動し、キャンセルされるまで待ち受ける
+    Raises:
+        OSError: 必要な環境変数が設定されていない場合
+    """
+    gemini_api_key = os.getenv('GEMINI_API_KEY')
+    if not gemini_api_key:
+        raise OSError('GEMINI_API_KEYが設定されていません。')
+
+    mode = os.getenv('VOICE_CLIENT_MODE', 'google')
+    nijivoice_api_key = os.getenv('NIJIVOICE_API_KEY')
+    if mode == 'nijivoice' and not nijivoice_api_key:
+        raise OSError('NIJIVOICE_API_KEYが設定されていません。')
+
+    output = StandardOutputWriter()
+    metrics_sink = HistogramSink()
+    cache_dir = os.getenv('TTS_CACHE_DIR')
+    bundle_path = os.getenv('PHRASE_BUNDLE')
+    bundle = open_bundle(Path(bundle_path) if bundle_path else None, output)
+
+    server = TalkServer(
+        genai_client=Client(api_key=gemini_api_key),
+        mode=mode,
+        nijivoice_api_key=nijivoice_api_key,
+        host=args.host,
+        port=args.port,
+        max_sessions=args.max_sessions,
+        max_recognitions=args.max_recognitions,
+        barge_in=os.getenv('BARGE_IN', '1') != '0',
+        cache_dir=Path(cache_dir) if cache_dir else None,
+        metrics=Metrics(metrics_sink),
+        output_writer=output,
+        bundle=bundle,
+        transfer_format=transfer_format_from_env(),
+        prompt_cache=os.getenv('PROMPT_CACHE', '1') != '0',
+        prompt_cache_ttl=float(
+            os.getenv('PROMPT_CACHE_TTL', str(PromptCache.DEFAULT_TTL))
+        ),
+    )
+
+    dump: asyncio.Task[None] | None = None
+    metrics_file = os.getenv('METRICS_FILE')
+    if metrics_file:
+        dumper = MetricsDumper(
+            metrics_sink,
+            path=Path(metrics_file),
+            format=os.getenv('METRICS_FORMAT', 'jsonl'),
+        )
+        dump = asyncio.create_task(dumper.run())
+
+    try:
+        await server.serve_forever()
+    finally:
+        if dump is not None:
+            dump.cancel()
+            await asyncio.gather(dump, return_exceptions=True)
+        output.print(server.stats.report())
+        metrics_sink.print_summary(output)
+        if bundle is not None:
+            bundle.close()
+
+
+def main() -> None:
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(prog='python -m stt.server')
+    parser.add_argument('--host', default=TalkServer.DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=TalkServer.DEFAULT_PORT)
+    parser.add_argument(
+        '--max-sessions',
+        type=int,
+        default=int(os.getenv('MAX_SESSIONS', str(TalkServer.MAX_SESSIONS))),
+        help='同時に会話できるセッション数の上限',
+    )
+    parser.add_argument(
+        '--max-recognitions',
+        type=int,
+        default=int(
+            os.getenv('MAX_RECOGNITIONS', str(TalkServer.MAX_RECOGNITIONS))
+        ),
+        help='全セッションで同時に実行する音声認識の上限',
+    )
+    parser.add_argument(
+        '--connect',
+        type=Path,
+        metavar='WAV',
+        help='サーバーを起動せず、WAV ファイルを送信するクライアントとして接続する',
+    )
+    parser.add_argument(
+        '--character', help='クライアントで指定するキャラクターID'
+    )
+    parser.add_argument(
+        '--output', type=Path, help='クライアントで受信した音声を保存する WAV'
+    )
+    args = parser.parse_args()
+
+    if args.connect is not None:
+        asyncio.run(
+            run_client(
+                args.connect,
+                host=args.host,
+                port=args.port,
+                character=args.character,
+                output=args.output,
+            )
+        )
+        return
+
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(serve(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from pathlib import Path
+
+from ..audio import AudioBuffer, AudioFormat, parse_wav
+from ..output import OutputWriter, StandardOutputWriter
+from .protocol import FrameType, parse_json, read_frame, write_frame, write_json
+
+
+async def run_client(
+    audio: Path,
+    host: str = '127.0.0.1',
+    port: int = 8765,
+    character: str | None = None,
+    output: Path | None = None,
+    output_writer: OutputWriter = StandardOutputWriter(),
+    frame_ms: int = 30,
+    trailing_silence: float = 1.0,
+) -> AudioBuffer | None:
+    """WAV ファイルをマイク入力の代わりに送信する検証用のクライアント
+    音声は実時間の速さで送信し、最後に無音を送ってから入力を終了します。
+    受信したメッセージは `output_writer` に出力し、受信した音声は
+    `output` を指定した場合に WAV として保存します。
+    Args:
+        audio (Path): 送信する 16bit モノラルの WAV ファイル
+        host (str): サーバーのアドレス
+        port (int): サーバーのポート
+        character (str | None): キャラクターID（None の場合はサーバーが選ぶ）
+        output (Path | None): 受信した音声を保存する WAV ファイル
+        output_writer (OutputWriter): 受信したメッセージの出力先
+        frame_ms (int): 1回に送信する音声の長さ（ミリ秒）
+        trailing_silence (float): 入力の終了前に送る無音の秒数
+    Returns:
+        AudioBuffer | None: 受信した音声（受信しなかった場合は None）
+    Raises:
+        ValueError: 16bit モノラルの WAV でない場合
+    """
+    audio_format, pcm = parse_wav(audio.read_bytes())
+    if audio_format.sample_width != 2 or audio_format.channels != 1:
+        raise ValueError('16bit モノラルの WAV のみ送信できます')
+
+    reader, writer = await asyncio.open_connection(host, port)
+    hello: dict[str, object] = {'sample_rate': audio_format.sample_rate}
+    if character is not None:
+        hello['character'] = character
+    write_json(writer, FrameType.HELLO, hello)
+
+    frame_size = audio_format.bytes_per_second * frame_ms // 1000
+    silence = bytes(int(audio_format.bytes_per_second * trailing_silence))
+
+    async def send() -> None:
+        started_at = time.monotonic()
+        sent = 0
+        for data in (pcm, memoryview(silence)):
+            for offset in range(0, len(data), frame_size):
+                chunk = data[offset : offset + frame_size]
+                write_frame(writer, FrameType.AUDIO, chunk)
+                await writer.drain()
+                sent += len(chunk)
+                # マイクと同じ速さになるよう送信済みの長さだけ待つ
+                await asyncio.sleep(
+                    started_at + audio_format.duration(sent) - time.monotonic()
+                )
+        write_frame(writer, FrameType.END)
+        await writer.drain()
+
+    async def read_frame_or_none(
+        reader: asyncio.StreamReader,
+    ) -> tuple[FrameType, bytes] | None:
+        # 送信中にサーバーが接続を閉じた場合も受信の終了として扱う
+        try:
+            return await read_frame(reader)
+        except ConnectionError:
+            return None
+
+    sender = asyncio.create_task(send())
+    received = bytearray()
+    received_format: AudioFormat | None = None
+    try:
+        while (frame := await read_frame_or_none(reader)) is not None:
+            frame_type, payload = frame
+            if frame_type == FrameType.AUDIO:
+                received += payload
+            elif frame_type == FrameType.FORMAT:
+                received_format = AudioFormat(**parse_json(payload))
+            elif frame_type in (FrameType.TEXT, FrameType.ERROR):
+                output_writer.print(parse_json(payload)['message'])
+            elif frame_type == FrameType.HELLO:
+                output_writer.print(
+                    f'セッションを開始しました: {payload.decode()}'
+                )
+    finally:
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
+        writer.close()
+
+    if received_format is None:
+        return None
+
+    buffer = AudioBuffer(received, received_format)
+    if output is not None:
+        output.write_bytes(buffer.to_wav())
+    return buffer
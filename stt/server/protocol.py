@@ -0,0 +1,109 @@
+import asyncio
+import enum
+import json
+import struct
+from typing import Any
+
+# フレームのヘッダー（種類 1バイト + ペイロード長 4バイト、ビッグエンディアン）
+HEADER = struct.Struct('!BI')
+
+# 1フレームのペイロードの上限
+MAX_PAYLOAD_SIZE = 4 * 1024 * 1024
+
+
+class FrameType(enum.IntEnum):
+    """フレームの種類
+    クライアントからサーバー:
+        HELLO: 会話の開始（JSON: `character`, `sample_rate`）
+        AUDIO: マイクの PCM（16bit モノラル、HELLO で指定したサンプリングレート）
+        END: 音声入力の終了
+    サーバーからクライアント:
+        HELLO: 会話の受け付け（JSON: `session`, `character`）
+        FORMAT: 以降の AUDIO の形式（JSON: `sample_rate`, `channels`, `sample_width`）
+        AUDIO: 再生する PCM
+        FLUSH: 再生中・再生待ちの音声の破棄（割り込み時）
+        TEXT: 認識結果や応答などのメッセージ（JSON: `message`）
+        CUE: 録音開始・終了の効果音（JSON: `cue` が `start` または `end`）
+        ERROR: エラー（JSON: `message`）。送信後に接続を閉じる
+    """
+
+    HELLO = 1
+    AUDIO = 2
+    END = 3
+    FORMAT = 4
+    FLUSH = 5
+    TEXT = 6
+    CUE = 7
+    ERROR = 8
+
+
+class ProtocolError(Exception):
+    """フレームの形式が不正な場合のエラー"""
+
+    pass
+
+
+async def read_frame(
+    reader: asyncio.StreamReader,
+) -> tuple[FrameType, bytes] | None:
+    """フレームを1つ受信する
+    Returns:
+        tuple[FrameType, bytes] | None: フレームの種類とペイロード
+            （接続が閉じられた場合は None）
+    Raises:
+        ProtocolError: 不明な種類、または上限を超える長さの場合
+    """
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+
+    kind, length = HEADER.unpack(header)
+    if length > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f'フレームが大きすぎます: {length} バイト')
+    try:
+        frame_type = FrameType(kind)
+    except ValueError:
+        raise ProtocolError(f'不明なフレームの種類です: {kind}')
+
+    try:
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
+    return frame_type, payload
+
+
+def write_frame(
+    writer: asyncio.StreamWriter,
+    frame_type: FrameType,
+    payload: bytes | memoryview = b'',
+) -> None:
+    """フレームを送信バッファに追加する（ペイロードはコピーせずに渡す）"""
+    writer.write(HEADER.pack(frame_type, len(payload)))
+    if payload:
+        writer.write(payload)
+
+
+def write_json(
+    writer: asyncio.StreamWriter,
+    frame_type: FrameType,
+    data: dict[str, Any],
+) -> None:
+    """JSON のペイロードを持つフレームを送信バッファに追加する"""
+    write_frame(
+        writer, frame_type, json.dumps(data, ensure_ascii=False).encode()
+    )
+
+
+def parse_json(payload: bytes) -> dict[str, Any]:
+    """JSON のペイロードを読み込む
+    Raises:
+        ProtocolError: JSON のオブジェクトでない場合
+    """
+    try:
+        data = json.loads(payload)
+    except ValueError as e:
+        raise ProtocolError(f'JSON を読み込めません: {e}')
+    if not isinstance(data, dict):
+        raise ProtocolError('JSON のオブジェクトが必要です')
+    return data
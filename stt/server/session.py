@@ -0,0 +1,136 @@
+import asyncio
+import dataclasses
+import time
+
+from ..audio import AudioBuffer, AudioFormat
+from ..capture import QueueAudioSource
+from ..effect import EffectPlayer
+from ..output import OutputWriter
+from ..playback import PlaybackEngine
+from .protocol import (
+    FrameType,
+    ProtocolError,
+    read_frame,
+    write_frame,
+    write_json,
+)
+
+
+class NetworkPlaybackEngine(PlaybackEngine):
+    """再生する音声をクライアントに送信する再生エンジン
+    音声は受け取った順にすぐ送信し、再生はクライアント側で行います。
+    クライアントは受信した音声を実時間で再生する前提で、送信した音声の
+    長さから再生終了時刻を見積もって `is_playing` と `drain` に使います。
+    Attributes:
+        _writer (asyncio.StreamWriter): クライアントへの送信先
+        _format (AudioFormat | None): 最後にクライアントへ通知した音声の形式
+        _ends_at (float): 送信済みの音声の再生が終わる見込みの時刻
+    """
+
+    # 1フレームで送信する PCM の最大サイズ
+    SEND_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self._writer = writer
+        self._format: AudioFormat | None = None
+        self._ends_at = 0.0
+
+    @property
+    def is_playing(self) -> bool:
+        return time.monotonic() < self._ends_at
+
+    async def enqueue(self, audio: AudioBuffer) -> None:
+        if not audio:
+            return
+
+        # 形式が変わる場合は先に通知する
+        if self._format != audio.audio_format:
+            write_json(
+                self._writer,
+                FrameType.FORMAT,
+                dataclasses.asdict(audio.audio_format),
+            )
+            self._format = audio.audio_format
+
+        for offset in range(0, audio.nbytes, self.SEND_CHUNK_SIZE):
+            write_frame(
+                self._writer,
+                FrameType.AUDIO,
+                audio.pcm[offset : offset + self.SEND_CHUNK_SIZE],
+            )
+
+        now = time.monotonic()
+        self._ends_at = max(self._ends_at, now) + audio.duration
+        # クライアントの受信が遅い場合は送信バッファが空くまで待つ
+        await self._writer.drain()
+
+    async def drain(self) -> None:
+        await asyncio.sleep(max(0.0, self._ends_at - time.monotonic()))
+
+    def flush(self) -> None:
+        if self.is_playing:
+            write_frame(self._writer, FrameType.FLUSH)
+        self._ends_at = time.monotonic()
+
+    def stop(self) -> None:
+        self.flush()
+
+
+class SessionOutputWriter(OutputWriter):
+    """メッセージをクライアントに送信する出力制御クラス
+    `log` を指定した場合は、セッションIDを付けてサーバー側にも出力します。
+    """
+
+    def __init__(
+        self,
+        writer: asyncio.StreamWriter,
+        session_id: int,
+        log: OutputWriter | None = None,
+    ):
+        self._writer = writer
+        self._session_id = session_id
+        self._log = log
+
+    def print(self, message: str) -> None:
+        """メッセージを TEXT フレームとして送信する"""
+        write_json(self._writer, FrameType.TEXT, {'message': message})
+        if self._log is not None:
+            self._log.print(f'[{self._session_id}] {message}')
+
+
+class SessionEffectPlayer(EffectPlayer):
+    """録音開始・終了の合図をクライアントに送信する効果音プレイヤー
+    効果音の再生はクライアント側で行います。
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self._writer = writer
+
+    def start(self) -> None:
+        write_json(self._writer, FrameType.CUE, {'cue': 'start'})
+
+    def end(self) -> None:
+        write_json(self._writer, FrameType.CUE, {'cue': 'end'})
+
+
+async def receive_audio(
+    reader: asyncio.StreamReader, source: QueueAudioSource
+) -> None:
+    """クライアントから受信した PCM を音声入力に渡す
+    END フレームを受信するか接続が閉じられた時点で音声入力を終了します。
+    Raises:
+        ProtocolError: AUDIO と END 以外のフレームを受信した場合
+    """
+    try:
+        while (frame := await read_frame(reader)) is not None:
+            frame_type, payload = frame
+            if frame_type == FrameType.AUDIO:
+                source.push(payload)
+            elif frame_type == FrameType.END:
+                break
+            else:
+                raise ProtocolError(
+                    f'会話中に受信できないフレームです: {frame_type.name}'
+                )
+    finally:
+        source.end()
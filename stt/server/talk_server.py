@@ -0,0 +1,473 @@
+import asyncio
+import contextlib
+import itertools
+import os
+import random
+import resource
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import httpx
+from google.genai import Client  # type: ignore
+
+from ..ai_chat import AIChat
+from ..audio import AudioFormat
+from ..bundle import BundledVoiceClient, PhraseBundle
+from ..cache import CachingVoiceClient
+from ..capture import QueueAudioSource
+from ..codec import TransferFormat
+from ..config import (
+    CHARACTER_MAP,
+    GEMINI_MODEL,
+    SYSTEM_INSTRUCTION_TEMPLATE,
+    TALK_END_KEYWORD,
+    CharacterID,
+    CharacterOptions,
+)
+from ..effect import EffectPlayer
+from ..googlevoice import GoogleTTSClient
+from ..governor import BackendName, Governor, create_governors
+from ..metrics import Metrics
+from ..nijivoice import NijiVoiceClient
+from ..output import OutputWriter, StandardOutputWriter
+from ..prompt_cache import PromptCache
+from ..speech_recognition import SpeechRecognizer
+from ..talk import TalkController
+from ..voice import VoiceClient
+from .protocol import (
+    FrameType,
+    ProtocolError,
+    parse_json,
+    read_frame,
+    write_json,
+)
+from .session import (
+    NetworkPlaybackEngine,
+    SessionEffectPlayer,
+    SessionOutputWriter,
+    receive_audio,
+)
+
+
+def current_rss() -> int:
+    """現在のメモリ使用量（RSS、バイト）を返す
+    /proc を読めない環境では、これまでの最大 RSS で代用します。
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss は Linux では KiB、macOS ではバイト単位
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+@dataclass
+class ServerStats:
+    """会話サーバーの統計情報"""
+
+    # 現在・最大・累計のセッション数
+    active_sessions: int = 0
+    peak_sessions: int = 0
+    total_sessions: int = 0
+    # 同時セッション数の上限により断った接続数
+    rejected_sessions: int = 0
+    # 待ち受け開始時のメモリ使用量（バイト）
+    baseline_rss: int = 0
+    cpu_count: int = os.cpu_count() or 1
+
+    @property
+    def sessions_per_core(self) -> float:
+        """CPU コアあたりの現在のセッション数"""
+        return self.active_sessions / self.cpu_count
+
+    @property
+    def memory_per_session(self) -> float:
+        """待ち受け開始時から増えたメモリを現在のセッション数で割った値（バイト）"""
+        if not self.active_sessions:
+            return 0.0
+        return max(0, current_rss() - self.baseline_rss) / self.active_sessions
+
+    def report(self) -> str:
+        """1行の概要を返す"""
+        return (
+            f'セッション: {self.active_sessions} '
+            f'(最大 {self.peak_sessions} / 累計 {self.total_sessions} / '
+            f'拒否 {self.rejected_sessions}) '
+            f'コアあたり {self.sessions_per_core:.2f} / '
+            f'1セッションあたり {self.memory_per_session / 1024 / 1024:.1f}MiB '
+            f'(RSS {current_rss() / 1024 / 1024:.0f}MiB)'
+        )
+
+
+class TalkServer:
+    """複数のユーザーと同時に会話するサーバー
+    接続ごとに TalkController・AIChat・音声入力を作成するため、会話の履歴や
+    割り込みの状態はセッション間で共有されません。Gemini のクライアント、
+    にじボイスの接続プール、音声キャッシュ、音声認識のスレッドプールは
+    すべてのセッションで共有します。キャラクターのシステムインストラクションは
+    Gemini 側にキャッシュし、同じキャラクターのセッションで使い回します。
+    通信の形式は `stt.server.protocol` を参照してください。
+    Attributes:
+        _genai_client (Client): 共有する Google GenAI クライアント
+        _http (httpx.AsyncClient | None): 共有するにじボイスの接続プール
+        _voice_clients (dict[CharacterID, VoiceClient]): キャラクターごとの音声合成クライアント
+        _bundle (PhraseBundle | None): 全セッションで共有する定型の台詞のファイル
+        _executor (ThreadPoolExecutor | None): 共有する音声認識のスレッドプール
+        _sessions (dict[int, asyncio.Task[None]]): 実行中のセッション
+        _governors (dict[BackendName, Governor]): 全セッションで共有する流量制御
+        _prompt_cache (PromptCache | None): 全セッションで共有するシステム
+            インストラクションのキャッシュ
+        stats (ServerStats): サーバーの統計情報
+    """
+
+    DEFAULT_HOST = '127.0.0.1'
+    DEFAULT_PORT = 8765
+
+    # 同時に会話できるセッション数の既定の上限
+    MAX_SESSIONS = 32
+
+    # 同時に実行する音声認識の既定の上限
+    MAX_RECOGNITIONS = 8
+
+    # 接続してから HELLO を受信するまでの待ち時間
+    HELLO_TIMEOUT = 10.0
+
+    # 受け付けるマイク入力のサンプリングレート
+    DEFAULT_SAMPLE_RATE = 16000
+    SAMPLE_RATE_RANGE = (8000, 48000)
+
+    # 統計情報を出力する間隔（秒）
+    REPORT_INTERVAL = 60.0
+
+    def __init__(
+        self,
+        genai_client: Client,
+        mode: str = 'google',
+        nijivoice_api_key: str | None = None,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        max_sessions: int = MAX_SESSIONS,
+        max_recognitions: int = MAX_RECOGNITIONS,
+        barge_in: bool = True,
+        cache_dir: Path | None = None,
+        metrics: Metrics | None = None,
+        output_writer: OutputWriter = StandardOutputWriter(),
+        nijivoice_base_url: str = NijiVoiceClient.BASE_URL,
+        governors: dict[BackendName, Governor] | None = None,
+        bundle: PhraseBundle | None = None,
+        transfer_format: TransferFormat = 'wav',
+        prompt_cache: bool = True,
+        prompt_cache_ttl: float = PromptCache.DEFAULT_TTL,
+    ):
+        """
+        Args:
+            genai_client (Client): AIChat と GoogleTTSClient で共有するクライアント
+            mode (str): 音声合成サービスのモード ('google' または 'nijivoice')
+            nijivoice_api_key (str | None): にじボイス API キー（nijivoice モードで必須）
+            host (str): 待ち受けるアドレス
+            port (int): 待ち受けるポート（0 の場合は空いているポート）
+            max_sessions (int): 同時に会話できるセッション数の上限
+            max_recognitions (int): 全セッションで同時に実行する音声認識の上限
+            barge_in (bool): 応答中のユーザーの発話で応答を打ち切るかどうか
+            cache_dir (Path | None): 音声キャッシュのディレクトリ
+            metrics (Metrics | None): 全セッションの所要時間の計測先
+            output_writer (OutputWriter): サーバーのログの出力先
+            nijivoice_base_url (str): にじボイス API のベース URL
+            governors (dict[BackendName, Governor] | None): バックエンドごとの
+                流量制御（None の場合は環境変数の設定で作成する）
+            bundle (PhraseBundle | None): 事前に合成した定型の台詞。
+                閉じるのは呼び出し側が行う
+            transfer_format (TransferFormat): にじボイスから受信する音声の形式
+            prompt_cache (bool): システムインストラクションを Gemini 側に
+                キャッシュするかどうか
+            prompt_cache_ttl (float): キャッシュの有効期間（秒）
+        Raises:
+            ValueError: nijivoice モードで API キーが指定されていない場合
+        """
+        if mode == 'nijivoice' and not nijivoice_api_key:
+            raise ValueError('nijivoice モードには API キーが必要です')
+
+        self._genai_client = genai_client
+        self._mode = mode
+        self._nijivoice_api_key = nijivoice_api_key
+        self._nijivoice_base_url = nijivoice_base_url
+        self._transfer_format: TransferFormat = transfer_format
+        self._host = host
+        self._port = port
+        self._max_sessions = max_sessions
+        self._max_recognitions = max_recognitions
+        self._barge_in = barge_in
+        self._cache_dir = cache_dir
+        self._metrics = metrics or Metrics()
+        self._output = output_writer
+
+        self._server: asyncio.Server | None = None
+        self._http: httpx.AsyncClient | None = None
+        self._voice_clients: dict[CharacterID, VoiceClient] = {}
+        self._bundle = bundle
+        self._executor: ThreadPoolExecutor | None = None
+        self._sessions: dict[int, asyncio.Task[None]] = {}
+        self._session_ids = itertools.count(1)
+        self._governors = governors or create_governors(self._metrics)
+        self._prompt_cache = (
+            PromptCache(
+                genai_client,
+                ttl=prompt_cache_ttl,
+                governor=self._governors['gemini'],
+            )
+            if prompt_cache
+            else None
+        )
+        self.stats = ServerStats()
+
+    @property
+    def port(self) -> int:
+        """待ち受けているポート"""
+        return self._port
+
+    async def start(self) -> None:
+        """待ち受けを開始する"""
+        self.stats.baseline_rss = current_rss()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._max_recognitions,
+            thread_name_prefix='stt-recognizer',
+        )
+        if self._mode == 'nijivoice':
+            self._http = NijiVoiceClient.create_http_client()
+
+        self._server = await asyncio.start_server(
+            self._handle, self._host, self._port
+        )
+        self._port = self._server.sockets[0].getsockname()[1]
+        self._output.print(
+            f'会話サーバーを開始しました: {self._host}:{self._port} '
+            f'(モード: {self._mode}, 最大 {self._max_sessions} セッション)'
+        )
+
+    async def serve_forever(self) -> None:
+        """待ち受けを開始し、キャンセルされるまで統計情報を定期的に出力する"""
+        await self.start()
+        try:
+            while True:
+                await asyncio.sleep(self.REPORT_INTERVAL)
+                self._output.print(self.stats.report())
+                if self._prompt_cache is not None:
+                    self._output.print(self._prompt_cache.stats.report())
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        """待ち受けを終了し、実行中のセッションと共有のリソースを閉じる"""
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+        sessions = list(self._sessions.values())
+        for task in sessions:
+            task.cancel()
+        await asyncio.gather(*sessions, return_exceptions=True)
+
+        for voice_client in self._voice_clients.values():
+            await voice_client.aclose()
+        self._voice_clients.clear()
+
+        if self._prompt_cache is not None:
+            await self._prompt_cache.aclose()
+
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def __aenter__(self) -> 'TalkServer':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close()
+
+    async def _handle(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """1つの接続で1つのセッションを実行する"""
+        if self.stats.active_sessions >= self._max_sessions:
+            self.stats.rejected_sessions += 1
+            write_json(
+                writer,
+                FrameType.ERROR,
+                {'message': '同時に会話できる上限に達しています'},
+            )
+            await self._close_writer(writer)
+            return
+
+        session_id = next(self._session_ids)
+        task = asyncio.current_task()
+        assert task is not None
+        self._sessions[session_id] = task
+        self.stats.active_sessions += 1
+        self.stats.total_sessions += 1
+        self.stats.peak_sessions = max(
+            self.stats.peak_sessions, self.stats.active_sessions
+        )
+
+        try:
+            await self._run_session(session_id, reader, writer)
+        except (ProtocolError, TimeoutError) as e:
+            write_json(writer, FrameType.ERROR, {'message': str(e)})
+        except ConnectionError:
+            pass
+        except Exception as e:
+            self._output.print(f'[{session_id}] エラーが発生しました: {e}')
+            write_json(writer, FrameType.ERROR, {'message': str(e)})
+        finally:
+            del self._sessions[session_id]
+            self.stats.active_sessions -= 1
+            await self._close_writer(writer)
+
+    async def _run_session(
+        self,
+        session_id: int,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """HELLO を受信してから会話が終わるまでを実行する"""
+        async with asyncio.timeout(self.HELLO_TIMEOUT):
+            frame = await read_frame(reader)
+        if frame is None:
+            return
+        frame_type, payload = frame
+        if frame_type != FrameType.HELLO:
+            raise ProtocolError('最初のフレームは HELLO である必要があります')
+
+        hello = parse_json(payload)
+        character = self._find_character(hello.get('character'))
+        sample_rate = hello.get('sample_rate', self.DEFAULT_SAMPLE_RATE)
+        low, high = self.SAMPLE_RATE_RANGE
+        if not isinstance(sample_rate, int) or not low <= sample_rate <= high:
+            raise ProtocolError(f'サンプリングレートが不正です: {sample_rate}')
+
+        source = QueueAudioSource(AudioFormat(sample_rate=sample_rate))
+        output = SessionOutputWriter(writer, session_id, log=self._output)
+        ai_chat = AIChat(
+            system_instruction=SYSTEM_INSTRUCTION_TEMPLATE.format(
+                character_name=character.name,
+                character_instruction=character.instruction,
+            ),
+            model=GEMINI_MODEL,
+            client=self._genai_client,
+            governor=self._governors['gemini'],
+            prompt_cache=self._prompt_cache,
+        )
+        speech_recognizer = self._create_speech_recognizer(
+            source, output, SessionEffectPlayer(writer)
+        )
+        controller = TalkController(
+            character_name=character.name,
+            talk_end_keyword=TALK_END_KEYWORD,
+            ai_chat=ai_chat,
+            voice_client=self._get_voice_client(character.id),
+            output_writer=output,
+            playback_engine=NetworkPlaybackEngine(writer),
+            speech_recognizer=speech_recognizer,
+            barge_in=self._barge_in,
+            metrics=self._metrics,
+            phrases=character.phrases,
+        )
+
+        write_json(
+            writer,
+            FrameType.HELLO,
+            {'session': session_id, 'character': character.id},
+        )
+        receiver = asyncio.create_task(receive_audio(reader, source))
+        try:
+            await controller.start_talk()
+        finally:
+            receiver.cancel()
+            (result,) = await asyncio.gather(receiver, return_exceptions=True)
+            await ai_chat.aclose()
+
+        # 不正なフレームで入力が終わった場合はクライアントに伝える
+        if isinstance(result, ProtocolError):
+            raise result
+
+    def _create_speech_recognizer(
+        self,
+        source: QueueAudioSource,
+        output: OutputWriter,
+        effect_player: EffectPlayer,
+    ) -> SpeechRecognizer:
+        """セッションの音声認識を作成する（スレッドプールは共有する）"""
+        return SpeechRecognizer(
+            effect_player=effect_player,
+            output_writer=output,
+            audio_source=source,
+            metrics=self._metrics,
+            executor=self._executor,
+            governor=self._governors['speech_recognition'],
+        )
+
+    def _get_voice_client(self, character_id: CharacterID) -> VoiceClient:
+        """キャラクターの音声合成クライアントを取得する（未作成の場合は新規作成）
+        同じキャラクターのセッション間で音声キャッシュも共有されます。
+        """
+        voice_client: VoiceClient | None = self._voice_clients.get(character_id)
+        if voice_client is not None:
+            return voice_client
+
+        if self._mode == 'nijivoice':
+            assert self._nijivoice_api_key is not None
+            base_client = NijiVoiceClient.create_from_character_id(
+                api_key=self._nijivoice_api_key,
+                character_id=character_id,
+                http_client=self._http,
+                metrics=self._metrics,
+                base_url=self._nijivoice_base_url,
+                governor=self._governors['nijivoice'],
+                audio_format=self._transfer_format,
+            )
+        else:
+            base_client = GoogleTTSClient.create_from_character_id(
+                client=self._genai_client,
+                character_id=character_id,
+                metrics=self._metrics,
+                governor=self._governors['gemini'],
+            )
+
+        voice_client = CachingVoiceClient(
+            voice_client=base_client, cache_dir=self._cache_dir
+        )
+        if self._bundle is not None:
+            voice_client = BundledVoiceClient(voice_client, self._bundle)
+        self._voice_clients[character_id] = voice_client
+        return voice_client
+
+    @staticmethod
+    def _find_character(character_id: object) -> CharacterOptions:
+        """キャラクターを取得する（指定がない場合はランダムに選ぶ）
+        Raises:
+            ProtocolError: 不明なキャラクターの場合
+        """
+        if character_id is None:
+            return random.choice(CHARACTER_MAP)
+        for character in CHARACTER_MAP:
+            if character.id == character_id:
+                return character
+        raise ProtocolError(f'不明なキャラクターです: {character_id}')
+
+    @staticmethod
+    async def _close_writer(writer: asyncio.StreamWriter) -> None:
+        """送信バッファを送り切ってから接続を閉じる"""
+        with contextlib.suppress(ConnectionError):
+            await writer.drain()
+        writer.close()
+        with contextlib.suppress(ConnectionError):
+            await writer.wait_closed()
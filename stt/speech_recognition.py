@@ -1,16 +1,37 @@
+import asyncio
+import contextlib
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
 import speech_recognition as sr  # type: ignore
 
-from .effect import EffectPlayer, EffectPlayerForMac
+from .audio import AudioBuffer, AudioFormat
+from .capture import AudioSource
+from .effect import EffectPlayer, ToneEffectPlayer
 from .exceptions import SpeechRecognitionError
+from .governor import Governor
+from .metrics import Metrics
 from .output import OutputWriter, StandardOutputWriter
+from .recording import SessionRecorder
+from .vad import BargeInDetector, UtteranceEndpointer
 
 
 class SpeechRecognizer:
     """音声認識を行うクラス
+    `audio_source` を指定した場合は入力ストリームを開いたまま使い続け、
+    フレーム単位の音声区間検出で発話の終了を判定します。
+    指定しない場合は発話ごとに `sr.Microphone()` を開きます。
     Attributes:
         _recognizer (sr.Recognizer): 音声認識のインスタンス
         _effect_player (EffectPlayer): 録音開始・終了時の効果音を再生するプレイヤー
         _output (OutputWriter): 出力制御を行うインターフェース
+        _executor (ThreadPoolExecutor): 録音・認識処理を実行するスレッドプール
+        _owns_executor (bool): スレッドプールをこのインスタンスが管理しているかどうか
+        _endpointer (UtteranceEndpointer | None): 常時入力時の発話区間検出
+        _barge_in_detector (BargeInDetector | None): 常時入力時の割り込み検出
+        _metrics (Metrics): 各段階の所要時間の計測先
+        _governor (Governor): 音声認識サービスへのリクエストの流量制御
+        recorder (SessionRecorder): 音声認識に送った発話の音声の記録先
     """
 
     # 周囲音の調整時間と音声認識のタイムアウト時間
@@ -21,54 +42,266 @@ class SpeechRecognizer:
 
     PHRASE_TIME_LIMIT = 10.0
 
+    # 認識する言語
+    LANGUAGE = 'ja-JP'
+
     def __init__(
         self,
-        effect_player: EffectPlayer = EffectPlayerForMac(),
+        effect_player: EffectPlayer | None = None,
         output_writer: OutputWriter = StandardOutputWriter(),
+        audio_source: AudioSource | None = None,
+        hangover_ms: int = UtteranceEndpointer.HANGOVER_MS,
+        metrics: Metrics | None = None,
+        executor: ThreadPoolExecutor | None = None,
+        governor: Governor | None = None,
+        recorder: SessionRecorder | None = None,
     ):
+        """
+        Args:
+            effect_player (EffectPlayer | None): 録音開始・終了時の効果音を
+                再生するプレイヤー（None の場合は合成した効果音を鳴らす）
+            executor (ThreadPoolExecutor | None): 録音・認識処理を実行する
+                スレッドプール。複数のセッションで認識の同時実行数を共有する
+                場合に指定し、終了は呼び出し側が管理する
+            governor (Governor | None): 音声認識サービスの流量制御
+                （None の場合は通信エラーの再試行のみ行う）
+            recorder (SessionRecorder | None): 発話の音声の記録先
+                （None の場合は記録しない）
+        """
         self._recognizer = sr.Recognizer()
-        self._effect_player = effect_player
+        self._metrics = metrics or Metrics()
+        self._effect_player = effect_player or ToneEffectPlayer()
         self._output = output_writer
+        # マイクは同時に1つしか扱えないため、ワーカーは1つに制限する
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='stt-recognizer'
+        )
+        self._owns_executor = executor is None
+        self._governor = governor or Governor(
+            'speech_recognition', retry_on=(sr.RequestError,)
+        )
+        self.recorder = recorder or SessionRecorder()
+        self._audio_source = audio_source
+        self._endpointer: UtteranceEndpointer | None = None
+        self._barge_in_detector: BargeInDetector | None = None
+        if audio_source is not None:
+            self._endpointer = UtteranceEndpointer(
+                audio_source, hangover_ms=hangover_ms
+            )
+            self._barge_in_detector = BargeInDetector(
+                self._endpointer.vad, frame_ms=audio_source.frame_ms
+            )
+
+    @property
+    def supports_barge_in(self) -> bool:
+        """応答中の割り込みを検出できるかどうか（常時入力の場合のみ）"""
+        return self._barge_in_detector is not None
+
+    async def listen_async(self, speech_started: bool = False) -> str:
+        """イベントループをブロックせずに音声を取得し、テキストに変換する
+        Args:
+            speech_started (bool): `wait_for_barge_in` で発話の開始を
+                検出済みの場合は True（発話の続きから取得する）
+        Returns:
+            str: 認識されたテキスト
+        Raises:
+            SpeechRecognitionError: 音声認識に失敗した場合
+        """
+        if self._endpointer is not None:
+            return await self._listen_stream(self._endpointer, speech_started)
+
+        loop = asyncio.get_running_loop()
+        audio = await loop.run_in_executor(self._executor, self._record)
+        self._record_capture(audio)
+        return await self._recognize_async(audio)
+
+    async def calibrate(self) -> None:
+        """常時入力の場合、入力ストリームを開いて周囲音を一度だけ測定する"""
+        if self._endpointer is None or self._endpointer.vad.calibrated:
+            return
+
+        assert self._audio_source is not None
+        with self._metrics.span('stt.mic_open', total=None):
+            await self._audio_source.start()
+
+        self._output.print('周囲音を調整中...')
+        with self._metrics.span('stt.calibrate', total=None):
+            await self._endpointer.calibrate()
+
+    def close(self) -> None:
+        """常時入力の場合は入力ストリームを閉じ、スレッドプールを終了する"""
+        if self._audio_source is not None:
+            self._audio_source.close()
+        if self._owns_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def wait_for_barge_in(self, is_playing: Callable[[], bool]) -> None:
+        """応答の生成中・再生中にユーザーが話し始めるまで待つ
+        Args:
+            is_playing (Callable[[], bool]): 応答を再生中かどうかを返す関数
+        Raises:
+            ValueError: 常時入力でない場合
+        """
+        if self._endpointer is None or self._barge_in_detector is None:
+            raise ValueError('割り込みの検出には audio_source が必要です')
+        await self._endpointer.wait_for_barge_in(
+            self._barge_in_detector, is_playing
+        )
+
+    async def _listen_stream(
+        self,
+        endpointer: UtteranceEndpointer,
+        speech_started: bool,
+    ) -> str:
+        """開いたままの入力ストリームから次の発話を取得し、テキストに変換する"""
+        await self.calibrate()
+
+        if not speech_started:
+            # 音声認識の開始時に効果音を再生
+            self._output.print('録音中... 話してください')
+            self._effect_player.start()
+            # 効果音が発話として検出されないよう、鳴り終わってから聞き始める
+            await self._effect_player.wait()
+
+            # 前の発話以降に溜まった音声（効果音や応答の再生音）は使わない
+            endpointer.reset()
+            await endpointer.wait_for_speech(timeout=self.SPEECH_TIMEOUT)
+
+        with self._metrics.span('stt.capture', total=None):
+            utterance = await endpointer.capture_speech(
+                max_duration=self.PHRASE_TIME_LIMIT
+            )
+        self._metrics.observe('stt.endpoint', utterance.endpoint_delay)
+
+        assert self._audio_source is not None
+        audio_format = self._audio_source.audio_format
+        audio = sr.AudioData(
+            frame_data=utterance.pcm,
+            sample_rate=audio_format.sample_rate,
+            sample_width=audio_format.sample_width,
+        )
+        self._record_capture(audio)
+
+        return await self._recognize_async(audio)
+
+    def _record_capture(self, audio: sr.AudioData) -> None:
+        """音声認識に送る発話の音声を記録する"""
+        # speech_recognition には型情報がないため、ここで型を明示する
+        pcm: bytes = audio.frame_data
+        sample_rate: int = audio.sample_rate
+        sample_width: int = audio.sample_width
+        self.recorder.capture(
+            pcm, AudioFormat(sample_rate=sample_rate, sample_width=sample_width)
+        )
+
+    async def recognize_async(self, audio: AudioBuffer) -> str:
+        """録音済みの音声をテキストに変換する
+        マイクを使わずに録音ファイルなどを認識するために使います。
+        効果音と進行状況の表示は行いません。
+        Args:
+            audio (AudioBuffer): 認識する音声（モノラル）
+        Returns:
+            str: 認識されたテキスト
+        Raises:
+            SpeechRecognitionError: 音声認識に失敗した場合
+        """
+        return await self._recognize_in_executor(
+            sr.AudioData(
+                frame_data=bytes(audio.pcm),
+                sample_rate=audio.sample_rate,
+                sample_width=audio.audio_format.sample_width,
+            )
+        )
+
+    async def _recognize_in_executor(self, audio: sr.AudioData) -> str:
+        """流量を制御しながらワーカースレッドで音声を認識する
+        通信エラーの場合は Governor の設定に従って再試行します。
+        """
+        loop = asyncio.get_running_loop()
+        with self._metrics.span('stt.recognize', total=None):
+            return await self._governor.call(
+                lambda: loop.run_in_executor(
+                    self._executor, self._recognize, audio
+                )
+            )
+
+    async def _recognize_async(self, audio: sr.AudioData) -> str:
+        """発話の音声を認識し、効果音と結果を出力する"""
+        self._output.print('音声認識中...')
+        result = await self._recognize_in_executor(audio)
+
+        # 音声認識の終了時に効果音を再生
+        self._effect_player.end()
+        self._output.print(f'認識結果: {result}')
+        return result
 
     def listen(self) -> str:
-        """マイクから音声を取得し、テキストに変換する
+        """マイクから音声を取得し、テキストに変換する（互換用の同期版）
         Returns:
             str: 認識されたテキスト
         Raises:
             SpeechRecognitionError: 音声認識に失敗した場合
         """
+        audio = self._record()
+        self._record_capture(audio)
+
+        self._output.print('音声認識中...')
+        with self._metrics.span('stt.recognize', total=None):
+            result = self._recognize(audio)
+
+        # 音声認識の終了時に効果音を再生
+        self._effect_player.end()
+        self._output.print(f'認識結果: {result}')
+        return result
+
+    def _record(self) -> sr.AudioData:
+        """発話ごとにマイクを開いて周囲音を調整し、発話を録音する
+        Raises:
+            SpeechRecognitionError: 時間内に発話が始まらなかった場合
+        """
         try:
-            with sr.Microphone() as source:
+            with contextlib.ExitStack() as stack:
+                with self._metrics.span('stt.mic_open', total=None):
+                    source = stack.enter_context(sr.Microphone())
+
                 self._output.print('周囲音を調整中...')
-                self._recognizer.adjust_for_ambient_noise(
-                    source, duration=int(self.AMBIENT_NOISE_DURATION)
-                )
+                with self._metrics.span('stt.calibrate', total=None):
+                    self._recognizer.adjust_for_ambient_noise(
+                        source, duration=int(self.AMBIENT_NOISE_DURATION)
+                    )
                 # 音声認識の開始時に効果音を再生
                 self._output.print('録音中... 話してください')
                 self._effect_player.start()
-                audio = self._recognizer.listen(
-                    source,
-                    timeout=self.SPEECH_TIMEOUT,
-                    phrase_time_limit=self.PHRASE_TIME_LIMIT,
-                )
+                with self._metrics.span('stt.capture', total=None):
+                    audio = self._recognizer.listen(
+                        source,
+                        timeout=self.SPEECH_TIMEOUT,
+                        phrase_time_limit=self.PHRASE_TIME_LIMIT,
+                    )
+        except sr.WaitTimeoutError:
+            raise SpeechRecognitionError(
+                'タイムアウトしました。もう一度話しかけてください。'
+            )
+        return audio
 
-            # 音声認識の終了時に効果音を再生
-            self._output.print('音声認識中...')
+    def _recognize(self, audio: sr.AudioData) -> str:
+        """Google Speech Recognition で音声をテキストに変換する
+        Args:
+            audio (sr.AudioData): 認識する音声
+        Returns:
+            str: 認識されたテキスト
+        Raises:
+            SpeechRecognitionError: 音声認識に失敗した場合
+        """
+        try:
             result: str = self._recognizer.recognize_google(  # type: ignore
-                audio, language='ja-JP'
+                audio, language=self.LANGUAGE
             )
-
-            self._effect_player.end()
-            self._output.print(f'認識結果: {result}')
             return result
-
         except sr.UnknownValueError:
             raise SpeechRecognitionError('音声を認識できませんでした')
-        except sr.WaitTimeoutError:
-            raise SpeechRecognitionError(
-                'タイムアウトしました。もう一度話しかけてください。'
-            )
         except sr.RequestError as e:
+            # 通信エラーは Governor が再試行できるよう原因として残す
             raise SpeechRecognitionError(
                 f'Google Speech Recognition サービスでエラーが発生しました: {e}'
-            )
+            ) from e
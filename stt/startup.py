@@ -0,0 +1,250 @@
+"""起動時間の計測
+
+自動で再起動する環境では、プロセスの起動から最初の入力待ちまでの時間が
+そのまま応答できない時間になります。起動の各段階の所要時間と、重い
+ライブラリの読み込み時間を計測して目標時間と比較できるようにします。
+
+使い方:
+    python -m stt.startup
+    python -m stt.startup stt --target 0.05
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from collections.abc import Generator, Sequence
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from .metrics import Metrics
+
+# 読み込み時間を計測するモジュール（起動時に読み込まれるもの）
+DEFAULT_MODULES = (
+    'stt',
+    'dotenv',
+    'numpy',
+    'httpx',
+    'google.genai',
+    'speech_recognition',
+    'stt.ai_chat',
+    'stt.googlevoice',
+    'stt.nijivoice',
+    'stt.speech_recognition',
+    'stt.talk',
+)
+
+
+@dataclass(frozen=True)
+class StartupPhase:
+    """起動の1段階の計測結果
+    Attributes:
+        name (str): 段階の名前
+        start (float): 起動開始からの開始時刻（秒）
+        end (float | None): 起動開始からの終了時刻（秒、実行中の場合は None）
+    """
+
+    name: str
+    start: float
+    end: float | None = None
+
+    @property
+    def duration(self) -> float | None:
+        """所要時間（秒、実行中の場合は None）"""
+        return None if self.end is None else self.end - self.start
+
+
+class StartupProfiler:
+    """起動の各段階の所要時間を計測するクラス
+    段階は並行して実行されるため、起動開始からの開始・終了時刻を記録し、
+    レポートではどの段階が最初の入力待ちを遅らせているかを表示します。
+    Attributes:
+        started_at (float): 起動開始時刻（`time.perf_counter` の値）
+        target (float | None): 最初の入力待ちまでの目標時間（秒）
+        phases (list[StartupPhase]): 開始した順の計測結果
+        ready_at (float | None): 起動開始から最初の入力待ちまでの時間（秒）
+    """
+
+    # 目標時間を指定する環境変数
+    TARGET_ENV = 'STARTUP_TARGET'
+
+    def __init__(
+        self,
+        started_at: float | None = None,
+        target: float | None = None,
+        metrics: Metrics | None = None,
+    ):
+        """
+        Args:
+            started_at (float | None): 起動開始時刻（None の場合は現在時刻）。
+                モジュールの読み込み時間も含める場合は、最初の import より
+                前に取得した `time.perf_counter()` の値を渡す
+            target (float | None): 目標時間（None の場合は `STARTUP_TARGET`）
+            metrics (Metrics | None): 各段階の所要時間を `startup.<段階>`
+                として記録する計測先
+        """
+        self.started_at = (
+            time.perf_counter() if started_at is None else started_at
+        )
+        if target is None and (value := os.getenv(self.TARGET_ENV)):
+            target = float(value)
+        self.target = target
+        self.phases: list[StartupPhase] = []
+        self.ready_at: float | None = None
+        self._metrics = metrics or Metrics()
+
+    def elapsed(self) -> float:
+        """起動開始からの経過時間（秒）"""
+        return time.perf_counter() - self.started_at
+
+    @contextmanager
+    def phase(self, name: str) -> Generator[None]:
+        """ブロックの実行を起動の1段階として計測する
+        `async with` の中でも使えるよう、同期のコンテキストマネージャーです。
+        例外で終了した場合も終了時刻を記録します。
+        """
+        index = len(self.phases)
+        self.phases.append(StartupPhase(name, self.elapsed()))
+        try:
+            yield
+        finally:
+            phase = self.phases[index]
+            end = self.elapsed()
+            self.phases[index] = StartupPhase(name, phase.start, end)
+            self._metrics.observe(f'startup.{name}', end - phase.start)
+
+    def record(self, name: str, start: float, end: float) -> None:
+        """別の方法で計測した段階を記録する（例: モジュールの読み込み）
+        Args:
+            name (str): 段階の名前
+            start (float): 開始時刻（`time.perf_counter` の値）
+            end (float): 終了時刻（`time.perf_counter` の値）
+        """
+        self.phases.append(
+            StartupPhase(name, start - self.started_at, end - self.started_at)
+        )
+        self._metrics.observe(f'startup.{name}', end - start)
+
+    def mark_ready(self) -> float:
+        """最初の入力待ちに入った時点を記録する
+        Returns:
+            float: 起動開始からの経過時間（秒）
+        """
+        self.ready_at = self.elapsed()
+        self._metrics.observe('startup.ready', self.ready_at)
+        return self.ready_at
+
+    @property
+    def over_target(self) -> bool:
+        """最初の入力待ちまでの時間が目標時間を超えたかどうか"""
+        return (
+            self.target is not None
+            and self.ready_at is not None
+            and self.ready_at > self.target
+        )
+
+    def report(self) -> str:
+        """各段階の開始・終了時刻と所要時間のレポートを返す"""
+        ready = '計測中' if self.ready_at is None else f'{self.ready_at:.3f} 秒'
+        lines = [f'起動時間: {ready}']
+        if self.target is not None:
+            verdict = '超過' if self.over_target else '達成'
+            lines[0] += f'（目標 {self.target:.3f} 秒 {verdict}）'
+
+        width = max((len(phase.name) for phase in self.phases), default=0)
+        for phase in self.phases:
+            if phase.end is None or phase.duration is None:
+                timing = f'{phase.start:7.3f} →  実行中'
+            else:
+                timing = (
+                    f'{phase.start:7.3f} → {phase.end:7.3f} 秒'
+                    f'  ({phase.duration:.3f} 秒)'
+                )
+            lines.append(f'  {phase.name:<{width}}  {timing}')
+        return '\n'.join(lines)
+
+
+def measure_import(module: str, python: str = sys.executable) -> float:
+    """新しいプロセスでモジュールを読み込み、その所要時間を計測する
+    他のモジュールの読み込み済みの影響を受けないよう、モジュールごとに
+    `python -X importtime` を実行して累積時間を取り出します。
+    Args:
+        module (str): 計測するモジュール名
+        python (str): 使用する Python の実行ファイル
+    Returns:
+        float: 読み込みの所要時間（秒）
+    Raises:
+        ImportError: モジュールを読み込めなかった場合
+    """
+    result = subprocess.run(
+        [python, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise ImportError(f'{module} を読み込めません: {result.stderr}')
+
+    # 例: "import time:       349 |     595297 | google.genai"
+    pattern = re.compile(
+        rf'^import time:\s*\d+ \|\s*(\d+) \| {re.escape(module)}$'
+    )
+    for line in reversed(result.stderr.splitlines()):
+        if match := pattern.match(line):
+            return int(match.group(1)) / 1_000_000
+    # 既に読み込まれているモジュール（組み込みモジュールなど）
+    return 0.0
+
+
+def import_report(
+    modules: Sequence[str] = DEFAULT_MODULES, target: float | None = None
+) -> tuple[str, bool]:
+    """モジュールごとの読み込み時間のレポートを返す
+    Args:
+        modules (Sequence[str]): 計測するモジュール名
+        target (float | None): モジュールごとの読み込み時間の目標（秒）
+    Returns:
+        tuple[str, bool]: レポートと、すべてのモジュールが目標時間内かどうか
+    """
+    width = max(len(module) for module in modules)
+    lines = ['モジュールの読み込み時間:']
+    within_target = True
+    for module in modules:
+        try:
+            seconds = measure_import(module)
+        except ImportError:
+            lines.append(f'  {module:<{width}}  読み込めません')
+            continue
+
+        line = f'  {module:<{width}}  {seconds * 1000:8.1f} ms'
+        if target is not None and seconds > target:
+            line += '  目標超過'
+            within_target = False
+        lines.append(line)
+    return '\n'.join(lines), within_target
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m stt.startup')
+    parser.add_argument(
+        'modules',
+        nargs='*',
+        default=list(DEFAULT_MODULES),
+        help='読み込み時間を計測するモジュール',
+    )
+    parser.add_argument(
+        '--target',
+        type=float,
+        help='モジュールごとの読み込み時間の目標（秒）。超えた場合は終了コード 1',
+    )
+    args = parser.parse_args()
+
+    report, within_target = import_report(args.modules, args.target)
+    print(report)
+    if not within_target:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,27 @@
+import asyncio
+import contextlib
+import time
+from collections.abc import Mapping
+
 from .ai_chat import AIChat
+from .audio import AudioBuffer
+from .config import PhraseID
 from .exceptions import VoiceSynthesisError
+from .metrics import Metrics, Span
 from .output import OutputWriter, StandardOutputWriter
+from .playback import PlaybackEngine, create_playback_engine
+from .recording import RecordingVoiceClient, SessionRecorder
+from .segmenter import SentenceSegmenter
 from .speech_recognition import SpeechRecognizer
-from .voice import VoiceClient, play
+from .voice import VoiceClient
+
+# 1文分の音声合成で受信した PCM の断片（None は文の終端を表す）
+type SpeechStream = asyncio.Queue[AudioBuffer | None]
+
+# 音声合成タスクと受信した PCM のキュー（None は応答の終端を表す）
+type SynthesisQueue = asyncio.Queue[
+    tuple[asyncio.Task[None], SpeechStream] | None
+]
 
 
 class TalkController:
@@ -13,8 +32,26 @@ class TalkController:
         _ai_chat (AIChat): AI チャットインスタンス
         _voice_client (VoiceClient): 音声合成クライアント
         _output (OutputWriter): 出力制御を行うインターフェース
+        _speech_recognizer (SpeechRecognizer): 音声認識を行うインスタンス
+        _playback (PlaybackEngine): 音声を再生するエンジン
+        _synthesis_semaphore (asyncio.Semaphore): 同時に実行する音声合成数の制限
+        _barge_in (bool): 応答中のユーザーの発話で応答を打ち切るかどうか
+        _partial_response (str): 現在の応答でこれまでに受信したテキスト
+        _metrics (Metrics): 各段階の所要時間の計測先
+        _phrases (Mapping[PhraseID, str]): 挨拶などの定型の台詞
+        _recorder (SessionRecorder): 会話セッションの記録先
     """
 
+    # 同時に実行する音声合成リクエストの最大数
+    MAX_PARALLEL_SYNTHESIS = 2
+
+    # 定型の挨拶に続けて AI が最初に話す内容の指示
+    # （会話の最初のユーザーの発言として履歴に残る）
+    OPENING_PROMPT = (
+        '（会話が始まりました。あなたは既に「{greeting}」と挨拶しています。'
+        '挨拶は繰り返さずに、続けてユーザーの名前を尋ねてください）'
+    )
+
     def __init__(
         self,
         character_name: str,
@@ -22,48 +59,361 @@ class TalkController:
         ai_chat: AIChat,
         voice_client: VoiceClient,
         output_writer: OutputWriter = StandardOutputWriter(),
+        playback_engine: PlaybackEngine | None = None,
+        speech_recognizer: SpeechRecognizer | None = None,
+        barge_in: bool = False,
+        metrics: Metrics | None = None,
+        phrases: Mapping[PhraseID, str] | None = None,
+        recorder: SessionRecorder | None = None,
     ):
+        """
+        Args:
+            barge_in (bool): True の場合は応答中もマイク入力を監視し、
+                ユーザーが話し始めたら応答の生成・合成・再生を打ち切る。
+                常時入力の SpeechRecognizer が必要
+            metrics (Metrics | None): 応答生成・音声合成・再生の所要時間の計測先
+            phrases (Mapping[PhraseID, str] | None): キャラクターの定型の台詞。
+                `greeting` がある場合は会話の開始時に再生し、その間に AI の
+                最初の発話を生成する。`error` と `farewell` はエラー時と
+                会話の終了時に再生する
+            recorder (SessionRecorder | None): 会話セッションの記録先。
+                音声認識の結果・AI への送信と応答・音声合成の結果・割り込みを
+                記録する（None の場合は記録しない）
+        Raises:
+            ValueError: barge_in が True で SpeechRecognizer が割り込みの
+                検出に対応していない場合
+        """
         self._character_name = character_name
         self._talk_end_keyword = talk_end_keyword
         self._output = output_writer
-        self._speech_recognizer = SpeechRecognizer(output_writer=output_writer)
+        self._speech_recognizer = speech_recognizer or SpeechRecognizer(
+            output_writer=output_writer
+        )
+
+        self._recorder = recorder or SessionRecorder()
+        if self._recorder.enabled:
+            voice_client = RecordingVoiceClient(voice_client, self._recorder)
+            if not self._speech_recognizer.recorder.enabled:
+                self._speech_recognizer.recorder = self._recorder
 
         self._ai_chat = ai_chat
         self._voice_client = voice_client
+        self._playback = playback_engine or create_playback_engine()
+        self._synthesis_semaphore = asyncio.Semaphore(
+            self.MAX_PARALLEL_SYNTHESIS
+        )
+
+        if barge_in and not self._speech_recognizer.supports_barge_in:
+            raise ValueError('割り込みには常時入力の音声認識が必要です')
+        self._barge_in = barge_in
+        self._partial_response = ''
+        self._metrics = metrics or Metrics()
+        self._phrases = phrases or {}
 
     async def start_talk(self) -> None:
         """会話を開始する"""
+        try:
+            await self._talk_loop()
+        finally:
+            self._playback.stop()
+            self._speech_recognizer.close()
+
+    async def _talk_loop(self) -> None:
+        """音声認識・応答生成・音声再生を繰り返す"""
+        speech_started = await self._open_talk()
         self._output.print('何か話しかけてください...')
 
         while True:
             try:
-                # 音声認識
-                user_input = self._speech_recognizer.listen()
+                # 音声認識（割り込みの場合は検出済みの発話の続きから取得）
+                user_input = await self._listen(speech_started)
+                speech_started = False
 
                 # 会話終了チェック
                 if self._talk_end_keyword in user_input:
                     self._output.print('音声認識を終了します。')
+                    await self._say('farewell')
                     break
 
-                # AI 応答生成
-                ai_response = self._ai_chat.send_message(user_input)
-                self._output.print(
-                    f'{self._character_name}の返答: {ai_response}'
-                )
+                # AI 応答生成と音声再生
+                if self._barge_in:
+                    speech_started = await self._respond_interruptible(
+                        user_input
+                    )
+                else:
+                    ai_response = await self._respond(user_input)
+                    self._output.print(
+                        f'{self._character_name}の返答: {ai_response}'
+                    )
 
-                # 音声再生
-                await self._play(ai_response)
+            except EOFError:
+                # ネットワークの切断などで音声入力が終了した場合
+                self._output.print('音声入力が終了しました。')
+                break
 
             except Exception as e:
                 self._output.print(f'エラーが発生しました: {e}')
+                await self._say('error')
                 continue
 
-    async def _play(self, text: str) -> None:
-        """テキストを音声合成して再生する"""
+    async def _listen(self, speech_started: bool) -> str:
+        """音声認識を行い、結果と所要時間を記録する"""
+        self._recorder.begin_turn()
+        started_at = time.perf_counter()
         try:
-            audio = await self._voice_client.text_to_speech(text)
-            play(audio)
+            user_input = await self._speech_recognizer.listen_async(
+                speech_started=speech_started
+            )
         except Exception as e:
-            raise VoiceSynthesisError(
-                f'音声合成でエラーが発生しました: {e}'
-            ) from e
+            self._recorder.write(
+                'listen',
+                elapsed=round(time.perf_counter() - started_at, 4),
+                speech_started=speech_started,
+                error=type(e).__name__,
+                message=str(e),
+            )
+            raise
+        self._recorder.write(
+            'listen',
+            elapsed=round(time.perf_counter() - started_at, 4),
+            speech_started=speech_started,
+            text=user_input,
+        )
+        return user_input
+
+    async def _open_talk(self) -> bool:
+        """定型の挨拶を再生し、続けて AI の最初の発話を再生する
+        挨拶は事前に合成した音声があればすぐに再生が始まり、その再生中に
+        AI の最初の発話の生成と音声合成を進めます。
+        Returns:
+            bool: 割り込みがあった場合は True
+        """
+        greeting = self._phrases.get('greeting')
+        if greeting is None:
+            return False
+
+        self._output.print(f'{self._character_name}の挨拶: {greeting}')
+        prompt = self.OPENING_PROMPT.format(greeting=greeting)
+        try:
+            if self._barge_in:
+                return await self._respond_interruptible(
+                    prompt, lead_in=greeting
+                )
+            ai_response = await self._respond(prompt, lead_in=greeting)
+            self._output.print(f'{self._character_name}の返答: {ai_response}')
+        except Exception as e:
+            self._output.print(f'エラーが発生しました: {e}')
+            await self._say('error')
+        return False
+
+    async def _say(self, phrase: PhraseID) -> None:
+        """定型の台詞を最後まで再生する（設定がない場合は何もしない）
+        エラー時にも使うため、再生に失敗しても例外は伝えません。
+        """
+        text = self._phrases.get(phrase)
+        if text is None:
+            return
+
+        try:
+            async for chunk in self._voice_client.stream_speech(text):
+                await self._playback.enqueue(chunk)
+            await self._playback.drain()
+        except Exception as e:
+            self._output.print(f'定型の台詞を再生できませんでした: {e}')
+
+    async def _respond_interruptible(
+        self, user_input: str, lead_in: str | None = None
+    ) -> bool:
+        """ユーザーの割り込みを監視しながら応答する
+        応答の生成中・再生中にユーザーが話し始めた場合は、応答のタスクを
+        キャンセルして LLM のストリーミング・音声合成・再生をすべて止め、
+        打ち切られた応答を履歴に記録します。
+        Args:
+            user_input (str): ユーザーの発話テキスト
+            lead_in (str | None): 応答の前に再生する定型の台詞
+        Returns:
+            bool: 割り込みがあった場合は True
+        """
+        started_at = time.perf_counter()
+        turn = asyncio.create_task(self._respond(user_input, lead_in))
+        monitor = asyncio.create_task(self._wait_for_barge_in())
+
+        try:
+            await asyncio.wait(
+                {turn, monitor}, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            # 応答が先に終わらなかった場合は割り込みとみなす
+            interrupted = not turn.done()
+            turn.cancel()
+            monitor.cancel()
+            turn_result, monitor_result = await asyncio.gather(
+                turn, monitor, return_exceptions=True
+            )
+
+        if not interrupted:
+            if isinstance(turn_result, BaseException):
+                raise turn_result
+            self._output.print(f'{self._character_name}の返答: {turn_result}')
+            return False
+
+        # 割り込みの検出に失敗した場合はその例外を伝える
+        if isinstance(monitor_result, BaseException):
+            raise monitor_result
+
+        partial_response = self._partial_response
+        self._recorder.write(
+            'barge_in',
+            offset=round(time.perf_counter() - started_at, 4),
+            partial_response=partial_response,
+        )
+        self._ai_chat.record_truncated(user_input, partial_response)
+        self._output.print(
+            f'{self._character_name}の返答（中断）: {partial_response}'
+        )
+        return True
+
+    async def _wait_for_barge_in(self) -> None:
+        """ユーザーが話し始めるまで待つ
+        音声入力が終了した場合は割り込みが起きないため、応答を最後まで
+        続けられるよう、キャンセルされるまで待ち続けます。
+        """
+        try:
+            await self._speech_recognizer.wait_for_barge_in(
+                lambda: self._playback.is_playing
+            )
+        except EOFError:
+            await asyncio.get_running_loop().create_future()
+
+    async def _respond(
+        self, user_input: str, lead_in: str | None = None
+    ) -> str:
+        """AI の応答をストリーミングで受信し、文単位で音声合成・再生する
+        完成した文から順に音声合成を開始し、最初の文の合成が終わった時点で
+        再生を始めます。後続の文は再生中に並行して生成・合成されます。
+        Args:
+            user_input (str): ユーザーの発話テキスト
+            lead_in (str | None): 応答の前に再生する定型の台詞
+        Returns:
+            str: AI の応答テキスト全体（`lead_in` は含まない）
+        """
+        # 発話の認識完了から最初の音声の再生開始・最後の音声の再生終了まで
+        with self._metrics.span('playback', total='end') as playback:
+            return await self._respond_and_play(user_input, playback, lead_in)
+
+    async def _respond_and_play(
+        self, user_input: str, playback: Span, lead_in: str | None = None
+    ) -> str:
+        """応答の受信と音声合成・再生を並行して行う"""
+        queue: SynthesisQueue = asyncio.Queue()
+        player = asyncio.create_task(self._play_queue(queue, playback))
+        segmenter = SentenceSegmenter()
+        self._partial_response = ''
+        # 受信した断片と応答の送信からの秒数（記録用）
+        deltas: list[tuple[float, str]] = []
+        started_at = time.perf_counter()
+        # キャンセル（割り込み）された場合は cancelled のまま記録する
+        outcome = 'cancelled'
+
+        try:
+            # 定型の台詞を先に再生し、その間に応答を生成する
+            if lead_in is not None:
+                queue.put_nowait(self._start_synthesis(lead_in))
+
+            with self._metrics.span('chat') as chat:
+                async with contextlib.aclosing(
+                    self._ai_chat.send_message_stream(user_input)
+                ) as stream:
+                    async for delta in stream:
+                        chat.mark('ttft')
+                        deltas.append((time.perf_counter() - started_at, delta))
+                        self._partial_response += delta
+                        for sentence in segmenter.feed(delta):
+                            queue.put_nowait(self._start_synthesis(sentence))
+
+            rest = segmenter.flush()
+            if rest is not None:
+                queue.put_nowait(self._start_synthesis(rest))
+
+            queue.put_nowait(None)
+            outcome = 'completed'
+            await player
+        except BaseException as e:
+            if isinstance(e, Exception) and outcome == 'cancelled':
+                outcome = 'error'
+            player.cancel()
+            self._cancel_pending(queue)
+            self._playback.flush()
+            raise
+        finally:
+            self._recorder.write(
+                'chat',
+                message=user_input,
+                deltas=[[round(offset, 4), text] for offset, text in deltas],
+                outcome=outcome,
+            )
+
+        return self._partial_response
+
+    def _start_synthesis(
+        self, text: str
+    ) -> tuple[asyncio.Task[None], SpeechStream]:
+        """1文分の音声合成を開始する
+        Returns:
+            tuple[asyncio.Task[None], SpeechStream]: 音声合成タスクと、
+                受信した PCM の断片が順に追加されるキュー
+        """
+        stream: SpeechStream = asyncio.Queue()
+        task = asyncio.create_task(self._synthesize(text, stream))
+        return task, stream
+
+    async def _synthesize(self, text: str, stream: SpeechStream) -> None:
+        """テキストを音声合成し、受信した PCM の断片をキューに追加する"""
+        try:
+            async with self._synthesis_semaphore:
+                try:
+                    with self._metrics.span('tts') as tts:
+                        async for chunk in self._voice_client.stream_speech(
+                            text
+                        ):
+                            tts.mark('ttfb')
+                            stream.put_nowait(chunk)
+                except Exception as e:
+                    raise VoiceSynthesisError(
+                        f'音声合成でエラーが発生しました: {e}'
+                    ) from e
+        finally:
+            stream.put_nowait(None)
+
+    async def _play_queue(self, queue: SynthesisQueue, playback: Span) -> None:
+        """音声合成の結果を文の順番どおりに再生キューに追加する
+        各文の PCM は受信した断片から順に再生されるため、合成の完了を
+        待たずに再生が始まります。再生エンジンは前の音声の再生中に次の
+        音声を受け付けるため、合成が再生に追いついていれば文と文の間に
+        隙間は生じません。
+        """
+        current: asyncio.Task[None] | None = None
+        try:
+            while (item := await queue.get()) is not None:
+                current, stream = item
+                while (chunk := await stream.get()) is not None:
+                    await self._playback.enqueue(chunk)
+                    playback.mark('start')
+                # 音声合成のエラーを伝える
+                await current
+                current = None
+            await self._playback.drain()
+        except BaseException:
+            # キューから取り出し済みで再生途中の音声合成も止める
+            if current is not None:
+                current.cancel()
+            self._cancel_pending(queue)
+            raise
+
+    @staticmethod
+    def _cancel_pending(queue: SynthesisQueue) -> None:
+        """キューに残っている音声合成タスクをキャンセルする"""
+        while not queue.empty():
+            item = queue.get_nowait()
+            if item is not None:
+                item[0].cancel()
@@ -0,0 +1,481 @@
+"""録音ファイルを一括で文字起こしするコマンド
+
+ディレクトリ以下の WAV / FLAC ファイルを SpeechRecognizer で文字起こしし、
+結果を JSONL に1行ずつ追記します。
+
+- 読み込みとリサンプリングは CPU を使うため、プロセスプールで並列に
+  行います（`--workers`）。
+- 音声認識はネットワークの待ち時間が大半のため、イベントループ上で
+  同時実行数を制限して並行に行います（`--max-concurrency`）。
+- 読み込んだ音声は同時実行数に合わせた長さのキューで受け渡すため、
+  ファイル数にかかわらずメモリ使用量は一定です。
+- 結果は1件ごとに書き出すため、中断した後に同じコマンドを実行すると、
+  出力済みのファイルを飛ばして続きから再開します。
+
+使い方:
+    python -m stt.transcribe recordings/ --output transcripts.jsonl
+    python -m stt.transcribe recordings/ --output transcripts.jsonl \\
+        --workers 4 --max-concurrency 8 --retry-failed
+
+出力の形式:
+    成功: {"path": ..., "text": ..., "duration": ..., "elapsed": ...}
+    失敗: {"path": ..., "error": ...}
+    `path` は指定したディレクトリからの相対パスです。
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, TextIO
+
+from .audio import AudioBuffer, AudioFormat
+from .capture import FileAudioSource, load_audio_file
+from .governor import create_governors
+from .metrics import Metrics
+from .output import OutputWriter, SilentOutputWriter, StandardOutputWriter
+
+if TYPE_CHECKING:
+    from .speech_recognition import SpeechRecognizer
+
+# 文字起こしの対象とする拡張子
+AUDIO_SUFFIXES = ('.wav', '.flac')
+
+
+def find_recordings(directory: Path) -> Iterator[Path]:
+    """ディレクトリ以下の録音ファイルをパスの順に返す
+    Args:
+        directory (Path): 録音ファイルを探すディレクトリ
+    Yields:
+        Path: 録音ファイルのパス
+    """
+    for path in sorted(directory.rglob('*')):
+        if path.suffix.lower() in AUDIO_SUFFIXES and path.is_file():
+            yield path
+
+
+@dataclass
+class TranscriptionStats:
+    """一括文字起こしの進捗と処理速度
+    Attributes:
+        transcribed (int): 文字起こしが完了したファイル数
+        skipped (int): 前回までに出力済みのため飛ばしたファイル数
+        failed (int): 読み込みか音声認識に失敗したファイル数
+        audio_seconds (float): 文字起こしした音声の合計秒数
+        started_at (float): 開始時刻（`time.perf_counter` の値）
+    """
+
+    transcribed: int = 0
+    skipped: int = 0
+    failed: int = 0
+    audio_seconds: float = 0.0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        """開始からの経過時間（秒）"""
+        return time.perf_counter() - self.started_at
+
+    @property
+    def files_per_second(self) -> float:
+        """1秒あたりに処理したファイル数（失敗を含む）"""
+        elapsed = self.elapsed
+        processed = self.transcribed + self.failed
+        return processed / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def realtime_factor(self) -> float:
+        """経過時間に対する文字起こしした音声の長さの比率"""
+        elapsed = self.elapsed
+        return self.audio_seconds / elapsed if elapsed > 0 else 0.0
+
+    def report(self) -> str:
+        """進捗と処理速度のレポートを返す"""
+        return (
+            f'完了 {self.transcribed} 件 / スキップ {self.skipped} 件 / '
+            f'失敗 {self.failed} 件、経過 {self.elapsed:.1f} 秒、'
+            f'{self.files_per_second:.2f} ファイル/秒、'
+            f'音声 {self.audio_seconds:.1f} 秒（実時間の '
+            f'{self.realtime_factor:.1f} 倍）'
+        )
+
+
+@dataclass(frozen=True)
+class _Decoded:
+    """読み込んだ録音ファイル
+    Attributes:
+        path (Path): 録音ファイルのパス
+        audio (AudioBuffer | None): 変換した PCM（失敗した場合は None）
+        error (str | None): 読み込みに失敗した場合のエラー
+    """
+
+    path: Path
+    audio: AudioBuffer | None = None
+    error: str | None = None
+
+
+class BatchTranscriber:
+    """録音ファイルを一括で文字起こしし、結果を JSONL に追記するクラス
+    読み込み（プロセスプール）と音声認識（イベントループ）はキューでつなぎ、
+    それぞれの同時実行数を別々に制限します。
+    Attributes:
+        _output_path (Path): 結果を追記する JSONL ファイル
+        _recognizer (SpeechRecognizer): 音声認識を行うインスタンス
+        _workers (int): 読み込みを行うプロセス数
+        _max_concurrency (int): 同時に実行する音声認識の最大数
+        stats (TranscriptionStats): 進捗と処理速度
+    """
+
+    # 同時に実行する音声認識の既定の最大数
+    MAX_CONCURRENCY = 4
+
+    # 進捗を出力する間隔（秒）
+    PROGRESS_INTERVAL = 10.0
+
+    def __init__(
+        self,
+        output_path: Path,
+        recognizer: 'SpeechRecognizer',
+        workers: int | None = None,
+        max_concurrency: int = MAX_CONCURRENCY,
+        sample_rate: int = FileAudioSource.SAMPLE_RATE,
+        retry_failed: bool = False,
+        metrics: Metrics | None = None,
+        output_writer: OutputWriter = StandardOutputWriter(),
+    ):
+        """
+        Args:
+            output_path (Path): 結果を追記する JSONL ファイル
+            recognizer (SpeechRecognizer): 音声認識を行うインスタンス
+            workers (int | None): 読み込みを行うプロセス数
+                （None の場合は CPU 数）
+            max_concurrency (int): 同時に実行する音声認識の最大数
+            sample_rate (int): 音声認識に渡すサンプリングレート
+            retry_failed (bool): 前回失敗したファイルも再び処理するかどうか
+            metrics (Metrics | None): 1ファイルごとの所要時間の計測先
+            output_writer (OutputWriter): 進捗とエラーの出力先
+        Raises:
+            ValueError: プロセス数か同時実行数が 1 未満の場合
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError('workers は 1 以上を指定してください')
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency は 1 以上を指定してください')
+
+        self._output_path = output_path
+        self._recognizer = recognizer
+        self._workers = workers
+        self._max_concurrency = max_concurrency
+        self._sample_rate = sample_rate
+        self._retry_failed = retry_failed
+        self._metrics = metrics or Metrics()
+        self._output = output_writer
+        self.stats = TranscriptionStats()
+
+    def completed_paths(self) -> set[str]:
+        """出力済みのファイルの相対パスを返す
+        異常終了で最後の行が途中で切れている場合は、その行を削除します。
+        `retry_failed` が True の場合、最後の結果が失敗のファイルは含めません。
+        """
+        if not self._output_path.exists():
+            return set()
+
+        with self._output_path.open('rb+') as file:
+            data = file.read()
+            end = data.rfind(b'\n') + 1
+            if end != len(data):
+                file.truncate(end)
+
+        results: dict[str, bool] = {}
+        for line in data[:end].splitlines():
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(row, dict) and 'path' in row:
+                results[row['path']] = 'error' not in row
+        return {
+            path
+            for path, succeeded in results.items()
+            if succeeded or not self._retry_failed
+        }
+
+    async def transcribe(
+        self, paths: Iterable[Path], root: Path
+    ) -> TranscriptionStats:
+        """録音ファイルをすべて文字起こしする
+        失敗したファイルはエラーを出力して続行します。
+        Args:
+            paths (Iterable[Path]): 録音ファイル（順に読み込まれる）
+            root (Path): 出力する相対パスの基準のディレクトリ
+        Returns:
+            TranscriptionStats: 進捗と処理速度
+        """
+        self._output_path.parent.mkdir(parents=True, exist_ok=True)
+        completed = self.completed_paths()
+        self.stats = TranscriptionStats()
+
+        pending: asyncio.Queue[Path | None] = asyncio.Queue(
+            maxsize=self._workers * 2
+        )
+        decoded: asyncio.Queue[_Decoded | None] = asyncio.Queue(
+            maxsize=self._max_concurrency * 2
+        )
+
+        # ワーカーはスレッドを持つ親プロセスを fork せず、新しく起動する
+        with (
+            ProcessPoolExecutor(
+                max_workers=self._workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            ) as pool,
+            self._output_path.open('a', encoding='utf-8') as output,
+        ):
+            decoders = [
+                asyncio.create_task(self._decode(pool, pending, decoded))
+                for _ in range(self._workers)
+            ]
+            recognizers = [
+                asyncio.create_task(self._recognize(decoded, output, root))
+                for _ in range(self._max_concurrency)
+            ]
+            feeder = asyncio.create_task(
+                self._feed(paths, root, completed, pending, decoded, decoders)
+            )
+            tasks = [feeder, *decoders, *recognizers]
+            progress = asyncio.create_task(self._report_progress())
+            try:
+                # どれか1つが失敗すると、ほかの処理はキューを待ち続けるため、
+                # 最初の失敗ですべてを取り消して例外を伝える
+                done, _pending = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_EXCEPTION
+                )
+                for task in tasks:
+                    if task in done and (error := task.exception()):
+                        raise error
+            finally:
+                progress.cancel()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(progress, *tasks, return_exceptions=True)
+
+        return self.stats
+
+    async def _feed(
+        self,
+        paths: Iterable[Path],
+        root: Path,
+        completed: set[str],
+        pending: 'asyncio.Queue[Path | None]',
+        decoded: 'asyncio.Queue[_Decoded | None]',
+        decoders: list['asyncio.Task[None]'],
+    ) -> None:
+        """録音ファイルを読み込みのキューに渡し、終わったら各処理に終了を伝える"""
+        for path in paths:
+            # 出力済みのファイルは読み込まずに飛ばす
+            if _relative(path, root) in completed:
+                self.stats.skipped += 1
+                continue
+            await pending.put(path)
+        for _ in decoders:
+            await pending.put(None)
+        await asyncio.gather(*decoders)
+        for _ in range(self._max_concurrency):
+            await decoded.put(None)
+
+    async def _decode(
+        self,
+        pool: ProcessPoolExecutor,
+        pending: 'asyncio.Queue[Path | None]',
+        decoded: 'asyncio.Queue[_Decoded | None]',
+    ) -> None:
+        """キューから録音ファイルを取り出し、プロセスプールで読み込む
+        Raises:
+            BrokenProcessPool: ワーカーが異常終了した場合（ファイルの失敗として
+                記録すると次回の実行で飛ばされるため、処理全体を中止する）
+        """
+        loop = asyncio.get_running_loop()
+        while (path := await pending.get()) is not None:
+            try:
+                with self._metrics.span('transcribe.decode', total=None):
+                    pcm, sample_rate = await loop.run_in_executor(
+                        pool, _decode_file, path, self._sample_rate
+                    )
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                await decoded.put(_Decoded(path, error=str(e)))
+                continue
+            audio = AudioBuffer(pcm, AudioFormat(sample_rate=sample_rate))
+            await decoded.put(_Decoded(path, audio=audio))
+
+    async def _recognize(
+        self,
+        decoded: 'asyncio.Queue[_Decoded | None]',
+        output: TextIO,
+        root: Path,
+    ) -> None:
+        """読み込んだ音声を文字起こしし、結果を追記する"""
+        while (item := await decoded.get()) is not None:
+            relative = _relative(item.path, root)
+            if item.audio is None:
+                self._fail(output, relative, item.error or '')
+                continue
+
+            started_at = time.perf_counter()
+            try:
+                text = await self._recognizer.recognize_async(item.audio)
+            except Exception as e:
+                self._fail(output, relative, str(e))
+                continue
+
+            self.stats.transcribed += 1
+            self.stats.audio_seconds += item.audio.duration
+            self._write(
+                output,
+                {
+                    'path': relative,
+                    'text': text,
+                    'duration': round(item.audio.duration, 3),
+                    'elapsed': round(time.perf_counter() - started_at, 3),
+                },
+            )
+
+    def _fail(self, output: TextIO, relative: str, error: str) -> None:
+        """失敗したファイルを出力し、次回の実行で再試行できるよう記録する"""
+        self.stats.failed += 1
+        self._output.print(f'{relative}: 文字起こしに失敗しました: {error}')
+        self._write(output, {'path': relative, 'error': error})
+
+    @staticmethod
+    def _write(output: TextIO, row: dict[str, Any]) -> None:
+        """結果を1行追記する（中断しても書き込み済みの行は残る）"""
+        output.write(json.dumps(row, ensure_ascii=False) + '\n')
+        output.flush()
+
+    async def _report_progress(self) -> None:
+        """一定間隔で進捗を出力する"""
+        while True:
+            await asyncio.sleep(self.PROGRESS_INTERVAL)
+            self._output.print(self.stats.report())
+
+
+def _decode_file(path: Path, sample_rate: int) -> tuple[bytes, int]:
+    """プロセスプールのワーカーで録音ファイルを読み込む
+    memoryview はプロセス間で受け渡せないため、bytes にして返します。
+    """
+    audio = load_audio_file(path, sample_rate)
+    return bytes(audio.pcm), audio.sample_rate
+
+
+def _relative(path: Path, root: Path) -> str:
+    """出力に記録する相対パスを返す"""
+    try:
+        return path.relative_to(root).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+
+async def transcribe_directory(
+    directory: Path,
+    output_path: Path,
+    workers: int | None = None,
+    max_concurrency: int = BatchTranscriber.MAX_CONCURRENCY,
+    retry_failed: bool = False,
+    output_writer: OutputWriter = StandardOutputWriter(),
+) -> TranscriptionStats:
+    """ディレクトリ以下の録音ファイルを Google Speech Recognition で文字起こしする"""
+    from .speech_recognition import SpeechRecognizer
+
+    metrics = Metrics()
+    # 音声認識のスレッドは同時実行数と同じ数だけ用意する
+    with ThreadPoolExecutor(
+        max_workers=max_concurrency, thread_name_prefix='stt-transcribe'
+    ) as executor:
+        recognizer = SpeechRecognizer(
+            output_writer=SilentOutputWriter(),
+            metrics=metrics,
+            executor=executor,
+            governor=create_governors(metrics)['speech_recognition'],
+        )
+        transcriber = BatchTranscriber(
+            output_path,
+            recognizer,
+            workers=workers,
+            max_concurrency=max_concurrency,
+            retry_failed=retry_failed,
+            metrics=metrics,
+            output_writer=output_writer,
+        )
+        try:
+            return await transcriber.transcribe(
+                find_recordings(directory), directory
+            )
+        finally:
+            recognizer.close()
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(prog='python -m stt.transcribe')
+    parser.add_argument(
+        'directory', type=Path, help='WAV / FLAC ファイルのディレクトリ'
+    )
+    parser.add_argument(
+        '--output', type=Path, required=True, help='結果を追記する JSONL'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        help='読み込みを行うプロセス数（デフォルトは CPU 数）',
+    )
+    parser.add_argument(
+        '--max-concurrency',
+        type=int,
+        default=BatchTranscriber.MAX_CONCURRENCY,
+        help='同時に実行する音声認識の最大数',
+    )
+    parser.add_argument(
+        '--retry-failed',
+        action='store_true',
+        help='前回失敗したファイルも再び文字起こしする',
+    )
+    args = parser.parse_args()
+
+    output = StandardOutputWriter()
+    try:
+        stats = asyncio.run(
+            transcribe_directory(
+                args.directory,
+                args.output,
+                workers=args.workers,
+                max_concurrency=args.max_concurrency,
+                retry_failed=args.retry_failed,
+                output_writer=output,
+            )
+        )
+    except KeyboardInterrupt:
+        output.print(
+            '中断しました。同じコマンドを実行すると続きから再開します。'
+        )
+        sys.exit(130)
+
+    output.print(stats.report())
+    if stats.failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
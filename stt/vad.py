@@ -0,0 +1,326 @@
+import asyncio
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import numpy as np
+
+from .capture import AudioSource
+from .exceptions import SpeechRecognitionError
+
+
+class EnergyVAD:
+    """フレームのエネルギーで発話の有無を判定する音声区間検出器
+    最初の数フレームで周囲音の大きさを一度だけ測定し、その後は発話でない
+    フレームを使って周囲音の推定値を少しずつ更新し続けます。
+    Attributes:
+        noise_floor (float | None): 推定した周囲音の RMS（測定前は None）
+    """
+
+    # 周囲音の初回測定に使用するフレーム数
+    CALIBRATION_FRAMES = 10
+
+    # 周囲音に対して何倍の大きさを発話とみなすか
+    SPEECH_RATIO = 3.0
+
+    # 周囲音の推定値を更新する割合
+    ADAPTATION_RATE = 0.05
+
+    # 無音環境で小さなノイズを発話と判定しないための下限 (int16 の RMS)
+    MIN_THRESHOLD = 150.0
+
+    def __init__(
+        self,
+        speech_ratio: float = SPEECH_RATIO,
+        min_threshold: float = MIN_THRESHOLD,
+    ):
+        self.speech_ratio = speech_ratio
+        self.min_threshold = min_threshold
+        self.noise_floor: float | None = None
+        self._calibration: list[float] = []
+
+    @property
+    def calibrated(self) -> bool:
+        """周囲音の初回測定が完了しているかどうか"""
+        return self.noise_floor is not None
+
+    @property
+    def threshold(self) -> float:
+        """発話とみなすエネルギーのしきい値"""
+        if self.noise_floor is None:
+            return self.min_threshold
+        return max(self.noise_floor * self.speech_ratio, self.min_threshold)
+
+    @staticmethod
+    def energy(frame: bytes) -> float:
+        """フレームの RMS を計算する"""
+        samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+        if samples.size == 0:
+            return 0.0
+        return float(np.sqrt(np.mean(samples * samples)))
+
+    def is_speech(self, frame: bytes) -> bool:
+        """フレームが発話を含むかどうかを判定する
+        周囲音の測定中は常に False を返します。
+        Args:
+            frame (bytes): int16 の PCM フレーム
+        Returns:
+            bool: 発話を含む場合は True
+        """
+        energy = self.energy(frame)
+
+        if self.noise_floor is None:
+            self._calibration.append(energy)
+            if len(self._calibration) >= self.CALIBRATION_FRAMES:
+                self.noise_floor = float(np.median(self._calibration))
+                self._calibration.clear()
+            return False
+
+        if energy > self.threshold:
+            return True
+
+        # 発話でないフレームで周囲音の推定値を更新する
+        self.noise_floor += self.ADAPTATION_RATE * (energy - self.noise_floor)
+        return False
+
+
+class BargeInDetector:
+    """応答の生成中・再生中にユーザーの発話（割り込み）を検出するクラス
+    再生中はマイクに自分の再生音が回り込むため、直近の再生中の入力
+    エネルギーの上位パーセンタイルを回り込みの大きさとみなし、それを
+    十分に上回る入力が一定時間続いた場合のみ割り込みと判定します。
+    Attributes:
+        _vad (EnergyVAD): 周囲音の推定に使用する音声区間検出器
+        _echo (deque[float]): 再生中の入力エネルギーの履歴
+        _held (list[float]): 割り込み候補として履歴への追加を保留しているエネルギー
+    """
+
+    # 割り込みと判定するのに必要な発話の長さ
+    MIN_SPEECH_MS = 240
+
+    # 回り込みの大きさを推定する期間
+    ECHO_WINDOW_MS = 1500
+
+    # 回り込みの推定を始めるのに必要な期間（この間は割り込みと判定しない）
+    ECHO_WARMUP_MS = 300
+
+    # 回り込みの推定に使用するパーセンタイル
+    ECHO_PERCENTILE = 90
+
+    # 回り込みの大きさに対して何倍の入力を発話とみなすか
+    ECHO_MARGIN = 1.5
+
+    def __init__(
+        self,
+        vad: EnergyVAD,
+        frame_ms: int,
+        min_speech_ms: int = MIN_SPEECH_MS,
+        echo_margin: float = ECHO_MARGIN,
+    ):
+        self._vad = vad
+        self._echo_margin = echo_margin
+        self.min_frames = max(1, min_speech_ms // frame_ms)
+        self._warmup_frames = max(1, self.ECHO_WARMUP_MS // frame_ms)
+        self._echo: deque[float] = deque(
+            maxlen=max(self._warmup_frames, self.ECHO_WINDOW_MS // frame_ms)
+        )
+        self._held: list[float] = []
+
+    def reset(self) -> None:
+        """回り込みの推定をやり直す"""
+        self._echo.clear()
+        self._held.clear()
+
+    def is_speech(self, frame: bytes, playing: bool) -> bool:
+        """フレームがユーザーの発話を含むかどうかを判定する
+        Args:
+            frame (bytes): int16 の PCM フレーム
+            playing (bool): 応答を再生中かどうか
+        Returns:
+            bool: ユーザーの発話を含む場合は True
+        """
+        if not playing:
+            return self._vad.is_speech(frame)
+
+        energy = EnergyVAD.energy(frame)
+        if len(self._echo) < self._warmup_frames:
+            self._echo.append(energy)
+            return False
+
+        echo = float(np.percentile(self._echo, self.ECHO_PERCENTILE))
+        if energy > max(self._vad.threshold, echo * self._echo_margin):
+            self._held.append(energy)
+            return True
+
+        # 割り込みに至らなかった候補は回り込みとして履歴に戻す
+        self._echo.extend(self._held)
+        self._held.clear()
+        self._echo.append(energy)
+        return False
+
+
+@dataclass
+class Utterance:
+    """検出された発話
+    Attributes:
+        pcm (bytes): 発話区間の PCM（発話開始直前の音声を含む）
+        truncated (bool): 最大長に達して打ち切られたかどうか
+        endpoint_delay (float): 最後の発話フレームから終了と判定するまでの秒数
+    """
+
+    pcm: bytes
+    truncated: bool = False
+    endpoint_delay: float = 0.0
+
+
+class UtteranceEndpointer:
+    """フレーム単位の音声区間検出で発話の開始と終了を判定するクラス
+    発話が始まる前のフレームはリングバッファに保持し、発話の頭が
+    欠けないようにします。無音が `hangover_ms` 続いた時点で発話の終了と
+    判定します。
+    Attributes:
+        _source (AudioSource): 音声入力
+        _vad (EnergyVAD): 音声区間検出器
+    """
+
+    # 発話開始と判定するのに必要な連続した発話フレームの長さ
+    START_MS = 90
+
+    # 発話の終了と判定する無音の長さ
+    HANGOVER_MS = 300
+
+    # 発話開始前に保持しておく音声の長さ
+    PRE_ROLL_MS = 300
+
+    def __init__(
+        self,
+        source: AudioSource,
+        vad: EnergyVAD | None = None,
+        hangover_ms: int = HANGOVER_MS,
+        start_ms: int = START_MS,
+        pre_roll_ms: int = PRE_ROLL_MS,
+    ):
+        self._source = source
+        self._vad = vad or EnergyVAD()
+        self._hangover_frames = max(1, hangover_ms // source.frame_ms)
+        self._start_frames = max(1, start_ms // source.frame_ms)
+        self._pre_roll: deque[bytes] = deque(
+            maxlen=max(self._start_frames, pre_roll_ms // source.frame_ms)
+        )
+
+    @property
+    def vad(self) -> EnergyVAD:
+        """使用している音声区間検出器"""
+        return self._vad
+
+    async def calibrate(self) -> None:
+        """周囲音の初回測定が終わるまでフレームを読み込む"""
+        await self._source.start()
+        while not self._vad.calibrated:
+            self._vad.is_speech(await self._source.read())
+
+    def reset(self) -> None:
+        """受信済みで未処理のフレームと発話開始前の保持分を破棄する"""
+        self._source.discard_pending()
+        self._pre_roll.clear()
+
+    async def wait_for_speech(self, timeout: float | None = None) -> None:
+        """発話が始まるまで待つ
+        Args:
+            timeout (float | None): 待機する最大秒数
+        Raises:
+            SpeechRecognitionError: 時間内に発話が始まらなかった場合
+        """
+        await self.calibrate()
+
+        try:
+            async with asyncio.timeout(timeout):
+                speech_run = 0
+                while speech_run < self._start_frames:
+                    frame = await self._source.read()
+                    self._pre_roll.append(frame)
+                    if self._vad.is_speech(frame):
+                        speech_run += 1
+                    else:
+                        speech_run = 0
+        except TimeoutError:
+            raise SpeechRecognitionError(
+                'タイムアウトしました。もう一度話しかけてください。'
+            )
+
+    async def wait_for_barge_in(
+        self,
+        detector: BargeInDetector,
+        is_playing: Callable[[], bool],
+    ) -> None:
+        """応答の生成中・再生中にユーザーが話し始めるまで待つ
+        検出に使用したフレームは保持しておくため、続けて
+        `capture_speech` を呼ぶと発話の頭から取得できます。
+        Args:
+            detector (BargeInDetector): 割り込みの検出器
+            is_playing (Callable[[], bool]): 応答を再生中かどうかを返す関数
+        """
+        await self.calibrate()
+        self.reset()
+        detector.reset()
+
+        speech_run = 0
+        while speech_run < detector.min_frames:
+            frame = await self._source.read()
+            self._pre_roll.append(frame)
+            if detector.is_speech(frame, is_playing()):
+                speech_run += 1
+            else:
+                speech_run = 0
+
+    async def capture_speech(self, max_duration: float) -> Utterance:
+        """発話開始後、発話の終了までのフレームを取得する
+        Args:
+            max_duration (float): 発話の最大秒数
+        Returns:
+            Utterance: 発話開始前の保持分を含む発話
+        """
+        frames = list(self._pre_roll)
+        self._pre_roll.clear()
+
+        max_frames = int(max_duration * 1000) // self._source.frame_ms
+        silence_run = 0
+        last_speech_at = time.perf_counter()
+
+        while len(frames) < max_frames:
+            frame = await self._source.read()
+            frames.append(frame)
+
+            if self._vad.is_speech(frame):
+                silence_run = 0
+                last_speech_at = time.perf_counter()
+                continue
+
+            silence_run += 1
+            if silence_run >= self._hangover_frames:
+                # 末尾の無音は認識に不要なため、余韻として少しだけ残す
+                keep = len(frames) - silence_run + min(silence_run, 3)
+                return Utterance(
+                    pcm=b''.join(frames[:keep]),
+                    endpoint_delay=time.perf_counter() - last_speech_at,
+                )
+
+        return Utterance(pcm=b''.join(frames), truncated=True)
+
+    async def next_utterance(
+        self,
+        timeout: float | None,
+        max_duration: float,
+    ) -> Utterance:
+        """次の発話を検出して取得する
+        Args:
+            timeout (float | None): 発話の開始を待つ最大秒数
+            max_duration (float): 発話の最大秒数
+        Returns:
+            Utterance: 検出した発話
+        Raises:
+            SpeechRecognitionError: 時間内に発話が始まらなかった場合
+        """
+        await self.wait_for_speech(timeout)
+        return await self.capture_speech(max_duration)
@@ -2,6 +2,11 @@ import io
 import shutil
 import subprocess
 from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+from types import TracebackType
+from typing import Self
+
+from .audio import AudioBuffer
 
 
 class VoiceClient(ABC):
@@ -10,17 +15,58 @@ class VoiceClient(ABC):
     """
 
     @abstractmethod
-    async def text_to_speech(self, text: str) -> bytes:
+    async def text_to_speech(self, text: str) -> AudioBuffer:
         """API を使用してテキストを音声に変換する
         Args:
             text (str): 音声に変換するテキスト
         Returns:
-            bytes: バイト形式の音声データ
+            AudioBuffer: 音声データ
         Raises:
             ValueError: API レスポンスに base64 音声データが含まれていない場合
         """
         pass
 
+    async def stream_speech(self, text: str) -> AsyncIterator[AudioBuffer]:
+        """テキストを音声に変換し、受信した順に PCM の断片を返す
+        ストリーミングに対応していないクライアントでは、`text_to_speech` の
+        結果全体を1つの断片として返します。
+        Args:
+            text (str): 音声に変換するテキスト
+        Yields:
+            AudioBuffer: PCM の断片
+        """
+        yield await self.text_to_speech(text)
+
+    def voice_settings(self) -> dict[str, str]:
+        """合成結果に影響する設定を返す
+        音声キャッシュのキーとして使用されるため、バックエンド・音声ID・
+        話速・出力形式など、同じテキストでも音声が変わる設定を含めます。
+        Returns:
+            dict[str, str]: 設定名と値の辞書
+        """
+        return {'backend': type(self).__name__}
+
+    async def warm_up(self) -> None:
+        """最初の音声合成の前に API への接続を確立しておく
+        接続を事前に確立できるクライアントのみが実装します。
+        """
+        return None
+
+    async def aclose(self) -> None:
+        """クライアントが保持している接続などのリソースを解放する"""
+        return None
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        await self.aclose()
+
 
 def is_installed(lib_name: str) -> bool:
     """指定されたライブラリがインストールされているか確認する
@@ -36,12 +82,13 @@ def is_installed(lib_name: str) -> bool:
 
 
 def play(
-    audio: bytes,
+    audio: AudioBuffer | bytes,
     use_ffmpeg: bool = True,
 ) -> None:
     """ffplay または sounddevice を使用して音声を再生する
     Args:
-        audio (bytes): バイト形式の音声データ
+        audio (AudioBuffer | bytes): 音声データ。bytes の場合は WAV などの
+            ファイル形式のデータとして扱う
         use_ffmpeg (bool): 再生に ffplay を使用するかどうか。デフォルトは True
     Raises:
         ValueError: use_ffmpeg が True で ffplay がインストールされていない場合
@@ -56,24 +103,46 @@ def play(
             )
 
         args = ['ffplay', '-autoexit', '-', '-nodisp']
+        # 出力を読まずに書き込むため、パイプが詰まらないよう出力は捨てる
         proc = subprocess.Popen(
             args=args,
-            stdout=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
             stdin=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
         )
-        _out, _err = proc.communicate(input=audio)
-        proc.poll()
+        assert proc.stdin is not None
+        try:
+            # ヘッダーと PCM を連結せずに順番に書き込む
+            if isinstance(audio, AudioBuffer):
+                proc.stdin.write(audio.wav_header())
+                proc.stdin.write(audio.pcm)
+            else:
+                proc.stdin.write(audio)
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        proc.wait()
     else:
         # sounddevice と soundfile を使用して音声を再生する
         try:
+            import numpy as np
             import sounddevice as sd  # type: ignore
             import soundfile as sf  # type: ignore
         except ModuleNotFoundError:
             message = '`use_ffmpeg=False` の場合は `uv add sounddevice soundfile` が必要です'
             raise ValueError(message)
 
-        data, samplerate = sf.read(io.BytesIO(audio))
+        if isinstance(audio, AudioBuffer):
+            if audio.sample_width == 1:
+                # 8bit の PCM は符号なしのため、符号付きに変換する
+                data = (np.frombuffer(audio.pcm, dtype='u1') ^ 0x80).view('i1')
+            else:
+                # PCM をコピーせずにサンプルの配列として参照する
+                data = np.frombuffer(audio.pcm, dtype=f'<i{audio.sample_width}')
+            data = data.reshape(-1, audio.channels)
+            samplerate = audio.sample_rate
+        else:
+            data, samplerate = sf.read(io.BytesIO(audio))
 
         sd.play(data, samplerate)
         sd.wait()